@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+推理后端接口
+服务层（serving.py）只通过这些方法调用推理，本地模型服务和模拟服务都实现同一接口。
+本模块不依赖 torch，模拟服务可以在没有模型环境的机器上运行。
+"""
+
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Union
+
+Messages = Union[str, List[Dict[str, Any]]]
+
+
+@dataclass
+class GenerationResult:
+    """单个请求的生成结果"""
+    text: str
+    token_ids: List[int]
+    prompt_tokens: int
+    completion_tokens: int
+    finish_reason: str
+    time_to_first_token: float
+    duration: float
+
+    @property
+    def tokens_per_second(self) -> float:
+        """首个 token 之后的解码速度"""
+        decode_time = self.duration - self.time_to_first_token
+        if self.completion_tokens <= 1 or decode_time <= 0:
+            return 0.0
+        return (self.completion_tokens - 1) / decode_time
+
+
+class InferenceBackend:
+    """推理后端基类"""
+
+    name = "autoglm-phone-9b"
+
+    def build_input(self, messages: Messages) -> str:
+        """从消息中取出模型输入文本"""
+        if isinstance(messages, str):
+            return messages
+        # 简化的消息格式处理，多模态内容只取文本部分
+        for msg in messages:
+            if msg.get("role") == "user":
+                content = msg.get("content", "")
+                if isinstance(content, list):
+                    return "\n".join(part.get("text", "") for part in content if part.get("type") == "text")
+                return content
+        return ""
+
+    def submit(self, input_text: str, max_tokens: int, temperature: float,
+               on_token: Optional[Callable[[int], None]] = None) -> Future:
+        """
+        提交生成请求，推理在后端自己的线程中进行
+
+        Args:
+            input_text: 输入文本
+            max_tokens: 最大生成 token 数
+            temperature: 采样温度
+            on_token: 每生成一个 token 时调用（在推理线程中），应尽快返回
+
+        Returns:
+            Future，结果为 GenerationResult；取消 Future 会尽快结束生成
+        """
+        raise NotImplementedError
+
+    def decode(self, token_ids: List[int]) -> str:
+        """把 token 解码为文本，用于流式输出"""
+        raise NotImplementedError
+
+    @property
+    def ready(self) -> bool:
+        """是否可以处理请求"""
+        return True
+
+    @property
+    def status(self) -> str:
+        """健康检查中的状态：loading、healthy 或 failed"""
+        return "healthy" if self.ready else "loading"
+
+    def health(self) -> Dict[str, Any]:
+        """健康检查中返回的后端状态"""
+        return {}
+
+    def close(self):
+        """释放推理线程等资源"""
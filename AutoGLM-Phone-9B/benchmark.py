@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+批处理调度器吞吐量测试
+用小模型在 CPU 上对比逐个 model.generate 与 BatchScheduler 并发生成的吞吐量
+
+用法: python benchmark.py [模型名或路径] [请求数] [最大生成token数] [最大批大小]
+"""
+
+import sys
+import time
+from concurrent.futures import wait
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from scheduler import BatchScheduler
+
+PROMPTS = [
+    "打开券商应用并进入交易页面",
+    "点击登录按钮",
+    "在搜索框中输入股票代码 600000 然后点击查询",
+    "返回上一页",
+    "向下滑动查看持仓列表，找到可用资金一栏并读取其中的数值",
+    "关闭升级提示弹窗",
+]
+
+
+def run_sequential(model, tokenizer, prompts, max_new_tokens):
+    """逐个调用 model.generate，返回 (生成token数, 耗时)"""
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    tokens = 0
+    start = time.perf_counter()
+    for prompt in prompts:
+        inputs = tokenizer(prompt, return_tensors="pt")
+        with torch.no_grad():
+            outputs = model.generate(
+                **inputs, max_new_tokens=max_new_tokens, do_sample=False, pad_token_id=pad_token_id
+            )
+        tokens += outputs.shape[1] - inputs["input_ids"].shape[1]
+    return tokens, time.perf_counter() - start
+
+
+def run_scheduler(model, tokenizer, prompts, max_new_tokens, max_batch_size):
+    """同时提交全部请求，返回 (生成token数, 耗时, 调度器)"""
+    scheduler = BatchScheduler(model, tokenizer, "cpu", max_batch_size=max_batch_size)
+    scheduler.start()
+    start = time.perf_counter()
+    futures = [scheduler.submit(prompt, max_new_tokens, temperature=0.0) for prompt in prompts]
+    wait(futures)
+    elapsed = time.perf_counter() - start
+    scheduler.stop()
+    tokens = sum(future.result().completion_tokens for future in futures)
+    return tokens, elapsed, scheduler
+
+
+def main():
+    model_name = sys.argv[1] if len(sys.argv) > 1 else "sshleifer/tiny-gpt2"
+    num_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    max_new_tokens = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+    max_batch_size = int(sys.argv[4]) if len(sys.argv) > 4 else 8
+
+    print(f"加载模型: {model_name}")
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32).eval()
+    prompts = [PROMPTS[i % len(PROMPTS)] for i in range(num_requests)]
+
+    # 预热，避免首次调用的初始化开销计入结果
+    run_sequential(model, tokenizer, prompts[:1], 2)
+
+    seq_tokens, seq_time = run_sequential(model, tokenizer, prompts, max_new_tokens)
+    batch_tokens, batch_time, scheduler = run_scheduler(
+        model, tokenizer, prompts, max_new_tokens, max_batch_size
+    )
+
+    print(f"\n请求数: {num_requests}, 最大生成token数: {max_new_tokens}, 最大批大小: {max_batch_size}")
+    print(f"逐个生成: {seq_tokens} tokens, {seq_time:.2f}s, {seq_tokens / seq_time:.1f} tokens/s")
+    print(f"批处理调度: {batch_tokens} tokens, {batch_time:.2f}s, {batch_tokens / batch_time:.1f} tokens/s")
+    print(f"加速比: {(batch_tokens / batch_time) / (seq_tokens / seq_time):.2f}x")
+    print(f"平均批大小: {scheduler.mean_batch_size:.2f}, 填充token: {scheduler.stats['padding_tokens']}")
+
+
+if __name__ == "__main__":
+    main()
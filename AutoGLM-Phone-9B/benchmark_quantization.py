@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+int8 量化的精度和延迟测试
+用小模型在 CPU 上对比 float32 与 int8 动态量化：权重内存、单次前向延迟、
+解码速度，以及下一个 token 的 top-1 一致率和贪心生成结果的一致率
+
+用法: python benchmark_quantization.py [模型名或路径] [最大生成token数]
+"""
+
+import copy
+import sys
+import time
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from benchmark import PROMPTS
+from quantization import count_quantized_layers, model_memory_bytes, quantize_int8
+
+
+def forward_latency(model, inputs, repeats=5):
+    """单次前向的平均耗时（秒）"""
+    with torch.no_grad():
+        model(**inputs)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            model(**inputs)
+    return (time.perf_counter() - start) / repeats
+
+
+def greedy_generate(model, tokenizer, prompt, max_new_tokens):
+    """贪心生成，返回 (新生成的 token, 耗时)"""
+    inputs = tokenizer(prompt, return_tensors="pt")
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    start = time.perf_counter()
+    with torch.no_grad():
+        outputs = model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False, pad_token_id=pad_token_id)
+    return outputs[0, inputs["input_ids"].shape[1]:].tolist(), time.perf_counter() - start
+
+
+def main():
+    model_name = sys.argv[1] if len(sys.argv) > 1 else "hf-internal-testing/tiny-random-LlamaForCausalLM"
+    max_new_tokens = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+
+    print(f"加载模型: {model_name}")
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    reference = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32).eval()
+    quantized = quantize_int8(copy.deepcopy(reference))
+    models = {"float32": reference, "int8": quantized}
+
+    results = {name: {"latency": 0.0, "tokens": 0, "generate_time": 0.0} for name in models}
+    top1_agree = top1_total = 0
+    generations_equal = 0
+    for prompt in PROMPTS:
+        inputs = tokenizer(prompt, return_tensors="pt")
+        with torch.no_grad():
+            reference_logits = reference(**inputs).logits
+            quantized_logits = quantized(**inputs).logits
+        top1_agree += int((reference_logits.argmax(-1) == quantized_logits.argmax(-1)).sum())
+        top1_total += reference_logits.shape[1]
+
+        generated = {}
+        for name, model in models.items():
+            results[name]["latency"] += forward_latency(model, inputs) / len(PROMPTS)
+            generated[name], elapsed = greedy_generate(model, tokenizer, prompt, max_new_tokens)
+            results[name]["tokens"] += len(generated[name])
+            results[name]["generate_time"] += elapsed
+        generations_equal += generated["float32"] == generated["int8"]
+
+    print(f"\n量化线性层: {count_quantized_layers(quantized)}")
+    for name, model in models.items():
+        result = results[name]
+        print(f"{name:>8}: 权重 {model_memory_bytes(model) / 1024 ** 2:.2f}MB, "
+              f"前向 {result['latency'] * 1000:.2f}ms, "
+              f"解码 {result['tokens'] / result['generate_time']:.1f} tokens/s")
+    print(f"下一个 token top-1 一致率: {top1_agree / top1_total:.2%}")
+    print(f"贪心生成完全一致: {generations_equal}/{len(PROMPTS)}")
+
+
+if __name__ == "__main__":
+    main()
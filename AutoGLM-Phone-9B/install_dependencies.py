@@ -50,7 +50,8 @@ def install_other_dependencies():
     """安装其他依赖"""
     dependencies = [
         "transformers>=4.35.0",
-        "flask>=2.3.0", 
+        "fastapi>=0.100.0",
+        "uvicorn>=0.23.0",
         "pyyaml>=6.0.0",
         "Pillow>=12.0.0",
         "openai>=2.9.0",
@@ -80,8 +81,8 @@ def verify_installation():
         import transformers
         print(f"✓ Transformers版本: {transformers.__version__}")
         
-        import flask
-        print(f"✓ Flask版本: {flask.__version__}")
+        import fastapi
+        print(f"✓ FastAPI版本: {fastapi.__version__}")
         
         import openai
         print(f"✓ OpenAI版本: {openai.__version__}")
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+决策流程负载测试
+模拟 N 个智能代理同时运行：每一步发送与 AIDecisionEngine 结构相同的决策请求
+（固定前缀 → 任务 → 历史 → 当前屏幕），解析出 ACTION/PARAMETERS 后模拟设备执行动作，
+再进入下一步。统计步骤延迟和模型延迟的 p50/p95/p99 以及吞吐量。
+
+用法:
+  # 对已运行的服务（本地模型或模拟服务）
+  python load_test.py --url http://localhost:8000/v1 --agents 8 --steps 20 --stream
+  # 在本进程内启动模拟服务并测试
+  python load_test.py --mock --ttft 0.3 --token-latency 0.02 --concurrency 4 --agents 16
+"""
+
+import argparse
+import json
+import random
+import re
+import statistics
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+# 与 autodroid-trader-server/core/engine.py 中的 DECISION_PROMPT_PREFIX 一致
+DECISION_PROMPT_PREFIX = """你是安卓自动化操作助手，根据任务、历史操作和当前屏幕决定下一步操作。
+可用操作类型: tap_at, swipe, input_text, long_press, double_tap, back, home, finish
+
+返回格式:
+ACTION: <操作类型>
+PARAMETERS: <参数>
+DESCRIPTION: <操作描述>"""
+
+TASKS = ["登录券商账户", "查询股票 600000 的行情", "查看持仓和可用资金", "撤销未成交委托"]
+
+# 出错后的指数退避（秒）
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+
+ACTION_PATTERN = re.compile(r"ACTION:\s*(\w+)\s*\nPARAMETERS:\s*(.*?)\s*\n", re.S)
+
+
+@dataclass
+class StepRecord:
+    """单个步骤的测量结果"""
+    step_latency: float  # 从第一次发出请求到动作执行完成，包含重试和等待
+    time_to_action: float  # 从第一次发出请求到解析出动作
+    time_to_first_token: Optional[float]  # 成功的那次请求的首 token 耗时
+    completion_tokens: int
+    attempts: int = 1
+
+
+@dataclass
+class AgentStats:
+    records: List[StepRecord] = field(default_factory=list)
+    errors: int = 0
+    rejected: int = 0
+    abandoned: int = 0  # 测试结束时仍在重试的步骤
+    tasks: int = 0
+
+
+def build_prompt(task: str, history: List[str], rng: random.Random, screen_chars: int) -> str:
+    """与 AIDecisionEngine.build_decision_prompt 相同结构的提示词，屏幕内容随机"""
+    screen = "".join(rng.choice("账户资金持仓委托买卖行情代码价格数量确定取消0123456789") for _ in range(screen_chars))
+    return "\n\n".join([
+        DECISION_PROMPT_PREFIX,
+        f"任务描述: {task}",
+        "历史操作:\n" + "\n".join(history) if history else "历史操作: 无",
+        f"当前屏幕:\n当前应用: com.tdx.androidCCZQ\n屏幕尺寸: 1080x1920\n屏幕内容: {screen}",
+        "请基于当前状态决定下一步操作。"
+    ])
+
+
+def request_decision(session: requests.Session, url: str, payload: Dict, stream: bool,
+                     timeout: float) -> Tuple[str, float, Optional[float], int]:
+    """
+    发送决策请求
+
+    Returns:
+        (动作类型, 解析出动作的耗时, 首 token 耗时, 生成 token 数)
+
+    Raises:
+        requests.HTTPError: 非 2xx 响应
+        ValueError: 输出中没有动作
+    """
+    start = time.perf_counter()
+    response = session.post(f"{url}/chat/completions", json={**payload, "stream": stream},
+                            stream=stream, timeout=timeout)
+    response.raise_for_status()
+
+    if not stream:
+        body = response.json()
+        match = ACTION_PATTERN.search(body["choices"][0]["message"]["content"] + "\n")
+        if not match:
+            raise ValueError("模型输出中缺少 ACTION/PARAMETERS")
+        elapsed = time.perf_counter() - start
+        return match.group(1), elapsed, None, body["usage"]["completion_tokens"]
+
+    text, action, time_to_action, first_token, tokens = "", None, None, None, 0
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data: ") or line == "data: [DONE]":
+            continue
+        chunk = json.loads(line[6:])
+        if "error" in chunk:
+            raise ValueError(chunk["error"]["message"])
+        if chunk.get("usage"):
+            tokens = chunk["usage"]["completion_tokens"]
+        content = chunk["choices"][0]["delta"].get("content")
+        if not content:
+            continue
+        if first_token is None:
+            first_token = time.perf_counter() - start
+        text += content
+        # 与代理的流式解析一致：ACTION/PARAMETERS 完整后立即下发动作
+        if action is None:
+            match = ACTION_PATTERN.search(text)
+            if match:
+                action, time_to_action = match.group(1), time.perf_counter() - start
+    if action is None:
+        match = ACTION_PATTERN.search(text + "\n")
+        if not match:
+            raise ValueError("模型输出中缺少 ACTION/PARAMETERS")
+        action, time_to_action = match.group(1), time.perf_counter() - start
+    return action, time_to_action, first_token, tokens
+
+
+def backoff_delay(failures: int, rng: random.Random) -> float:
+    """第 failures 次连续失败后的等待时间：指数增长并加随机抖动，避免代理同时重试"""
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (failures - 1)) * rng.uniform(0.5, 1.0)
+
+
+def run_agent(index: int, args, stats: AgentStats, deadline: float):
+    """单个代理：连续执行步骤，finish 后开始新任务；请求失败时重试同一步骤"""
+    rng = random.Random(index)
+    session = requests.Session()
+    task, history = rng.choice(TASKS), []
+    steps = 0
+    while steps < args.steps and time.monotonic() < deadline:
+        payload = {
+            "model": "autoglm-phone-9b",
+            "messages": [{"role": "user", "content": build_prompt(task, history, rng, args.screen_chars)}],
+            "max_tokens": args.max_tokens,
+            "temperature": args.temperature
+        }
+        # 步骤延迟从第一次尝试开始计算，服务饱和时的重试和等待都计入
+        start = time.perf_counter()
+        attempts = 0
+        decision = None
+        while decision is None and time.monotonic() < deadline:
+            attempts += 1
+            attempt_start = time.perf_counter()
+            try:
+                decision = request_decision(session, args.url, payload, args.stream, args.timeout)
+                break
+            except requests.HTTPError as e:
+                if e.response.status_code == 429:
+                    stats.rejected += 1
+                    delay = float(e.response.headers.get("Retry-After", 1))
+                else:
+                    stats.errors += 1
+                    delay = backoff_delay(attempts, rng)
+            except (requests.RequestException, ValueError):
+                stats.errors += 1
+                delay = backoff_delay(attempts, rng)
+            time.sleep(max(0.0, min(delay, deadline - time.monotonic())))
+        if decision is None:
+            stats.abandoned += 1
+            break
+
+        action, time_to_action, first_token, tokens = decision
+        # 模拟设备执行动作
+        time.sleep(args.action_delay)
+        stats.records.append(StepRecord(
+            time.perf_counter() - start, attempt_start - start + time_to_action, first_token, tokens, attempts
+        ))
+        steps += 1
+        history.append(f"{len(history) + 1}. {action}")
+        if action == "finish":
+            stats.tasks += 1
+            task, history = rng.choice(TASKS), []
+
+
+def percentiles(values: List[float]) -> str:
+    if not values:
+        return "-"
+    ordered = sorted(values)
+
+    def rank(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return (f"p50 {rank(0.50) * 1000:.0f}ms  p95 {rank(0.95) * 1000:.0f}ms  "
+            f"p99 {rank(0.99) * 1000:.0f}ms  mean {statistics.mean(ordered) * 1000:.0f}ms")
+
+
+def start_mock_server(args):
+    """在后台线程中启动模拟服务，返回 uvicorn Server"""
+    import uvicorn
+    from mock_model_server import SimulationConfig, create_mock_app
+
+    config = SimulationConfig(
+        ttft=args.ttft, token_latency=args.token_latency, jitter=args.jitter,
+        concurrency=args.concurrency, error_rate=args.error_rate, finish_rate=args.finish_rate,
+        seed=0, verbose=False
+    )
+    app = create_mock_app(config, max_concurrency=args.concurrency * 2, max_queue=args.max_queue)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.mock_port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    args.url = f"http://127.0.0.1:{args.mock_port}/v1"
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="决策流程负载测试")
+    parser.add_argument("--url", default="http://localhost:8000/v1", help="模型服务地址")
+    parser.add_argument("--agents", type=int, default=8, help="同时运行的代理数")
+    parser.add_argument("--steps", type=int, default=20, help="每个代理执行的步骤数")
+    parser.add_argument("--duration", type=float, default=600.0, help="最长测试时间（秒）")
+    parser.add_argument("--stream", action="store_true", help="流式请求，解析出动作后立即执行")
+    parser.add_argument("--action-delay", type=float, default=0.3, help="模拟设备执行动作的时间（秒）")
+    parser.add_argument("--screen-chars", type=int, default=400, help="屏幕内容的字符数")
+    parser.add_argument("--max-tokens", type=int, default=256, help="最大生成 token 数")
+    parser.add_argument("--temperature", type=float, default=0.1, help="采样温度")
+    parser.add_argument("--timeout", type=float, default=120.0, help="单个请求的超时时间（秒）")
+    mock = parser.add_argument_group("模拟服务（--mock 时在本进程内启动）")
+    mock.add_argument("--mock", action="store_true", help="启动模拟服务")
+    mock.add_argument("--mock-port", type=int, default=8765)
+    mock.add_argument("--ttft", type=float, default=0.3)
+    mock.add_argument("--token-latency", type=float, default=0.02)
+    mock.add_argument("--jitter", type=float, default=0.2)
+    mock.add_argument("--concurrency", type=int, default=4)
+    mock.add_argument("--error-rate", type=float, default=0.0)
+    mock.add_argument("--finish-rate", type=float, default=0.1)
+    mock.add_argument("--max-queue", type=int, default=64)
+    args = parser.parse_args()
+
+    server = start_mock_server(args) if args.mock else None
+
+    print(f"🚀 负载测试: {args.agents} 个代理 × {args.steps} 步, {'流式' if args.stream else '非流式'}, {args.url}")
+    agents = [AgentStats() for _ in range(args.agents)]
+    deadline = time.monotonic() + args.duration
+    threads = [threading.Thread(target=run_agent, args=(i, args, agents[i], deadline)) for i in range(args.agents)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    records = [record for agent in agents for record in agent.records]
+    tokens = sum(record.completion_tokens for record in records)
+    first_tokens = [record.time_to_first_token for record in records if record.time_to_first_token is not None]
+    print(f"\n完成步骤: {len(records)}, 完成任务: {sum(a.tasks for a in agents)}, "
+          f"错误: {sum(a.errors for a in agents)}, 429: {sum(a.rejected for a in agents)}, "
+          f"重试过的步骤: {sum(1 for r in records if r.attempts > 1)}, "
+          f"未完成步骤: {sum(a.abandoned for a in agents)}, 耗时 {elapsed:.1f}s")
+    print(f"吞吐量: {len(records) / elapsed:.2f} 步/秒, {tokens / elapsed:.1f} tokens/秒")
+    print(f"步骤延迟:   {percentiles([r.step_latency for r in records])}")
+    print(f"动作延迟:   {percentiles([r.time_to_action for r in records])}")
+    if first_tokens:
+        print(f"首token延迟: {percentiles(first_tokens)}")
+
+    if server:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
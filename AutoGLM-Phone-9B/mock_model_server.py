@@ -2,14 +2,26 @@
 """
 AutoGLM-Phone-9B 模拟模型服务
 用于测试集成流程，提供模拟响应
+与本地模型服务使用相同的服务层（serving.py），准入控制、流式输出和超时行为一致
+
+也可以作为延迟/吞吐量模拟器：首 token 延迟、每个 token 的延迟、模型并发上限和
+错误率都可以配置，配合 load_test.py 离线测试整个决策流程。
 """
 
-from flask import Flask, request, jsonify
+import argparse
 import json
 import random
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 
-app = Flask(__name__)
+from backend import GenerationResult, InferenceBackend
+from serving import create_app, run_server
 
 # 模拟UI元素识别响应
 MOCK_UI_RESPONSES = [
@@ -94,98 +106,186 @@ MOCK_LOGIN_RESULTS = [
     }
 ]
 
-@app.route('/v1/chat/completions', methods=['POST'])
-def chat_completions():
-    """模拟聊天完成接口"""
-    try:
-        data = request.get_json()
-        messages = data.get('messages', [])
-        
-        # 获取用户输入
-        user_input = ""
-        for msg in messages:
-            if msg.get("role") == "user":
-                user_input = msg.get("content", "")
-                break
-        
-        print(f"收到请求: {user_input}")
-        
-        # 根据输入内容生成模拟响应
-        if "UI" in user_input or "界面" in user_input or "element" in user_input.lower():
-            response_data = random.choice(MOCK_UI_RESPONSES)
-            response_text = f"AI分析结果: {json.dumps(response_data, ensure_ascii=False, indent=2)}"
-        
-        elif "登录" in user_input or "login" in user_input.lower():
-            result = random.choice(MOCK_LOGIN_RESULTS)
-            response_text = f"登录测试结果: {json.dumps(result, ensure_ascii=False, indent=2)}"
-        
-        elif "测试" in user_input or "test" in user_input.lower():
-            response_text = f"测试执行完成: {json.dumps(random.choice(MOCK_LOGIN_RESULTS), ensure_ascii=False, indent=2)}"
-        
+# 模拟决策：请求中包含 ACTION 返回格式时按该格式回答
+MOCK_DECISIONS = [
+    ('tap_at', {"x": 540, "y": 1200, "relative": False}, "点击登录按钮"),
+    ('input_text', {"text": "600000"}, "输入股票代码"),
+    ('swipe', {"start_x": 540, "start_y": 1500, "end_x": 540, "end_y": 600}, "向上滑动查看更多"),
+    ('back', {}, "返回上一页"),
+]
+
+@dataclass
+class SimulationConfig:
+    """
+    模拟推理的延迟和容量
+    
+    Args:
+        ttft: 首 token 延迟（秒），不含排队时间
+        token_latency: 之后每个 token 的延迟（秒）
+        jitter: 延迟的随机波动比例
+        concurrency: 模型同时处理的请求数，超过时在后端排队
+        error_rate: 请求失败（返回 500）的概率
+        finish_rate: 决策请求返回 finish 的概率
+        seed: 随机种子
+        verbose: 是否打印每个请求
+    """
+    ttft: float = 0.0
+    token_latency: float = 0.0
+    jitter: float = 0.0
+    concurrency: int = 16
+    error_rate: float = 0.0
+    finish_rate: float = 0.0
+    seed: Optional[int] = None
+    verbose: bool = True
+
+def mock_response(user_input: str, rng: random.Random = random, finish_rate: float = 0.0) -> str:
+    """根据输入内容生成模拟响应"""
+    if "ACTION:" in user_input:
+        if rng.random() < finish_rate:
+            return 'ACTION: finish\nPARAMETERS: {"message": "任务完成"}\nDESCRIPTION: 任务已完成'
+        action_type, parameters, description = rng.choice(MOCK_DECISIONS)
+        return (f"ACTION: {action_type}\nPARAMETERS: {json.dumps(parameters, ensure_ascii=False)}\n"
+                f"DESCRIPTION: {description}")
+    
+    if "UI" in user_input or "界面" in user_input or "element" in user_input.lower():
+        response_data = rng.choice(MOCK_UI_RESPONSES)
+        return f"AI分析结果: {json.dumps(response_data, ensure_ascii=False, indent=2)}"
+    
+    if "登录" in user_input or "login" in user_input.lower():
+        result = rng.choice(MOCK_LOGIN_RESULTS)
+        return f"登录测试结果: {json.dumps(result, ensure_ascii=False, indent=2)}"
+    
+    if "测试" in user_input or "test" in user_input.lower():
+        return f"测试执行完成: {json.dumps(rng.choice(MOCK_LOGIN_RESULTS), ensure_ascii=False, indent=2)}"
+    
+    return f"模拟AI响应: 已处理请求 '{user_input[:50]}...'"
+
+class SimulatedError(RuntimeError):
+    """按错误率注入的推理错误"""
+
+class MockBackend(InferenceBackend):
+    """模拟推理后端，每个字符算作一个 token"""
+    
+    def __init__(self, config: Optional[SimulationConfig] = None, max_workers: int = 64):
+        self.config = config or SimulationConfig()
+        self.rng = random.Random(self.config.seed)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mock-inference")
+        self.slots = threading.BoundedSemaphore(self.config.concurrency)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "completed": 0, "errors": 0, "cancelled": 0, "tokens": 0, "running": 0}
+    
+    def submit(self, input_text: str, max_tokens: int, temperature: float,
+               on_token: Optional[Callable[[int], None]] = None) -> Future:
+        # 自行创建 Future：取消后生成循环在下一个 token 前退出并释放并发名额
+        future = Future()
+        self._count("requests")
+        self.executor.submit(self._run, future, input_text, max_tokens, on_token)
+        return future
+    
+    def _run(self, future: Future, input_text: str, max_tokens: int,
+             on_token: Optional[Callable[[int], None]]):
+        try:
+            result = self._generate(future, input_text, max_tokens, on_token)
+        except Exception as e:
+            self._count("errors")
+            self._settle(future.set_exception, e)
         else:
-            response_text = f"模拟AI响应: 已处理请求 '{user_input[:50]}...'"
-        
-        # 构建 OpenAI 兼容的响应
-        response = {
-            "id": f"chatcmpl-{datetime.now().strftime('%Y%m%d%H%M%S')}",
-            "object": "chat.completion",
-            "created": int(datetime.now().timestamp()),
-            "model": "autoglm-phone-9b",
-            "choices": [{
-                "index": 0,
-                "message": {
-                    "role": "assistant",
-                    "content": response_text
-                },
-                "finish_reason": "stop"
-            }],
-            "usage": {
-                "prompt_tokens": len(user_input),
-                "completion_tokens": len(response_text),
-                "total_tokens": len(user_input) + len(response_text)
-            }
+            if result is not None:
+                self._settle(future.set_result, result)
+    
+    @staticmethod
+    def _settle(setter: Callable[[Any], None], value: Any):
+        try:
+            setter(value)
+        except InvalidStateError:
+            # 请求已被取消
+            pass
+    
+    def _count(self, key: str, value: int = 1):
+        with self.lock:
+            self.stats[key] += value
+    
+    def _delay(self, seconds: float):
+        if seconds > 0:
+            time.sleep(seconds * (1 + self.config.jitter * (2 * self.rng.random() - 1)))
+    
+    def _generate(self, future: Future, input_text: str, max_tokens: int,
+                  on_token: Optional[Callable[[int], None]]) -> Optional[GenerationResult]:
+        config = self.config
+        start = time.perf_counter()
+        if config.verbose:
+            print(f"收到请求: {input_text}")
+        with self.slots:
+            self._count("running")
+            try:
+                self._delay(config.ttft)
+                if self.rng.random() < config.error_rate:
+                    raise SimulatedError("模拟推理错误")
+                response_text = mock_response(input_text, self.rng, config.finish_rate)
+                token_ids = [ord(char) for char in response_text][:max_tokens]
+                first_token_at = time.perf_counter()
+                for index, token in enumerate(token_ids):
+                    if future.cancelled():
+                        self._count("cancelled")
+                        return None
+                    if index:
+                        self._delay(config.token_latency)
+                    if on_token is not None:
+                        on_token(token)
+            finally:
+                self._count("running", -1)
+        self._count("completed")
+        self._count("tokens", len(token_ids))
+        if config.verbose:
+            print(f"返回响应: {response_text[:100]}...")
+        return GenerationResult(
+            text=self.decode(token_ids),
+            token_ids=token_ids,
+            prompt_tokens=len(input_text),
+            completion_tokens=len(token_ids),
+            finish_reason="stop" if len(token_ids) == len(response_text) else "length",
+            time_to_first_token=first_token_at - start,
+            duration=time.perf_counter() - start
+        )
+    
+    def decode(self, token_ids: List[int]) -> str:
+        return "".join(chr(token) for token in token_ids)
+    
+    def health(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = dict(self.stats)
+        return {
+            "model_loaded": True,
+            "device": "mock",
+            "service": "AutoGLM-Phone-9B Mock Server",
+            "simulation": {
+                "ttft": self.config.ttft,
+                "token_latency": self.config.token_latency,
+                "concurrency": self.config.concurrency,
+                "error_rate": self.config.error_rate
+            },
+            **stats
         }
-        
-        print(f"返回响应: {response_text[:100]}...")
-        return jsonify(response)
-        
-    except Exception as e:
-        return jsonify({
-            "error": {
-                "message": str(e),
-                "type": "internal_error",
-                "code": "internal_error"
-            }
-        }), 500
-
-@app.route('/v1/models', methods=['GET'])
-def list_models():
-    """列出可用模型"""
-    return jsonify({
-        "object": "list",
-        "data": [{
-            "id": "autoglm-phone-9b",
-            "object": "model",
-            "created": int(datetime.now().timestamp()),
-            "owned_by": "autoglm"
-        }]
-    })
-
-@app.route('/health', methods=['GET'])
-def health_check():
-    """健康检查接口"""
-    return jsonify({
-        "status": "healthy",
-        "model_loaded": True,
-        "device": "mock",
-        "service": "AutoGLM-Phone-9B Mock Server"
-    })
-
-@app.route('/ui/analyze', methods=['POST'])
-def ui_analyze():
+    
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+def create_mock_app(config: Optional[SimulationConfig] = None, **serving_options) -> FastAPI:
+    """
+    创建模拟服务应用
+    
+    Args:
+        config: 模拟参数
+        serving_options: 传给 create_app 的准入控制参数
+    """
+    app = create_app(MockBackend(config), **serving_options)
+    app.post('/ui/analyze')(ui_analyze)
+    return app
+
+async def ui_analyze(request: Request):
     """UI分析接口（自定义）"""
     try:
-        data = request.get_json()
+        data = await request.json()
         screenshot = data.get('screenshot')
         
         # 返回模拟的UI分析结果
@@ -196,18 +296,37 @@ def ui_analyze():
             "confidence": random.uniform(0.85, 0.98)
         }
         
-        return jsonify(response)
+        return response
         
     except Exception as e:
-        return jsonify({
+        return JSONResponse({
             "status": "error",
             "message": str(e)
-        }), 500
+        }, status_code=500)
+
+app = create_mock_app()
 
 def main():
     """主函数"""
-    host = "localhost"
-    port = 8000
+    parser = argparse.ArgumentParser(description="AutoGLM-Phone-9B 模拟模型服务")
+    parser.add_argument("--host", default="localhost", help="服务地址")
+    parser.add_argument("--port", type=int, default=8000, help="服务端口")
+    parser.add_argument("--ttft", type=float, default=0.0, help="首 token 延迟（秒）")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="每个 token 的延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟的随机波动比例")
+    parser.add_argument("--concurrency", type=int, default=16, help="模型同时处理的请求数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="请求失败的概率")
+    parser.add_argument("--finish-rate", type=float, default=0.0, help="决策请求返回 finish 的概率")
+    parser.add_argument("--max-queue", type=int, default=64, help="最大排队请求数，超过时返回 429")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    parser.add_argument("--quiet", action="store_true", help="不打印每个请求")
+    args = parser.parse_args()
+    host, port = args.host, args.port
+    config = SimulationConfig(
+        ttft=args.ttft, token_latency=args.token_latency, jitter=args.jitter,
+        concurrency=args.concurrency, error_rate=args.error_rate, finish_rate=args.finish_rate,
+        seed=args.seed, verbose=not args.quiet
+    )
     
     print("🚀 AutoGLM-Phone-9B 模拟模型服务启动")
     print("=" * 50)
@@ -216,19 +335,20 @@ def main():
     print(f"  - POST /v1/chat/completions")
     print(f"  - GET  /v1/models")
     print(f"  - GET  /health")
+    print(f"  - GET  /metrics")
     print(f"  - POST /ui/analyze")
     print("\n📋 模拟功能:")
     print("  - UI元素识别和分析")
     print("  - 登录流程测试")
     print("  - 智能操作决策")
+    print(f"  - 首token延迟 {config.ttft}s, 每token {config.token_latency}s, "
+          f"并发 {config.concurrency}, 错误率 {config.error_rate:.0%}")
     print("\n⚠️  注意：这是模拟服务，用于测试集成流程")
     print("按 Ctrl+C 停止服务")
     
-    try:
-        app.run(host=host, port=port, debug=False)
-    except KeyboardInterrupt:
-        print("\n正在停止服务...")
-        print("服务已停止")
+    # 模型并发之外再留出排队余量，由服务层返回 429
+    run_server(create_mock_app(config, max_concurrency=args.concurrency * 2, max_queue=args.max_queue), host, port)
+    print("服务已停止")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
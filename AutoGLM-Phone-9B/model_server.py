@@ -6,203 +6,267 @@ AutoGLM-Phone-9B 模型服务
 
 import os
 import sys
-import json
+import argparse
+import threading
+import time
 import torch
+from concurrent.futures import Future
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Callable, Optional
 
 # 添加 Open-AutoGLM 路径
 sys.path.append(str(Path(__file__).parent.parent / "Open-AutoGLM"))
 
 try:
     from transformers import AutoTokenizer, AutoModelForCausalLM, AutoModel
-    from flask import Flask, request, jsonify
     import yaml
 except ImportError:
     print("正在安装依赖...")
-    os.system("pip install transformers flask torch pyyaml")
+    os.system("pip install transformers torch pyyaml")
     from transformers import AutoTokenizer, AutoModelForCausalLM, AutoModel
-    from flask import Flask, request, jsonify
     import yaml
 
-app = Flask(__name__)
+from backend import GenerationResult, InferenceBackend, Messages
+from prefix_cache import PrefixCache
+from quantization import QUANTIZATION_MODES, count_quantized_layers, model_memory_bytes, quantize_int8
+from scheduler import BatchScheduler
+from response_cache import ResponseCache
+from serving import create_app, run_server
 
-class ModelServer:
-    def __init__(self, model_path: str, host: str = "localhost", port: int = 8000):
+# 预热用的提示词，按批内序号重复不同次数，使预热批次包含不同长度和填充
+WARMUP_PROMPT = "你是安卓自动化操作助手，根据当前屏幕决定下一步操作。"
+
+class ModelNotReady(RuntimeError):
+    """模型尚未加载、预热完成或加载失败时提交了请求"""
+
+
+class ModelServer(InferenceBackend):
+    def __init__(self, model_path: str, host: str = "localhost", port: int = 8000,
+                 max_batch_size: int = 8, prefix_cache_mb: int = 1024, quantization: str = "none",
+                 warmup_batch: Optional[int] = None, warmup_tokens: int = 16):
         self.model_path = model_path
         self.host = host
         self.port = port
+        self.max_batch_size = max_batch_size
+        # 决策提示词共享相同的指令前缀，缓存其 KV 避免每次重新编码
+        self.prefix_cache = PrefixCache(max_bytes=prefix_cache_mb * 1024 * 1024)
         self.model = None
         self.tokenizer = None
+        self.scheduler = None
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        # 动态 int8 量化只有 CPU 内核
+        self.quantization = quantization if self.device == "cpu" else "none"
+        self.memory_report: Dict[str, Any] = {}
+        # 预热批大小默认等于最大批大小，让内核初始化和显存分配器增长发生在就绪之前
+        self.warmup_batch = max_batch_size if warmup_batch is None else warmup_batch
+        self.warmup_tokens = warmup_tokens
+        # loading -> warming_up -> ready，加载或预热出错时为 failed
+        self.state = "loading"
+        self.startup: Dict[str, Any] = {}
+        self._created = time.monotonic()
         
         print(f"模型服务配置:")
         print(f"  模型路径: {model_path}")
         print(f"  服务地址: {host}:{port}")
         print(f"  设备: {self.device}")
+        print(f"  最大批大小: {max_batch_size}")
+        print(f"  前缀缓存: {prefix_cache_mb}MB")
+        print(f"  量化: {self.quantization}")
+        print(f"  预热批大小: {self.warmup_batch}")
+        if quantization != self.quantization:
+            print(f"⚠ {quantization} 量化仅支持 CPU，已忽略")
     
+    def start_loading(self) -> threading.Thread:
+        """在后台线程中加载模型并预热，服务可以先开始监听，/health 在此期间返回 loading"""
+        thread = threading.Thread(target=self._load_and_warmup, name="model-loader", daemon=True)
+        thread.start()
+        return thread
+
+    def _load_and_warmup(self):
+        if not self.load_model():
+            self.state = "failed"
+            return
+        self.state = "warming_up"
+        try:
+            self.warmup()
+        except Exception as e:
+            print(f"✗ 模型预热失败: {e}")
+            self.state = "failed"
+            return
+        self.startup["cold_start_seconds"] = round(time.monotonic() - self._created, 3)
+        self.state = "ready"
+        print(f"✓ 模型服务就绪，冷启动耗时 {self.startup['cold_start_seconds']}s")
+
+    def _has_safetensors(self) -> bool:
+        return any(Path(self.model_path).glob("*.safetensors"))
+
     def load_model(self):
-        """加载模型"""
+        """加载模型，有 safetensors 权重时通过 mmap 直接映射，不经过 pickle 反序列化"""
         print("正在加载模型...")
         
         try:
+            start = time.monotonic()
             # 加载分词器
             self.tokenizer = AutoTokenizer.from_pretrained(
                 self.model_path,
                 trust_remote_code=True
             )
+            self.startup["tokenizer_seconds"] = round(time.monotonic() - start, 3)
             
+            use_safetensors = self._has_safetensors()
+            self.startup["safetensors"] = use_safetensors
+            if not use_safetensors:
+                print("⚠ 未找到 safetensors 权重，使用 PyTorch 权重文件加载")
+            
+            start = time.monotonic()
             # 使用 AutoModel 而不是 AutoModelForCausalLM，因为 AutoGLM-Phone-9B 使用特殊的配置类
             self.model = AutoModel.from_pretrained(
                 self.model_path,
                 torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
                 device_map="auto" if self.device == "cuda" else None,
-                trust_remote_code=True
+                trust_remote_code=True,
+                low_cpu_mem_usage=True,
+                use_safetensors=use_safetensors
             )
             
             if self.device == "cpu":
                 self.model = self.model.to(self.device)
+            self.model.eval()
+            self.startup["weights_seconds"] = round(time.monotonic() - start, 3)
             
-            print("✓ 模型加载成功！")
+            self.memory_report["weights_mb"] = round(model_memory_bytes(self.model) / 1024 ** 2, 1)
+            if self.quantization == "int8":
+                print("正在进行 int8 动态量化...")
+                start = time.monotonic()
+                quantize_int8(self.model)
+                self.startup["quantize_seconds"] = round(time.monotonic() - start, 3)
+                self.memory_report["float32_weights_mb"] = self.memory_report["weights_mb"]
+                self.memory_report["weights_mb"] = round(model_memory_bytes(self.model) / 1024 ** 2, 1)
+                self.memory_report["quantized_layers"] = count_quantized_layers(self.model)
+                print(f"✓ 已量化 {self.memory_report['quantized_layers']} 个线性层")
+            print(f"  模型权重内存: {self.memory_report}")
+            
+            # 并发请求经调度器合并为批次，解码步骤之间可以加入新请求
+            self.scheduler = BatchScheduler(
+                self.model, self.tokenizer, self.device, max_batch_size=self.max_batch_size,
+                prefix_cache=self.prefix_cache
+            )
+            self.scheduler.start()
+            
+            print(f"✓ 模型加载成功！耗时 {round(time.monotonic() - self._created, 1)}s")
             return True
             
         except Exception as e:
             print(f"✗ 模型加载失败: {e}")
+            self.startup["error"] = str(e)
             return False
     
-    def generate_response(self, messages: List[Dict[str, str]], 
-                         max_tokens: int = 3000, 
-                         temperature: float = 0.1) -> str:
-        """生成响应"""
-        try:
-            # 构建输入文本
-            if isinstance(messages, str):
-                input_text = messages
-            else:
-                # 简化的消息格式处理
-                input_text = ""
-                for msg in messages:
-                    if msg.get("role") == "user":
-                        input_text = msg.get("content", "")
-                        break
-            
-            if not input_text:
-                return "请输入有效的问题"
-            
-            # 编码输入
-            inputs = self.tokenizer(input_text, return_tensors="pt").to(self.device)
-            
-            # 生成响应
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    **inputs,
-                    max_new_tokens=max_tokens,
-                    temperature=temperature,
-                    do_sample=True,
-                    pad_token_id=self.tokenizer.eos_token_id
-                )
-            
-            # 解码输出
-            response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-            
-            # 移除输入部分，只保留生成的内容
-            if input_text in response:
-                response = response.replace(input_text, "").strip()
-            
-            return response
-            
-        except Exception as e:
-            print(f"生成响应时出错: {e}")
-            return f"生成响应失败: {str(e)}"
-
-# 创建全局模型服务实例
-model_server = None
+    def warmup(self):
+        """
+        通过调度器生成一批请求，完成内核初始化、显存分配器增长和批量预填充/解码的首次执行，
+        避免第一个真实请求承担这些开销
+        """
+        if self.warmup_batch <= 0:
+            self.startup["warmup_seconds"] = 0.0
+            return
+        print(f"正在预热（批大小 {self.warmup_batch}，每个请求 {self.warmup_tokens} 个 token）...")
+        start = time.monotonic()
+        futures = [
+            self.scheduler.submit(WARMUP_PROMPT * (index + 1), self.warmup_tokens, 0.1)
+            for index in range(self.warmup_batch)
+        ]
+        for future in futures:
+            future.result()
+        if self.device == "cuda":
+            torch.cuda.synchronize()
+        self.startup["warmup_seconds"] = round(time.monotonic() - start, 3)
+        print(f"✓ 预热完成，耗时 {self.startup['warmup_seconds']}s")
+    
+    def submit(self, input_text: str, max_tokens: int = 3000, temperature: float = 0.1,
+               on_token: Optional[Callable[[int], None]] = None) -> Future:
+        """
+        提交到调度器，与其他并发请求一起批量生成，结果为 GenerationResult
 
-@app.route('/v1/chat/completions', methods=['POST'])
-def chat_completions():
-    """OpenAI 兼容的聊天完成接口"""
-    try:
-        data = request.get_json()
-        
-        messages = data.get('messages', [])
-        max_tokens = data.get('max_tokens', 3000)
-        temperature = data.get('temperature', 0.1)
-        model = data.get('model', 'autoglm-phone-9b')
-        
-        # 生成响应
-        response_text = model_server.generate_response(
-            messages, max_tokens, temperature
-        )
-        
-        # 构建 OpenAI 兼容的响应格式
-        response = {
-            "id": f"chatcmpl-{hash(str(messages))}",
-            "object": "chat.completion",
-            "created": int(torch.cuda.Event().elapsed_time(torch.cuda.Event()) / 1000) if torch.cuda.is_available() else 0,
-            "model": model,
-            "choices": [{
-                "index": 0,
-                "message": {
-                    "role": "assistant",
-                    "content": response_text
-                },
-                "finish_reason": "stop"
-            }],
-            "usage": {
-                "prompt_tokens": len(str(messages)),
-                "completion_tokens": len(response_text),
-                "total_tokens": len(str(messages)) + len(response_text)
-            }
+        Raises:
+            ModelNotReady: 模型未就绪
+        """
+        if not self.ready:
+            raise ModelNotReady(f"模型未就绪（{self.state}）")
+        return self.scheduler.submit(input_text, max_tokens, temperature, on_token=on_token)
+    
+    def decode(self, token_ids: List[int]) -> str:
+        return self.tokenizer.decode(token_ids, skip_special_tokens=True)
+    
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+    
+    @property
+    def status(self) -> str:
+        if self.state == "failed":
+            return "failed"
+        return "healthy" if self.ready else "loading"
+    
+    def health(self) -> Dict[str, Any]:
+        scheduler = self.scheduler
+        return {
+            "model_loaded": self.model is not None,
+            "state": self.state,
+            "startup": self.startup,
+            "device": self.device,
+            "quantization": self.quantization,
+            "memory": self.memory_report,
+            "scheduler": {
+                **scheduler.stats,
+                "mean_batch_size": round(scheduler.mean_batch_size, 2)
+            } if scheduler else None,
+            "prefix_cache": self.prefix_cache.stats
         }
+    
+    def close(self):
+        if self.scheduler is not None:
+            self.scheduler.stop()
+    
+    def generate_response(self, messages: Messages, 
+                         max_tokens: int = 3000, 
+                         temperature: float = 0.1) -> GenerationResult:
+        """
+        生成响应
         
-        return jsonify(response)
+        Returns:
+            GenerationResult，text 只包含新生成的内容
         
-    except Exception as e:
-        return jsonify({
-            "error": {
-                "message": str(e),
-                "type": "internal_error",
-                "code": "internal_error"
-            }
-        }), 500
-
-@app.route('/v1/models', methods=['GET'])
-def list_models():
-    """列出可用模型"""
-    return jsonify({
-        "object": "list",
-        "data": [{
-            "id": "autoglm-phone-9b",
-            "object": "model",
-            "created": 0,
-            "owned_by": "autoglm"
-        }]
-    })
-
-@app.route('/health', methods=['GET'])
-def health_check():
-    """健康检查接口"""
-    return jsonify({
-        "status": "healthy",
-        "model_loaded": model_server.model is not None,
-        "device": model_server.device
-    })
+        Raises:
+            ValueError: 消息中没有输入文本
+            ModelNotReady: 模型未就绪
+        """
+        input_text = self.build_input(messages)
+        if not input_text:
+            raise ValueError("请输入有效的问题")
+        return self.submit(input_text, max_tokens, temperature).result()
 
 def main():
-    global model_server
-    
-    # 默认模型路径
-    model_path = "./autoglm-phone-9b"
-    host = "localhost"
-    port = 8000
-    
     # 检查命令行参数
-    if len(sys.argv) > 1:
-        model_path = sys.argv[1]
-    if len(sys.argv) > 2:
-        host = sys.argv[2]
-    if len(sys.argv) > 3:
-        port = int(sys.argv[3])
+    parser = argparse.ArgumentParser(description="AutoGLM-Phone-9B 模型服务")
+    parser.add_argument("model_path", nargs="?", default="./autoglm-phone-9b", help="模型路径")
+    parser.add_argument("host", nargs="?", default="localhost", help="服务地址")
+    parser.add_argument("port", nargs="?", type=int, default=8000, help="服务端口")
+    parser.add_argument("max_batch_size", nargs="?", type=int, default=8, help="最大批大小")
+    parser.add_argument("--prefix-cache-mb", type=int, default=1024, help="前缀 KV 缓存大小（MB）")
+    parser.add_argument("--quantize", choices=QUANTIZATION_MODES, default="none",
+                        help="CPU 推理时的量化方式，int8 为线性层动态量化")
+    parser.add_argument("--warmup-batch", type=int, default=None,
+                        help="就绪前预热的批大小，默认等于最大批大小，0 为不预热")
+    parser.add_argument("--warmup-tokens", type=int, default=16, help="预热请求生成的 token 数")
+    parser.add_argument("--max-concurrency", type=int, default=16, help="同时推理的最大请求数")
+    parser.add_argument("--max-queue", type=int, default=64, help="最大排队请求数，超过时返回 429")
+    parser.add_argument("--request-timeout", type=float, default=300.0, help="单个请求的超时时间（秒）")
+    parser.add_argument("--response-cache-entries", type=int, default=1024,
+                        help="温度为0的请求的响应缓存条目数，0 为不缓存")
+    parser.add_argument("--response-cache-mb", type=int, default=64, help="响应缓存大小（MB）")
+    parser.add_argument("--response-cache-path", default=None, help="响应缓存持久化文件，停止服务时保存")
+    args = parser.parse_args()
+    model_path, host, port = args.model_path, args.host, args.port
     
     # 检查模型路径
     if not Path(model_path).exists():
@@ -211,24 +275,38 @@ def main():
         return False
     
     # 创建并启动模型服务
-    model_server = ModelServer(model_path, host, port)
+    model_server = ModelServer(
+        model_path, host, port, args.max_batch_size,
+        prefix_cache_mb=args.prefix_cache_mb, quantization=args.quantize,
+        warmup_batch=args.warmup_batch, warmup_tokens=args.warmup_tokens
+    )
     
-    if not model_server.load_model():
-        return False
+    # 先开始监听，模型在后台加载和预热，就绪前 /health 返回 loading，推理请求返回 503
+    model_server.start_loading()
     
-    print(f"\n🚀 模型服务启动成功！")
+    print(f"\n🚀 模型服务已启动，模型加载中")
     print(f"服务地址: http://{host}:{port}")
     print(f"API 端点:")
     print(f"  - POST /v1/chat/completions")
     print(f"  - GET  /v1/models")
     print(f"  - GET  /health")
+    print(f"  - GET  /metrics")
     print(f"\n按 Ctrl+C 停止服务")
     
-    try:
-        app.run(host=host, port=port, debug=False)
-    except KeyboardInterrupt:
-        print("\n正在停止服务...")
-        print("服务已停止")
+    app = create_app(
+        model_server,
+        max_concurrency=args.max_concurrency,
+        max_queue=args.max_queue,
+        request_timeout=args.request_timeout,
+        response_cache=ResponseCache(
+            max_entries=args.response_cache_entries,
+            max_bytes=args.response_cache_mb * 1024 * 1024,
+            path=args.response_cache_path
+        ) if args.response_cache_entries > 0 else None
+    )
+    # 服务停止时由 create_app 的 lifespan 关闭调度器
+    run_server(app, host, port)
+    print("服务已停止")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+前缀 KV 缓存
+决策提示词都以相同的长指令开头，预填充时可以从缓存中取出最长的已计算前缀，
+只对剩余部分做前向计算。
+
+前缀按固定长度的块切分，每个块边界处的哈希由前一个哈希和本块 token 链式计算，
+因此只要哈希相同即代表整个前缀相同。缓存条目保存一个请求提示词（截到块边界）的
+past-key-values，条目的每个块边界都登记到索引中，命中较短前缀时对条目切片即可。
+条目按 LRU 淘汰，总大小不超过 max_bytes。
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import torch
+
+# 逐层 (key, value)，形状为 [1, heads, seq, head_dim]
+LegacyCache = Tuple[Tuple[torch.Tensor, torch.Tensor], ...]
+
+
+def prefix_hashes(token_ids: List[int], block_size: int) -> List[str]:
+    """各块边界处的前缀哈希，第 i 个元素对应前 (i+1)*block_size 个 token"""
+    hashes = []
+    digest = b""
+    for end in range(block_size, len(token_ids) + 1, block_size):
+        block = ",".join(str(token) for token in token_ids[end - block_size:end])
+        digest = hashlib.sha1(digest + block.encode()).digest()
+        hashes.append(digest.hex())
+    return hashes
+
+
+def cache_bytes(past: LegacyCache) -> int:
+    return sum(key.numel() * key.element_size() + value.numel() * value.element_size() for key, value in past)
+
+
+@dataclass
+class PrefixEntry:
+    """缓存条目：一个前缀的 past-key-values 及其各块边界哈希"""
+    past: LegacyCache
+    hashes: List[str]
+    size: int = field(init=False)
+
+    def __post_init__(self):
+        self.size = cache_bytes(self.past)
+
+
+class PrefixCache:
+    """按内存大小限制的 LRU 前缀缓存，线程安全"""
+
+    def __init__(self, max_bytes: int = 1 << 30, block_size: int = 16):
+        """
+        初始化前缀缓存
+
+        Args:
+            max_bytes: 缓存的 past-key-values 总字节数上限
+            block_size: 前缀块大小（token 数），只有块边界处的前缀会被复用
+        """
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self.bytes = 0
+        self.lookups = 0
+        self.hits = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.evictions = 0
+
+        self._entries: "OrderedDict[str, PrefixEntry]" = OrderedDict()
+        # 块边界哈希 -> (条目键, 前缀长度)
+        self._index: Dict[str, Tuple[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, token_ids: List[int]) -> Tuple[int, Optional[LegacyCache]]:
+        """
+        查找最长的已缓存前缀，至少保留一个 token 不命中以便计算下一个 token 的 logits
+
+        Args:
+            token_ids: 提示词 token
+
+        Returns:
+            (命中的前缀长度, 对应的 past-key-values)，未命中时为 (0, None)
+        """
+        hashes = prefix_hashes(token_ids[:-1], self.block_size)
+        with self._lock:
+            self.lookups += 1
+            self.prompt_tokens += len(token_ids)
+            for digest in reversed(hashes):
+                location = self._index.get(digest)
+                if location is None:
+                    continue
+                key, length = location
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.cached_tokens += length
+                past = tuple((k[:, :, :length], v[:, :, :length]) for k, v in self._entries[key].past)
+                return length, past
+        return 0, None
+
+    def insert(self, token_ids: List[int], past: LegacyCache):
+        """
+        缓存提示词的 past-key-values，截到最后一个块边界
+
+        Args:
+            token_ids: 提示词 token
+            past: 与 token_ids 等长的 past-key-values，批大小为1
+        """
+        hashes = prefix_hashes(token_ids, self.block_size)
+        if not hashes:
+            return
+        key = hashes[-1]
+        length = len(hashes) * self.block_size
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            # 复制一份，避免切片引用整个批次的张量
+            entry = PrefixEntry(
+                tuple((k[:, :, :length].clone(), v[:, :, :length].clone()) for k, v in past), hashes
+            )
+            if entry.size > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self.bytes += entry.size
+            # 共享前缀指向最新的条目，淘汰旧条目后仍然可以命中
+            for i, digest in enumerate(hashes):
+                self._index[digest] = (key, (i + 1) * self.block_size)
+            self._evict()
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._entries:
+            key, entry = self._entries.popitem(last=False)
+            self.bytes -= entry.size
+            self.evictions += 1
+            for digest in entry.hashes:
+                if self._index.get(digest, (None,))[0] == key:
+                    del self._index[digest]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+            self.bytes = 0
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        """命中率、命中 token 比例和内存占用"""
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_ratio": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            "token_hit_ratio": round(self.cached_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+CPU int8 推理
+对线性层做动态 int8 量化：权重按输出通道量化为 int8 保存，激活在推理时按批动态量化，
+权重内存约为 float32 的四分之一，CPU 上矩阵乘法使用 int8 内核。
+输出层（lm_head）默认保留 float32，对生成结果影响最大。
+"""
+
+from typing import Iterable
+
+import torch
+from torch import nn
+
+QUANTIZATION_MODES = ("none", "int8")
+
+# 不量化的线性层名称（模块名的最后一段）
+DEFAULT_SKIP_MODULES = ("lm_head", "output_layer")
+
+
+def quantize_int8(model: nn.Module, skip_modules: Iterable[str] = DEFAULT_SKIP_MODULES) -> nn.Module:
+    """
+    对模型中的线性层做动态 int8 量化（原地修改）
+
+    Args:
+        model: float32 模型，必须在 CPU 上
+        skip_modules: 保持 float32 的线性层名称
+
+    Returns:
+        量化后的模型
+    """
+    skip = set(skip_modules)
+    qconfig = torch.ao.quantization.per_channel_dynamic_qconfig
+    spec = {
+        name: qconfig for name, module in model.named_modules()
+        if isinstance(module, nn.Linear) and name.rsplit(".", 1)[-1] not in skip
+    }
+    return torch.ao.quantization.quantize_dynamic(model, spec, dtype=torch.qint8, inplace=True)
+
+
+def _tensor_bytes(value) -> int:
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    if isinstance(value, (tuple, list)):
+        return sum(_tensor_bytes(item) for item in value)
+    return 0
+
+
+def model_memory_bytes(model: nn.Module) -> int:
+    """
+    模型权重占用的内存
+
+    量化线性层的打包权重不是 Parameter，因此按 state_dict 统计。
+    """
+    return sum(_tensor_bytes(value) for value in model.state_dict().values())
+
+
+def count_quantized_layers(model: nn.Module) -> int:
+    return sum(1 for module in model.modules() if isinstance(module, torch.ao.nn.quantized.dynamic.Linear))
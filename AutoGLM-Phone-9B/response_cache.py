@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+确定性请求的响应缓存
+温度为0时相同的消息和截图一定得到相同的输出，重试或多台设备停在同一界面时
+可以直接返回缓存结果，不再重新生成。
+
+缓存键是消息的规范化哈希：JSON 按键排序序列化，图片内容（data URL 或 base64）
+替换为其数据的 SHA-256，因此同一张截图无论出现在哪条消息里都得到相同的键。
+按条目数和字节数做 LRU 淘汰，可以保存到磁盘并在启动时加载。
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from backend import GenerationResult, Messages
+
+# 温度不超过该值时视为确定性请求
+DETERMINISTIC_TEMPERATURE = 1e-5
+
+
+def image_digest(url: str) -> str:
+    """图片数据的哈希，data URL 按解码后的字节计算，其他 URL 按字符串计算"""
+    if url.startswith("data:") and "," in url:
+        header, data = url.split(",", 1)
+        if header.endswith(";base64"):
+            try:
+                return "sha256:" + hashlib.sha256(base64.b64decode(data)).hexdigest()
+            except (binascii.Error, ValueError):
+                pass
+        return "sha256:" + hashlib.sha256(data.encode()).hexdigest()
+    return "sha256:" + hashlib.sha256(url.encode()).hexdigest()
+
+
+def canonical_messages(messages: Messages) -> Any:
+    """把消息中的图片替换为哈希，其余内容保持不变"""
+    if isinstance(messages, list):
+        return [canonical_messages(item) for item in messages]
+    if not isinstance(messages, dict):
+        return messages
+    if messages.get("type") == "image_url":
+        image = messages.get("image_url")
+        url = image.get("url", "") if isinstance(image, dict) else str(image)
+        return {"type": "image_url", "image_url": image_digest(url)}
+    if messages.get("type") == "image" and isinstance(messages.get("image"), str):
+        return {"type": "image", "image": image_digest(messages["image"])}
+    return {key: canonical_messages(value) for key, value in messages.items()}
+
+
+def request_key(messages: Messages, model: str, max_tokens: int) -> str:
+    """请求的缓存键"""
+    body = {"model": model, "max_tokens": max_tokens, "messages": canonical_messages(messages)}
+    return hashlib.sha256(
+        json.dumps(body, sort_keys=True, ensure_ascii=False, separators=(",", ":")).encode()
+    ).hexdigest()
+
+
+class ResponseCache:
+    """按条目数和字节数限制的 LRU 响应缓存，线程安全"""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024,
+                 path: Optional[str] = None):
+        """
+        初始化响应缓存
+
+        Args:
+            max_entries: 最大条目数
+            max_bytes: 缓存内容的最大字节数（按序列化后的大小计算）
+            path: 持久化文件路径，存在时立即加载
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.path = Path(path) if path else None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        if self.path and self.path.exists():
+            self.load()
+
+    @staticmethod
+    def cacheable(temperature: float) -> bool:
+        return temperature <= DETERMINISTIC_TEMPERATURE
+
+    def get(self, key: str) -> Optional[GenerationResult]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return GenerationResult(**entry)
+
+    def put(self, key: str, result: GenerationResult):
+        """缓存生成结果，只缓存正常结束的结果"""
+        if result.finish_reason not in ("stop", "length"):
+            return
+        entry = asdict(result)
+        size = len(json.dumps(entry, ensure_ascii=False).encode())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = entry
+            self._sizes[key] = size
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _discard(self, key: str):
+        if key in self._entries:
+            del self._entries[key]
+            self.bytes -= self._sizes.pop(key)
+
+    def load(self):
+        """从磁盘加载缓存，文件损坏时从空缓存开始"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠ 响应缓存加载失败: {e}")
+            return
+        for key, entry in entries.items():
+            self.put(key, GenerationResult(**entry))
+        print(f"✓ 已加载 {len(self._entries)} 条响应缓存")
+
+    def save(self):
+        """保存到磁盘（先写临时文件再替换）"""
+        if not self.path:
+            return
+        with self._lock:
+            entries = dict(self._entries)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions
+        }
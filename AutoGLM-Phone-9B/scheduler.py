@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+连续批处理调度器
+多个请求共享一次前向计算：新请求先按长度分组做预填充（prefill），
+然后加入正在解码的批次，每个解码步骤之间都可以有新请求加入、已完成的请求退出。
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional, Tuple
+
+import torch
+
+from backend import GenerationResult
+from prefix_cache import PrefixCache
+
+try:
+    from transformers.cache_utils import DynamicCache
+except ImportError:
+    DynamicCache = None
+
+# 逐层 (key, value)，形状为 [batch, heads, seq, head_dim]
+LegacyCache = Tuple[Tuple[torch.Tensor, torch.Tensor], ...]
+
+
+@dataclass
+class Sequence:
+    """调度中的单个请求"""
+    prompt_ids: List[int]
+    max_new_tokens: int
+    temperature: float
+    future: Future = field(default_factory=Future)
+    generated: List[int] = field(default_factory=list)
+    submitted_at: float = field(default_factory=time.perf_counter)
+    first_token_at: Optional[float] = None
+    on_token: Optional[Callable[[int], None]] = None
+    prefix_length: int = 0
+    prefix_past: Optional[LegacyCache] = None
+
+    @property
+    def suffix_ids(self) -> List[int]:
+        """前缀缓存未命中、需要预填充的部分"""
+        return self.prompt_ids[self.prefix_length:]
+
+
+def to_legacy_cache(past: Any) -> LegacyCache:
+    """把模型返回的缓存转换为逐层元组"""
+    if DynamicCache is not None and isinstance(past, DynamicCache):
+        return past.to_legacy_cache()
+    return tuple((layer[0], layer[1]) for layer in past)
+
+
+def from_legacy_cache(past: LegacyCache) -> Any:
+    """把逐层元组转换为模型接受的缓存格式"""
+    if DynamicCache is not None:
+        return DynamicCache.from_legacy_cache(past)
+    return past
+
+
+def left_pad_cache(past: LegacyCache, length: int) -> LegacyCache:
+    """在序列维度左侧补零到指定长度"""
+    current = past[0][0].shape[2]
+    if current == length:
+        return past
+    padded = []
+    for key, value in past:
+        shape = list(key.shape)
+        shape[2] = length - current
+        zeros = key.new_zeros(shape)
+        padded.append((torch.cat([zeros, key], dim=2), torch.cat([zeros, value], dim=2)))
+    return tuple(padded)
+
+
+def sample_tokens(logits: torch.Tensor, temperatures: List[float]) -> List[int]:
+    """按各请求的温度采样，温度接近0时取概率最大的 token"""
+    tokens = []
+    for row, temperature in zip(logits, temperatures):
+        if temperature <= 1e-5:
+            tokens.append(int(torch.argmax(row)))
+        else:
+            probs = torch.softmax(row.float() / temperature, dim=-1)
+            tokens.append(int(torch.multinomial(probs, 1)))
+    return tokens
+
+
+class BatchScheduler:
+    """连续批处理调度器，所有模型计算都在调度线程中进行"""
+
+    def __init__(self, model, tokenizer, device: str = "cpu",
+                 max_batch_size: int = 8, max_padding_ratio: float = 0.25,
+                 prefix_cache: Optional[PrefixCache] = None):
+        """
+        初始化调度器
+
+        Args:
+            model: 因果语言模型
+            tokenizer: 分词器
+            device: 计算设备
+            max_batch_size: 同时解码的最大请求数
+            max_padding_ratio: 预填充分组时允许的最大填充比例，超过时拆成多组
+            prefix_cache: 前缀 KV 缓存，预填充从最长的已缓存前缀继续
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.max_padding_ratio = max_padding_ratio
+        self.prefix_cache = prefix_cache
+        self.eos_token_id = tokenizer.eos_token_id
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else (self.eos_token_id or 0)
+        self.stats = {
+            "requests": 0, "completed": 0, "prefill_batches": 0, "decode_steps": 0,
+            "generated_tokens": 0, "batch_rows": 0, "padding_tokens": 0, "prompt_tokens": 0
+        }
+
+        self._waiting: "queue.Queue[Sequence]" = queue.Queue()
+        self._running: List[Sequence] = []
+        self._past: Optional[LegacyCache] = None
+        self._mask: Optional[torch.Tensor] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """启动调度线程"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="batch-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """停止调度线程，未完成的请求以异常结束"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        pending = list(self._running)
+        while not self._waiting.empty():
+            pending.append(self._waiting.get_nowait())
+        for seq in pending:
+            self._settle(seq.future.set_exception, RuntimeError("调度器已停止"))
+        self._running, self._past, self._mask = [], None, None
+
+    def submit(self, prompt: str, max_new_tokens: int = 256, temperature: float = 0.1,
+               on_token: Optional[Callable[[int], None]] = None) -> Future:
+        """
+        提交生成请求
+
+        Args:
+            prompt: 输入文本
+            max_new_tokens: 最大生成 token 数
+            temperature: 采样温度
+            on_token: 每生成一个 token 时在调度线程中调用（不含结束符），应尽快返回
+
+        Returns:
+            Future，结果为 GenerationResult；取消 Future 会让请求在下一步退出批次
+        """
+        seq = Sequence(
+            prompt_ids=self.tokenizer(prompt)["input_ids"],
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            on_token=on_token
+        )
+        self.stats["requests"] += 1
+        self._waiting.put(seq)
+        return seq.future
+
+    def generate(self, prompt: str, max_new_tokens: int = 256, temperature: float = 0.1) -> GenerationResult:
+        """提交请求并等待结果"""
+        return self.submit(prompt, max_new_tokens, temperature).result()
+
+    @property
+    def mean_batch_size(self) -> float:
+        """平均每个解码步骤的请求数"""
+        steps = self.stats["decode_steps"]
+        return self.stats["batch_rows"] / steps if steps else 0.0
+
+    # ---- 调度线程 ----
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            admitted = self._admit()
+            try:
+                if admitted:
+                    if self.prefix_cache is not None:
+                        for seq in admitted:
+                            seq.prefix_length, seq.prefix_past = self.prefix_cache.lookup(seq.prompt_ids)
+                    for group in self._group_by_length(admitted):
+                        self._prefill(group)
+                if self._running:
+                    self._decode_step()
+            except Exception as e:
+                # 出错时结束当前批次的所有请求，调度线程继续服务新请求
+                for seq in self._running + admitted:
+                    self._settle(seq.future.set_exception, e)
+                self._running, self._past, self._mask = [], None, None
+
+    def _admit(self) -> List[Sequence]:
+        """取出等待中的请求，批次为空时阻塞等待"""
+        admitted = []
+        capacity = self.max_batch_size - len(self._running)
+        while len(admitted) < capacity:
+            try:
+                block = not self._running and not admitted
+                seq = self._waiting.get(timeout=0.05) if block else self._waiting.get_nowait()
+            except queue.Empty:
+                break
+            # 排队期间已取消的请求不再预填充
+            if not seq.future.cancelled():
+                admitted.append(seq)
+        return admitted
+
+    def _group_by_length(self, seqs: List[Sequence]) -> List[List[Sequence]]:
+        """按需要预填充的长度排序后分组，组内填充比例不超过 max_padding_ratio"""
+        groups: List[List[Sequence]] = []
+        for seq in sorted(seqs, key=lambda s: len(s.suffix_ids)):
+            if groups:
+                group = groups[-1]
+                longest = len(seq.suffix_ids)
+                padding = sum(longest - len(s.suffix_ids) for s in group)
+                if padding <= self.max_padding_ratio * longest * (len(group) + 1):
+                    group.append(seq)
+                    continue
+            groups.append([seq])
+        return groups
+
+    def _prefill(self, group: List[Sequence]):
+        """
+        对一组新请求做预填充，采样第一个 token 并加入解码批次
+
+        每行由两段组成：左填充的已缓存前缀和左填充的待计算部分，
+        中间的填充位置由 attention mask 屏蔽，position_ids 按实际 token 计数。
+        """
+        prefix_length = max(seq.prefix_length for seq in group)
+        length = max(len(seq.suffix_ids) for seq in group)
+        input_ids = torch.full((len(group), length), self.pad_token_id, dtype=torch.long)
+        mask = torch.zeros((len(group), prefix_length + length), dtype=torch.long)
+        for row, seq in enumerate(group):
+            suffix = seq.suffix_ids
+            input_ids[row, length - len(suffix):] = torch.tensor(suffix)
+            mask[row, prefix_length - seq.prefix_length:prefix_length] = 1
+            mask[row, prefix_length + length - len(suffix):] = 1
+        input_ids, mask = input_ids.to(self.device), mask.to(self.device)
+        position_ids = (mask.cumsum(-1) - 1).clamp(min=0)[:, prefix_length:]
+
+        past = None
+        if prefix_length:
+            past = from_legacy_cache(self._stack_prefixes(group, prefix_length))
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=input_ids, attention_mask=mask, position_ids=position_ids,
+                past_key_values=past, use_cache=True
+            )
+        suffix_mask = mask[:, prefix_length:]
+        self.stats["prefill_batches"] += 1
+        self.stats["prompt_tokens"] += int(suffix_mask.sum())
+        self.stats["padding_tokens"] += int(suffix_mask.numel() - suffix_mask.sum())
+
+        tokens = sample_tokens(outputs.logits[:, -1, :], [seq.temperature for seq in group])
+        now = time.perf_counter()
+        for seq, token in zip(group, tokens):
+            seq.first_token_at = now
+            seq.prefix_past = None
+            self._append(seq, token)
+        merged = to_legacy_cache(outputs.past_key_values)
+        if self.prefix_cache is not None:
+            self._cache_prompts(group, merged, mask)
+        self._merge(group, merged, mask)
+        self._retire_finished()
+
+    def _stack_prefixes(self, group: List[Sequence], length: int) -> LegacyCache:
+        """把各行命中的前缀左填充到相同长度后拼成一个批次，未命中的行全部为填充"""
+        reference = next(seq.prefix_past for seq in group if seq.prefix_past is not None)
+        layers = []
+        for layer, (ref_key, ref_value) in enumerate(reference):
+            keys, values = [], []
+            for seq in group:
+                if seq.prefix_past is None:
+                    shape = list(ref_key.shape)
+                    shape[2] = length
+                    keys.append(ref_key.new_zeros(shape))
+                    values.append(ref_value.new_zeros(shape))
+                    continue
+                key, value = left_pad_cache((seq.prefix_past[layer],), length)[0]
+                keys.append(key)
+                values.append(value)
+            layers.append((torch.cat(keys, dim=0).to(self.device), torch.cat(values, dim=0).to(self.device)))
+        return tuple(layers)
+
+    def _cache_prompts(self, group: List[Sequence], past: LegacyCache, mask: torch.Tensor):
+        """取出每行提示词对应的 KV（去掉填充位置）存入前缀缓存"""
+        for row, seq in enumerate(group):
+            columns = mask[row].nonzero().squeeze(-1)
+            self.prefix_cache.insert(seq.prompt_ids, tuple(
+                (key[row:row + 1].index_select(2, columns), value[row:row + 1].index_select(2, columns))
+                for key, value in past
+            ))
+
+    def _merge(self, group: List[Sequence], past: LegacyCache, mask: torch.Tensor):
+        """把预填充完成的请求并入解码批次，两边左填充到相同长度"""
+        if self._past is None:
+            self._running, self._past, self._mask = list(group), past, mask
+            return
+        length = max(self._mask.shape[1], mask.shape[1])
+        running_past = left_pad_cache(self._past, length)
+        past = left_pad_cache(past, length)
+        self._past = tuple(
+            (torch.cat([rk, nk], dim=0), torch.cat([rv, nv], dim=0))
+            for (rk, rv), (nk, nv) in zip(running_past, past)
+        )
+        self._mask = torch.cat([
+            torch.nn.functional.pad(self._mask, (length - self._mask.shape[1], 0)),
+            torch.nn.functional.pad(mask, (length - mask.shape[1], 0))
+        ], dim=0)
+        self._running.extend(group)
+
+    def _decode_step(self):
+        """批次内所有请求各解码一个 token"""
+        input_ids = torch.tensor([[seq.generated[-1]] for seq in self._running], device=self.device)
+        position_ids = self._mask.sum(dim=-1, keepdim=True)
+        self._mask = torch.cat([self._mask, self._mask.new_ones((len(self._running), 1))], dim=-1)
+
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=input_ids, attention_mask=self._mask, position_ids=position_ids,
+                past_key_values=from_legacy_cache(self._past), use_cache=True
+            )
+        self._past = to_legacy_cache(outputs.past_key_values)
+        self.stats["decode_steps"] += 1
+        self.stats["batch_rows"] += len(self._running)
+
+        tokens = sample_tokens(outputs.logits[:, -1, :], [seq.temperature for seq in self._running])
+        for seq, token in zip(self._running, tokens):
+            self._append(seq, token)
+        self._retire_finished()
+
+    def _append(self, seq: Sequence, token: int):
+        seq.generated.append(token)
+        if seq.on_token is None or token == self.eos_token_id or seq.future.done():
+            return
+        try:
+            seq.on_token(token)
+        except Exception as e:
+            # 回调出错只影响这个请求，下一步退出批次
+            self._settle(seq.future.set_exception, e)
+
+    @staticmethod
+    def _settle(setter: Callable[[Any], None], value: Any):
+        """设置 Future 的结果；调用方可能在任意时刻取消，检查和设置之间的取消不影响调度线程"""
+        try:
+            setter(value)
+        except InvalidStateError:
+            # 请求已被取消
+            pass
+
+    def _finish_reason(self, seq: Sequence) -> Optional[str]:
+        if seq.future.done():
+            return "cancelled"
+        if self.eos_token_id is not None and seq.generated[-1] == self.eos_token_id:
+            return "stop"
+        if len(seq.generated) >= seq.max_new_tokens:
+            return "length"
+        return None
+
+    def _retire_finished(self):
+        """完成的请求返回结果并移出批次，同时去掉所有行共有的左侧填充"""
+        keep = []
+        for row, seq in enumerate(self._running):
+            reason = self._finish_reason(seq)
+            if reason is None:
+                keep.append(row)
+                continue
+            if reason == "cancelled":
+                continue
+            token_ids = seq.generated[:-1] if reason == "stop" else seq.generated
+            now = time.perf_counter()
+            self.stats["completed"] += 1
+            self.stats["generated_tokens"] += len(token_ids)
+            self._settle(seq.future.set_result, GenerationResult(
+                text=self.tokenizer.decode(token_ids, skip_special_tokens=True),
+                token_ids=token_ids,
+                prompt_tokens=len(seq.prompt_ids),
+                completion_tokens=len(token_ids),
+                finish_reason=reason,
+                time_to_first_token=seq.first_token_at - seq.submitted_at,
+                duration=now - seq.submitted_at
+            ))
+
+        if len(keep) == len(self._running):
+            return
+        if not keep:
+            self._running, self._past, self._mask = [], None, None
+            return
+
+        index = torch.tensor(keep, device=self._mask.device)
+        mask = self._mask.index_select(0, index)
+        # 剩余请求都不需要的左侧列可以丢弃
+        start = int((mask.sum(dim=0) > 0).nonzero()[0])
+        self._mask = mask[:, start:]
+        self._past = tuple(
+            (key.index_select(0, index)[:, :, start:], value.index_select(0, index)[:, :, start:])
+            for key, value in self._past
+        )
+        self._running = [self._running[row] for row in keep]
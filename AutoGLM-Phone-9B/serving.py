@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+异步服务层
+OpenAI 兼容接口的 ASGI 实现，推理交给后端自己的线程（InferenceBackend.submit），
+事件循环只负责收发请求，生成过程中 /health 和 /metrics 仍然可以立即响应。
+
+准入控制：同时推理的请求数不超过 max_concurrency，排队的请求数不超过 max_queue，
+队列满时返回 429 并在 Retry-After 中给出按近期平均耗时估计的等待秒数；
+每个请求（含排队时间）不超过 request_timeout 秒，超时返回 504 并取消生成。
+
+确定性请求（温度为0）先查响应缓存，命中时不占用推理名额，响应头 x-cache 为 hit/miss，
+非确定性请求为 bypass。
+"""
+
+import asyncio
+import json
+import math
+import time
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from backend import GenerationResult, InferenceBackend
+from response_cache import ResponseCache, request_key
+
+
+class ServerBusy(Exception):
+    """排队请求已满"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"服务繁忙，请 {retry_after} 秒后重试")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """限制并发推理数和排队长度"""
+
+    def __init__(self, max_concurrency: int = 8, max_queue: int = 32):
+        """
+        初始化准入控制
+
+        Args:
+            max_concurrency: 同时提交给后端的最大请求数
+            max_queue: 等待推理的最大请求数，超过时拒绝
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.waiting = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._durations: deque = deque(maxlen=100)
+
+    def retry_after(self) -> int:
+        """按近期平均耗时估计排队请求全部完成需要的秒数"""
+        if not self._durations:
+            return 1
+        mean = sum(self._durations) / len(self._durations)
+        return max(1, math.ceil(mean * (self.waiting + 1) / self.max_concurrency))
+
+    async def acquire(self) -> float:
+        """
+        等待推理名额
+
+        Returns:
+            获得名额的时间，传给 release()
+
+        Raises:
+            ServerBusy: 排队请求已满
+        """
+        # 有空闲名额时直接进入，没有时才计入排队长度
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise ServerBusy(self.retry_after())
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        self.admitted += 1
+        return time.monotonic()
+
+    def release(self, started: float):
+        self.in_flight -= 1
+        self._durations.append(time.monotonic() - started)
+        self._semaphore.release()
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "mean_duration_ms": round(sum(self._durations) / len(self._durations) * 1000, 1)
+            if self._durations else 0.0
+        }
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    占用推理名额的流式响应
+
+    名额在响应结束时归还，包括客户端在生成器开始迭代之前断开的情况
+    （未开始的生成器关闭时不会执行其中的 finally）。
+    """
+
+    def __init__(self, content: AsyncIterator[str], release: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
+
+def usage_of(result: GenerationResult) -> Dict[str, Any]:
+    """按分词器统计的 token 用量，以及首 token 延迟和解码速度"""
+    return {
+        "prompt_tokens": result.prompt_tokens,
+        "completion_tokens": result.completion_tokens,
+        "total_tokens": result.prompt_tokens + result.completion_tokens,
+        "time_to_first_token_ms": round(result.time_to_first_token * 1000, 1),
+        "tokens_per_second": round(result.tokens_per_second, 2)
+    }
+
+
+def error_response(message: str, error_type: str, status: int,
+                   headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    return JSONResponse({
+        "error": {
+            "message": message,
+            "type": error_type,
+            "code": error_type
+        }
+    }, status_code=status, headers=headers)
+
+
+def completion_body(result: GenerationResult, model: str) -> Dict[str, Any]:
+    """OpenAI 兼容的 chat.completion 响应"""
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {
+                "role": "assistant",
+                "content": result.text.strip()
+            },
+            "finish_reason": result.finish_reason
+        }],
+        "usage": usage_of(result)
+    }
+
+
+def sse_chunk(completion_id: str, created: int, model: str, delta: Dict[str, Any],
+              finish_reason: Optional[str] = None, **extra) -> str:
+    """OpenAI 兼容的 chat.completion.chunk 数据块"""
+    body = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        **extra
+    }
+    return f"data: {json.dumps(body, ensure_ascii=False)}\n\n"
+
+
+async def replay(result: GenerationResult, model: str) -> AsyncIterator[str]:
+    """把缓存的结果作为一次完整的流式响应返回"""
+    completion_id, created = f"chatcmpl-{uuid.uuid4().hex}", int(time.time())
+    yield sse_chunk(completion_id, created, model, {"role": "assistant", "content": ""})
+    yield sse_chunk(completion_id, created, model, {"content": result.text})
+    yield sse_chunk(completion_id, created, model, {}, result.finish_reason, usage=usage_of(result))
+    yield "data: [DONE]\n\n"
+
+
+def create_app(backend: InferenceBackend, max_concurrency: int = 8, max_queue: int = 32,
+               request_timeout: float = 300.0, response_cache: Optional[ResponseCache] = None) -> FastAPI:
+    """
+    创建服务应用
+
+    Args:
+        backend: 推理后端
+        max_concurrency: 同时推理的最大请求数
+        max_queue: 最大排队请求数
+        request_timeout: 单个请求的超时时间（秒），包含排队时间
+        response_cache: 确定性请求的响应缓存
+
+    Returns:
+        FastAPI 应用
+    """
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        yield
+        backend.close()
+        if response_cache is not None:
+            response_cache.save()
+
+    app = FastAPI(title="AutoGLM-Phone-9B 模型服务", lifespan=lifespan)
+    admission = AdmissionController(max_concurrency, max_queue)
+    app.state.backend = backend
+    app.state.admission = admission
+
+    async def admit(deadline: float) -> float:
+        try:
+            return await asyncio.wait_for(admission.acquire(), deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            admission.timeouts += 1
+            raise
+
+    async def generate(input_text: str, max_tokens: int, temperature: float, deadline: float) -> GenerationResult:
+        started = await admit(deadline)
+        future = backend.submit(input_text, max_tokens, temperature)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            admission.timeouts += 1
+            raise
+        finally:
+            future.cancel()
+            admission.release(started)
+
+    async def stream(input_text: str, max_tokens: int, temperature: float, model: str,
+                     deadline: float, cache_key: Optional[str]) -> AsyncIterator[str]:
+        """
+        以 SSE 逐个 token 返回生成结果，格式与 OpenAI 的 chat.completion.chunk 一致
+
+        最后一个数据块包含 finish_reason 和 usage，随后发送 [DONE]。
+        客户端断开或超时时取消生成；推理名额由 AdmittedStreamingResponse 归还。
+        """
+        loop = asyncio.get_running_loop()
+        tokens: "asyncio.Queue[Optional[int]]" = asyncio.Queue()
+        future = backend.submit(
+            input_text, max_tokens, temperature,
+            on_token=lambda token: loop.call_soon_threadsafe(tokens.put_nowait, token)
+        )
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(tokens.put_nowait, None))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra) -> str:
+            return sse_chunk(completion_id, created, model, delta, finish_reason, **extra)
+
+        def error(message: str, error_type: str) -> str:
+            return f"data: {json.dumps({'error': {'message': message, 'type': error_type}}, ensure_ascii=False)}\n\n"
+
+        try:
+            yield chunk({"role": "assistant", "content": ""})
+            token_ids: List[int] = []
+            sent = ""
+            while True:
+                try:
+                    token = await asyncio.wait_for(tokens.get(), deadline - time.monotonic())
+                except asyncio.TimeoutError:
+                    admission.timeouts += 1
+                    yield error("生成超时", "timeout")
+                    yield "data: [DONE]\n\n"
+                    return
+                if token is None:
+                    break
+                token_ids.append(token)
+                # 按已生成的全部 token 解码再取增量，避免把多字节字符拆开
+                text = backend.decode(token_ids)
+                if text.endswith("\ufffd") or len(text) <= len(sent):
+                    continue
+                yield chunk({"content": text[len(sent):]})
+                sent = text
+
+            try:
+                result = future.result()
+            except Exception as e:
+                yield error(str(e), "internal_error")
+            else:
+                if cache_key is not None:
+                    response_cache.put(cache_key, result)
+                if len(result.text) > len(sent):
+                    yield chunk({"content": result.text[len(sent):]})
+                yield chunk({}, result.finish_reason, usage=usage_of(result))
+            yield "data: [DONE]\n\n"
+        finally:
+            future.cancel()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        """OpenAI 兼容的聊天完成接口，stream 为 true 时以 SSE 返回"""
+        deadline = time.monotonic() + request_timeout
+        data = await request.json()
+
+        messages = data.get('messages', [])
+        max_tokens = data.get('max_tokens', 3000)
+        temperature = data.get('temperature', 0.1)
+        model = data.get('model', backend.name)
+
+        if not backend.ready:
+            if backend.status == "failed":
+                return error_response("模型加载失败", "service_unavailable", 503)
+            return error_response("模型加载中", "service_unavailable", 503, {"Retry-After": "5"})
+        input_text = backend.build_input(messages)
+        if not input_text:
+            return error_response("请输入有效的问题", "invalid_request_error", 400)
+
+        streaming = data.get('stream', False)
+        cache_key = None
+        headers = {"x-cache": "bypass"}
+        if response_cache is not None and response_cache.cacheable(temperature):
+            cache_key = request_key(messages, model, max_tokens)
+            cached = response_cache.get(cache_key)
+            headers["x-cache"] = "miss" if cached is None else "hit"
+            if cached is not None:
+                if streaming:
+                    return StreamingResponse(replay(cached, model), media_type="text/event-stream",
+                                             headers={"Cache-Control": "no-cache", **headers})
+                return JSONResponse(completion_body(cached, model), headers=headers)
+
+        try:
+            if streaming:
+                started = await admit(deadline)
+                return AdmittedStreamingResponse(
+                    stream(input_text, max_tokens, temperature, model, deadline, cache_key),
+                    release=lambda: admission.release(started),
+                    media_type="text/event-stream",
+                    headers={"Cache-Control": "no-cache", **headers}
+                )
+            result = await generate(input_text, max_tokens, temperature, deadline)
+            if cache_key is not None:
+                response_cache.put(cache_key, result)
+            return JSONResponse(completion_body(result, model), headers=headers)
+        except ServerBusy as e:
+            return error_response(str(e), "server_busy", 429, {"Retry-After": str(e.retry_after)})
+        except asyncio.TimeoutError:
+            return error_response(f"请求超过 {request_timeout} 秒未完成", "timeout", 504)
+        except Exception as e:
+            return error_response(str(e), "internal_error", 500)
+
+    @app.get("/v1/models")
+    async def list_models():
+        """列出可用模型"""
+        return {
+            "object": "list",
+            "data": [{
+                "id": backend.name,
+                "object": "model",
+                "created": 0,
+                "owned_by": "autoglm"
+            }]
+        }
+
+    @app.get("/health")
+    async def health_check():
+        """健康检查接口"""
+        return {
+            "status": backend.status,
+            **backend.health(),
+            "admission": admission.stats,
+            "response_cache": response_cache.stats if response_cache is not None else None
+        }
+
+    @app.get("/metrics")
+    async def metrics():
+        """准入控制和后端的运行指标"""
+        return {
+            "admission": admission.stats,
+            "response_cache": response_cache.stats if response_cache is not None else None,
+            "backend": backend.health()
+        }
+
+    return app
+
+
+def run_server(app: FastAPI, host: str, port: int):
+    """启动 HTTP 服务，阻塞直到停止"""
+    uvicorn.run(app, host=host, port=port, log_level="warning")
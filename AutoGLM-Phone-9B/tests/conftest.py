@@ -0,0 +1,32 @@
+"""
+测试配置
+
+需要模型的测试使用 hf-internal-testing 的随机权重小模型，只验证计算路径的正确性。
+离线环境可通过 AUTOGLM_TEST_MODEL 指定同结构的本地模型目录；无法加载时跳过。
+"""
+import os
+
+import pytest
+
+TEST_MODEL = os.environ.get("AUTOGLM_TEST_MODEL", "hf-internal-testing/tiny-random-LlamaForCausalLM")
+
+# 随机初始化的注意力分数接近 0，注意力近似均匀，位置编码或 mask 出错时输出几乎不变；
+# 放大 q/k 投影让注意力集中，这类错误才会改变贪心结果
+ATTENTION_SHARPNESS = 10.0
+
+
+@pytest.fixture(scope="session")
+def tiny_llama():
+    """(model, tokenizer)，float32、CPU、eval 模式"""
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    try:
+        tokenizer = transformers.AutoTokenizer.from_pretrained(TEST_MODEL)
+        model = transformers.AutoModelForCausalLM.from_pretrained(TEST_MODEL, torch_dtype=torch.float32)
+    except OSError as e:
+        pytest.skip(f"无法加载测试模型 {TEST_MODEL}: {e}")
+    with torch.no_grad():
+        for name, parameter in model.named_parameters():
+            if name.endswith(("q_proj.weight", "k_proj.weight")):
+                parameter.mul_(ATTENTION_SHARPNESS)
+    return model.eval(), tokenizer
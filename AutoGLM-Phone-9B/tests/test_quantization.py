@@ -0,0 +1,64 @@
+"""
+测试 CPU int8 动态量化：量化范围、内存统计，以及量化模型经调度器生成的结果
+"""
+import copy
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from torch import nn
+
+from quantization import count_quantized_layers, model_memory_bytes, quantize_int8
+from scheduler import BatchScheduler
+from test_scheduler import PROMPTS, reference_tokens
+
+
+@pytest.fixture(scope="module")
+def quantized(tiny_llama):
+    model, tokenizer = tiny_llama
+    return quantize_int8(copy.deepcopy(model)), tokenizer
+
+
+class TestQuantization:
+    """测试线性层的 int8 动态量化"""
+
+    def test_quantizes_linear_layers_except_output(self, tiny_llama, quantized):
+        model, _ = tiny_llama
+        int8_model, _ = quantized
+        linear = [name for name, module in model.named_modules() if isinstance(module, nn.Linear)]
+
+        assert count_quantized_layers(int8_model) == len(linear) - 1
+        assert type(int8_model.lm_head) is nn.Linear
+        assert model_memory_bytes(int8_model) < model_memory_bytes(model)
+
+    def test_next_token_mostly_agrees_with_float32(self, tiny_llama, quantized):
+        model, tokenizer = tiny_llama
+        int8_model, _ = quantized
+        agree = total = 0
+        for prompt in PROMPTS:
+            inputs = tokenizer(prompt, return_tensors="pt")
+            with torch.no_grad():
+                reference = model(**inputs).logits.argmax(-1)
+                logits = int8_model(**inputs).logits.argmax(-1)
+            agree += int((reference == logits).sum())
+            total += reference.numel()
+
+        assert agree / total >= 0.8
+
+    def test_scheduler_on_quantized_model_matches_generate(self, quantized):
+        """模型服务对量化后的模型使用同一个调度器
+
+        激活按整个输入张量动态量化，批内其他行会改变量化尺度，
+        因此逐个调度，只验证调度器的缓存处理与量化层兼容
+        """
+        int8_model, tokenizer = quantized
+        scheduler = BatchScheduler(int8_model, tokenizer, "cpu", max_batch_size=1)
+        futures = [scheduler.submit(prompt, max_new_tokens=8, temperature=0.0) for prompt in PROMPTS]
+        scheduler.start()
+        try:
+            for prompt, future in zip(PROMPTS, futures):
+                assert future.result(timeout=60).token_ids == reference_tokens(int8_model, tokenizer, prompt, 8)
+        finally:
+            scheduler.stop()
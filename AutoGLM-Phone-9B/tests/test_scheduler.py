@@ -0,0 +1,145 @@
+"""
+测试连续批处理调度器：贪心生成结果必须与逐个请求调用 model.generate 完全一致
+"""
+import threading
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from prefix_cache import PrefixCache
+from scheduler import BatchScheduler
+
+PROMPTS = [
+    "点击登录按钮",
+    "打开券商应用并进入交易页面",
+    "在搜索框中输入股票代码 600000 然后点击查询",
+    "返回上一页",
+]
+
+# 决策提示词共享的长指令
+INSTRUCTION = "你是一个手机操作助手，当前屏幕显示主页面。任务："
+
+
+def reference_tokens(model, tokenizer, prompt, max_new_tokens):
+    """单个请求的 model.generate 贪心结果，去掉结束符及其后的 token（与调度器一致）"""
+    input_ids = torch.tensor([tokenizer(prompt)["input_ids"]])
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    with torch.no_grad():
+        outputs = model.generate(
+            input_ids, attention_mask=torch.ones_like(input_ids), max_new_tokens=max_new_tokens,
+            do_sample=False, pad_token_id=pad_token_id
+        )
+    tokens = outputs[0, input_ids.shape[1]:].tolist()
+    if tokenizer.eos_token_id in tokens:
+        tokens = tokens[:tokens.index(tokenizer.eos_token_id)]
+    return tokens
+
+
+@pytest.fixture
+def make_scheduler(tiny_llama):
+    schedulers = []
+
+    def factory(**kwargs):
+        model, tokenizer = tiny_llama
+        scheduler = BatchScheduler(model, tokenizer, "cpu", **kwargs)
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield factory
+    for scheduler in schedulers:
+        scheduler.stop()
+
+
+class TestBatchScheduler:
+    """测试批处理生成与逐个生成的一致性"""
+
+    def test_mixed_prompt_lengths_match_generate(self, tiny_llama, make_scheduler):
+        """不同长度的请求在同一批中左填充预填充、一起解码"""
+        model, tokenizer = tiny_llama
+        scheduler = make_scheduler(max_padding_ratio=1.0)
+        # 启动前提交，保证所有请求在同一次调度中被接纳
+        futures = [scheduler.submit(prompt, max_new_tokens=12, temperature=0.0) for prompt in PROMPTS]
+        scheduler.start()
+
+        for prompt, future in zip(PROMPTS, futures):
+            assert future.result(timeout=60).token_ids == reference_tokens(model, tokenizer, prompt, 12)
+        assert scheduler.stats["prefill_batches"] == 1
+        assert scheduler.stats["padding_tokens"] > 0
+
+    def test_request_joining_mid_decode_matches_generate(self, tiny_llama, make_scheduler):
+        """解码进行中加入的请求单独预填充后并入批次，两边的结果都不受影响"""
+        model, tokenizer = tiny_llama
+        scheduler = make_scheduler()
+        decoding = threading.Event()
+        counts = []
+
+        def on_token(token):
+            counts.append(token)
+            if len(counts) == 4:
+                decoding.set()
+
+        first = scheduler.submit(PROMPTS[1], max_new_tokens=24, temperature=0.0, on_token=on_token)
+        scheduler.start()
+        assert decoding.wait(60)
+        second = scheduler.submit(PROMPTS[2], max_new_tokens=8, temperature=0.0)
+
+        assert first.result(timeout=60).token_ids == reference_tokens(model, tokenizer, PROMPTS[1], 24)
+        assert second.result(timeout=60).token_ids == reference_tokens(model, tokenizer, PROMPTS[2], 8)
+        assert scheduler.stats["prefill_batches"] == 2
+        # 有解码步骤同时处理了两个请求
+        assert scheduler.stats["batch_rows"] > scheduler.stats["decode_steps"]
+
+    def test_cancelled_request_leaves_batch(self, tiny_llama, make_scheduler):
+        """取消的请求退出批次，其余请求结果不变"""
+        model, tokenizer = tiny_llama
+        scheduler = make_scheduler()
+        decoding = threading.Event()
+        cancelled = scheduler.submit(PROMPTS[0], max_new_tokens=64, temperature=0.0,
+                                     on_token=lambda token: decoding.set())
+        kept = scheduler.submit(PROMPTS[3], max_new_tokens=16, temperature=0.0)
+        scheduler.start()
+        assert decoding.wait(60)
+        cancelled.cancel()
+
+        assert kept.result(timeout=60).token_ids == reference_tokens(model, tokenizer, PROMPTS[3], 16)
+        assert cancelled.cancelled()
+
+
+class TestPrefixReuse:
+    """测试从前缀缓存继续预填充的结果与完整预填充一致"""
+
+    def test_prefix_hit_matches_generate(self, tiny_llama, make_scheduler):
+        model, tokenizer = tiny_llama
+        cache = PrefixCache(block_size=4)
+        scheduler = make_scheduler(prefix_cache=cache)
+        scheduler.start()
+        scheduler.submit(INSTRUCTION + PROMPTS[0], max_new_tokens=4, temperature=0.0).result(timeout=60)
+
+        prompt = INSTRUCTION + PROMPTS[2]
+        result = scheduler.submit(prompt, max_new_tokens=12, temperature=0.0).result(timeout=60)
+
+        assert result.token_ids == reference_tokens(model, tokenizer, prompt, 12)
+        assert cache.hits == 1
+        assert cache.cached_tokens >= 4
+
+    def test_group_mixing_hits_and_misses_matches_generate(self, tiny_llama, make_scheduler):
+        """同一组内命中长度不同的行和未命中的行：前缀左填充对齐，未命中的行前缀全为填充"""
+        model, tokenizer = tiny_llama
+        cache = PrefixCache(block_size=4)
+        warm = make_scheduler(prefix_cache=cache)
+        warm.start()
+        for prompt in (INSTRUCTION + PROMPTS[0], INSTRUCTION[:16] + PROMPTS[3]):
+            warm.submit(prompt, max_new_tokens=2, temperature=0.0).result(timeout=60)
+        hits = cache.hits
+
+        prompts = [INSTRUCTION + PROMPTS[1], INSTRUCTION[:16] + PROMPTS[2], PROMPTS[1]]
+        scheduler = make_scheduler(prefix_cache=cache, max_padding_ratio=1.0)
+        futures = [scheduler.submit(prompt, max_new_tokens=12, temperature=0.0) for prompt in prompts]
+        scheduler.start()
+
+        for prompt, future in zip(prompts, futures):
+            assert future.result(timeout=60).token_ids == reference_tokens(model, tokenizer, prompt, 12)
+        assert scheduler.stats["prefill_batches"] == 1
+        assert cache.hits - hits == 2
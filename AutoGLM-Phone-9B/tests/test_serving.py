@@ -0,0 +1,258 @@
+"""
+测试异步服务层：准入控制（429/504）、流式响应的名额归还、确定性请求的响应缓存和模型加载期间的就绪状态
+"""
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient
+
+from backend import GenerationResult
+from mock_model_server import SimulationConfig, create_mock_app
+from response_cache import ResponseCache, request_key
+from serving import AdmissionController, ServerBusy, create_app
+
+IMAGE = "data:image/png;base64,iVBORw0KGgo="
+OTHER_IMAGE = "data:image/png;base64,R0lGODlh"
+
+
+def chat(content="点击登录按钮", temperature=0.0, **extra):
+    return {"model": "autoglm-phone-9b", "temperature": temperature, "max_tokens": 1000,
+            "messages": [{"role": "user", "content": content}], **extra}
+
+
+def make_client(ttft=0.0, **serving_options):
+    app = create_mock_app(SimulationConfig(ttft=ttft, seed=0, verbose=False), **serving_options)
+    return TestClient(app)
+
+
+def result(text="ACTION: back", finish_reason="stop"):
+    return GenerationResult(text=text, token_ids=[1, 2], prompt_tokens=3, completion_tokens=2,
+                            finish_reason=finish_reason, time_to_first_token=0.01, duration=0.02)
+
+
+class TestAdmissionController:
+    """测试并发和排队限制"""
+
+    def test_rejects_when_queue_full(self):
+        async def run():
+            admission = AdmissionController(max_concurrency=1, max_queue=1)
+            started = await admission.acquire()
+            waiter = asyncio.ensure_future(admission.acquire())
+            await asyncio.sleep(0)
+            with pytest.raises(ServerBusy):
+                await admission.acquire()
+
+            admission.release(started)
+            admission.release(await waiter)
+            return admission.stats
+
+        stats = asyncio.run(run())
+        assert stats["admitted"] == 2
+        assert stats["rejected"] == 1
+        assert stats["in_flight"] == 0
+
+    def test_retry_after_scales_with_queue(self):
+        admission = AdmissionController(max_concurrency=2, max_queue=8)
+        assert admission.retry_after() == 1
+        admission._durations.extend([2.0, 2.0])
+        admission.waiting = 3
+        assert admission.retry_after() == 4
+
+
+class TestChatCompletions:
+    """测试聊天完成接口的准入控制和流式响应"""
+
+    def test_rejects_with_429_when_busy(self):
+        with make_client(ttft=0.5, max_concurrency=1, max_queue=0) as client:
+            first = []
+            thread = threading.Thread(target=lambda: first.append(client.post("/v1/chat/completions",
+                                                                                   json=chat("任务一"))))
+            thread.start()
+            time.sleep(0.2)
+            response = client.post("/v1/chat/completions", json=chat("任务二"))
+            thread.join()
+
+            assert response.status_code == 429
+            assert int(response.headers["Retry-After"]) >= 1
+            assert first[0].status_code == 200
+            assert client.get("/metrics").json()["admission"]["rejected"] == 1
+
+    def test_times_out_with_504_and_releases_slot(self):
+        with make_client(ttft=1.0, request_timeout=0.2) as client:
+            response = client.post("/v1/chat/completions", json=chat())
+
+            assert response.status_code == 504
+            admission = client.get("/metrics").json()["admission"]
+            assert admission["timeouts"] == 1
+            assert admission["in_flight"] == 0
+
+    def test_stream_returns_chunks_and_releases_slot(self):
+        with make_client() as client:
+            response = client.post("/v1/chat/completions", json=chat(stream=True))
+            events = [line[len("data: "):] for line in response.text.splitlines() if line.startswith("data: ")]
+
+            assert events[-1] == "[DONE]"
+            chunks = [json.loads(event) for event in events[:-1]]
+            assert chunks[-1]["choices"][0]["finish_reason"] == "stop"
+            assert "".join(chunk["choices"][0]["delta"].get("content", "") for chunk in chunks)
+            assert client.get("/metrics").json()["admission"]["in_flight"] == 0
+
+    def test_stream_disconnect_before_first_chunk_releases_slot(self):
+        """发送响应头时连接已断开：生成器从未迭代，名额仍然归还"""
+        app = create_mock_app(SimulationConfig(verbose=False), max_concurrency=1)
+        body = json.dumps(chat(stream=True)).encode()
+
+        async def run():
+            messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+            async def receive():
+                if messages:
+                    return messages.pop(0)
+                await asyncio.Event().wait()
+
+            async def send(message):
+                raise OSError("连接已断开")
+
+            scope = {"type": "http", "method": "POST", "path": "/v1/chat/completions", "headers": [],
+                     "query_string": b"", "http_version": "1.1", "scheme": "http",
+                     "server": ("test", 80), "client": ("test", 1), "root_path": ""}
+            # anyio 4 把错误包装为 ExceptionGroup
+            with pytest.raises(Exception):
+                await app(scope, receive, send)
+
+        asyncio.run(run())
+        assert app.state.admission.stats["admitted"] == 1
+        assert app.state.admission.stats["in_flight"] == 0
+
+
+class TestResponseCache:
+    """测试确定性请求的响应缓存"""
+
+    def test_request_key_hashes_images_by_content(self):
+        def messages(url):
+            return [{"role": "user", "content": [{"type": "text", "text": "当前界面"},
+                                                 {"type": "image_url", "image_url": {"url": url}}]}]
+
+        assert request_key(messages(IMAGE), "m", 64) == request_key(messages(IMAGE), "m", 64)
+        assert request_key(messages(IMAGE), "m", 64) != request_key(messages(OTHER_IMAGE), "m", 64)
+        assert request_key(messages(IMAGE), "m", 64) != request_key(messages(IMAGE), "m", 128)
+
+    def test_lru_eviction_and_unfinished_results(self):
+        cache = ResponseCache(max_entries=2)
+        cache.put("a", result())
+        cache.put("b", result())
+        cache.get("a")
+        cache.put("c", result())
+        cache.put("d", result(finish_reason="cancelled"))
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None and cache.get("c") is not None
+        assert cache.get("d") is None
+        assert cache.stats["evictions"] == 1
+
+    def test_persists_across_restarts(self, tmp_path):
+        path = str(tmp_path / "responses.json")
+        cache = ResponseCache(path=path)
+        cache.put("a", result("ACTION: finish"))
+        cache.save()
+
+        assert ResponseCache(path=path).get("a").text == "ACTION: finish"
+
+    def test_deterministic_requests_served_from_cache(self):
+        with make_client(response_cache=ResponseCache()) as client:
+            first = client.post("/v1/chat/completions", json=chat())
+            second = client.post("/v1/chat/completions", json=chat())
+            streamed = client.post("/v1/chat/completions", json=chat(stream=True))
+            sampled = client.post("/v1/chat/completions", json=chat(temperature=0.7))
+
+            assert first.headers["x-cache"] == "miss"
+            assert second.headers["x-cache"] == "hit"
+            assert second.json()["choices"] == first.json()["choices"]
+            assert streamed.headers["x-cache"] == "hit"
+            assert streamed.text.endswith("data: [DONE]\n\n")
+            assert sampled.headers["x-cache"] == "bypass"
+            assert client.get("/health").json()["admission"]["admitted"] == 2
+
+
+def staged_server(warmup_error=None):
+    """加载和预热分别阻塞到 loaded/warmed 事件的模型服务，不加载真实模型"""
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    from model_server import ModelServer
+
+    class StagedModelServer(ModelServer):
+        def __init__(self):
+            super().__init__("unused", warmup_batch=0)
+            self.loaded = threading.Event()
+            self.warmed = threading.Event()
+
+        def load_model(self):
+            self.loaded.wait(5)
+            return True
+
+        def warmup(self):
+            self.warmed.wait(5)
+            if warmup_error:
+                raise RuntimeError(warmup_error)
+
+    return StagedModelServer()
+
+
+def wait_state(server, state):
+    deadline = time.monotonic() + 5
+    while server.state != state and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert server.state == state
+
+
+class TestModelReadiness:
+    """测试模型加载和预热期间的健康检查与推理请求"""
+
+    def test_loading_then_ready(self):
+        from model_server import ModelNotReady
+
+        server = staged_server()
+        with TestClient(create_app(server)) as client:
+            server.start_loading()
+            health = client.get("/health").json()
+            assert (health["status"], health["state"]) == ("loading", "loading")
+            assert "cold_start_seconds" not in health["startup"]
+
+            response = client.post("/v1/chat/completions", json=chat())
+            assert response.status_code == 503
+            assert response.headers["Retry-After"] == "5"
+            with pytest.raises(ModelNotReady):
+                server.generate_response("点击登录按钮")
+
+            server.loaded.set()
+            wait_state(server, "warming_up")
+            health = client.get("/health").json()
+            assert (health["status"], health["state"]) == ("loading", "warming_up")
+            assert client.post("/v1/chat/completions", json=chat()).status_code == 503
+
+            server.warmed.set()
+            wait_state(server, "ready")
+            health = client.get("/health").json()
+            assert (health["status"], health["state"]) == ("healthy", "ready")
+            assert health["startup"]["cold_start_seconds"] > 0
+
+    def test_failed_warmup_reported_without_retry(self):
+        server = staged_server(warmup_error="显存不足")
+        with TestClient(create_app(server)) as client:
+            server.start_loading()
+            server.loaded.set()
+            server.warmed.set()
+            wait_state(server, "failed")
+
+            assert client.get("/health").json()["status"] == "failed"
+            response = client.post("/v1/chat/completions", json=chat())
+            assert response.status_code == 503
+            assert "Retry-After" not in response.headers
+            assert "cold_start_seconds" not in server.startup
+
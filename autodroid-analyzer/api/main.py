@@ -7,6 +7,7 @@ from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, JSONResponse, RedirectResponse
+from contextlib import asynccontextmanager
 import os
 import sys
 import yaml
@@ -43,7 +44,15 @@ from .apks import router as apks_router
 from .devices import router as devices_router
 from .server import router as server_router
 
-app = FastAPI(title="Autodroid Analyzer API", version="1.0.0")
+from core.database import ensure_schema
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """启动时把数据库结构升级到最新版本（只执行一次）"""
+    ensure_schema()
+    yield
+
+app = FastAPI(title="Autodroid Analyzer API", version="1.0.0", lifespan=lifespan)
 
 # 配置CORS
 app.add_middleware(
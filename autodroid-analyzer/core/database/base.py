@@ -1,14 +1,15 @@
 """
 数据库基类模块
-定义所有数据库管理类的基类，提供统一的数据库连接和表创建方法
+定义所有数据库管理类的基类，提供统一的数据库连接
 """
 
 from typing import Optional
-from . import db, create_tables
+from .models import db
+from .schema import ensure_schema
 
 
 class BaseDatabase:
-    """数据库基类（基于peewee ORM）"""
+    """数据库基类（基于peewee ORM），子类实例只是共享连接的轻量句柄"""
     
     def __init__(self, db_path: Optional[str] = None):
         """
@@ -20,18 +21,9 @@ class BaseDatabase:
         # 使用统一的数据库连接
         self.db = db
         
-        # 确保表已创建
-        create_tables()
+        # 表结构由启动时的版本迁移创建，这里只确认本进程已迁移过
+        ensure_schema()
     
     def get_connection(self):
         """获取数据库连接（返回peewee数据库实例）"""
         return self.db
-    
-    def close(self):
-        """关闭数据库连接"""
-        if self.db:
-            self.db.close()
-    
-    def __del__(self):
-        """析构函数，确保连接关闭"""
-        self.close()
\ No newline at end of file
@@ -281,22 +281,24 @@ class AnalysisReport(BaseModel):
     class Meta:
         table_name = 'analysis_report'
 
+ALL_MODELS = [
+    # APK模块
+    Apk,
+    # 设备模块
+    Device, DeviceConnectionLog, DeviceApp,
+    # 截屏模块
+    Screenshot, PageElement, ScreenshotAnalysisResult, PageStructure,
+    # 用户操作模块
+    UserOperation, OperationSequence, OperationPattern, UserBehavior, OperationStatistics,
+    # 分析模块
+    AnalysisResult, AnalysisTask, AnalysisPattern, AnalysisReport
+]
+
 # 创建所有表
 def create_tables():
     """创建所有数据库表"""
     with db:
-        db.create_tables([
-            # APK模块
-            Apk,
-            # 设备模块
-            Device, DeviceConnectionLog, DeviceApp,
-            # 截屏模块
-            Screenshot, PageElement, ScreenshotAnalysisResult, PageStructure,
-            # 用户操作模块
-            UserOperation, OperationSequence, OperationPattern, UserBehavior, OperationStatistics,
-            # 分析模块
-            AnalysisResult, AnalysisTask, AnalysisPattern, AnalysisReport
-        ])
+        db.create_tables(ALL_MODELS)
 
 # 初始化数据库
 if __name__ == "__main__":
@@ -25,6 +25,7 @@ from core.device.service import DeviceManager
 from core.device.models import DeviceInfoResponse
 from core.auth.models import UserCreate, UserLogin, UserResponse, Token
 from core.auth.service import AuthService
+from core.database import connection_scope, ensure_schema
 
 def setup_logging(config):
     """Setup logging configuration based on config.yaml"""
@@ -108,6 +109,9 @@ auth_config = config.get('authentication', {})
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup and shutdown events"""
     # Startup
+    # Bring the database schema up to date once, before any request is served
+    ensure_schema()
+    
     # Register mDNS service
     mdns_service = await register_mdns_from_config(config)
     app.state.mdns_service = mdns_service
@@ -135,6 +139,13 @@ app.add_middleware(
     allow_headers=api_config.get('cors_headers', ["*"]),
 )
 
+# Open the database connection for the duration of each request
+@app.middleware("http")
+async def database_connection(request: Request, call_next):
+    """Connect before handling the request and close after the last concurrent request on this thread"""
+    with connection_scope:
+        return await call_next(request)
+
 # SPA fallback handler for client-side routing
 @app.exception_handler(404)
 async def spa_fallback_handler(request: Request, exc: HTTPException):
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+数据库基准测试（在临时数据库上运行）
+
+- 请求开销：模拟 API 请求（打开连接 → 构造数据库对象 → 按主键查询设备 → 关闭连接），
+  对比每次构造数据库对象都执行 create_tables（旧行为）和启动时迁移一次（现行为）的单请求耗时；
+- 热点查询：写入大量交易计划后，对比结构版本2的二级索引创建前后各查询的
+  EXPLAIN QUERY PLAN 和耗时。
+
+用法:
+  python benchmark_database.py --requests 2000 --tradeplans 100000
+  python benchmark_database.py --requests 0    # 只测试热点查询
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from peewee import Query
+
+from core.database.models import (
+    Apk, Device, TradePlan, TradeScript, connection_scope, create_tables, database_config, db
+)
+from core.database.schema import migrate
+from core.device.database import DeviceDatabase
+
+# 结构版本2创建的二级索引，删除后即为迁移前的数据库
+SECONDARY_INDEXES = [
+    'tradeplan_status_created_at', 'tradeplan_created_at', 'device_is_online_battery_level', 'apk_package_name'
+]
+
+# 交易计划状态分布：大部分是已结束的历史计划
+TRADEPLAN_STATUSES = {
+    'COMPLETED': 0.80, 'FAILED': 0.08, 'REJECTED': 0.06, 'PENDING': 0.03, 'APPROVED': 0.02, 'EXECUTING': 0.01
+}
+
+APK_COUNT = 1000
+DEVICE_COUNT = 1000
+BATCH_SIZE = 1000
+
+
+def create_tables_per_request():
+    """旧行为：每次构造数据库对象都执行 create_tables"""
+    create_tables()
+    return DeviceDatabase()
+
+
+def run(requests: int, make_handle) -> list:
+    """执行 requests 个模拟请求，返回每个请求的耗时（秒）"""
+    durations = []
+    for index in range(requests):
+        start = time.perf_counter()
+        with connection_scope:
+            handle = make_handle()
+            handle.get_device(f"device-{index % 100}")
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def report(name: str, durations: list):
+    ordered = sorted(durations)
+    p99 = ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))]
+    print(f"{name}: 平均 {statistics.mean(ordered) * 1e6:.0f}µs  p50 {statistics.median(ordered) * 1e6:.0f}µs  "
+          f"p99 {p99 * 1e6:.0f}µs  {len(ordered) / sum(ordered):.0f} 请求/秒")
+
+
+def seed(tradeplans: int):
+    """写入APK、交易脚本、设备和交易计划"""
+    rng = random.Random(0)
+    now = datetime.now()
+    with db.atomic():
+        Apk.insert_many([
+            {'id': f"apk-{i}", 'package_name': f"com.example.app{i}", 'app_name': f"应用{i}",
+             'name': f"应用{i}", 'version': '1.0', 'version_code': 1}
+            for i in range(APK_COUNT)
+        ]).execute()
+        TradeScript.insert_many([
+            {'id': f"script-{i}", 'apk': f"apk-{i}", 'name': f"脚本{i}", 'metadata': '{}',
+             'script_path': f"workscripts/script_{i}.py"}
+            for i in range(APK_COUNT)
+        ]).execute()
+        Device.insert_many([
+            {'serialno': f"bench-{i}", 'is_online': rng.random() < 0.1, 'battery_level': rng.randint(0, 100)}
+            for i in range(DEVICE_COUNT)
+        ]).execute()
+        statuses, weights = list(TRADEPLAN_STATUSES), list(TRADEPLAN_STATUSES.values())
+        for start in range(0, tradeplans, BATCH_SIZE):
+            TradePlan.insert_many([
+                {'id': f"plan-{i}", 'script': f"script-{i % APK_COUNT}", 'name': f"计划{i}",
+                 'status': rng.choices(statuses, weights)[0],
+                 'created_at': now - timedelta(minutes=tradeplans - i)}
+                for i in range(start, min(start + BATCH_SIZE, tradeplans))
+            ]).execute()
+
+
+def hot_queries() -> Dict[str, Query]:
+    """API 中的热点查询"""
+    return {
+        "待批准交易计划": TradePlan.select().where(TradePlan.status == 'PENDING'),
+        "已批准交易计划": TradePlan.select().where(TradePlan.status == 'APPROVED'),
+        "最新50个交易计划": TradePlan.select().order_by(TradePlan.created_at.desc()).limit(50),
+        "可用设备": Device.select().where((Device.is_online == True) & (Device.battery_level > 20)),
+        "按包名查找APK": Apk.select().where(Apk.package_name == f"com.example.app{APK_COUNT // 2}"),
+        "APK的交易脚本": TradeScript.select().where(TradeScript.apk == f"apk-{APK_COUNT // 2}")
+    }
+
+
+def explain(query: Query) -> List[str]:
+    sql, params = query.sql()
+    return [row[-1] for row in db.execute_sql("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def measure(repeat: int) -> Dict[str, tuple]:
+    """每个热点查询的执行计划和平均耗时（毫秒，SQLite 执行并取回所有行，不含模型转换）"""
+    results = {}
+    for name, query in hot_queries().items():
+        sql, params = query.sql()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            db.execute_sql(sql, params).fetchall()
+        results[name] = (explain(query), (time.perf_counter() - start) / repeat * 1000)
+    return results
+
+
+def benchmark_queries(tradeplans: int, repeat: int):
+    print(f"\n写入 {tradeplans} 个交易计划、{DEVICE_COUNT} 台设备、{APK_COUNT} 个APK...")
+    seed(tradeplans)
+
+    # 回到结构版本1：删除版本2的索引
+    for name in SECONDARY_INDEXES:
+        db.execute_sql(f'DROP INDEX IF EXISTS "{name}"')
+    db.pragma('user_version', 1)
+    before = measure(repeat)
+
+    start = time.perf_counter()
+    migrate(db)
+    print(f"迁移到结构版本2（创建索引）耗时 {time.perf_counter() - start:.2f}s")
+    after = measure(repeat)
+
+    for name, (plan, elapsed) in before.items():
+        new_plan, new_elapsed = after[name]
+        print(f"\n{name}: {elapsed:.2f}ms → {new_elapsed:.2f}ms")
+        print(f"  迁移前: {'; '.join(plan)}")
+        print(f"  迁移后: {'; '.join(new_plan)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="数据库基准测试")
+    parser.add_argument("--requests", type=int, default=2000, help="模拟请求数，0 为不测试请求开销")
+    parser.add_argument("--tradeplans", type=int, default=100000, help="交易计划数，0 为不测试热点查询")
+    parser.add_argument("--repeat", type=int, default=20, help="每个热点查询的执行次数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # 使用临时数据库，不影响配置文件中的数据库
+        db.init(os.path.join(temp_dir, "benchmark.db"), timeout=database_config['busy_timeout_ms'] / 1000)
+        migrate(db)
+        with db.atomic():
+            for index in range(100):
+                Device.create(serialno=f"device-{index}")
+
+        if args.requests:
+            db.close()
+            print(f"模拟 {args.requests} 个请求（每个请求打开连接、构造 DeviceDatabase、查询一台设备）")
+            report("每次构造时建表", run(args.requests, create_tables_per_request))
+            report("启动时迁移一次", run(args.requests, DeviceDatabase))
+
+        if args.tradeplans:
+            benchmark_queries(args.tradeplans, args.repeat)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
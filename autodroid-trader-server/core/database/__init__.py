@@ -5,7 +5,8 @@
 
 import os
 from typing import Optional
-from .models import db, create_tables
+from .models import db, create_tables, connection_scope
+from .schema import SCHEMA_VERSION, ensure_schema, migrate
 
 class DatabaseManager:
     """统一数据库管理器（基于peewee ORM）"""
@@ -24,21 +25,12 @@ class DatabaseManager:
         # 初始化peewee数据库连接
         self.db = db
         
-        # 创建所有表
-        create_tables()
+        # 升级到最新表结构（本进程只执行一次）
+        ensure_schema()
     
     def get_connection(self):
         """获取数据库连接（返回peewee数据库实例）"""
         return self.db
-    
-    def close(self):
-        """关闭数据库连接"""
-        if self.db:
-            self.db.close()
-    
-    def __del__(self):
-        """析构函数，确保连接关闭"""
-        self.close()
 
 # 全局数据库管理器实例
 _db_manager: Optional[DatabaseManager] = None
@@ -3,25 +3,94 @@ Peewee数据库模型定义
 """
 
 import os
+import threading
+from typing import Any, Dict
 from peewee import (
     CharField, IntegerField, DateTimeField, ForeignKeyField, 
     TextField, DecimalField, CompositeKey, SqliteDatabase, Model, BooleanField
 )
 from datetime import datetime
 
-# 获取数据库路径
-def get_db_path():
-    """获取数据库文件路径"""
+# database 配置项的默认值
+DEFAULT_DATABASE_CONFIG = {
+    'sqlite_path': 'users.db',
+    'journal_mode': 'wal',  # WAL 模式下读不阻塞写，写也不阻塞读
+    'synchronous': 'normal',  # WAL 模式下 NORMAL 不会损坏数据库，只在断电时可能丢失最后的事务
+    'busy_timeout_ms': 5000,  # 写锁被占用时等待的时间，超时才报 database is locked
+    'cache_size_mb': 64,  # 每个连接的页缓存
+    'mmap_size_mb': 256  # 内存映射读取的大小，0 为不使用
+}
+
+def load_database_config() -> Dict[str, Any]:
+    """读取配置文件中的 database 部分，未配置的项使用默认值"""
     config_path = os.path.join(os.path.dirname(__file__), "..", "..", "config.yaml")
+    section = {}
     if os.path.exists(config_path):
         import yaml
         with open(config_path, 'r', encoding='utf-8') as f:
-            config = yaml.safe_load(f)
-        return config.get('database', {}).get('sqlite_path', 'users.db')
-    return 'users.db'
+            config = yaml.safe_load(f) or {}
+        section = config.get('database') or {}
+    return {**DEFAULT_DATABASE_CONFIG, **section}
+
+# 获取数据库路径
+def get_db_path():
+    """获取数据库文件路径"""
+    return load_database_config()['sqlite_path']
+
+def build_pragmas(config: Dict[str, Any]) -> Dict[str, Any]:
+    """每个连接打开时设置的 PRAGMA"""
+    return {
+        'journal_mode': config['journal_mode'],
+        'synchronous': config['synchronous'],
+        'cache_size': -int(config['cache_size_mb'] * 1024),  # 负数表示以 KiB 为单位
+        'mmap_size': int(config['mmap_size_mb'] * 1024 * 1024)
+    }
+
+def create_database(path: str, config: Dict[str, Any]) -> SqliteDatabase:
+    """
+    创建数据库对象
+    
+    peewee 按线程保存连接，每个线程使用自己的 sqlite3 连接；timeout 即 sqlite 的 busy timeout。
+    
+    Args:
+        path: 数据库文件路径
+        config: database 配置
+    
+    Returns:
+        SqliteDatabase
+    """
+    return SqliteDatabase(path, pragmas=build_pragmas(config), timeout=config['busy_timeout_ms'] / 1000)
+
+class _ScopeDepth(threading.local):
+    depth = 0
+
+class ConnectionScope:
+    """
+    请求级连接作用域：进入时打开当前线程的连接，最外层退出时关闭
+    
+    异步请求处理函数都在事件循环线程上执行，同一线程上并发的请求共享一个连接，
+    因此按线程计数，最后一个请求结束时才关闭；有未结束的事务时不关闭。
+    """
+    
+    def __init__(self, database: SqliteDatabase):
+        self.database = database
+        self._local = _ScopeDepth()
+    
+    def __enter__(self) -> SqliteDatabase:
+        if self._local.depth == 0:
+            self.database.connect(reuse_if_open=True)
+        self._local.depth += 1
+        return self.database
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._local.depth -= 1
+        if self._local.depth == 0 and not self.database.in_transaction():
+            self.database.close()
 
 # 创建数据库连接
-db = SqliteDatabase(get_db_path())
+database_config = load_database_config()
+db = create_database(database_config['sqlite_path'], database_config)
+connection_scope = ConnectionScope(db)
 
 class BaseModel(Model):
     """基础模型类"""
@@ -44,7 +113,7 @@ class User(BaseModel):
 class Apk(BaseModel):
     """APK模型"""
     id = CharField(primary_key=True)  # 对应设计文档中的id字段
-    package_name = CharField()  # 包名
+    package_name = CharField(index=True)  # 包名
     app_name = CharField()  # 应用名称
     name = CharField()  # 保留原有字段
     description = CharField(null=True)
@@ -84,6 +153,12 @@ class Device(BaseModel):
     registered_at = DateTimeField(default=datetime.now)  # 注册时间
     created_at = DateTimeField(default=datetime.now)
     updated_at = DateTimeField(default=datetime.now)
+    
+    class Meta:
+        # get_available_devices 按在线状态和电量筛选
+        indexes = (
+            (('is_online', 'battery_level'), False),
+        )
 
 class DeviceApk(BaseModel):
     """设备-APK关联模型（多对多关系）"""
@@ -119,11 +194,17 @@ class TradePlan(BaseModel):
     change_percent = DecimalField(null=True)  # 涨跌幅
     data = TextField(null=True)  # JSON格式存储，交易计划数据符合TradeScript的metadata要求
     status = CharField(default='PENDING')  # 状态：PENDING、APPROVED、REJECTED、EXECUTING、COMPLETED、FAILED
-    created_at = DateTimeField(default=datetime.now)
+    created_at = DateTimeField(default=datetime.now, index=True)
     started_at = DateTimeField(null=True)
     ended_at = DateTimeField(null=True)
     execution_result = TextField(null=True)  # 执行结果（JSON格式）
     execution_message = TextField(null=True)  # 执行消息或错误信息
+    
+    class Meta:
+        # 按状态查询（待批准、已批准）时同时按创建时间有序
+        indexes = (
+            (('status', 'created_at'), False),
+        )
 
 class Contract(BaseModel):
     """合约模型"""
@@ -150,14 +231,16 @@ class TradeOrder(BaseModel):
     contract_profit_loss = DecimalField(default=0.00)  # 利润损失
     created_at = DateTimeField(default=datetime.now)
 
+ALL_MODELS = [
+    User, Device, Apk, DeviceApk, 
+    TradeScript, TradePlan, Contract, TradeOrder
+]
+
 # 创建所有表
 def create_tables():
     """创建所有数据库表"""
     with db:
-        db.create_tables([
-            User, Device, Apk, DeviceApk, 
-            TradeScript, TradePlan, Contract, TradeOrder
-        ])
+        db.create_tables(ALL_MODELS)
 
 # 初始化数据库
 if __name__ == "__main__":
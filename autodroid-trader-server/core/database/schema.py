@@ -0,0 +1,100 @@
+"""
+数据库结构版本管理
+
+结构版本保存在 SQLite 的 PRAGMA user_version 中。进程启动时执行一次 migrate：
+依次执行比当前版本新的迁移，每个迁移和版本号更新在同一个事务中提交。
+DeviceDatabase 等数据库对象只是共享连接的句柄，构造时不再建表。
+"""
+
+import logging
+import threading
+from typing import Callable, List
+
+from peewee import Database
+
+from .models import ALL_MODELS, db
+
+logger = logging.getLogger(__name__)
+
+
+def _all_models() -> list:
+    # 服务器表定义在 core.server.database 中，该模块依赖本包，在这里导入避免循环引用
+    from ..server.database import Server
+    return ALL_MODELS + [Server]
+
+
+def _create_initial_tables(database: Database):
+    """版本1：创建所有表（IF NOT EXISTS，兼容版本号出现之前创建的数据库）"""
+    models = _all_models()
+    with database.bind_ctx(models):
+        database.create_tables(models)
+
+
+# 版本2的索引语句，迁移内容固定，不随模型定义变化
+_SECONDARY_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS "tradeplan_status_created_at" ON "tradeplan" ("status", "created_at")',
+    'CREATE INDEX IF NOT EXISTS "tradeplan_created_at" ON "tradeplan" ("created_at")',
+    'CREATE INDEX IF NOT EXISTS "device_is_online_battery_level" ON "device" ("is_online", "battery_level")',
+    'CREATE INDEX IF NOT EXISTS "apk_package_name" ON "apk" ("package_name")',
+    # migrate_db.py 重建 device 表时丢失的外键索引
+    'CREATE INDEX IF NOT EXISTS "device_user_id" ON "device" ("user_id")',
+]
+
+
+def _create_secondary_indexes(database: Database):
+    """
+    版本2：热点查询的二级索引（TradePlan.status/created_at、Device.is_online/battery_level、
+    Apk.package_name）
+
+    模型中也声明了这些索引，新建的数据库在版本1已经有了，IF NOT EXISTS 跳过即可。
+    """
+    for sql in _SECONDARY_INDEXES:
+        database.execute_sql(sql)
+
+
+# 按版本顺序排列，第 i 项把结构从版本 i 升级到 i+1；只能追加，不能修改已发布的迁移
+MIGRATIONS: List[Callable[[Database], None]] = [
+    _create_initial_tables,
+    _create_secondary_indexes,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(database: Database) -> int:
+    """数据库当前的结构版本"""
+    return database.pragma('user_version')
+
+
+def migrate(database: Database = db) -> int:
+    """
+    把数据库升级到最新结构版本
+
+    Args:
+        database: 数据库
+
+    Returns:
+        升级后的版本号
+    """
+    current = get_schema_version(database)
+    for version in range(current + 1, SCHEMA_VERSION + 1):
+        with database.atomic():
+            MIGRATIONS[version - 1](database)
+            database.pragma('user_version', version)
+        logger.info(f"数据库结构已升级到版本 {version}")
+    return max(current, SCHEMA_VERSION)
+
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+
+def ensure_schema():
+    """确保本进程已执行过迁移；第一次调用之后只检查一个标志"""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            migrate(db)
+            _schema_ready = True
@@ -4,20 +4,34 @@
 """
 
 import json
+import os
+import re
+import threading
 import time
 import logging
-from dataclasses import dataclass, field
+import xml.etree.ElementTree as ET
+from dataclasses import asdict, dataclass, field, replace
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Callable, Union
+from typing import Any, Dict, List, Optional, Callable, Tuple, Union
 from datetime import datetime
 
 # 导入现有模块
 # 导入现有基础模块
-from workscript.engine import WorkScriptEngine
-from workscript import (
-    EnhancedBaseWorkScript, Action, ScreenInfo, CoordinateConverter,
-    APP_CONFIGURATIONS, AppNavigator
+from .enhanced_workscript import (
+    EnhancedBaseWorkScript, Action, ScreenInfo, CoordinateConverter, AppNavigator
 )
+from .workscript.artifacts import get_artifact_sink
+from .workscript.cancellation import CancellationToken, WorkScriptCancelled
+from .workscript.decision_cache import DecisionCache, get_decision_cache
+from .workscript.frames import Frame, FrameBuffer
+from .workscript.history import ConversationHistory, HistoryEntry, screen_digest
+from .workscript.pipeline import ObservationPipeline
+from .workscript.preprocess import PreprocessConfig, ProcessedImage, ScreenshotPreprocessor
+from .workscript.recovery import RecoveryManager, classify_error, load_app_dialogs
+from .workscript.registry import ScriptRegistry
+from .workscript.model_client import ModelClient, get_model_client
+from .workscript.streaming import ActionStreamParser, StreamingDecision, stream_chat_completion
+from .workscript.tracing import Tracer, NULL_TRACER
 
 
 @dataclass
@@ -31,6 +45,10 @@ class ModelConfig:
     top_p: float = 0.85
     frequency_penalty: float = 0.2
     extra_body: Dict[str, Any] = field(default_factory=lambda: {"skip_special_tokens": False})
+    history_token_ratio: float = 0.5  # 对话历史占 max_tokens 的比例
+    stream: bool = False  # 以 SSE 流式请求模型，ACTION/PARAMETERS 完整后立即下发动作
+    request_timeout: float = 60.0  # 模型请求超时时间（秒）
+    shared_client: bool = False  # 通过共享客户端请求模型：多设备共用连接池，相同请求去重
 
 
 @dataclass
@@ -40,8 +58,23 @@ class AgentConfig:
     device_id: Optional[str] = None
     verbose: bool = True
     enable_ai: bool = False  # 是否启用AI决策
-    enable_vision: bool = False  # 是否启用视觉理解
+    enable_vision: bool = False  # 是否启用视觉理解（截图预处理后随决策请求发送）
+    vision_max_pixels: int = 768 * 28 * 28  # 截图缩放后的最大像素数
+    vision_format: str = "jpeg"  # 截图编码格式，jpeg 或 webp
+    vision_quality: int = 80  # 截图编码质量
+    vision_crop_bars: bool = True  # 是否裁掉状态栏和导航栏
     confirmation_required: bool = True  # 是否需要敏感操作确认
+    task_timeout: Optional[float] = None  # 任务整体超时时间（秒）
+    step_timeout: Optional[float] = None  # 单步超时时间（秒）
+    pipelined: bool = False  # AI模式下动作下发后立即开始下一次观察
+    settle_interval: float = 0.2  # 流水线模式下界面稳定检测的观察间隔（秒）
+    settle_timeout: float = 3.0  # 流水线模式下等待界面稳定的最长时间（秒）
+    settle_min_delay: float = 0.3  # 流水线模式下动作下发后开始观察前的最短等待时间（秒）
+    unchanged_limit: int = 3  # 流水线模式下连续这么多次观察仍是动作前的界面时视为动作没有改变界面
+    persist_frames: bool = False  # 每一帧截图都写入磁盘（调试用），默认只在步骤失败时写入
+    decision_cache_path: Optional[str] = None  # 决策缓存持久化文件，None 表示不启用决策缓存
+    decision_cache_ttl: Optional[float] = 24 * 3600  # 决策缓存有效期（秒）
+    decision_cache_min_successes: int = 2  # 决策缓存命中前需要的成功执行次数
 
 
 @dataclass
@@ -66,20 +99,174 @@ class StepResult:
     screenshot: Optional[str] = None
 
 
+# 决策提示的固定前缀：放在最前面且不随步骤变化，模型服务端可以复用前缀缓存
+DECISION_PROMPT_PREFIX = """你是安卓自动化操作助手，根据任务、历史操作和当前屏幕决定下一步操作。
+可用操作类型: tap_at, swipe, input_text, long_press, double_tap, back, home, finish
+
+返回格式:
+ACTION: <操作类型>
+PARAMETERS: <参数>
+DESCRIPTION: <操作描述>"""
+
+# UI层级节点的 bounds 属性，如 [0,0][1080,1920]
+UI_BOUNDS_PATTERN = re.compile(r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]')
+
+# 只改变浏览位置、不提交任何内容的操作类型
+NAVIGATION_ACTIONS = frozenset({"back", "home", "swipe", "finish"})
+# 交易、资金类关键词，出现在操作描述或参数中时视为敏感操作
+SENSITIVE_ACTION_PATTERN = re.compile(r'买入|卖出|下单|委托|撤单|转账|支付|付款|交易密码')
+
+
+def is_sensitive_action(action_type: str, parameters: Dict[str, Any], description: str) -> bool:
+    """
+    判断模型决策是否为需要确认的敏感操作
+
+    Args:
+        action_type: 操作类型
+        parameters: 操作参数
+        description: 操作描述（流式模式下提前下发时可能为空）
+
+    Returns:
+        是否敏感
+    """
+    if action_type in NAVIGATION_ACTIONS:
+        return False
+    content = f"{description} {json.dumps(parameters, ensure_ascii=False)}"
+    return bool(SENSITIVE_ACTION_PATTERN.search(content))
+
+
 class AIDecisionEngine:
     """AI决策引擎"""
     
-    def __init__(self, model_config: Optional[ModelConfig] = None):
+    def __init__(self, model_config: Optional[ModelConfig] = None, tracer: Optional[Tracer] = None,
+                 decision_cache: Optional[DecisionCache] = None,
+                 preprocessor: Optional[ScreenshotPreprocessor] = None,
+                 confirmation_required: bool = True):
         self.model_config = model_config or ModelConfig()
-        self.conversation_history = []
+        self.preprocessor = preprocessor
+        self.confirmation_required = confirmation_required
+        self.conversation_history = ConversationHistory(
+            token_budget=int(self.model_config.max_tokens * self.model_config.history_token_ratio)
+        )
+        self.tracer = tracer or NULL_TRACER
+        self.decision_cache = decision_cache
+        self._last_cache_key: Optional[str] = None
+        self._pending_stream: Optional[StreamingDecision] = None
+        self._pending_action: Optional[Action] = None
+        self._pending_entry: Optional[HistoryEntry] = None
+        # 同一模型服务的所有决策引擎共享客户端和连接池
+        self.model_client: Optional[ModelClient] = (
+            get_model_client(self.model_config.base_url, self.model_config.api_key)
+            if self.model_config.shared_client else None
+        )
         
     def decide_next_action(self, task_description: str, screen_info: ScreenInfo, 
-                          previous_actions: List[Dict[str, Any]]) -> Action:
-        """基于AI模型决定下一步操作"""
-        # 这里应该集成实际的AI模型调用
-        # 暂时返回模拟的决策结果
+                          previous_actions: List[Dict[str, Any]],
+                          screen_context: Optional[str] = None,
+                          frame: Optional[Frame] = None) -> Action:
+        """基于AI模型决定下一步操作，决策缓存命中时跳过推理
+        
+        Args:
+            screen_context: prepare_observation() 的预处理结果，未提供时现场计算
+            frame: 当前截图，配置了截图预处理器时预处理后随请求发送
+        """
+        self.finish_pending_stream()
+        with self.tracer.span("decide_next_action", "model", model=self.model_config.model_name) as span:
+            action = self._cached_decision(
+                task_description, screen_info, previous_actions, screen_context, frame, span
+            )
+            entry = self.conversation_history.add(
+                action.action_type, action.parameters, action.description, screen_info
+            )
+            if self._pending_stream:
+                self._pending_entry = entry
+            return action
+    
+    def finish_pending_stream(self):
+        """等待上一次流式输出读完，补全提前下发时尚未生成的操作描述"""
+        decision, self._pending_stream = self._pending_stream, None
+        action, self._pending_action = self._pending_action, None
+        entry, self._pending_entry = self._pending_entry, None
+        if decision is None or not decision.wait_done(self.model_config.request_timeout):
+            return
+        description = decision.parser.description
+        if description and not action.description:
+            action.description = description
+            if entry is not None:
+                entry.description = description
+    
+    def _requires_confirmation(self, action_type: str, parameters: Dict[str, Any], description: str) -> bool:
+        """按配置和操作内容判断是否需要确认"""
+        return self.confirmation_required and is_sensitive_action(action_type, parameters, description)
+    
+    def _cached_decision(self, task_description: str, screen_info: ScreenInfo,
+                         previous_actions: List[Dict[str, Any]], screen_context: Optional[str],
+                         frame: Optional[Frame], span) -> Action:
+        """查询决策缓存，未命中时调用模型"""
+        if not self.decision_cache:
+            return self._decide_next_action(task_description, screen_info, previous_actions, screen_context, frame)
         
-        prompt = self.build_decision_prompt(task_description, screen_info, previous_actions)
+        # 截图随请求发送时决策也取决于画面，否则只按界面结构区分
+        self._last_cache_key = self.decision_cache.make_key(
+            task_description, screen_info, previous_actions,
+            frame.phash if frame and self.preprocessor else None
+        )
+        if self._last_cache_key is None:
+            # 屏幕信息没有界面结构时无法确认是同一界面，不查询也不写入缓存
+            if span:
+                span.set_attribute("cache", "skip")
+            return self._decide_next_action(task_description, screen_info, previous_actions, screen_context, frame)
+        cached = self.decision_cache.get(self._last_cache_key)
+        if span:
+            span.set_attribute("cache", "hit" if cached else "miss")
+        if cached:
+            return Action(**cached)
+        
+        action = self._decide_next_action(task_description, screen_info, previous_actions, screen_context, frame)
+        # 需要确认的敏感操作不缓存
+        if not action.requires_confirmation:
+            self.decision_cache.put(self._last_cache_key, asdict(action))
+        return action
+    
+    def record_outcome(self, success: bool):
+        """记录上一次决策的执行结果，用于对话历史和决策缓存的置信度门控"""
+        self.conversation_history.record_outcome(success)
+        if self.decision_cache and self._last_cache_key:
+            self.decision_cache.record_outcome(self._last_cache_key, success)
+            self._last_cache_key = None
+    
+    def prepare_observation(self, screen_info: ScreenInfo) -> str:
+        """模型预处理：与任务无关的屏幕描述，流水线模式下在设备稳定期间完成"""
+        return (
+            f"当前应用: {screen_info.current_app}\n"
+            f"屏幕尺寸: {screen_info.width}x{screen_info.height}\n"
+            f"屏幕内容: {screen_digest(screen_info)}"
+        )
+    
+    def prepare_image(self, frame: Optional[Frame]) -> Optional[ProcessedImage]:
+        """缩放、裁剪并重新编码截图，未配置预处理器或没有截图时返回 None"""
+        if not self.preprocessor or frame is None:
+            return None
+        with self.tracer.span("preprocess_screenshot", "preprocess") as span:
+            image = self.preprocessor.process(frame.data)
+            if span:
+                span.set_attribute("original_bytes", image.original_bytes)
+                span.set_attribute("bytes", len(image.data))
+                span.set_attribute("size", f"{image.width}x{image.height}")
+            return image
+    
+    def _decide_next_action(self, task_description: str, screen_info: ScreenInfo,
+                            previous_actions: List[Dict[str, Any]],
+                            screen_context: Optional[str] = None,
+                            frame: Optional[Frame] = None) -> Action:
+        """调用模型决策"""
+        prompt = self.build_decision_prompt(task_description, screen_info, previous_actions, screen_context)
+        image = self.prepare_image(frame)
+        
+        if self.model_config.stream:
+            return self._stream_decision(prompt, image)
+        if self.model_client:
+            return self._shared_client_decision(prompt, image)
         
         # 模拟AI响应
         if "登录" in task_description:
@@ -104,134 +291,277 @@ class AIDecisionEngine:
                 requires_confirmation=False
             )
     
+    def _request_payload(self, prompt: str, image: Optional[ProcessedImage] = None) -> Dict[str, Any]:
+        """chat/completions 请求体，有截图时以 data URL 附在文本之后"""
+        config = self.model_config
+        content: Union[str, List[Dict[str, Any]]] = prompt
+        if image is not None:
+            content = [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": image.data_url()}}
+            ]
+        return {
+            "model": config.model_name,
+            "messages": [{"role": "user", "content": content}],
+            "max_tokens": config.max_tokens,
+            "temperature": config.temperature,
+            "top_p": config.top_p,
+            "frequency_penalty": config.frequency_penalty,
+            **config.extra_body
+        }
+    
+    def _shared_client_decision(self, prompt: str, image: Optional[ProcessedImage] = None) -> Action:
+        """通过共享客户端请求模型，与其他设备共用连接池和并发限制"""
+        with self.tracer.span("model_request", "model"):
+            response = self.model_client.complete(
+                self._request_payload(prompt, image), self.model_config.request_timeout
+            )
+        parser = ActionStreamParser()
+        parser.feed(response["choices"][0]["message"]["content"])
+        parser.finish()
+        if not parser.ready:
+            raise ValueError(f"模型输出中缺少 ACTION/PARAMETERS: {parser.text[:200]}")
+        description = parser.description or ""
+        return Action(
+            action_type=parser.action_type,
+            parameters=parser.parameters,
+            description=description,
+            requires_confirmation=self._requires_confirmation(parser.action_type, parser.parameters, description)
+        )
+    
+    def _stream_decision(self, prompt: str, image: Optional[ProcessedImage] = None) -> Action:
+        """流式请求模型，ACTION/PARAMETERS 完整后立即返回（需确认敏感操作时等到 DESCRIPTION），其余输出在后台读入追踪"""
+        config = self.model_config
+        decision = StreamingDecision(
+            stream_chat_completion(
+                config.base_url, config.api_key, self._request_payload(prompt, image), config.request_timeout,
+                session=self.model_client.session if self.model_client else None
+            ),
+            tracer=self.tracer
+        )
+        action_type, parameters = decision.wait_action(config.request_timeout)
+        # 需要确认敏感操作时，可能敏感的操作等描述解析完再下发，下发前就确定是否需要确认
+        if self.confirmation_required and action_type not in NAVIGATION_ACTIONS:
+            decision.wait_description(config.request_timeout)
+        description = decision.parser.description or ""
+        action = Action(
+            action_type=action_type,
+            parameters=parameters,
+            description=description,
+            requires_confirmation=self._requires_confirmation(action_type, parameters, description)
+        )
+        self._pending_stream, self._pending_action = decision, action
+        return action
+    
     def build_decision_prompt(self, task_description: str, screen_info: ScreenInfo,
-                            previous_actions: List[Dict[str, Any]]) -> str:
-        """构建决策提示"""
-        prompt = f"""
-        任务描述: {task_description}
-        当前应用: {screen_info.current_app}
-        屏幕尺寸: {screen_info.width}x{screen_info.height}
-        历史操作: {len(previous_actions)} 个
-        
-        请基于当前状态决定下一步操作。
-        可用操作类型: tap_at, swipe, input_text, long_press, double_tap, back, home, finish
+                            previous_actions: List[Dict[str, Any]],
+                            screen_context: Optional[str] = None) -> str:
+        """构建决策提示
         
-        返回格式:
-        ACTION: <操作类型>
-        PARAMETERS: <参数>
-        DESCRIPTION: <操作描述>
+        顺序为 固定前缀 → 任务 → 历史 → 当前屏幕：同一任务内前面的部分保持不变，
+        历史在 token 预算内压缩，变化集中在末尾。
         """
-        return prompt.strip()
+        if screen_context is None:
+            screen_context = self.prepare_observation(screen_info)
+        history = self.conversation_history.render()
+        sections = [
+            DECISION_PROMPT_PREFIX,
+            f"任务描述: {task_description}",
+            f"历史操作:\n{history}" if history else "历史操作: 无",
+            f"当前屏幕:\n{screen_context}",
+            "请基于当前状态决定下一步操作。"
+        ]
+        return "\n\n".join(sections)
 
 
 class ScreenCapture:
-    """屏幕截图管理器"""
+    """屏幕截图管理器：每台设备一个内存环形缓冲区，多个使用方共享最新一帧"""
     
-    def __init__(self, device_id: Optional[str] = None):
+    def __init__(self, device_id: Optional[str] = None, capacity: int = 8,
+                 source: Optional[Callable[[], Optional[bytes]]] = None,
+                 hierarchy: Optional[Callable[[], Optional[ET.Element]]] = None):
+        """
+        Args:
+            device_id: 设备ID
+            capacity: 内存中保留的帧数
+            source: 截屏函数，返回 PNG 数据（通常为 ADBDevice.capture_screenshot）
+            hierarchy: UI层级获取函数（通常为 DeviceConnection.dump_ui_hierarchy）
+        """
         self.device_id = device_id
-        self.screenshot_counter = 0
-        self.screenshot_dir = Path("reports/screenshots")
-        self.screenshot_dir.mkdir(parents=True, exist_ok=True)
-    
-    def capture_screen(self, filename: Optional[str] = None) -> str:
-        """截取屏幕并保存"""
-        if not filename:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"screenshot_{timestamp}_{self.screenshot_counter}.png"
-            self.screenshot_counter += 1
-        
-        screenshot_path = self.screenshot_dir / filename
-        
-        # 这里应该集成实际的屏幕截图逻辑
-        # 暂时创建空文件作为占位符
-        screenshot_path.touch()
-        
-        return str(screenshot_path)
+        self.source = source
+        self.hierarchy = hierarchy
+        self.frames = FrameBuffer(capacity)
+        self.persist = False  # 每一帧都写入磁盘，默认只在步骤失败时写入
+        self.artifacts = get_artifact_sink()
+        self.screenshot_dir = os.path.join(self.artifacts.root_dir, "screenshots", device_id or "default")
+    
+    def capture_screen(self) -> Optional[Frame]:
+        """截屏并加入缓冲区，与上一帧相同时不保存新帧"""
+        if not self.source:
+            return None
+        png_data = self.source()
+        if not png_data:
+            return None
+        frame, _ = self.frames.add(png_data)
+        if self.persist:
+            self.flush("frame")
+        return frame
+    
+    def latest_frame(self, max_age: Optional[float] = None) -> Optional[Frame]:
+        """最新一帧；超过 max_age 秒时重新截屏，供校验器、实时预览等使用方共享"""
+        frame = self.frames.latest()
+        if frame is None or (max_age is not None and frame.age > max_age):
+            frame = self.capture_screen()
+        return frame
+    
+    def flush(self, reason: str) -> List[str]:
+        """把缓冲区中尚未写入的帧写入磁盘（步骤失败或开启逐帧保存时）"""
+        return self.frames.flush(self.artifacts, self.screenshot_dir, prefix=reason)
     
     def get_screen_info(self) -> ScreenInfo:
-        """获取屏幕信息"""
-        # 这里应该集成实际的设备信息获取
+        """获取屏幕信息：截图加入缓冲区，当前应用、屏幕尺寸、文本和控件来自UI层级"""
+        frame = self.capture_screen()
+        root = self.hierarchy() if self.hierarchy else None
+        width, height, current_app = 1080, 1920, "Unknown"
+        text_elements: List[Dict[str, Any]] = []
+        ui_elements: List[Dict[str, Any]] = []
+        if root is not None:
+            for index, node in enumerate(root.iter("node")):
+                if index == 0:
+                    # 第一个节点是整个窗口
+                    match = UI_BOUNDS_PATTERN.search(node.get("bounds") or "")
+                    if match:
+                        x1, y1, x2, y2 = map(int, match.groups())
+                        width, height = x2 - x1, y2 - y1
+                if current_app == "Unknown" and node.get("package"):
+                    current_app = node.get("package")
+                text = node.get("text") or node.get("content-desc")
+                if text:
+                    text_elements.append({"text": text})
+                if node.get("resource-id"):
+                    ui_elements.append({"resource_id": node.get("resource-id"), "class": node.get("class")})
         return ScreenInfo(
-            width=1080,
-            height=1920,
-            current_app="Unknown",
-            screenshot_path=self.capture_screen(),
-            text_elements=[],
-            ui_elements=[]
+            width=width,
+            height=height,
+            current_app=current_app,
+            screenshot_path=frame.path if frame else None,
+            text_elements=text_elements,
+            ui_elements=ui_elements,
+            frame_hash=frame.phash if frame else None
         )
 
 
-class ErrorRecovery:
-    """错误恢复处理器"""
-    
-    def __init__(self):
-        self.recovery_strategies = {
-            'app_not_responding': self.handle_app_crash,
-            'element_not_found': self.handle_missing_element,
-            'network_error': self.handle_network_issue,
-            'login_required': self.handle_login_required,
-            'timeout': self.handle_timeout
-        }
-        self.max_retries = 3
-    
-    def handle_error(self, error_type: str, context: Dict[str, Any]) -> bool:
-        """处理错误并尝试恢复"""
-        if error_type in self.recovery_strategies:
-            return self.recovery_strategies[error_type](context)
-        return False
-    
-    def handle_app_crash(self, context: Dict[str, Any]) -> bool:
-        """处理应用崩溃"""
-        logging.info("尝试恢复应用崩溃")
-        # 重新启动应用
-        app_name = context.get('current_app', '')
-        if app_name in APP_CONFIGURATIONS:
-            # 这里应该集成应用重启逻辑
-            return True
-        return False
-    
-    def handle_missing_element(self, context: Dict[str, Any]) -> bool:
-        """处理元素未找到"""
-        logging.info("尝试处理元素未找到")
-        # 等待并重试，或者尝试替代方案
-        time.sleep(2)  # 等待页面加载
-        return True
-    
-    def handle_network_issue(self, context: Dict[str, Any]) -> bool:
-        """处理网络问题"""
-        logging.info("尝试处理网络问题")
-        # 等待网络恢复
-        time.sleep(5)
-        return True
-    
-    def handle_login_required(self, context: Dict[str, Any]) -> bool:
-        """处理需要登录的情况"""
-        logging.info("需要登录，尝试自动登录")
-        # 这里可以实现自动登录逻辑
-        return False  # 暂时无法自动处理
-    
-    def handle_timeout(self, context: Dict[str, Any]) -> bool:
-        """处理超时"""
-        logging.info("处理超时问题")
-        # 增加等待时间
-        time.sleep(3)
-        return True
-
-
 class TaskExecutor:
     """任务执行器"""
     
     def __init__(self, agent_config: AgentConfig):
         self.config = agent_config
         self.screen_capture = ScreenCapture(agent_config.device_id)
-        self.error_recovery = ErrorRecovery()
+        self.error_recovery = RecoveryManager()
         self.ai_engine = None
+        self.cancel_token: Optional[CancellationToken] = None
+        self.pipeline: Optional[ObservationPipeline] = None
+        self.decision_cache: Optional[DecisionCache] = None
+        if agent_config.decision_cache_path:
+            self.decision_cache = get_decision_cache(
+                agent_config.decision_cache_path,
+                ttl=agent_config.decision_cache_ttl,
+                min_successes=agent_config.decision_cache_min_successes
+            )
+        
+        # 启用视觉理解时截图先缩放、裁剪、重新编码再提交给模型
+        self.preprocessor: Optional[ScreenshotPreprocessor] = None
+        if agent_config.enable_vision:
+            self.preprocessor = ScreenshotPreprocessor(PreprocessConfig(
+                max_pixels=agent_config.vision_max_pixels,
+                format=agent_config.vision_format,
+                quality=agent_config.vision_quality,
+                crop_bars=agent_config.vision_crop_bars
+            ))
         
         if agent_config.enable_ai:
-            self.ai_engine = AIDecisionEngine()
+            self.ai_engine = AIDecisionEngine(
+                decision_cache=self.decision_cache, preprocessor=self.preprocessor,
+                confirmation_required=agent_config.confirmation_required
+            )
+    
+    def cancel(self, reason: str = "用户手动停止"):
+        """取消当前正在执行的任务"""
+        if self.cancel_token:
+            self.cancel_token.cancel(reason)
     
-    def execute_task(self, task_description: str, work_script: EnhancedBaseWorkScript) -> ExecutionResult:
-        """执行任务"""
+    def execute_task(self, task_description: str, work_script: EnhancedBaseWorkScript,
+                     cancel_token: Optional[CancellationToken] = None) -> ExecutionResult:
+        """执行任务
+        
+        Args:
+            task_description: 任务描述
+            work_script: 工作脚本
+            cancel_token: 取消令牌，未提供时按 task_timeout 创建
+        """
+        self.cancel_token = cancel_token or CancellationToken(self.config.task_timeout)
+        work_script.cancel_token = self.cancel_token
+        if work_script.device:
+            work_script.device.cancel_token = self.cancel_token
+            work_script.device.tracer = work_script.tracer
+            if work_script.device.adb_device:
+                self.screen_capture.source = work_script.device.adb_device.capture_screenshot
+            self.screen_capture.hierarchy = work_script.device.dump_ui_hierarchy
+        self.error_recovery.device = work_script.device
+        self.error_recovery.tracer = work_script.tracer
+        self.error_recovery.cancel_token = self.cancel_token
+        self.error_recovery.reset()
+        self.error_recovery.load_dialogs(load_app_dialogs(work_script.app_package) if work_script.app_package else [])
+        # 截图只保存在内存中，开启逐帧保存时才每帧写入磁盘
+        self.screen_capture.persist = self.config.persist_frames
+        if self.ai_engine:
+            self.ai_engine.tracer = work_script.tracer
+            self.ai_engine.conversation_history.clear()
+        
+        # 流水线模式：动作下发后立即在后台开始下一次观察，与设备稳定和结果记录重叠
+        if self.config.pipelined and self.config.enable_ai and self.ai_engine:
+            self.pipeline = ObservationPipeline(
+                self.screen_capture.get_screen_info,
+                preprocess=self.ai_engine.prepare_observation,
+                settle_interval=self.config.settle_interval,
+                settle_timeout=self.config.settle_timeout,
+                settle_min_delay=self.config.settle_min_delay,
+                unchanged_limit=self.config.unchanged_limit,
+                tracer=work_script.tracer,
+                cancel_token=self.cancel_token
+            )
+        
+        try:
+            result = self._run_task(task_description, work_script)
+        finally:
+            if self.ai_engine:
+                # 流式模式下最后一步的说明文本读完后再导出追踪
+                self.ai_engine.finish_pending_stream()
+            pipeline_stats = self.pipeline.stats if self.pipeline else None
+            if self.pipeline:
+                self.pipeline.close()
+                self.pipeline = None
+        
+        # 导出追踪文件，并把步骤延迟统计附加到结果数据中
+        result.data = {**(result.data or {}), **work_script.export_trace()}
+        if result.execution_time > 0:
+            result.data["steps_per_minute"] = round(len(result.actions) * 60 / result.execution_time, 2)
+        if pipeline_stats:
+            result.data["pipeline"] = pipeline_stats
+        result.data["recovery"] = self.error_recovery.stats
+        result.data["frames"] = {
+            **self.screen_capture.frames.stats,
+            "memory_bytes": self.screen_capture.frames.memory_bytes
+        }
+        if self.preprocessor:
+            result.data["preprocess"] = self.preprocessor.stats
+        if self.decision_cache:
+            self.decision_cache.save()
+            result.data["decision_cache"] = self.decision_cache.stats
+        return result
+    
+    def _run_task(self, task_description: str, work_script: EnhancedBaseWorkScript) -> ExecutionResult:
+        """执行任务主循环"""
         start_time = time.time()
         actions = []
         
@@ -241,8 +571,8 @@ class TaskExecutor:
             # 初始化任务
             self.log_task_start(task_description)
             
-            # 检查是否有run方法，直接调用脚本运行
-            if hasattr(work_script, 'run'):
+            # 未启用AI决策时直接调用脚本的run方法，启用时由模型逐步决策
+            if not (self.config.enable_ai and self.ai_engine):
                 logging.info(f"直接调用脚本的run方法执行任务: {task_description}")
                 result = work_script.run(task_description=task_description)
                 execution_time = time.time() - start_time
@@ -257,7 +587,9 @@ class TaskExecutor:
             
             # 执行任务步骤（传统模式）
             for step in range(self.config.max_steps):
-                step_result = self.execute_step(task_description, work_script, actions)
+                with work_script.tracer.span("执行步骤", "step", step=step + 1), \
+                        self.cancel_token.step(f"步骤 {step + 1}", self.config.step_timeout):
+                    step_result = self.execute_step(task_description, work_script, actions)
                 
                 if step_result.action:
                     actions.append({
@@ -277,9 +609,19 @@ class TaskExecutor:
                     )
                 
                 if not step_result.success:
-                    # 尝试错误恢复
-                    recovery_success = self.error_recovery.handle_error(
-                        "execution_error", {"context": step_result.message}
+                    # 保留失败前的画面供排查
+                    self.screen_capture.flush(f"step{step + 1}_failed")
+                    latest_frame = self.screen_capture.frames.latest()
+                    step_result.screenshot = latest_frame.path if latest_frame else None
+                    
+                    # 按错误类型退避并执行恢复动作，预算用完时放弃
+                    recovery_success = self.error_recovery.handle(
+                        classify_error(step_result.message),
+                        {
+                            "context": step_result.message,
+                            "screen_info": work_script.screen_info,
+                            "app_package": work_script.app_package
+                        }
                     )
                     
                     if not recovery_success:
@@ -301,6 +643,24 @@ class TaskExecutor:
                 execution_time=execution_time
             )
             
+        except WorkScriptCancelled as e:
+            # 立即释放设备，并返回已完成的部分结果
+            work_script.release_device()
+            execution_time = time.time() - start_time
+            logging.warning(f"任务已取消: {e.reason} (步骤: {e.step})")
+            return ExecutionResult(
+                success=False,
+                message=f"任务已取消: {e.reason}",
+                data={
+                    "cancelled": True,
+                    "cancelled_step": e.step,
+                    "completed_actions": len(actions)
+                },
+                actions=actions,
+                execution_time=execution_time,
+                error=e.reason
+            )
+            
         except Exception as e:
             execution_time = time.time() - start_time
             return ExecutionResult(
@@ -315,17 +675,25 @@ class TaskExecutor:
                     previous_actions: List[Dict[str, Any]]) -> StepResult:
         """执行单步操作"""
         try:
-            # 获取当前屏幕状态
-            screen_info = self.screen_capture.get_screen_info()
+            # 获取当前屏幕状态；流水线模式下使用后台已稳定并预处理的观察
+            screen_context = None
+            if self.pipeline:
+                observation = self.pipeline.next()
+                screen_info, screen_context = observation.screen, observation.prepared
+            else:
+                with work_script.tracer.span("get_screen_info", "capture"):
+                    screen_info = self.screen_capture.get_screen_info()
             work_script.screen_info = screen_info
             
             if self.config.enable_ai and self.ai_engine:
                 # AI决策模式
                 action = self.ai_engine.decide_next_action(
-                    task_description, screen_info, previous_actions
+                    task_description, screen_info, previous_actions, screen_context,
+                    frame=self.screen_capture.frames.latest()
                 )
                 
                 if action.action_type == "finish":
+                    self.ai_engine.record_outcome(True)
                     return StepResult(
                         success=True,
                         finished=True,
@@ -335,7 +703,13 @@ class TaskExecutor:
                     )
                 
                 # 执行AI决策的动作
-                result = work_script.execute_action(action)
+                with work_script.tracer.span("execute_action", "action", action=action.action_type):
+                    result = work_script.execute_action(action)
+                
+                # 动作已下发，立即开始下一次截屏和UI层级获取
+                if self.pipeline:
+                    self.pipeline.start()
+                self.ai_engine.record_outcome(result["success"])
                 
                 return StepResult(
                     success=result["success"],
@@ -374,57 +748,98 @@ class TaskExecutor:
 
 
 class EnhancedWorkScriptEngine:
-    """增强版工作脚本引擎"""
+    """增强版工作脚本引擎
+    
+    构造时只登记脚本工厂；脚本、任务执行器、产物写入器和日志处理器都在首次使用时创建。
+    """
     
     def __init__(self, reports_dir: str = "reports", agent_config: Optional[AgentConfig] = None):
         self.reports_dir = Path(reports_dir)
-        self.reports_dir.mkdir(parents=True, exist_ok=True)
-        
         self.agent_config = agent_config or AgentConfig()
-        self.task_executor = TaskExecutor(self.agent_config)
-        self.script_registry = {}
+        self.model_config: Optional[ModelConfig] = None
+        self.script_registry = ScriptRegistry()
+        self.logger = logging.getLogger(__name__)
+        
+        # 每台设备一个任务执行器；设备锁在引擎生命周期内保持不变，同一设备上的任务串行执行
+        self._executors: Dict[Optional[str], TaskExecutor] = {}
+        self._device_locks: Dict[Optional[str], threading.Lock] = {}
+        self._executors_lock = threading.Lock()
+        self._artifacts = None
         
-        self._setup_logging()
         self._register_enhanced_scripts()
     
+    @property
+    def artifacts(self):
+        """产物写入器，首次使用时创建报告目录并设置日志"""
+        if self._artifacts is None:
+            self._artifacts = get_artifact_sink(str(self.reports_dir))
+            self._setup_logging()
+        return self._artifacts
+    
+    @property
+    def task_executor(self) -> TaskExecutor:
+        """默认设备的任务执行器"""
+        return self.executor_for(self.agent_config.device_id)
+    
+    def executor_for(self, device_id: Optional[str]) -> TaskExecutor:
+        """获取设备对应的任务执行器，首次使用时创建"""
+        return self._executor_and_lock(device_id)[0]
+    
+    def _executor_and_lock(self, device_id: Optional[str]) -> Tuple[TaskExecutor, threading.Lock]:
+        """同时获取设备的任务执行器和设备锁"""
+        with self._executors_lock:
+            lock = self._device_locks.setdefault(device_id, threading.Lock())
+            executor = self._executors.get(device_id)
+            if executor is None:
+                config = replace(self.agent_config, device_id=device_id)
+                executor = TaskExecutor(config)
+                if config.enable_ai and self.model_config:
+                    executor.ai_engine = AIDecisionEngine(
+                        self.model_config, decision_cache=executor.decision_cache,
+                        preprocessor=executor.preprocessor,
+                        confirmation_required=config.confirmation_required
+                    )
+                self._executors[device_id] = executor
+            return executor, lock
+    
     def _setup_logging(self):
         """设置日志记录"""
-        log_file = self.reports_dir / "enhanced_engine.log"
+        if logging.getLogger().handlers:
+            return
+        
+        # 日志经 QueueHandler 入队，由后台线程写入
         logging.basicConfig(
             level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(log_file),
-                logging.StreamHandler()
-            ]
+            handlers=[self._artifacts.log_handler("enhanced_engine.log")]
         )
-        self.logger = logging.getLogger(__name__)
     
     def _register_enhanced_scripts(self):
-        """注册增强版脚本"""
-        # 导入增强版脚本
-        from enhanced_workscript import EnhancedLoginTestScript
-        
-        self.script_registry["enhanced_login"] = EnhancedLoginTestScript()
-        
-        self.logger.info(f"注册了 {len(self.script_registry)} 个增强版脚本")
+        """登记增强版脚本工厂，首次使用时才导入"""
+        self.script_registry.register("enhanced_login", "core.enhanced_workscript:EnhancedLoginTestScript")
     
     def execute_intelligent_task(self, task_description: str, script_name: str = None, 
                                work_script: EnhancedBaseWorkScript = None, **kwargs) -> ExecutionResult:
-        """执行智能任务"""
+        """执行智能任务
+        
+        Args:
+            device_id: 关键字参数，执行任务的设备，默认使用 agent_config.device_id
+        """
         
         if not work_script:
             if script_name and script_name in self.script_registry:
-                work_script = self.script_registry[script_name]
+                work_script = self.script_registry.create(script_name)
             else:
                 # 创建默认的智能脚本
                 work_script = self.create_intelligent_script(task_description)
         
         # 执行任务
-        result = self.task_executor.execute_task(task_description, work_script)
+        device_id = kwargs.get("device_id", self.agent_config.device_id)
+        executor, lock = self._executor_and_lock(device_id)
+        with lock:
+            result = executor.execute_task(task_description, work_script)
         
         # 保存结果
-        self.save_execution_result(result, task_description)
+        self.save_execution_result(result, task_description, kwargs.get("workplan_id"))
         
         return result
     
@@ -448,14 +863,15 @@ class EnhancedWorkScriptEngine:
         
         return IntelligentScript(task_description)
     
-    def save_execution_result(self, result: ExecutionResult, task_description: str):
-        """保存执行结果"""
+    def save_execution_result(self, result: ExecutionResult, task_description: str,
+                              workplan_id: Optional[str] = None):
+        """保存执行结果到产物索引（后台批量写入，按工作计划ID和时间查询）"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        result_file = self.reports_dir / f"enhanced_execution_{timestamp}.json"
         
         result_data = {
             "task_description": task_description,
             "timestamp": timestamp,
+            "status": "success" if result.success else "failed",
             "success": result.success,
             "message": result.message,
             "execution_time": result.execution_time,
@@ -464,10 +880,8 @@ class EnhancedWorkScriptEngine:
             "data": result.data
         }
         
-        with open(result_file, 'w', encoding='utf-8') as f:
-            json.dump(result_data, f, ensure_ascii=False, indent=2)
-        
-        self.logger.info(f"执行结果已保存到: {result_file}")
+        self.artifacts.record_result("enhanced_execution", workplan_id, result_data)
+        self.logger.info(f"执行结果已加入写入队列: {self.artifacts.index_path}")
     
     def get_available_apps(self) -> List[str]:
         """获取可用的应用列表"""
@@ -478,11 +892,14 @@ class EnhancedWorkScriptEngine:
         return AppNavigator.get_app_config(app_name)
     
     def set_ai_config(self, model_config: ModelConfig, agent_config: AgentConfig):
-        """设置AI配置"""
-        self.agent_config = agent_config
-        self.task_executor = TaskExecutor(agent_config)
-        if agent_config.enable_ai:
-            self.task_executor.ai_engine = AIDecisionEngine(model_config)
+        """设置AI配置，已创建的任务执行器在下次使用时按新配置重建
+        
+        正在执行的任务继续使用原执行器；设备锁不重建，新配置下的任务仍等待同一设备上的任务结束。
+        """
+        with self._executors_lock:
+            self.agent_config = agent_config
+            self.model_config = model_config
+            self._executors.clear()
         
         self.logger.info("AI配置已更新")
 
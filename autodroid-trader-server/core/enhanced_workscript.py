@@ -12,8 +12,8 @@ from typing import Any, Dict, List, Optional, Tuple, Union
 from pathlib import Path
 
 # 导入现有基础模块
-from workscript.base import BaseWorkScript
-from workscript.engine import WorkScriptEngine
+from .workscript.base import BaseWorkScript
+from .workscript.engine import WorkScriptEngine
 
 
 @dataclass
@@ -60,6 +60,7 @@ class ScreenInfo:
     screenshot_path: Optional[str] = None
     text_elements: List[Dict] = None
     ui_elements: List[Dict] = None
+    frame_hash: Optional[int] = None  # 当前截图的感知哈希，没有截图时为 None
 
 
 class CoordinateConverter:
@@ -96,6 +97,8 @@ class EnhancedBaseWorkScript(BaseWorkScript):
         self.coordinate_converter = CoordinateConverter()
         self.screen_info = None
         self.device_id = serialno
+        # 目标应用包名：错误恢复时重启该应用，并加载其应用定义中的已知弹窗
+        self.app_package: Optional[str] = self.get_workplan_param('app_package')
         self.logger = logging.getLogger(self.__class__.__name__)
         
     def initialize_enhanced_features(self, device_id: str = None):
@@ -8,7 +8,7 @@ from typing import List, Optional, Dict, Any
 from peewee import DoesNotExist, CharField, IntegerField, TextField, DateTimeField
 
 from ..database.base import BaseDatabase
-from ..database.models import db, create_tables, BaseModel
+from ..database.models import db, BaseModel
 
 
 class Server(BaseModel):
@@ -30,21 +30,12 @@ class Server(BaseModel):
         table_name = 'servers'
 
 
-# 确保在导入时创建表
-def ensure_tables():
-    """确保服务器相关表已创建"""
-    if not Server.table_exists():
-        Server.create_table()
-
-
 class ServerDatabase(BaseDatabase):
     """服务器数据库管理类"""
     
     def __init__(self):
         """初始化服务器数据库"""
         super().__init__()
-        # 确保服务器表已创建
-        ensure_tables()
     
     def get_server(self, server_id: str) -> Optional[Server]:
         """根据ID获取服务器"""
@@ -12,8 +12,8 @@ from pathlib import Path
 sys.path.append('d:/git/autodroid')
 
 # 导入增强版引擎
-from enhanced_engine import EnhancedWorkScriptEngine, AgentConfig, ModelConfig
-from enhanced_workscript import EnhancedLoginTestScript
+from core.engine import EnhancedWorkScriptEngine, AgentConfig, ModelConfig
+from core.enhanced_workscript import EnhancedLoginTestScript
 
 def test_enhanced_engine():
     """测试增强版工作脚本引擎"""
@@ -88,7 +88,7 @@ def test_enhanced_engine():
     
     # 测试3: 坐标转换功能
     print("\n📍 测试3: 坐标转换功能")
-    from workscript import CoordinateConverter
+    from core.enhanced_workscript import CoordinateConverter
 
     converter = CoordinateConverter()
 
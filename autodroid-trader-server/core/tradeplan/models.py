@@ -55,6 +55,7 @@ class TradePlanExecuteRequest(BaseModel):
 class TradePlanStartExecuteRequest(BaseModel):
     """开始执行交易计划请求模型"""
     device_udid: Optional[str] = None
+    timeout_seconds: Optional[float] = Field(None, gt=0, description="执行整体超时时间（秒）")
 
 
 class TradePlanStopRequest(BaseModel):
@@ -1,8 +1,9 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime
 import asyncio
 import logging
 
+from ..workscript.cancellation import CancellationToken, WorkScriptCancelled, DeadlineExceeded
 from .database import TradePlanDatabase
 from .models import (
     TradePlanStatus,
@@ -29,6 +30,8 @@ class TradePlanService:
     def __init__(self):
         """初始化交易计划服务"""
         self.tradeplan_db = TradePlanDatabase()
+        # 正在执行的交易计划：tradeplan_id -> (异步任务, 取消令牌)
+        self._executions: Dict[str, Tuple[asyncio.Task, CancellationToken]] = {}
     
     def create_tradeplan(self, request: TradePlanCreateRequest) -> TradePlanCreateResponse:
         """创建交易计划"""
@@ -220,8 +223,12 @@ class TradePlanService:
                 started_at=datetime.now()
             )
             
-            # 启动异步执行任务
-            asyncio.create_task(self._execute_tradeplan_async(tradeplan_id, tradeplan))
+            # 启动异步执行任务，保留取消令牌以便 stop_tradeplan 真正中止执行
+            cancel_token = CancellationToken(request.timeout_seconds)
+            task = asyncio.create_task(
+                self._execute_tradeplan_async(tradeplan_id, tradeplan, cancel_token)
+            )
+            self._executions[tradeplan_id] = (task, cancel_token)
             
             return TradePlanStartExecuteResponse(
                 message=f"交易计划开始执行: {tradeplan['name']}",
@@ -238,16 +245,25 @@ class TradePlanService:
                 status=TradePlanStatus.FAILED
             )
     
-    async def _execute_tradeplan_async(self, tradeplan_id: str, tradeplan: Dict[str, Any]):
+    async def _execute_tradeplan_async(
+        self,
+        tradeplan_id: str,
+        tradeplan: Dict[str, Any],
+        cancel_token: CancellationToken
+    ):
         """异步执行交易计划（实际执行逻辑）"""
+        progress = 0
         try:
             logger.info(f"开始执行交易计划: {tradeplan_id}")
             
-            # 模拟执行过程（实际项目中这里应该调用真正的执行引擎）
+            # 模拟执行过程（实际项目中这里应该调用真正的执行引擎，并传入 cancel_token）
             # 可以在这里更新执行进度和状态
             for i in range(1, 6):
+                cancel_token.check()
                 await asyncio.sleep(1)
-                logger.info(f"交易计划 {tradeplan_id} 执行进度: {i * 20}%")
+                progress = i * 20
+                logger.info(f"交易计划 {tradeplan_id} 执行进度: {progress}%")
+            cancel_token.check()
             
             # 执行完成
             self.tradeplan_db.update_tradeplan_status(tradeplan_id, TradePlanStatus.COMPLETED)
@@ -263,6 +279,32 @@ class TradePlanService:
             
             logger.info(f"交易计划执行完成: {tradeplan_id}")
             
+        except (WorkScriptCancelled, asyncio.CancelledError) as e:
+            # 记录部分结果；用户停止时状态已由 stop_tradeplan 更新
+            if isinstance(e, DeadlineExceeded):
+                logger.warning(f"交易计划执行超时: {tradeplan_id}，进度: {progress}%")
+                self.tradeplan_db.update_tradeplan_status(tradeplan_id, TradePlanStatus.FAILED)
+                self.tradeplan_db.update_tradeplan_execution_time(
+                    tradeplan_id,
+                    ended_at=datetime.now()
+                )
+                self.tradeplan_db.update_tradeplan_execution_result(
+                    tradeplan_id,
+                    execution_result="TIMEOUT",
+                    execution_message=f"执行超时，已完成 {progress}%"
+                )
+            else:
+                reason = cancel_token.reason or "执行已取消"
+                logger.info(f"交易计划已停止: {tradeplan_id}，进度: {progress}%")
+                self.tradeplan_db.update_tradeplan_execution_result(
+                    tradeplan_id,
+                    execution_result="STOPPED",
+                    execution_message=f"{reason}（已完成 {progress}%）"
+                )
+            if isinstance(e, asyncio.CancelledError):
+                # 任务本身被取消，继续向上传递，让 await 它的一方看到取消
+                raise
+            
         except Exception as e:
             logger.error(f"执行交易计划失败: {e}")
             self.tradeplan_db.update_tradeplan_status(tradeplan_id, TradePlanStatus.FAILED)
@@ -275,6 +317,9 @@ class TradePlanService:
                 execution_result="FAILED",
                 execution_message=f"执行失败: {str(e)}"
             )
+        
+        finally:
+            self._executions.pop(tradeplan_id, None)
     
     def stop_tradeplan(
         self,
@@ -298,6 +343,13 @@ class TradePlanService:
                     status=tradeplan["status"]
                 )
             
+            # 通知正在运行的任务停止，任务会释放设备并记录部分结果
+            execution = self._executions.get(tradeplan_id)
+            if execution:
+                task, cancel_token = execution
+                cancel_token.cancel(request.reason or "用户手动停止")
+                task.cancel()
+            
             # 更新状态为已停止
             self.tradeplan_db.update_tradeplan_status(tradeplan_id, TradePlanStatus.FAILED)
             self.tradeplan_db.update_tradeplan_execution_time(
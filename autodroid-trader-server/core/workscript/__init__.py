@@ -6,7 +6,26 @@
 """
 
 from .base import BaseWorkScript
+from .cancellation import CancellationToken, WorkScriptCancelled, DeadlineExceeded
+from .checkpoint import Checkpoint, CheckpointFailed
+from .decision_cache import DecisionCache, get_decision_cache
+from .history import ConversationHistory
+from .model_client import ModelClient, get_model_client
+from .flow import FlowWorkScript, compile_flow
+from .frames import FrameBuffer
+from .pipeline import ObservationPipeline, screen_signature
+from .preprocess import ScreenshotPreprocessor
+from .recovery import RecoveryManager
+from .registry import ScriptRegistry
+from .streaming import StreamingDecision
+from .tracing import Tracer
 from .engine import WorkScriptEngine
 
 __version__ = '1.0.0'
-__all__ = ['BaseWorkScript', 'WorkScriptEngine']
\ No newline at end of file
+__all__ = [
+    'BaseWorkScript', 'WorkScriptEngine',
+    'CancellationToken', 'WorkScriptCancelled', 'DeadlineExceeded',
+    'Checkpoint', 'CheckpointFailed', 'ConversationHistory', 'DecisionCache', 'get_decision_cache', 'FlowWorkScript', 'compile_flow',
+    'FrameBuffer', 'ModelClient', 'get_model_client', 'ObservationPipeline', 'screen_signature',
+    'ScreenshotPreprocessor', 'RecoveryManager', 'ScriptRegistry', 'StreamingDecision', 'Tracer'
+]
\ No newline at end of file
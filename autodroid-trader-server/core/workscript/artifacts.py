@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+报告和产物异步写入 - 执行线程只负责入队，磁盘写入在后台线程完成
+
+- 报告、追踪等文件由后台线程写入，截图压缩为 WebP（Pillow 不可用时使用 gzip）；
+- 小型 JSON 执行结果批量写入 SQLite 索引（按工作计划ID和时间建索引），
+  替代每次执行生成一个缩进 JSON 文件；
+- 日志通过 QueueHandler 入队，由 QueueListener 写入滚动日志，滚动后的日志 gzip 压缩。
+"""
+
+import atexit
+import gzip
+import io
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        workplan_id TEXT,
+        status TEXT,
+        created_at REAL NOT NULL,
+        data TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_results_workplan_time ON results (workplan_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_results_time ON results (created_at)",
+]
+
+
+def _gzip_rotator(source: str, dest: str):
+    """滚动日志时压缩旧文件"""
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb', compresslevel=6) as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+class ArtifactSink:
+    """
+    非阻塞产物写入器
+
+    写入请求进入有界队列，由单个后台线程按顺序处理；队列满时调用方等待，
+    保证内存有界。barrier() 等待调用方此前入队的写入完成，
+    flush() 等待队列中的写入全部完成。
+    """
+
+    def __init__(self, root_dir: str, max_pending: int = 1000, batch_size: int = 100,
+                 index_name: str = 'artifacts.db'):
+        """
+        初始化产物写入器
+
+        Args:
+            root_dir: 报告根目录
+            max_pending: 队列中最多等待的写入请求数
+            batch_size: 每次事务最多写入的结果条数
+            index_name: 结果索引数据库文件名
+        """
+        self.root_dir = root_dir
+        self.index_path = os.path.join(root_dir, index_name)
+        self.batch_size = batch_size
+        self.stats = {'files': 0, 'results': 0, 'bytes_in': 0, 'bytes_out': 0, 'errors': 0}
+        os.makedirs(root_dir, exist_ok=True)
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._listeners: List[logging.handlers.QueueListener] = []
+        self._closed = False
+        self._thread = threading.Thread(target=self._worker, name='ArtifactSink', daemon=True)
+        self._thread.start()
+
+    @property
+    def closed(self) -> bool:
+        """是否已关闭"""
+        return self._closed
+
+    # ---- 入队接口（执行线程调用） ----
+
+    def write_bytes(self, path: str, data: bytes, compress: bool = False) -> str:
+        """
+        异步写入二进制文件
+
+        Args:
+            path: 文件路径
+            data: 文件内容
+            compress: 是否 gzip 压缩（路径追加 .gz）
+
+        Returns:
+            最终文件路径
+        """
+        if compress:
+            path = f"{path}.gz"
+        self._put(('file', path, data, 'gzip' if compress else None))
+        return path
+
+    def write_text(self, path: str, content: str, compress: bool = False) -> str:
+        """异步写入文本文件（UTF-8）"""
+        return self.write_bytes(path, content.encode('utf-8'), compress)
+
+    def write_json(self, path: str, obj: Any, compress: bool = False) -> str:
+        """
+        异步写入 JSON 文件，序列化在后台线程完成
+
+        调用方在入队后不能再修改 obj。
+        """
+        if compress:
+            path = f"{path}.gz"
+        self._put(('json', path, obj, 'gzip' if compress else None))
+        return path
+
+    def write_screenshot(self, path: str, png_data: bytes) -> str:
+        """
+        异步写入截图，压缩为 WebP；Pillow 不可用时 gzip 压缩原始数据
+
+        Args:
+            path: 截图路径（扩展名会被替换）
+            png_data: 截图数据
+
+        Returns:
+            最终文件路径
+        """
+        base = os.path.splitext(path)[0]
+        if PIL_AVAILABLE:
+            path = f"{base}.webp"
+            self._put(('file', path, png_data, 'webp'))
+            return path
+        return self.write_bytes(f"{base}.png", png_data, compress=True)
+
+    def record_result(self, kind: str, workplan_id: Optional[str], result: Dict[str, Any]):
+        """
+        记录执行结果到索引，序列化在调用线程完成，之后可以继续修改 result
+
+        Args:
+            kind: 结果类型，如 workscript、enhanced_execution
+            workplan_id: 工作计划ID
+            result: 结果数据
+        """
+        self._put(('result', (
+            kind,
+            workplan_id,
+            result.get('status'),
+            time.time(),
+            json.dumps(result, ensure_ascii=False, default=str)
+        )))
+
+    def log_handler(self, filename: str, level: int = logging.INFO,
+                    max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5,
+                    console: bool = True) -> logging.handlers.QueueHandler:
+        """
+        创建异步日志处理器
+
+        Args:
+            filename: 日志文件名（位于报告根目录）
+            level: 日志级别
+            max_bytes: 单个日志文件最大字节数
+            backup_count: 保留的压缩日志数
+            console: 是否同时输出到控制台
+
+        Returns:
+            QueueHandler，记录在后台线程写入
+        """
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        file_handler = logging.handlers.RotatingFileHandler(
+            os.path.join(self.root_dir, filename),
+            maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+        )
+        file_handler.namer = lambda name: f"{name}.gz"
+        file_handler.rotator = _gzip_rotator
+        handlers: List[logging.Handler] = [file_handler]
+        if console:
+            handlers.append(logging.StreamHandler())
+        for handler in handlers:
+            handler.setFormatter(formatter)
+            handler.setLevel(level)
+
+        log_queue: queue.Queue = queue.Queue(-1)
+        listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        self._listeners.append(listener)
+
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.setLevel(level)
+        return queue_handler
+
+    def barrier(self) -> threading.Event:
+        """
+        在队列中放入标记，标记之前入队的写入完成后事件置位
+
+        队列按顺序处理，等待事件即等待调用方已入队的写入，
+        不受其他执行线程之后入队的写入影响。
+
+        Returns:
+            写入完成事件
+        """
+        done = threading.Event()
+        self._put(('barrier', done))
+        return done
+
+    def flush(self):
+        """等待已入队的写入全部完成（包括其他执行线程持续入队的写入）"""
+        self._queue.join()
+
+    def close(self):
+        """写完剩余请求并停止后台线程和日志监听"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        for listener in self._listeners:
+            listener.stop()
+        self._listeners.clear()
+
+    # ---- 查询接口 ----
+
+    def query_results(self, workplan_id: Optional[str] = None, kind: Optional[str] = None,
+                      since: Optional[float] = None, until: Optional[float] = None,
+                      limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        按工作计划ID和时间查询执行结果（只包含已写入的结果，必要时先 flush()）
+
+        Args:
+            workplan_id: 工作计划ID
+            kind: 结果类型
+            since: 起始时间戳（含）
+            until: 结束时间戳（不含）
+            limit: 最多返回条数
+
+        Returns:
+            结果列表，按时间倒序
+        """
+        if not os.path.exists(self.index_path):
+            return []
+
+        conditions, params = [], []
+        for column, operator, value in (('workplan_id', '=', workplan_id), ('kind', '=', kind),
+                                        ('created_at', '>=', since), ('created_at', '<', until)):
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        conn = sqlite3.connect(self.index_path)
+        try:
+            rows = conn.execute(
+                f"SELECT kind, workplan_id, status, created_at, data FROM results {where} "
+                f"ORDER BY created_at DESC LIMIT ?",
+                params + [limit]
+            ).fetchall()
+        finally:
+            conn.close()
+
+        return [
+            {'kind': row[0], 'workplan_id': row[1], 'status': row[2],
+             'created_at': row[3], 'data': json.loads(row[4])}
+            for row in rows
+        ]
+
+    # ---- 后台线程 ----
+
+    def _put(self, job):
+        if self._closed:
+            raise RuntimeError("产物写入器已关闭")
+        self._queue.put(job)
+
+    def _worker(self):
+        conn = sqlite3.connect(self.index_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            conn.execute(statement)
+        conn.commit()
+
+        running = True
+        while running:
+            jobs = [self._queue.get()]
+            # 一次取出已积压的请求，结果在同一事务中写入
+            while len(jobs) < self.batch_size:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            rows = []
+            for job in jobs:
+                if job is None:
+                    running = False
+                elif job[0] == 'result':
+                    rows.append(job[1])
+                elif job[0] == 'barrier':
+                    # 标记之前的结果先提交，再通知等待方
+                    self._insert_results(conn, rows)
+                    rows = []
+                    job[1].set()
+                else:
+                    self._write_file(*job)
+            self._insert_results(conn, rows)
+
+            for _ in jobs:
+                self._queue.task_done()
+
+        conn.close()
+
+    def _insert_results(self, conn: sqlite3.Connection, rows: List[tuple]):
+        if not rows:
+            return
+        try:
+            conn.executemany(
+                "INSERT INTO results (kind, workplan_id, status, created_at, data) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.commit()
+            self.stats['results'] += len(rows)
+        except sqlite3.Error as e:
+            self.stats['errors'] += 1
+            logger.error(f"写入结果索引失败: {e}")
+
+    def _write_file(self, job_type: str, path: str, payload: Any, encoding: Optional[str]):
+        try:
+            if job_type == 'json':
+                payload = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            data = payload
+            if encoding == 'gzip':
+                data = gzip.compress(payload, compresslevel=6)
+            elif encoding == 'webp':
+                with Image.open(io.BytesIO(payload)) as image:
+                    buffer = io.BytesIO()
+                    image.save(buffer, format='WEBP', quality=80, method=4)
+                    data = buffer.getvalue()
+
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+
+            self.stats['files'] += 1
+            self.stats['bytes_in'] += len(payload)
+            self.stats['bytes_out'] += len(data)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"写入产物失败: {path} - {e}")
+
+
+_sinks: Dict[str, ArtifactSink] = {}
+_sinks_lock = threading.Lock()
+
+
+def get_artifact_sink(root_dir: Optional[str] = None) -> ArtifactSink:
+    """
+    获取报告根目录对应的共享产物写入器
+
+    Args:
+        root_dir: 报告根目录，默认使用 AUTODROID_REPORTS_DIR
+
+    Returns:
+        产物写入器
+    """
+    root_dir = os.path.abspath(root_dir or os.getenv('AUTODROID_REPORTS_DIR', './reports'))
+    with _sinks_lock:
+        sink = _sinks.get(root_dir)
+        if sink is None or sink.closed:
+            sink = ArtifactSink(root_dir)
+            _sinks[root_dir] = sink
+        return sink
+
+
+@atexit.register
+def close_artifact_sinks():
+    """进程退出前写完所有产物"""
+    with _sinks_lock:
+        for sink in _sinks.values():
+            sink.close()
+        _sinks.clear()
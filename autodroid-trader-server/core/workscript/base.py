@@ -4,12 +4,18 @@
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
 import logging
 import os
 import time
 from datetime import datetime
 
+from .artifacts import get_artifact_sink
+from .cancellation import CancellationToken, WorkScriptCancelled
+from .checkpoint import Checkpoint, CheckpointFailed, CheckpointStore, screen_matches
+from .tracing import Tracer
+
 # 导入设备连接模块
 try:
     import sys
@@ -24,13 +30,15 @@ except ImportError as e:
 class BaseWorkScript(ABC):
     """工作脚本抽象基类"""
     
-    def __init__(self, workplan: Dict[str, Any], device_serialno: Optional[str] = None):
+    def __init__(self, workplan: Dict[str, Any], device_serialno: Optional[str] = None,
+                 cancel_token: Optional[CancellationToken] = None):
         """
         初始化工作脚本
         
         Args:
             workplan: 工作计划数据，包含脚本执行所需的所有参数
             device_serialno: 设备序列号
+            cancel_token: 取消令牌，未提供时按工作计划的 execution_timeout 创建
         """
         self.workplan = workplan
         self.device_serialno = device_serialno
@@ -38,12 +46,23 @@ class BaseWorkScript(ABC):
         self.start_time = None
         self.end_time = None
         self.report_dir = None
+        self.cancel_token = cancel_token or CancellationToken(
+            self.get_workplan_param('execution_timeout')
+        )
+        self.completed_steps: List[str] = []
+        self.resumed_from: Optional[str] = None
+        self.tracer = Tracer(enabled=self.get_workplan_param('trace', True))
+        # 报告、截图和结果由后台线程写入，执行线程只入队
+        self.artifacts = get_artifact_sink()
         
         # 设置报告目录
         self._setup_report_directory()
         
         # 初始化设备对象
         self.device = self._initialize_device()
+        if self.device:
+            self.device.cancel_token = self.cancel_token
+            self.device.tracer = self.tracer
         
         self.logger.info(f"初始化工作脚本: {self.__class__.__name__}")
         self.logger.info(f"工作计划ID: {workplan.get('id', 'unknown')}")
@@ -117,13 +136,42 @@ class BaseWorkScript(ABC):
                 'device_serialno': self.device_serialno,
                 'workplan_id': self.workplan.get('id'),
                 'script_name': self.__class__.__name__,
-                'report_directory': self.report_dir
+                'report_directory': self.report_dir,
+                'resumed_from': self.resumed_from
             })
+            result.update(self.export_trace())
             
             self.logger.info(f"工作脚本执行完成: {result['status']}")
             self.logger.info(f"执行时间: {execution_time:.2f}秒")
             
-            return result
+            return self._finish(result)
+            
+        except WorkScriptCancelled as e:
+            self.end_time = time.time()
+            execution_time = self.end_time - self.start_time
+            
+            cancelled_result = {
+                'status': 'failed',
+                'message': e.reason,
+                'cancelled': True,
+                'error_type': type(e).__name__,
+                'cancelled_step': e.step,
+                'completed_steps': list(self.completed_steps),
+                'execution_time': execution_time,
+                'device_serialno': self.device_serialno,
+                'workplan_id': self.workplan.get('id'),
+                'script_name': self.__class__.__name__,
+                'report_directory': self.report_dir,
+                'resumed_from': self.resumed_from
+            }
+            
+            cancelled_result.update(self.export_trace())
+            
+            self.logger.warning(f"工作脚本已取消: {e.reason} (步骤: {e.step})")
+            self.logger.warning(f"已完成步骤: {len(self.completed_steps)} 个")
+            self.release_device()
+            
+            return self._finish(cancelled_result)
             
         except Exception as e:
             self.end_time = time.time()
@@ -137,13 +185,26 @@ class BaseWorkScript(ABC):
                 'device_serialno': self.device_serialno,
                 'workplan_id': self.workplan.get('id'),
                 'script_name': self.__class__.__name__,
-                'report_directory': self.report_dir
+                'report_directory': self.report_dir,
+                'resumed_from': self.resumed_from
             }
+            error_result.update(self.export_trace())
             
             self.logger.error(f"工作脚本执行失败: {e}")
             self.logger.error(f"执行时间: {execution_time:.2f}秒")
             
-            return error_result
+            return self._finish(error_result)
+    
+    def _finish(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        记录执行结果到产物索引，并等待本次执行的报告写完
+        
+        步骤执行期间的写入都在后台完成，只在返回结果前等待一次，
+        保证结果中的报告路径可以直接读取；其他设备上的执行随后入队的写入不计入等待。
+        """
+        self.artifacts.record_result('workscript', self.workplan.get('id'), result)
+        self.artifacts.barrier().wait()
+        return result
     
     def get_workplan_param(self, key: str, default: Any = None) -> Any:
         """
@@ -173,16 +234,35 @@ class BaseWorkScript(ABC):
         filepath = os.path.join(self.report_dir, filename)
         
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            self.logger.info(f"报告已保存: {filepath}")
+            self.artifacts.write_text(filepath, content)
+            self.logger.info(f"报告已加入写入队列: {filepath}")
             return filepath
             
         except Exception as e:
             self.logger.error(f"保存报告失败: {e}")
             raise
     
+    def save_screenshot(self, name: str) -> Optional[str]:
+        """
+        截取当前屏幕并异步保存（压缩为 WebP）
+        
+        Args:
+            name: 截图名称，如步骤名
+            
+        Returns:
+            截图文件路径，设备不可用时返回None
+        """
+        if not self.device:
+            return None
+        
+        with self.tracer.span("screenshot", "adb", name=name):
+            png_data = self.device.adb_device.capture_screenshot()
+        if not png_data:
+            self.logger.warning(f"截图失败: {name}")
+            return None
+        
+        return self.artifacts.write_screenshot(os.path.join(self.report_dir, f"{name}.png"), png_data)
+    
     def log_step(self, step_name: str, message: str = ""):
         """
         记录执行步骤
@@ -192,6 +272,144 @@ class BaseWorkScript(ABC):
             message: 步骤描述
         """
         self.logger.info(f"[步骤] {step_name}: {message}")
+        # 未使用 step() 的脚本：每个步骤区间持续到下一次 log_step
+        self.tracer.mark_step(step_name, message=message)
+    
+    @contextmanager
+    def step(self, step_name: str, message: str = "", timeout: Optional[float] = None):
+        """
+        带截止时间和追踪区间的执行步骤，正常结束后记入 completed_steps
+        
+        Args:
+            step_name: 步骤名称
+            message: 步骤描述
+            timeout: 步骤超时时间（秒）
+        """
+        self.logger.info(f"[步骤] {step_name}: {message}")
+        self.tracer.finish_step()
+        with self.tracer.span(step_name, "step", message=message, timeout=timeout):
+            with self.cancel_token.step(step_name, timeout):
+                yield
+        self.completed_steps.append(step_name)
+    
+    def sleep(self, seconds: float):
+        """可被取消的等待，替代 time.sleep"""
+        with self.tracer.span("sleep", "wait", seconds=seconds):
+            self.cancel_token.sleep(seconds)
+    
+    def export_trace(self) -> Dict[str, Any]:
+        """
+        导出本次执行的 Chrome Trace 文件和延迟统计
+        
+        Returns:
+            合并到执行结果中的追踪字段
+        """
+        if not self.tracer.enabled:
+            return {}
+        
+        self.tracer.finish_step()
+        trace_result = {
+            'step_latency': self.tracer.summary("step"),
+            'latency_by_category': self.tracer.category_totals()
+        }
+        
+        trace_result['trace_file'] = self.artifacts.write_json(
+            os.path.join(self.report_dir, 'trace.json'),
+            self.tracer.to_chrome_trace()
+        )
+        
+        return trace_result
+    
+    def check_cancelled(self):
+        """检查取消请求和截止时间，已取消时抛出 WorkScriptCancelled"""
+        self.cancel_token.check()
+    
+    @property
+    def checkpoint_key(self) -> str:
+        """检查点存储键：脚本、工作计划和设备"""
+        return f"{self.__class__.__name__}_{self.workplan.get('id', 'unknown')}_{self.device_serialno or 'local'}"
+    
+    def _checkpoint_store(self) -> CheckpointStore:
+        """检查点存储，位于报告根目录下"""
+        reports_base = os.getenv('AUTODROID_REPORTS_DIR', './reports')
+        return CheckpointStore(os.path.join(reports_base, 'checkpoints'))
+    
+    def screen_postcondition(self, screen_identifiers: List[Dict[Any, Dict[str, Any]]]):
+        """
+        创建基于界面识别的后置条件
+        
+        Args:
+            screen_identifiers: 界面标识组列表（同 ScreenDefinition.screen_identifiers）
+            
+        Returns:
+            后置条件函数，当前界面匹配时返回True
+        """
+        def postcondition() -> bool:
+            if not self.device:
+                return False
+            root = self.device.dump_ui_hierarchy()
+            return root is not None and screen_matches(root, screen_identifiers)
+        
+        return postcondition
+    
+    def _find_resume_index(self, checkpoints: List[Checkpoint], store: CheckpointStore) -> int:
+        """
+        根据已保存的进度和当前界面确定恢复位置
+        
+        从最后到达的检查点向前查找，第一个后置条件仍然成立的检查点即为恢复点。
+        
+        Returns:
+            下一个要执行的检查点下标
+        """
+        saved = store.load(self.checkpoint_key)
+        if not saved:
+            return 0
+        
+        names = [checkpoint.name for checkpoint in checkpoints]
+        if saved.get('checkpoint') not in names:
+            return 0
+        
+        for index in range(names.index(saved['checkpoint']), -1, -1):
+            checkpoint = checkpoints[index]
+            if checkpoint.postcondition and checkpoint.postcondition():
+                self.resumed_from = checkpoint.name
+                self.logger.info(f"从检查点恢复: {checkpoint.name}")
+                return index + 1
+        
+        self.logger.info("当前界面不匹配任何已到达的检查点，从头执行")
+        return 0
+    
+    def run_checkpoints(self, checkpoints: List[Checkpoint]) -> List[str]:
+        """
+        按顺序执行检查点，每到达一个检查点就持久化进度
+        
+        重试时先识别当前界面，从最近的有效检查点之后继续执行；
+        全部完成后清除进度。
+        
+        Args:
+            checkpoints: 检查点列表
+            
+        Returns:
+            本次执行到达的检查点名称列表
+            
+        Raises:
+            CheckpointFailed: 检查点后置条件不满足
+        """
+        store = self._checkpoint_store()
+        start_index = self._find_resume_index(checkpoints, store)
+        reached = [checkpoint.name for checkpoint in checkpoints[:start_index]]
+        
+        for checkpoint in checkpoints[start_index:]:
+            with self.step(checkpoint.name, "检查点", timeout=checkpoint.timeout):
+                checkpoint.action()
+                if checkpoint.postcondition and not checkpoint.postcondition():
+                    raise CheckpointFailed(checkpoint.name)
+            
+            reached.append(checkpoint.name)
+            store.save(self.checkpoint_key, checkpoint.name, reached)
+        
+        store.clear(self.checkpoint_key)
+        return reached
     
     def log_success(self, message: str):
         """记录成功信息"""
@@ -205,6 +423,19 @@ class BaseWorkScript(ABC):
         """记录警告信息"""
         self.logger.warning(f"⚠️ {message}")
     
+    def release_device(self):
+        """释放设备连接，供其他任务使用"""
+        if not self.device:
+            return
+        
+        try:
+            self.device.disconnect()
+            self.logger.info(f"设备 {self.device_serialno} 已释放")
+        except Exception as e:
+            self.logger.error(f"释放设备失败: {str(e)}")
+        finally:
+            self.device = None
+    
     def _initialize_device(self) -> Optional[Any]:
         """
         初始化设备对象
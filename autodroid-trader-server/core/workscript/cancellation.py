@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+工作脚本协作式取消 - 取消令牌与截止时间
+
+取消异常继承自 BaseException（与 asyncio.CancelledError 相同），
+避免被脚本和设备层中大量的 ``except Exception`` 吞掉。
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+
+class WorkScriptCancelled(BaseException):
+    """工作脚本被取消"""
+
+    def __init__(self, reason: str = "已取消", step: Optional[str] = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.step = step
+
+
+class DeadlineExceeded(WorkScriptCancelled):
+    """工作脚本或步骤超过截止时间"""
+
+
+class CancellationToken:
+    """
+    取消令牌
+
+    在执行线程中传递，由其他线程（例如停止交易计划的API请求）调用 cancel()。
+    支持整体截止时间和嵌套的步骤截止时间，所有时间基于 time.monotonic()。
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        """
+        初始化取消令牌
+
+        Args:
+            timeout: 整体超时时间（秒），None 表示不限时
+        """
+        self._event = threading.Event()
+        self._reason: Optional[str] = None
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self._steps: List[Tuple[str, Optional[float]]] = []
+
+    def cancel(self, reason: str = "用户手动停止"):
+        """请求取消，可从任意线程调用"""
+        if not self._event.is_set():
+            self._reason = reason
+            self._event.set()
+
+    @property
+    def is_cancelled(self) -> bool:
+        """是否已请求取消"""
+        return self._event.is_set()
+
+    @property
+    def reason(self) -> Optional[str]:
+        """取消原因"""
+        return self._reason
+
+    @property
+    def current_step(self) -> Optional[str]:
+        """当前步骤名称"""
+        return self._steps[-1][0] if self._steps else None
+
+    def _effective_deadline(self) -> Tuple[Optional[float], Optional[str]]:
+        """返回最近的截止时间及其所属步骤（整体截止时间的步骤为None）"""
+        deadline, owner = self.deadline, None
+        for name, step_deadline in self._steps:
+            if step_deadline is not None and (deadline is None or step_deadline < deadline):
+                deadline, owner = step_deadline, name
+        return deadline, owner
+
+    def remaining(self) -> Optional[float]:
+        """
+        距最近截止时间的剩余秒数
+
+        Returns:
+            剩余秒数（不小于0），没有截止时间时返回None
+        """
+        deadline, _ = self._effective_deadline()
+        if deadline is None:
+            return None
+        return max(0.0, deadline - time.monotonic())
+
+    def check(self):
+        """
+        检查取消和截止时间
+
+        Raises:
+            WorkScriptCancelled: 已请求取消
+            DeadlineExceeded: 已超过截止时间
+        """
+        if self._event.is_set():
+            raise WorkScriptCancelled(self._reason or "已取消", self.current_step)
+
+        deadline, owner = self._effective_deadline()
+        if deadline is not None and time.monotonic() >= deadline:
+            if owner:
+                raise DeadlineExceeded(f"步骤超时: {owner}", owner)
+            raise DeadlineExceeded("执行超时", self.current_step)
+
+    def timeout_for(self, timeout: Optional[float] = None) -> Optional[float]:
+        """
+        将调用方的超时时间限制在剩余时间内，用于 subprocess 等阻塞调用
+
+        Args:
+            timeout: 调用方期望的超时时间
+
+        Returns:
+            实际应使用的超时时间
+        """
+        self.check()
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if timeout is None:
+            return remaining
+        return min(timeout, remaining)
+
+    def sleep(self, seconds: float):
+        """
+        可中断的等待，取消或到达截止时间时立即抛出异常
+
+        Args:
+            seconds: 等待秒数
+        """
+        wait_time = self.timeout_for(seconds)
+        if wait_time and self._event.wait(wait_time):
+            self.check()
+        if wait_time is not None and wait_time < seconds:
+            self.check()
+
+    @contextmanager
+    def step(self, name: str, timeout: Optional[float] = None):
+        """
+        步骤截止时间上下文
+
+        Args:
+            name: 步骤名称
+            timeout: 步骤超时时间（秒），None 表示只受整体截止时间约束
+        """
+        self.check()
+        step_deadline = time.monotonic() + timeout if timeout else None
+        self._steps.append((name, step_deadline))
+        try:
+            yield self
+            # 步骤中存在不感知令牌的阻塞调用时，在步骤结束时补充检查
+            self.check()
+        finally:
+            self._steps.pop()
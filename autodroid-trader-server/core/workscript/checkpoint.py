@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+工作脚本检查点 - 持久化执行进度，重试时从最近的有效检查点恢复
+
+检查点的后置条件通常是界面识别（见 screen_matches），重试时用它判断
+应用当前停留在哪个界面，而不是重新启动应用从头执行。
+"""
+
+import json
+import os
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from datetime import datetime
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional
+
+
+@dataclass
+class Checkpoint:
+    """检查点：执行 action 后应满足 postcondition"""
+    name: str
+    action: Callable[[], Any]
+    postcondition: Optional[Callable[[], bool]] = None  # 无后置条件的检查点不能作为恢复点
+    timeout: Optional[float] = None  # 步骤超时时间（秒）
+
+
+class CheckpointFailed(Exception):
+    """检查点后置条件不满足"""
+
+    def __init__(self, checkpoint: str):
+        super().__init__(f"检查点后置条件不满足: {checkpoint}")
+        self.checkpoint = checkpoint
+
+
+class CheckpointStore:
+    """检查点存储，每个执行键对应一个JSON文件"""
+
+    def __init__(self, store_dir: str):
+        """
+        初始化检查点存储
+
+        Args:
+            store_dir: 存储目录
+        """
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        safe_key = "".join(c if c.isalnum() or c in "-_." else "_" for c in key)
+        return os.path.join(self.store_dir, f"{safe_key}.json")
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取最后到达的检查点，不存在时返回None"""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, key: str, checkpoint: str, reached: List[str]):
+        """记录最后到达的检查点（先写临时文件再替换，避免中断时留下半个文件）"""
+        path = self._path(key)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'checkpoint': checkpoint,
+                'reached': reached,
+                'updated_at': datetime.now().isoformat()
+            }, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def clear(self, key: str):
+        """流程完成后清除检查点"""
+        path = self._path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def identifier_key(key: Any) -> str:
+    """IdentifierType 枚举或字符串统一为字符串"""
+    return key.value if isinstance(key, Enum) else str(key)
+
+
+def _node_matches(root: ET.Element, id_type: str, data: Dict[str, Any]) -> bool:
+    """判断UI层级中是否存在满足单个标识的节点"""
+    if id_type == "resource_id":
+        return any(node.get("resource-id") == data.get("id") for node in root.iter())
+
+    if id_type in ("text", "description"):
+        attribute = "text" if id_type == "text" else "content-desc"
+        expected = data.get("text") if id_type == "text" else data.get("description")
+        if not expected:
+            return False
+        for node in root.iter():
+            value = node.get(attribute) or ""
+            if (value == expected) if data.get("exact") else (expected in value):
+                return True
+        return False
+
+    if id_type == "class_name":
+        return any(node.get("class") == data.get("class_name") for node in root.iter())
+
+    # 坐标、XPath、图像模板等无法仅凭层级结构确认
+    return False
+
+
+def screen_matches(root: ET.Element, screen_identifiers: List[Dict[Any, Dict[str, Any]]]) -> bool:
+    """
+    判断UI层级是否匹配界面定义（ScreenDefinition.screen_identifiers）
+
+    任一标识组匹配即视为当前界面；同一组内的所有标识都必须匹配。
+
+    Args:
+        root: UI层级XML根节点
+        screen_identifiers: 界面标识组列表
+
+    Returns:
+        是否匹配
+    """
+    for identifier_group in screen_identifiers:
+        if identifier_group and all(
+            _node_matches(root, identifier_key(id_type), data)
+            for id_type, data in identifier_group.items()
+        ):
+            return True
+    return False
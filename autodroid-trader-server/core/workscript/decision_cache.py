@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+决策缓存 - 相同任务、相同界面、相同近期操作时复用模型决策
+
+缓存键为 (任务描述, 归一化界面签名, 截图感知哈希, 最近K个操作摘要)；
+屏幕信息没有界面结构（文本和控件都为空）时不生成缓存键，避免在任意界面上重放决策。
+缓存条目需要经过执行结果验证（置信度门控）才会命中：
+成功次数达到 min_successes 且成功率不低于 min_confidence 时跳过模型推理。
+需要确认的敏感操作不缓存。
+同一持久化文件只对应一个缓存实例（get_decision_cache），各设备的执行器共享条目。
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+from .pipeline import has_structure, screen_signature
+
+
+def _decision_of(action: Dict[str, Any]) -> List[Any]:
+    """决策的可执行部分：操作类型和参数"""
+    return [action.get('action_type'), action.get('parameters'), action.get('requires_confirmation')]
+
+
+@dataclass
+class CacheEntry:
+    """缓存的决策及其执行结果统计"""
+    action: Dict[str, Any]
+    created_at: float = field(default_factory=time.time)
+    successes: int = 0
+    failures: int = 0
+
+    @property
+    def confidence(self) -> float:
+        """执行成功率"""
+        total = self.successes + self.failures
+        return self.successes / total if total else 0.0
+
+
+class DecisionCache:
+    """
+    LRU + TTL 决策缓存，可持久化到JSON文件
+
+    线程安全；put/record_outcome 只修改内存，save() 时原子写入文件。
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 1024,
+                 ttl: Optional[float] = 24 * 3600, min_successes: int = 2,
+                 min_confidence: float = 0.9, history_k: int = 3):
+        """
+        初始化决策缓存
+
+        Args:
+            path: 持久化文件路径，None 表示只在内存中缓存
+            max_entries: 最大条目数，超出时淘汰最久未使用的条目
+            ttl: 条目有效期（秒），None 表示不过期
+            min_successes: 命中所需的最少成功次数
+            min_confidence: 命中所需的最低成功率
+            history_k: 缓存键包含的最近操作数
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.min_successes = min_successes
+        self.min_confidence = min_confidence
+        self.history_k = history_k
+        self.counters = {'hits': 0, 'misses': 0, 'gated': 0, 'expired': 0, 'evictions': 0, 'skipped': 0}
+
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self.load()
+
+    def make_key(self, task_description: str, screen_info: Any,
+                 previous_actions: List[Dict[str, Any]], frame_hash: Optional[int] = None) -> Optional[str]:
+        """
+        计算缓存键
+
+        Args:
+            task_description: 任务描述
+            screen_info: 屏幕信息
+            previous_actions: 已执行的操作（TaskExecutor 记录的格式）
+            frame_hash: 当前截图的感知哈希（截图随请求发送给模型时决策也取决于画面）
+
+        Returns:
+            缓存键，屏幕信息没有界面结构时为 None（不可缓存）
+        """
+        if not has_structure(screen_info):
+            with self._lock:
+                self.counters['skipped'] += 1
+            return None
+        recent = [
+            [action.get('action'), action.get('description'), action.get('success')]
+            for action in previous_actions[-self.history_k:]
+        ] if self.history_k else []
+        payload = json.dumps(
+            [task_description.strip(), screen_signature(screen_info), frame_hash, recent],
+            ensure_ascii=False
+        )
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        查询缓存，只返回通过置信度门控的决策
+
+        Returns:
+            决策（Action 字段字典），未命中返回None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+
+            if self.ttl is not None and time.time() - entry.created_at > self.ttl:
+                del self._entries[key]
+                self.counters['expired'] += 1
+                self.counters['misses'] += 1
+                return None
+
+            if entry.successes < self.min_successes or entry.confidence < self.min_confidence:
+                self.counters['gated'] += 1
+                self.counters['misses'] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return dict(entry.action)
+
+    def put(self, key: str, action: Dict[str, Any]):
+        """
+        记录模型决策；与已缓存的决策相同时保留执行统计，不同时重新计数。
+        描述只用于展示（流式模式下可能尚未生成），不参与比较。
+
+        Args:
+            key: 缓存键
+            action: 决策（Action 字段字典）
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or _decision_of(entry.action) != _decision_of(action):
+                self._entries[key] = CacheEntry(action=dict(action))
+            elif action.get('description'):
+                entry.action['description'] = action['description']
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def record_outcome(self, key: str, success: bool):
+        """
+        记录决策的执行结果，用于置信度门控
+
+        Args:
+            key: 缓存键
+            success: 是否执行成功
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            if success:
+                entry.successes += 1
+            else:
+                entry.failures += 1
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return {
+                **self.counters,
+                'size': len(self._entries),
+                'hit_ratio': round(self.counters['hits'] / lookups, 4) if lookups else 0.0
+            }
+
+    def load(self):
+        """从持久化文件加载，丢弃已过期的条目"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        now = time.time()
+        with self._lock:
+            for key, entry_data in data.get('entries', []):
+                entry = CacheEntry(**entry_data)
+                if self.ttl is None or now - entry.created_at <= self.ttl:
+                    self._entries[key] = entry
+
+    def save(self):
+        """持久化到文件（先写同目录下的临时文件再替换）"""
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # 在保存锁内取快照，较早的快照不会覆盖较新的
+        with self._save_lock:
+            with self._lock:
+                data = {'entries': [[key, asdict(entry)] for key, entry in self._entries.items()]}
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(temp_path, self.path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+                raise
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+
+_caches: Dict[str, DecisionCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_decision_cache(path: str, **options) -> DecisionCache:
+    """
+    获取持久化文件对应的共享决策缓存
+
+    各设备的执行器写入同一个实例，save() 不会互相覆盖；
+    options 只在首次创建时生效。
+
+    Args:
+        path: 持久化文件路径
+        **options: DecisionCache 的其他构造参数
+
+    Returns:
+        共享决策缓存
+    """
+    path = os.path.abspath(path)
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = DecisionCache(path, **options)
+            _caches[path] = cache
+        return cache
@@ -12,7 +12,14 @@ from typing import Dict, Any, Optional, Type
 from datetime import datetime
 import traceback
 
+from .artifacts import get_artifact_sink
 from .base import BaseWorkScript
+from .flow import FlowWorkScript
+
+# 内置通用脚本类型，无需脚本文件
+BUILTIN_SCRIPTS: Dict[str, Type[BaseWorkScript]] = {
+    'flow': FlowWorkScript
+}
 
 
 class WorkScriptEngine:
@@ -50,15 +57,14 @@ class WorkScriptEngine:
         # 确保报告目录存在
         os.makedirs(self.reports_dir, exist_ok=True)
         
+        # basicConfig 只在根日志器没有处理器时生效，避免重复创建日志监听线程
+        if logging.getLogger().handlers:
+            return
+        
+        # 日志经 QueueHandler 入队，由后台线程写入控制台和滚动日志文件
         logging.basicConfig(
             level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.StreamHandler(),
-                logging.FileHandler(
-                    os.path.join(self.reports_dir, 'workscript_engine.log')
-                )
-            ]
+            handlers=[get_artifact_sink(self.reports_dir).log_handler('workscript_engine.log')]
         )
     
     def load_script(self, script_name: str) -> Type[BaseWorkScript]:
@@ -76,6 +82,9 @@ class WorkScriptEngine:
             ImportError: 脚本导入失败
             ValueError: 脚本格式错误
         """
+        if script_name in BUILTIN_SCRIPTS:
+            return BUILTIN_SCRIPTS[script_name]
+        
         # 检查缓存
         if script_name in self.loaded_scripts:
             self.logger.info(f"从缓存加载脚本: {script_name}")
@@ -153,14 +162,27 @@ class WorkScriptEngine:
             # 加载脚本类
             script_class = self.load_script(script_name)
             
-            # 创建脚本实例
-            script_instance = script_class(workplan, device_serialno)
-            
-            # 执行脚本
-            result = script_instance.execute()
+            # 失败后重试；使用检查点的脚本会从最近的有效检查点恢复
+            max_retries = workplan['data'].get('max_retries', 0)
+            for attempt in range(max_retries + 1):
+                # 创建脚本实例
+                script_instance = script_class(workplan, device_serialno)
+                
+                # 执行脚本
+                result = script_instance.execute()
+                
+                if result['status'] == 'success' or result.get('cancelled'):
+                    break
+                if attempt < max_retries:
+                    self.logger.warning(
+                        f"工作脚本第 {attempt + 1} 次执行失败: {result.get('message')}，准备重试"
+                    )
+                    # 下一次重试创建新实例并重新连接设备，先释放本次实例占用的连接
+                    script_instance.release_device()
             
             # 添加执行元数据
             result.update({
+                'attempts': attempt + 1,
                 'execution_start_time': start_time.isoformat(),
                 'execution_end_time': datetime.now().isoformat(),
                 'engine_version': '1.0.0'
@@ -230,6 +252,7 @@ class WorkScriptEngine:
                     except Exception as e:
                         self.logger.warning(f"脚本验证失败: {script_name} - {e}")
             
+            scripts.extend(BUILTIN_SCRIPTS)
             self.logger.info(f"发现 {len(scripts)} 个可用脚本")
             return sorted(scripts)
             
@@ -262,7 +285,7 @@ class WorkScriptEngine:
             info = {
                 'name': script_name,
                 'class_name': script_class.__name__,
-                'module_path': os.path.join(self.workscripts_dir, f"{script_name}.py"),
+                'module_path': None if script_name in BUILTIN_SCRIPTS else os.path.join(self.workscripts_dir, f"{script_name}.py"),
                 'docstring': script_class.__doc__ or '',
                 'available': True
             }
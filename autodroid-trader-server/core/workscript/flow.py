@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+声明式流程编译 - 将 ScreenDefinition 和元素操作序列编译为执行计划
+
+编译结果按批次执行：
+- 定位器在编译期解析为有序列表，执行时每个批次只获取一次UI层级并建立索引，
+  批次内所有元素都从同一份索引中定位；
+- 连续的确定性操作（不带 validation_text 的输入）合并到同一批次，连续执行不等待；
+- 带 validation_text 的操作结束当前批次，以界面出现该文本作为等待条件，
+  不再使用 wait_after_action 固定等待；只有没有等待条件的点击才回退到固定等待。
+"""
+
+import re
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from .base import BaseWorkScript
+from .checkpoint import identifier_key
+from workscripts.ui_definitions import (
+    ScreenDefinition,
+    UIElementDefinition,
+    screen_definition_from_dict,
+)
+
+# 定位器优先级：唯一性越强越靠前，坐标不依赖UI层级，作为最后的兜底
+LOCATOR_PRIORITY = ["resource_id", "description", "text", "coordinates"]
+
+SUPPORTED_ACTIONS = ("tap", "input")
+
+
+class FlowStepFailed(Exception):
+    """流程步骤执行失败"""
+
+
+@dataclass
+class Locator:
+    """单个元素定位方式"""
+    kind: str
+    value: Any
+    exact: bool = False
+
+    @property
+    def needs_hierarchy(self) -> bool:
+        """是否需要UI层级才能定位"""
+        return self.kind != "coordinates"
+
+
+@dataclass
+class FlowAction:
+    """编译后的单个元素操作"""
+    element: str
+    name: str
+    action: str
+    locators: List[Locator]
+    input_data: Optional[str] = None
+    validation_text: Optional[str] = None
+    wait_after_action: float = 0.0
+
+
+@dataclass
+class FlowBatch:
+    """连续执行的一组操作，结束后等待 wait_text 出现或固定等待 settle 秒"""
+    actions: List[FlowAction] = field(default_factory=list)
+    wait_text: Optional[str] = None
+    settle: float = 0.0
+
+    @property
+    def name(self) -> str:
+        return "+".join(action.element for action in self.actions)
+
+    @property
+    def needs_hierarchy(self) -> bool:
+        """批次内是否有元素需要UI层级定位"""
+        return any(
+            locator.needs_hierarchy
+            for action in self.actions
+            for locator in action.locators[:1]
+        )
+
+
+@dataclass
+class FlowPlan:
+    """流程执行计划"""
+    screen: str
+    app_package: str
+    batches: List[FlowBatch]
+
+    @property
+    def action_count(self) -> int:
+        return sum(len(batch.actions) for batch in self.batches)
+
+    def describe(self) -> List[Dict[str, Any]]:
+        """执行计划摘要，写入执行结果"""
+        return [
+            {
+                'actions': [f"{action.action}:{action.element}" for action in batch.actions],
+                'wait_text': batch.wait_text,
+                'settle': batch.settle
+            }
+            for batch in self.batches
+        ]
+
+
+def _compile_locators(element: UIElementDefinition) -> List[Locator]:
+    """将元素的标识和备用标识按优先级展开为定位器列表"""
+    locators: List[Locator] = []
+    for identifiers in [element.identifiers] + list(element.fallback_identifiers or []):
+        by_kind = {identifier_key(id_type): data for id_type, data in identifiers.items()}
+        for kind in LOCATOR_PRIORITY:
+            data = by_kind.get(kind)
+            if not data:
+                continue
+            if kind == "resource_id":
+                locators.append(Locator(kind, data["id"]))
+            elif kind == "description":
+                locators.append(Locator(kind, data["description"], data.get("exact", False)))
+            elif kind == "text":
+                locators.append(Locator(kind, data["text"], data.get("exact", False)))
+            else:
+                locators.append(Locator(kind, (data["x"], data["y"])))
+    # 坐标兜底只在所有层级定位方式之后使用
+    locators.sort(key=lambda locator: not locator.needs_hierarchy)
+    return locators
+
+
+def compile_flow(screen: ScreenDefinition, sequence: Optional[List[Any]] = None) -> FlowPlan:
+    """
+    编译流程执行计划
+
+    Args:
+        screen: 界面定义
+        sequence: 元素名称列表，或包含 "element" 和覆盖字段（action、input_data、
+            validation_text、wait_after_action）的字典；默认使用 expected_elements
+
+    Returns:
+        执行计划
+
+    Raises:
+        ValueError: 元素不存在、没有定位方式或操作不受支持
+    """
+    if sequence is None:
+        sequence = screen.expected_elements
+
+    batches: List[FlowBatch] = []
+    current = FlowBatch()
+    for item in sequence:
+        overrides = dict(item) if isinstance(item, dict) else {"element": item}
+        element_key = overrides.pop("element")
+        element = screen.elements.get(element_key)
+        if element is None:
+            raise ValueError(f"界面 {screen.name} 中不存在元素: {element_key}")
+
+        action = FlowAction(
+            element=element_key,
+            name=element.name,
+            action=overrides.get("action", element.action),
+            locators=_compile_locators(element),
+            input_data=overrides.get("input_data", element.input_data),
+            validation_text=overrides.get("validation_text", element.validation_text),
+            wait_after_action=overrides.get("wait_after_action", element.wait_after_action)
+        )
+        if action.action not in SUPPORTED_ACTIONS:
+            raise ValueError(f"不支持的操作: {action.action} ({element_key})")
+        if not action.locators:
+            raise ValueError(f"元素没有可用的定位方式: {element_key}")
+        if action.action == "input" and action.input_data is None:
+            raise ValueError(f"输入操作缺少 input_data: {element_key}")
+
+        current.actions.append(action)
+        if action.validation_text:
+            current.wait_text = action.validation_text
+        elif action.action == "tap":
+            # 点击可能切换界面，没有等待条件时只能固定等待
+            current.settle = action.wait_after_action
+        else:
+            continue
+        batches.append(current)
+        current = FlowBatch()
+
+    if current.actions:
+        batches.append(current)
+
+    return FlowPlan(screen=screen.name, app_package=screen.app_package, batches=batches)
+
+
+class UIIndex:
+    """UI层级索引，一次遍历后按 resource-id、文本和描述定位元素中心坐标"""
+
+    _BOUNDS_PATTERN = re.compile(r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]')
+
+    def __init__(self, root: Optional[ET.Element]):
+        self.by_resource_id: Dict[str, Tuple[int, int]] = {}
+        self.by_text: Dict[str, Tuple[int, int]] = {}
+        self.by_description: Dict[str, Tuple[int, int]] = {}
+        if root is None:
+            return
+
+        for node in root.iter():
+            match = self._BOUNDS_PATTERN.search(node.get("bounds") or "")
+            if not match:
+                continue
+            x1, y1, x2, y2 = map(int, match.groups())
+            center = ((x1 + x2) // 2, (y1 + y2) // 2)
+            # 同一键以文档顺序中第一个节点为准
+            for value, index in ((node.get("resource-id"), self.by_resource_id),
+                                 (node.get("text"), self.by_text),
+                                 (node.get("content-desc"), self.by_description)):
+                if value:
+                    index.setdefault(value, center)
+
+    def contains_text(self, text: str) -> bool:
+        """界面文本或描述中是否包含指定文本"""
+        return any(text in value for value in self.by_text) or \
+            any(text in value for value in self.by_description)
+
+    def locate(self, locators: List[Locator], allow_coordinates: bool = True) -> Optional[Tuple[int, int]]:
+        """
+        按优先级定位元素
+
+        Args:
+            locators: 定位器列表
+            allow_coordinates: 是否允许使用坐标兜底
+
+        Returns:
+            元素中心坐标，未找到返回None
+        """
+        for locator in locators:
+            if locator.kind == "coordinates":
+                if allow_coordinates:
+                    return locator.value
+                continue
+            if locator.kind == "resource_id":
+                index, exact = self.by_resource_id, True
+            elif locator.kind == "text":
+                index, exact = self.by_text, locator.exact
+            else:
+                index, exact = self.by_description, locator.exact
+
+            if locator.value in index:
+                return index[locator.value]
+            if not exact:
+                for value, center in index.items():
+                    if locator.value in value:
+                        return center
+        return None
+
+
+class FlowWorkScript(BaseWorkScript):
+    """
+    通用声明式流程工作脚本（workscript: flow）
+
+    工作计划参数：
+    - screen_definition: 界面定义（UIDefinitionManager.save_screen_definition 的格式）
+    - sequence: 元素操作序列，默认使用 expected_elements
+    - locate_timeout: 等待批次元素全部出现的超时时间（秒），默认10
+    - wait_timeout: 等待 validation_text 出现的超时时间（秒），默认10
+    - poll_interval: 轮询UI层级的间隔（秒），默认0.5
+    """
+
+    def __init__(self, workplan: Dict[str, Any], *args, **kwargs):
+        super().__init__(workplan, *args, **kwargs)
+        self.hierarchy_dumps = 0
+
+    def run(self) -> Dict[str, Any]:
+        screen_data = self.get_workplan_param('screen_definition')
+        if not screen_data:
+            raise ValueError("工作计划缺少 screen_definition")
+
+        plan = compile_flow(
+            screen_definition_from_dict(screen_data),
+            self.get_workplan_param('sequence')
+        )
+        self.log_step("编译流程", f"{plan.screen}: {plan.action_count} 个操作, {len(plan.batches)} 个批次")
+
+        if not self.device:
+            return {
+                'status': 'failed',
+                'message': '设备未连接，无法执行流程',
+                'data': {'plan': plan.describe()}
+            }
+
+        for batch in plan.batches:
+            with self.step(batch.name, batch.wait_text or ""):
+                self._run_batch(batch)
+
+        return {
+            'status': 'success',
+            'message': f"流程执行完成: {plan.screen}",
+            'data': {
+                'plan': plan.describe(),
+                'actions': plan.action_count,
+                'batches': len(plan.batches),
+                'hierarchy_dumps': self.hierarchy_dumps
+            }
+        }
+
+    def _snapshot(self) -> UIIndex:
+        """获取UI层级并建立索引"""
+        self.hierarchy_dumps += 1
+        return UIIndex(self.device.dump_ui_hierarchy())
+
+    def _poll(self, timeout: float, condition) -> Any:
+        """轮询UI层级直到 condition(index) 返回真值，超时返回None"""
+        poll_interval = self.get_workplan_param('poll_interval', 0.5)
+        deadline = time.monotonic() + timeout
+        while True:
+            value = condition(self._snapshot())
+            if value or time.monotonic() >= deadline:
+                return value
+            self.sleep(poll_interval)
+
+    def _locate_batch(self, batch: FlowBatch) -> List[Tuple[int, int]]:
+        """从同一份UI层级中定位批次内的全部元素"""
+        if not batch.needs_hierarchy:
+            return [action.locators[0].value for action in batch.actions]
+
+        def locate_all(index: UIIndex) -> Optional[List[Tuple[int, int]]]:
+            # 界面可能尚未渲染完成，等待期间只有纯坐标元素使用坐标
+            points = [
+                index.locate(action.locators, allow_coordinates=not action.locators[0].needs_hierarchy)
+                for action in batch.actions
+            ]
+            return points if all(points) else None
+
+        points = self._poll(self.get_workplan_param('locate_timeout', 10), locate_all)
+        if points:
+            return points
+
+        points = [UIIndex(None).locate(action.locators) for action in batch.actions]
+        if not all(points):
+            raise FlowStepFailed(f"未找到元素: {batch.name}")
+        self.log_warning(f"元素定位超时，使用坐标兜底: {batch.name}")
+        return points
+
+    def _run_batch(self, batch: FlowBatch):
+        """执行一个批次：定位、连续操作、等待条件"""
+        adb_device = self.device.adb_device
+        for action, (x, y) in zip(batch.actions, self._locate_batch(batch)):
+            self.check_cancelled()
+            adb_device.tap(x, y, delay=0)
+            if action.action == "input":
+                adb_device.type_text(action.input_data, delay=0)
+            self.logger.info(f"{action.action} {action.name} ({x}, {y})")
+
+        if batch.wait_text:
+            found = self._poll(
+                self.get_workplan_param('wait_timeout', 10),
+                lambda index: index.contains_text(batch.wait_text)
+            )
+            if not found:
+                raise FlowStepFailed(f"等待文本超时: {batch.wait_text}")
+        elif batch.settle:
+            self.sleep(batch.settle)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+截图环形缓冲区 - 每台设备在内存中保留最近N帧
+
+- 帧以设备返回的 PNG 压缩数据保存，不落盘；
+- 连续相同的帧按感知哈希（dHash）去重，不新增帧，但数据替换为最新一次截图；
+- 只在步骤失败或显式开启逐帧保存时把缓冲区中的帧写入磁盘（经 ArtifactSink 压缩为 WebP）；
+- AI 引擎、校验器、实时预览等多个使用方共享最新一帧，不重复截屏。
+"""
+
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+
+def perceptual_hash(png_data: bytes, hash_size: int = 8) -> int:
+    """
+    计算截图的差值哈希（dHash）
+
+    缩放为 (hash_size+1)×hash_size 的灰度图后比较相邻像素，
+    压缩噪声和细微渲染差异不会改变哈希。Pillow 不可用时退化为内容哈希。
+
+    Args:
+        png_data: PNG 数据
+        hash_size: 哈希边长，结果为 hash_size² 位
+
+    Returns:
+        哈希值
+    """
+    if not PIL_AVAILABLE:
+        return int.from_bytes(hashlib.sha1(png_data).digest()[:8], 'big')
+
+    with Image.open(io.BytesIO(png_data)) as image:
+        pixels = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR).tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hash_distance(a: int, b: int) -> int:
+    """两个感知哈希的汉明距离"""
+    return bin(a ^ b).count('1')
+
+
+@dataclass
+class Frame:
+    """缓冲区中的一帧"""
+    seq: int
+    data: bytes
+    phash: int
+    captured_at: float = field(default_factory=time.time)
+    last_seen_at: float = field(default_factory=time.time)
+    repeats: int = 1
+    path: Optional[str] = None  # 写入磁盘后的路径
+
+    @property
+    def age(self) -> float:
+        """距最后一次截到该画面的时间（秒）"""
+        return time.time() - self.last_seen_at
+
+
+class FrameBuffer:
+    """
+    线程安全的截图环形缓冲区
+
+    add() 由截屏方调用，latest()/wait_for_frame() 供多个使用方读取。
+    """
+
+    def __init__(self, capacity: int = 8, dedupe_distance: int = 0):
+        """
+        初始化缓冲区
+
+        Args:
+            capacity: 保留的帧数，超出时丢弃最早的帧
+            dedupe_distance: 与上一帧的哈希距离不超过该值时视为相同画面
+        """
+        self.capacity = capacity
+        self.dedupe_distance = dedupe_distance
+        self.stats: Dict[str, int] = {'captures': 0, 'deduplicated': 0, 'evicted': 0, 'flushed': 0}
+
+        self._frames: Deque[Frame] = deque()
+        self._next_seq = 1
+        self._changed = threading.Condition()
+
+    def add(self, png_data: bytes) -> Tuple[Frame, bool]:
+        """
+        加入一次截屏
+
+        Args:
+            png_data: PNG 数据
+
+        Returns:
+            (当前帧, 是否为新画面)；与上一帧相同时返回上一帧，其数据已替换为本次截图
+        """
+        phash = perceptual_hash(png_data)
+        with self._changed:
+            self.stats['captures'] += 1
+            latest = self._frames[-1] if self._frames else None
+            if latest is not None and hash_distance(latest.phash, phash) <= self.dedupe_distance:
+                # 感知哈希相同不代表像素相同（如输入框中多了一个字符），保存的始终是最新画面
+                if latest.data != png_data:
+                    latest.data = png_data
+                    latest.phash = phash
+                    latest.path = None
+                latest.last_seen_at = time.time()
+                latest.repeats += 1
+                self.stats['deduplicated'] += 1
+                return latest, False
+
+            frame = Frame(seq=self._next_seq, data=png_data, phash=phash)
+            self._next_seq += 1
+            self._frames.append(frame)
+            if len(self._frames) > self.capacity:
+                self._frames.popleft()
+                self.stats['evicted'] += 1
+            self._changed.notify_all()
+            return frame, True
+
+    def latest(self) -> Optional[Frame]:
+        """最新一帧"""
+        with self._changed:
+            return self._frames[-1] if self._frames else None
+
+    def wait_for_frame(self, after_seq: int = 0, timeout: Optional[float] = None) -> Optional[Frame]:
+        """
+        等待比 after_seq 更新的画面（实时预览使用）
+
+        Args:
+            after_seq: 已经取得的帧序号
+            timeout: 超时时间（秒）
+
+        Returns:
+            新画面，超时返回None
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self._frames and self._frames[-1].seq > after_seq, timeout)
+            if self._frames and self._frames[-1].seq > after_seq:
+                return self._frames[-1]
+            return None
+
+    def frames(self) -> List[Frame]:
+        """缓冲区中所有帧（从旧到新）"""
+        with self._changed:
+            return list(self._frames)
+
+    @property
+    def memory_bytes(self) -> int:
+        """缓冲区占用的内存（帧数据大小）"""
+        with self._changed:
+            return sum(len(frame.data) for frame in self._frames)
+
+    def flush(self, sink: Any, directory: str, prefix: str = "frame") -> List[str]:
+        """
+        把尚未写入的帧交给产物写入器
+
+        Args:
+            sink: 产物写入器（ArtifactSink）
+            directory: 截图目录
+            prefix: 文件名前缀，如失败原因
+
+        Returns:
+            本次写入的截图路径
+        """
+        paths = []
+        for frame in self.frames():
+            if frame.path is None:
+                frame.path = sink.write_screenshot(os.path.join(directory, f"{prefix}_{frame.seq:06d}.png"), frame.data)
+                paths.append(frame.path)
+        self.stats['flushed'] += len(paths)
+        return paths
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+对话历史管理 - 在 token 预算内保留决策上下文
+
+- 最近的步骤保留完整记录（参数、屏幕摘要、截图路径）；
+- 较早的步骤压缩为单行操作记录，截图只保留文字摘要；
+- 超出预算时把最早的记录合并为一行统计摘要。
+压缩按批进行（压到低水位），两次压缩之间只有最近几步的记录会变化，
+配合固定的提示前缀，模型服务端可以复用前缀缓存。
+"""
+
+import json
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+_CJK = re.compile(r'[\u3000-\u9fff\uff00-\uffef]')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算 token 数：中日韩字符按每字一个 token，其余按每4个字符一个 token
+
+    Args:
+        text: 文本
+
+    Returns:
+        估算的 token 数
+    """
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def screen_digest(screen_info: Any, max_texts: int = 5, max_length: int = 80) -> str:
+    """
+    屏幕的文字摘要：当前应用和前几个可见文本
+
+    Args:
+        screen_info: 屏幕信息（ScreenInfo）
+        max_texts: 最多保留的文本数
+        max_length: 摘要最大长度
+
+    Returns:
+        摘要文本
+    """
+    texts = []
+    for element in screen_info.text_elements or []:
+        text = element.get('text') if isinstance(element, dict) else str(element)
+        if text:
+            texts.append(text.strip())
+        if len(texts) >= max_texts:
+            break
+    digest = screen_info.current_app or ""
+    if texts:
+        digest += f" [{' | '.join(texts)}]"
+    return digest[:max_length]
+
+
+@dataclass
+class HistoryEntry:
+    """单步决策记录"""
+    step: int
+    action_type: str
+    parameters: Dict[str, Any]
+    description: str
+    screen: str
+    screenshot_path: Optional[str] = None
+    success: Optional[bool] = None
+
+    @property
+    def outcome(self) -> str:
+        return {True: "成功", False: "失败", None: "未知"}[self.success]
+
+    def render_full(self) -> str:
+        """完整记录"""
+        lines = [
+            f"步骤{self.step}: {self.action_type} "
+            f"{json.dumps(self.parameters, ensure_ascii=False, sort_keys=True)} "
+            f"- {self.description} ({self.outcome})",
+            f"  屏幕: {self.screen}"
+        ]
+        if self.screenshot_path:
+            lines.append(f"  截图: {self.screenshot_path}")
+        return "\n".join(lines)
+
+    def render_compact(self) -> str:
+        """压缩后的单行操作记录"""
+        return f"步骤{self.step}: {self.action_type} - {self.description} ({self.outcome}) @ {self.screen}"
+
+
+@dataclass
+class ConversationHistory:
+    """
+    token 预算内的对话历史
+
+    Args:
+        token_budget: 历史部分的 token 预算
+        keep_full: 保留完整记录的最近步骤数
+        keep_screenshots: 保留截图路径的最近步骤数
+        low_watermark: 超出预算时压缩到预算的比例
+    """
+    token_budget: int
+    keep_full: int = 3
+    keep_screenshots: int = 1
+    low_watermark: float = 0.6
+    entries: List[HistoryEntry] = field(default_factory=list)
+    summary: str = ""
+    summary_counts: Counter = field(default_factory=Counter)
+    summary_failures: int = 0
+    summarized_steps: int = 0
+    compactions: int = 0
+
+    def add(self, action_type: str, parameters: Dict[str, Any], description: str,
+            screen_info: Any) -> HistoryEntry:
+        """
+        追加一步决策
+
+        Args:
+            action_type: 操作类型
+            parameters: 操作参数
+            description: 操作描述
+            screen_info: 决策时的屏幕信息
+
+        Returns:
+            新记录，执行后通过 record_outcome() 更新结果
+        """
+        entry = HistoryEntry(
+            step=self.summarized_steps + len(self.entries) + 1,
+            action_type=action_type,
+            parameters=dict(parameters),
+            description=description,
+            screen=screen_digest(screen_info),
+            screenshot_path=screen_info.screenshot_path
+        )
+        self.entries.append(entry)
+
+        # 较早步骤的截图只保留文字摘要
+        for old in self.entries[:len(self.entries) - self.keep_screenshots]:
+            old.screenshot_path = None
+
+        if self.token_count() > self.token_budget:
+            self._compact()
+        return entry
+
+    def record_outcome(self, success: bool):
+        """记录最近一步的执行结果"""
+        if self.entries and self.entries[-1].success is None:
+            self.entries[-1].success = success
+
+    def recent_screenshots(self) -> List[str]:
+        """仍保留的截图路径（供多模态请求使用）"""
+        return [entry.screenshot_path for entry in self.entries if entry.screenshot_path]
+
+    def render(self) -> str:
+        """
+        渲染历史文本：统计摘要、压缩记录、最近的完整记录
+
+        Returns:
+            历史文本，没有历史时为空字符串
+        """
+        lines = [self.summary] if self.summary else []
+        full_from = max(0, len(self.entries) - self.keep_full)
+        for index, entry in enumerate(self.entries):
+            lines.append(entry.render_full() if index >= full_from else entry.render_compact())
+        return "\n".join(lines)
+
+    def token_count(self) -> int:
+        return estimate_tokens(self.render())
+
+    def clear(self):
+        """开始新任务时清空历史"""
+        self.entries.clear()
+        self.summary = ""
+        self.summary_counts.clear()
+        self.summary_failures = 0
+        self.summarized_steps = 0
+
+    def _compact(self):
+        """把最早的记录合并进统计摘要，直到低于低水位或只剩完整记录"""
+        target = int(self.token_budget * self.low_watermark)
+        while len(self.entries) > self.keep_full and self.token_count() > target:
+            entry = self.entries.pop(0)
+            self.summary_counts[entry.action_type] += 1
+            if entry.success is False:
+                self.summary_failures += 1
+            self.summarized_steps += 1
+            actions = ", ".join(f"{action}×{count}" for action, count in sorted(self.summary_counts.items()))
+            self.summary = f"步骤1-{self.summarized_steps} 摘要: {actions} (失败{self.summary_failures}次)"
+        self.compactions += 1
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+共享模型客户端 - 多设备的决策请求共享连接池，相同请求去重
+
+多台设备同时执行 AI 任务时，各自的 TaskExecutor 通过同一个客户端请求模型：
+- 请求先进入有界队列，由分发协程逐个取出立即下发，不在客户端攒批
+  （合批由模型服务端的连续批处理调度器完成）；
+- 温度为 0 的请求与在途的相同请求合并，只发送一次，结果分发给所有等待方；
+- 同时在途的 HTTP 请求数受限，请求通过共享的连接池发送；
+- 服务端返回 429/503（队列已满）时按 Retry-After 暂停下发并重试，
+  暂停期间客户端队列逐渐填满，调用方在入队时等待，压力传导回各设备；
+- 调用方等待超时时撤回请求，尚未下发的请求不再发送。
+
+可直接对 AutoGLM-Phone-9B/mock_model_server.py 测试：
+    client = get_model_client("http://localhost:8000/v1")
+    client.complete({"model": "autoglm-phone-9b", "messages": [...]})
+"""
+
+import asyncio
+import atexit
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# 服务端队列已满时返回的状态码
+BUSY_STATUS_CODES = (429, 503)
+
+
+class ModelServerBusy(Exception):
+    """服务端持续繁忙，重试次数用尽"""
+
+
+class ModelClient:
+    """
+    共享模型客户端
+
+    在独立线程中运行事件循环；同步代码调用 complete()，协程中 await acomplete()。
+    """
+
+    def __init__(self, base_url: str, api_key: str = "EMPTY", max_concurrency: int = 8, max_pending: int = 64,
+                 timeout: float = 60.0, max_retries: int = 3, default_retry_after: float = 1.0):
+        """
+        初始化共享模型客户端
+
+        Args:
+            base_url: OpenAI 兼容接口地址（如 http://localhost:8000/v1）
+            api_key: API 密钥
+            max_concurrency: 同时在途的 HTTP 请求数，也是连接池大小
+            max_pending: 队列中最多等待的请求数，队列满时调用方等待
+            timeout: 单次 HTTP 请求超时时间（秒）
+            max_retries: 服务端繁忙时的最大重试次数
+            default_retry_after: 服务端未返回 Retry-After 时的暂停时间（秒）
+        """
+        self.base_url = base_url.rstrip('/')
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.default_retry_after = default_retry_after
+        self.stats: Dict[str, Any] = {
+            'requests': 0, 'coalesced': 0, 'cancelled': 0, 'http_requests': 0,
+            'throttled': 0, 'errors': 0, 'max_queue_depth': 0
+        }
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['Authorization'] = f"Bearer {api_key}"
+
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='model-http')
+        self._paused_until = 0.0
+        self._waiting: set = set()
+        # 在途请求：去重键 → 等待该请求结果的所有调用方
+        self._in_flight: Dict[str, List[asyncio.Future]] = {}
+        self._closed = False
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='model-client', daemon=True)
+        self._thread.start()
+        # 队列和信号量必须在客户端事件循环中创建
+        asyncio.run_coroutine_threadsafe(self._setup(max_pending), self._loop).result()
+
+    async def _setup(self, max_pending: int):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._dispatcher = asyncio.ensure_future(self._run_dispatcher())
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def complete(self, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        同步请求补全，队列满时等待
+
+        Args:
+            payload: chat/completions 请求体
+            timeout: 等待结果的超时时间（秒），超时后撤回请求
+
+        Returns:
+            响应 JSON
+
+        Raises:
+            ModelServerBusy: 服务端持续繁忙
+            requests.RequestException: 请求失败
+            concurrent.futures.TimeoutError: 等待超时
+        """
+        future = asyncio.run_coroutine_threadsafe(self._submit(payload), self._loop)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            # 取消 _submit 协程，其等待的结果 future 随之取消
+            future.cancel()
+            raise
+
+    async def acomplete(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """在任意事件循环中请求补全，语义同 complete()"""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._submit(payload), self._loop))
+
+    async def _submit(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if self._closed:
+            raise RuntimeError("模型客户端已关闭")
+        future = self._loop.create_future()
+        self._waiting.add(future)
+        future.add_done_callback(self._waiting.discard)
+        try:
+            await self._queue.put((payload, future))
+            self.stats['requests'] += 1
+            self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], self._queue.qsize())
+            return await future
+        except asyncio.CancelledError:
+            self.stats['cancelled'] += 1
+            future.cancel()
+            raise
+
+    async def _run_dispatcher(self):
+        sequence = 0
+        while True:
+            payload, future = await self._queue.get()
+            if future.cancelled():
+                continue
+
+            # 温度为 0 的请求结果确定，与在途的相同请求合并
+            if payload.get('temperature', 1.0) == 0:
+                key = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+            else:
+                sequence += 1
+                key = f"#{sequence}"
+            if key in self._in_flight:
+                self._in_flight[key].append(future)
+                self.stats['coalesced'] += 1
+                continue
+
+            futures = self._in_flight[key] = [future]
+            # 在途请求已满时在此等待，队列随之填满，调用方在入队时等待
+            await self._slots.acquire()
+            if all(waiting.cancelled() for waiting in futures):
+                # 等待期间调用方都已超时，不再发送
+                del self._in_flight[key]
+                self._slots.release()
+                continue
+            asyncio.ensure_future(self._dispatch(key, payload))
+
+    async def _dispatch(self, key: str, payload: Dict[str, Any]):
+        try:
+            result = await self._post_with_retry(payload)
+        except Exception as e:
+            self.stats['errors'] += 1
+            for future in self._in_flight.pop(key):
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for future in self._in_flight.pop(key):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._slots.release()
+
+    async def _post_with_retry(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        for attempt in range(self.max_retries + 1):
+            # 服务端繁忙期间所有请求一起暂停
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+
+            self.stats['http_requests'] += 1
+            response = await self._loop.run_in_executor(self._executor, self._post, payload)
+            if response.status_code not in BUSY_STATUS_CODES:
+                response.raise_for_status()
+                return response.json()
+
+            self.stats['throttled'] += 1
+            retry_after = self._retry_after(response)
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            if attempt < self.max_retries:
+                logger.warning(f"模型服务繁忙({response.status_code})，{retry_after:.2f}秒后重试 "
+                               f"({attempt + 1}/{self.max_retries})")
+
+        raise ModelServerBusy(f"模型服务持续繁忙，已重试{self.max_retries}次")
+
+    def _post(self, payload: Dict[str, Any]) -> requests.Response:
+        return self.session.post(f"{self.base_url}/chat/completions", json=payload, timeout=self.timeout)
+
+    def _retry_after(self, response: requests.Response) -> float:
+        try:
+            return max(0.0, float(response.headers.get('Retry-After', '')))
+        except ValueError:
+            return self.default_retry_after
+
+    def close(self):
+        """停止分发，关闭连接池"""
+        if self._closed:
+            return
+        self._closed = True
+
+        async def shutdown():
+            self._dispatcher.cancel()
+            for future in list(self._waiting):
+                future.cancel()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+
+_clients: Dict[Tuple[str, str], ModelClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_model_client(base_url: str, api_key: str = "EMPTY") -> ModelClient:
+    """
+    获取模型服务对应的共享客户端
+
+    Args:
+        base_url: OpenAI 兼容接口地址
+        api_key: API 密钥
+
+    Returns:
+        共享模型客户端
+    """
+    key = (base_url.rstrip('/'), api_key)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None or client.closed:
+            client = ModelClient(base_url, api_key)
+            _clients[key] = client
+        return client
+
+
+@atexit.register
+def close_model_clients():
+    """进程退出前关闭所有客户端"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+观察流水线 - 动作下发后立即在后台开始下一次截屏和UI层级获取
+
+后台线程在动作下发至少 settle_min_delay 秒后开始反复观察：每次观察后立即做模型预处理，
+如果下一次观察的界面签名不变且不同于动作前的界面，说明动作已生效且界面已稳定，
+直接使用已预处理的结果；界面签名变化时丢弃旧观察。决策线程只在需要时等待稳定的观察结果。
+"""
+
+import hashlib
+import json
+import re
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+from .cancellation import CancellationToken
+from .tracing import NULL_TRACER, Tracer
+
+_DIGITS = re.compile(r'\d+')
+
+
+def _normalize(value: Any) -> Any:
+    """归一化易变内容：数字（时间、价格、角标计数）统一替换"""
+    if isinstance(value, str):
+        return _DIGITS.sub('#', value.strip())
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def screen_signature(screen_info: Any) -> str:
+    """
+    计算归一化的界面签名
+
+    只使用界面结构（当前应用、尺寸、文本和控件），忽略截图像素和数字，
+    因此行情刷新、时钟变化不会被视为界面切换。
+
+    Args:
+        screen_info: 屏幕信息（ScreenInfo）
+
+    Returns:
+        签名（十六进制字符串）
+    """
+    payload = {
+        'app': screen_info.current_app,
+        'size': [screen_info.width, screen_info.height],
+        'texts': _normalize(screen_info.text_elements or []),
+        'elements': _normalize(screen_info.ui_elements or []),
+    }
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def observation_signature(screen_info: Any) -> str:
+    """
+    稳定检测使用的界面签名：有截图时使用截图的感知哈希，否则使用界面结构签名
+
+    结构签名忽略数字和控件位置，获取不到UI层级时在任何界面上都相同；截图能反映这些变化。
+
+    Args:
+        screen_info: 屏幕信息（ScreenInfo）
+
+    Returns:
+        签名
+    """
+    if screen_info.frame_hash is not None:
+        return f"frame:{screen_info.frame_hash:016x}"
+    return screen_signature(screen_info)
+
+
+def has_structure(screen_info: Any) -> bool:
+    """屏幕信息是否包含界面结构（文本或控件），没有结构时界面签名无法区分不同界面"""
+    return bool(screen_info.text_elements or screen_info.ui_elements)
+
+
+@dataclass
+class Observation:
+    """一次界面观察及其预处理结果"""
+    screen: Any
+    signature: str
+    prepared: Any = None
+    captured_at: float = field(default_factory=time.monotonic)
+
+
+class ObservationPipeline:
+    """
+    观察流水线
+
+    start() 在后台开始下一次观察（在动作下发后立即调用），
+    next() 返回稳定的观察结果；没有进行中的观察时同步执行一次（不等待动作生效）。
+    """
+
+    def __init__(self, capture: Callable[[], Any],
+                 preprocess: Optional[Callable[[Any], Any]] = None,
+                 signature: Callable[[Any], str] = observation_signature,
+                 settle_interval: float = 0.2, settle_timeout: float = 3.0,
+                 settle_min_delay: float = 0.3, unchanged_limit: int = 3,
+                 tracer: Optional[Tracer] = None,
+                 cancel_token: Optional[CancellationToken] = None):
+        """
+        初始化观察流水线
+
+        Args:
+            capture: 获取屏幕信息（截屏和UI层级）
+            preprocess: 模型预处理，结果随观察一起返回
+            signature: 界面签名函数
+            settle_interval: 稳定检测的观察间隔（秒），预处理耗时计入间隔
+            settle_timeout: 等待界面稳定的最长时间（秒），超时后使用最新观察
+            settle_min_delay: 动作下发后开始观察前的最短等待时间（秒），避免截到动作生效前的画面
+            unchanged_limit: 连续这么多次观察仍是动作前的界面时视为动作没有改变界面（无效点击、
+                只改变被签名忽略的文本），不再等待到稳定超时
+            tracer: 追踪器
+            cancel_token: 取消令牌
+        """
+        self.capture = capture
+        self.preprocess = preprocess
+        self.signature = signature
+        self.settle_interval = settle_interval
+        self.settle_timeout = settle_timeout
+        self.settle_min_delay = settle_min_delay
+        self.unchanged_limit = unchanged_limit
+        self.tracer = tracer or NULL_TRACER
+        self.cancel_token = cancel_token
+        self.stats: Dict[str, int] = {
+            'observations': 0, 'captures': 0, 'discarded': 0, 'unchanged': 0, 'no_change': 0, 'unsettled': 0
+        }
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='observe')
+        self._pending: Optional[Future] = None
+        self._last_signature: Optional[str] = None
+
+    def start(self):
+        """动作已下发，在后台开始下一次观察，已有进行中的观察时忽略"""
+        if self._pending is None:
+            self._pending = self._executor.submit(
+                self._observe_settled, time.monotonic() + self.settle_min_delay, self._last_signature
+            )
+
+    def next(self) -> Observation:
+        """
+        获取稳定的观察结果
+
+        Returns:
+            观察结果
+
+        Raises:
+            WorkScriptCancelled: 观察期间任务被取消
+        """
+        if self._pending is None:
+            self._pending = self._executor.submit(self._observe_settled, None, None)
+        pending, self._pending = self._pending, None
+        with self.tracer.span("wait_observation", "wait"):
+            observation = pending.result()
+        self.stats['observations'] += 1
+        self._last_signature = observation.signature
+        return observation
+
+    def close(self):
+        """停止后台线程，丢弃进行中的观察"""
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        self._executor.shutdown(wait=True)
+
+    def _capture(self) -> Observation:
+        with self.tracer.span("observe", "capture"):
+            screen = self.capture()
+            self.stats['captures'] += 1
+            return Observation(screen=screen, signature=self.signature(screen))
+
+    def _prepare(self, observation: Observation):
+        if self.preprocess:
+            with self.tracer.span("preprocess", "model"):
+                observation.prepared = self.preprocess(observation.screen)
+
+    def _sleep(self, seconds: float):
+        if seconds <= 0:
+            return
+        if self.cancel_token:
+            self.cancel_token.sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+    def _observe_settled(self, not_before: Optional[float], previous_signature: Optional[str]) -> Observation:
+        """
+        观察直到连续两次界面签名相同且不同于动作前的界面，
+        或连续 unchanged_limit 次仍是动作前的界面，或超过稳定等待时间
+
+        Args:
+            not_before: 最早的观察时间（time.monotonic()），None 表示立即观察
+            previous_signature: 动作前的界面签名，None 表示不比较
+        """
+        if not_before is not None:
+            self._sleep(not_before - time.monotonic())
+        observation = self._capture()
+        self._prepare(observation)
+        # 连续与动作前界面相同的观察次数
+        unchanged = 1 if observation.signature == previous_signature else 0
+        deadline = time.monotonic() + self.settle_timeout
+        while time.monotonic() < deadline:
+            # 预处理已经占用的时间计入观察间隔
+            elapsed = time.monotonic() - observation.captured_at
+            self._sleep(min(self.settle_interval - elapsed, deadline - time.monotonic()))
+
+            latest = self._capture()
+            if latest.signature == observation.signature:
+                if latest.signature == previous_signature:
+                    observation.screen, observation.captured_at = latest.screen, latest.captured_at
+                    unchanged += 1
+                    if unchanged >= self.unchanged_limit:
+                        # 动作没有改变界面，不再等待
+                        self.stats['no_change'] += 1
+                        return observation
+                    # 仍是动作前的界面，动作可能尚未生效，继续观察
+                    self.stats['unchanged'] += 1
+                    continue
+                # 界面已稳定，使用最新截图，沿用已完成的预处理
+                observation.screen = latest.screen
+                return observation
+
+            # 界面仍在变化，丢弃旧观察
+            self.stats['discarded'] += 1
+            observation = latest
+            unchanged = 1 if observation.signature == previous_signature else 0
+            self._prepare(observation)
+
+        self.stats['unsettled'] += 1
+        return observation
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+截图预处理 - 截图提交给决策模型之前缩小、裁剪并重新编码
+
+- 按模型的像素预算缩放，宽高取视觉编码器 patch 大小的整数倍，避免服务端再次缩放；
+- 可选裁掉顶部状态栏和底部导航栏：与 stitch_screenshots.py 的头部/底部检测思路相同，
+  从边缘逐行扫描，与首行背景色一致的行视为系统栏；检测结果超过上限时认为界面与系统栏
+  同色、无法区分，不裁剪；
+- 编码为 JPEG/WebP；
+- 结果按帧内容哈希缓存，同一画面重复决策时不再处理。
+"""
+
+import base64
+import hashlib
+import io
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+
+@dataclass(frozen=True)
+class PreprocessConfig:
+    """
+    截图预处理参数
+
+    Args:
+        max_pixels: 缩放后的最大像素数
+        patch_size: 宽高对齐的倍数（视觉编码器的 patch 大小）
+        format: 编码格式，jpeg 或 webp
+        quality: 编码质量
+        crop_bars: 是否裁掉状态栏和导航栏
+        max_bar_fraction: 单个系统栏最多占屏幕高度的比例
+        bar_fill: 行内与背景色一致的像素比例达到该值时视为系统栏
+        diff_threshold: 灰度差不超过该值视为与背景色一致
+    """
+    max_pixels: int = 768 * 28 * 28
+    patch_size: int = 28
+    format: str = "jpeg"
+    quality: int = 80
+    crop_bars: bool = True
+    max_bar_fraction: float = 0.08
+    bar_fill: float = 0.6
+    diff_threshold: int = 8
+
+
+@dataclass
+class ProcessedImage:
+    """预处理后的截图"""
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    crop: Tuple[int, int]  # 裁掉的 (顶部, 底部) 像素数，按原图计算
+    original_bytes: int
+
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{base64.b64encode(self.data).decode()}"
+
+
+def detect_bar_heights(image: "Image.Image", config: PreprocessConfig) -> Tuple[int, int]:
+    """
+    检测顶部状态栏和底部导航栏的高度
+
+    Args:
+        image: 截图
+        config: 预处理参数
+
+    Returns:
+        (顶部高度, 底部高度)，无法区分时为0
+    """
+    gray = image.convert('L')
+    width, height = gray.size
+    pixels = gray.tobytes()
+    limit = int(height * config.max_bar_fraction)
+    tolerance = config.diff_threshold
+
+    def scan(rows: range) -> int:
+        # 边缘第一行出现最多的灰度作为系统栏背景色
+        edge = pixels[rows[0] * width:(rows[0] + 1) * width]
+        background = max(range(256), key=edge.count)
+        # 与背景色一致的灰度映射为1，按行计数
+        table = bytes(int(abs(value - background) <= tolerance) for value in range(256))
+        for offset, row in enumerate(rows[:limit + 1]):
+            if pixels[row * width:(row + 1) * width].translate(table).count(1) < config.bar_fill * width:
+                return offset
+        return 0
+
+    top = scan(range(height))
+    bottom = scan(range(height - 1, -1, -1))
+    return top, bottom
+
+
+def target_size(width: int, height: int, config: PreprocessConfig) -> Tuple[int, int]:
+    """按像素预算等比缩放，宽高对齐到 patch_size 的整数倍（不放大）"""
+    scale = min(1.0, (config.max_pixels / (width * height)) ** 0.5)
+    patch = config.patch_size
+    return (
+        max(patch, int(width * scale) // patch * patch),
+        max(patch, int(height * scale) // patch * patch)
+    )
+
+
+class ScreenshotPreprocessor:
+    """截图预处理器，结果按帧内容哈希做 LRU 缓存，线程安全"""
+
+    def __init__(self, config: Optional[PreprocessConfig] = None, cache_size: int = 32):
+        """
+        初始化截图预处理器
+
+        Args:
+            config: 预处理参数
+            cache_size: 缓存的处理结果数
+        """
+        if not PIL_AVAILABLE:
+            raise ImportError("截图预处理需要 Pillow")
+        self.config = config or PreprocessConfig()
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, ProcessedImage]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'frames': 0, 'cache_hits': 0, 'original_bytes': 0, 'processed_bytes': 0, 'process_ms': 0.0
+        }
+
+    def process(self, png_data: bytes) -> ProcessedImage:
+        """
+        预处理一帧截图
+
+        Args:
+            png_data: 设备返回的截图数据
+
+        Returns:
+            预处理后的截图
+        """
+        key = hashlib.sha1(png_data).hexdigest()
+        with self._lock:
+            self._stats['frames'] += 1
+            self._stats['original_bytes'] += len(png_data)
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self._stats['cache_hits'] += 1
+                self._stats['processed_bytes'] += len(cached.data)
+                return cached
+
+        start = time.perf_counter()
+        processed = self._process(png_data)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            self._stats['processed_bytes'] += len(processed.data)
+            self._stats['process_ms'] += elapsed
+            self._cache[key] = processed
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return processed
+
+    def _process(self, png_data: bytes) -> ProcessedImage:
+        config = self.config
+        with Image.open(io.BytesIO(png_data)) as image:
+            image = image.convert('RGB')
+        crop = (0, 0)
+        if config.crop_bars:
+            crop = detect_bar_heights(image, config)
+            if any(crop):
+                image = image.crop((0, crop[0], image.width, image.height - crop[1]))
+
+        size = target_size(image.width, image.height, config)
+        if size != image.size:
+            image = image.resize(size, Image.BICUBIC, reducing_gap=2.0)
+
+        output = io.BytesIO()
+        if config.format == "webp":
+            image.save(output, format="WEBP", quality=config.quality, method=4)
+        else:
+            image.save(output, format="JPEG", quality=config.quality, optimize=True)
+        return ProcessedImage(
+            data=output.getvalue(),
+            mime_type=f"image/{config.format}",
+            width=image.width,
+            height=image.height,
+            crop=crop,
+            original_bytes=len(png_data)
+        )
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """处理帧数、缓存命中数和处理前后的数据量"""
+        with self._lock:
+            stats = dict(self._stats)
+        processed = stats['frames'] - stats['cache_hits']
+        stats['process_ms'] = round(stats['process_ms'], 3)
+        stats['mean_process_ms'] = round(stats['process_ms'] / processed, 3) if processed else 0.0
+        stats['compression_ratio'] = (
+            round(stats['processed_bytes'] / stats['original_bytes'], 4) if stats['original_bytes'] else 0.0
+        )
+        return stats
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+错误恢复 - 指数退避加随机抖动，执行实际的恢复动作
+
+每种错误类型对应一条恢复策略：恢复动作（强制停止后经缓存的启动Activity重启应用、
+按界面签名或应用定义中的界面标识关闭已知弹窗、重建ADB连接）、退避参数和预算（每个任务内的最大尝试次数
+和累计恢复时间）。预算用完后不再恢复，避免在不可恢复的错误上反复等待。
+每次恢复尝试记录为 recovery 分类的追踪区间。
+"""
+
+import logging
+import os
+import random
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .cancellation import CancellationToken
+from .checkpoint import screen_matches
+from .pipeline import screen_signature
+from .tracing import NULL_TRACER, Tracer
+
+logger = logging.getLogger(__name__)
+
+# 应用定义目录：workscripts/<包名>/workscripts.yaml
+WORKSCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                               'workscripts')
+
+
+@dataclass
+class Backoff:
+    """
+    指数退避
+
+    Args:
+        base: 第一次重试前的等待时间（秒）
+        factor: 每次重试的增长倍数
+        max_delay: 最长等待时间（秒）
+        jitter: 随机抖动比例，等待时间在 [delay*(1-jitter), delay] 之间
+    """
+    base: float = 0.5
+    factor: float = 2.0
+    max_delay: float = 30.0
+    jitter: float = 0.5
+
+    def delay(self, attempt: int, rng: random.Random) -> float:
+        """第 attempt 次（从0开始）恢复前的等待时间"""
+        delay = min(self.max_delay, self.base * self.factor ** attempt)
+        return delay * (1 - self.jitter * rng.random())
+
+
+@dataclass
+class RecoveryPolicy:
+    """
+    单一错误类型的恢复策略
+
+    Args:
+        actions: 依次执行的恢复动作名称，任一动作成功即视为恢复成功
+        backoff: 退避参数
+        max_attempts: 每个任务内的最大恢复次数
+        max_seconds: 每个任务内的累计恢复时间上限（秒）
+        wait_is_recovery: 动作都不适用时，退避等待本身是否算作恢复（如等待页面加载）
+    """
+    actions: Tuple[str, ...] = ()
+    backoff: Backoff = field(default_factory=Backoff)
+    max_attempts: int = 3
+    max_seconds: float = 60.0
+    wait_is_recovery: bool = False
+
+
+DEFAULT_POLICIES: Dict[str, RecoveryPolicy] = {
+    'network_error': RecoveryPolicy(('reconnect_transport',), Backoff(base=1.0), max_attempts=5, max_seconds=120.0),
+    'app_not_responding': RecoveryPolicy(('relaunch_app',), Backoff(base=1.0), max_attempts=2),
+    'element_not_found': RecoveryPolicy(('dismiss_dialog',), max_attempts=3, max_seconds=15.0,
+                                        wait_is_recovery=True),
+    'timeout': RecoveryPolicy(('dismiss_dialog',), Backoff(base=1.0), max_attempts=3, max_seconds=30.0,
+                              wait_is_recovery=True),
+    'execution_error': RecoveryPolicy(('dismiss_dialog',), max_attempts=2, max_seconds=15.0),
+    'login_required': RecoveryPolicy(max_attempts=0),
+}
+
+# 按错误信息判断错误类型，按顺序匹配
+# login_required 不可恢复，只匹配明确的会话/认证失效提示且放在最后，
+# "未找到登录按钮"、"点击登录失败: timeout" 之类的信息仍按元素缺失或超时处理
+_ERROR_PATTERNS = [
+    ('network_error', re.compile(r'网络|连接|offline|connection|transport|device not found', re.IGNORECASE)),
+    ('app_not_responding', re.compile(r'无响应|崩溃|ANR|crash|not responding', re.IGNORECASE)),
+    ('timeout', re.compile(r'超时|timeout|timed out', re.IGNORECASE)),
+    ('element_not_found', re.compile(r'未找到|找不到|not found', re.IGNORECASE)),
+    ('login_required', re.compile(
+        r'(登录|会话)(状态)?已?(过期|失效)|重新登录|请先登录|未登录|'
+        r'session (has )?expired|not logged in|login required|unauthori[sz]ed',
+        re.IGNORECASE
+    )),
+]
+
+
+def classify_error(message: str) -> str:
+    """
+    根据错误信息判断错误类型
+
+    Args:
+        message: 错误信息
+
+    Returns:
+        错误类型，无法判断时为 execution_error
+    """
+    for error_type, pattern in _ERROR_PATTERNS:
+        if pattern.search(message or ""):
+            return error_type
+    return 'execution_error'
+
+
+def load_app_dialogs(app_package: str, workscripts_dir: str = WORKSCRIPTS_DIR) -> List[Dict[str, Any]]:
+    """
+    读取应用定义（workscripts.yaml）中的已知弹窗
+
+    Args:
+        app_package: 应用包名
+        workscripts_dir: 应用定义目录
+
+    Returns:
+        弹窗定义列表，应用没有定义时为空
+    """
+    path = os.path.join(workscripts_dir, app_package, 'workscripts.yaml')
+    if not os.path.exists(path):
+        return []
+    import yaml
+    with open(path, 'r', encoding='utf-8') as f:
+        return (yaml.safe_load(f) or {}).get('dialogs') or []
+
+
+@dataclass
+class DialogRule:
+    """已知弹窗：界面签名或界面标识组，以及关闭方式"""
+    name: str
+    signature: Optional[str] = None
+    action_type: str = 'back'  # back 或 tap_at
+    parameters: Dict[str, Any] = field(default_factory=dict)
+    screen_identifiers: List[Dict[str, Dict[str, Any]]] = field(default_factory=list)
+
+
+class RecoveryManager:
+    """
+    错误恢复管理器
+
+    device 为设备对象（ADBDeviceController），恢复动作通过其 adb_device 执行；
+    每个任务开始时调用 reset() 重置预算。
+    """
+
+    def __init__(self, device: Optional[Any] = None,
+                 policies: Optional[Dict[str, RecoveryPolicy]] = None,
+                 tracer: Optional[Tracer] = None,
+                 cancel_token: Optional[CancellationToken] = None,
+                 rng: Optional[random.Random] = None):
+        """
+        初始化错误恢复管理器
+
+        Args:
+            device: 设备对象
+            policies: 覆盖默认策略的错误类型和策略
+            tracer: 追踪器
+            cancel_token: 取消令牌，退避等待期间响应取消
+            rng: 随机数生成器（抖动）
+        """
+        self.device = device
+        self.policies = {**DEFAULT_POLICIES, **(policies or {})}
+        self.tracer = tracer or NULL_TRACER
+        self.cancel_token = cancel_token
+        self.rng = rng or random.Random()
+        self.dialogs: Dict[str, DialogRule] = {}
+        self.defined_dialogs: List[DialogRule] = []
+        self.actions: Dict[str, Callable[[Dict[str, Any]], bool]] = {
+            'relaunch_app': self.relaunch_app,
+            'dismiss_dialog': self.dismiss_dialog,
+            'reconnect_transport': self.reconnect_transport,
+        }
+        self.usage: Dict[str, Dict[str, Any]] = {}
+
+    def reset(self):
+        """开始新任务时重置各错误类型的预算"""
+        self.usage.clear()
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各错误类型的恢复次数、成功次数和累计耗时"""
+        return {error_type: dict(usage) for error_type, usage in self.usage.items()}
+
+    def register_dialog(self, name: str, screen_info: Any, action_type: str = 'back',
+                        parameters: Optional[Dict[str, Any]] = None):
+        """
+        登记已知弹窗，之后在相同界面签名上出错时自动关闭
+
+        Args:
+            name: 弹窗名称
+            screen_info: 弹窗出现时的屏幕信息
+            action_type: 关闭方式，back 或 tap_at
+            parameters: tap_at 的坐标 {"x": ..., "y": ...}
+        """
+        signature = screen_signature(screen_info)
+        self.dialogs[signature] = DialogRule(name, signature, action_type, dict(parameters or {}))
+
+    def load_dialogs(self, definitions: List[Dict[str, Any]]):
+        """
+        设置按界面标识识别的已知弹窗（替换之前加载的定义）
+
+        Args:
+            definitions: 弹窗定义列表（load_app_dialogs），每项包含 name、screen_identifiers，
+                可选 action（back 或 tap_at）和 parameters
+        """
+        self.defined_dialogs = [
+            DialogRule(
+                name=definition['name'],
+                action_type=definition.get('action', 'back'),
+                parameters=dict(definition.get('parameters') or {}),
+                screen_identifiers=definition['screen_identifiers']
+            )
+            for definition in definitions
+        ]
+
+    def handle(self, error_type: str, context: Dict[str, Any]) -> bool:
+        """
+        尝试从错误中恢复
+
+        Args:
+            error_type: 错误类型
+            context: 错误上下文，可包含 screen_info、app_package、context（错误信息）
+
+        Returns:
+            是否已恢复，调用方可以重试当前步骤
+        """
+        policy = self.policies.get(error_type)
+        if policy is None:
+            return False
+
+        usage = self.usage.setdefault(error_type, {'attempts': 0, 'successes': 0, 'seconds': 0.0})
+        if usage['attempts'] >= policy.max_attempts or usage['seconds'] >= policy.max_seconds:
+            logger.warning(f"{error_type} 恢复预算已用完 (尝试{usage['attempts']}次, 耗时{usage['seconds']:.1f}秒)")
+            return False
+
+        attempt = usage['attempts']
+        usage['attempts'] += 1
+        start = time.monotonic()
+        with self.tracer.span(f"recover:{error_type}", "recovery", attempt=attempt + 1) as span:
+            delay = min(policy.backoff.delay(attempt, self.rng), policy.max_seconds - usage['seconds'])
+            self._sleep(delay)
+
+            results = {}
+            for name in policy.actions:
+                try:
+                    results[name] = self.actions[name](context)
+                except Exception as e:
+                    logger.warning(f"恢复动作 {name} 失败: {e}")
+                    results[name] = False
+                if results[name]:
+                    break
+            recovered = any(results.values()) or policy.wait_is_recovery
+
+            if span:
+                span.set_attribute('delay_ms', round(delay * 1000, 3))
+                span.set_attribute('actions', results)
+                span.set_attribute('recovered', recovered)
+
+        usage['seconds'] += time.monotonic() - start
+        usage['successes'] += recovered
+        logger.info(f"{error_type} 第{attempt + 1}次恢复: {'成功' if recovered else '失败'} {results}")
+        return recovered
+
+    def _sleep(self, seconds: float):
+        if seconds <= 0:
+            return
+        with self.tracer.span("backoff", "wait", seconds=round(seconds, 3)):
+            if self.cancel_token:
+                self.cancel_token.sleep(seconds)
+            else:
+                time.sleep(seconds)
+
+    def _adb(self) -> Optional[Any]:
+        return self.device.adb_device if self.device else None
+
+    def relaunch_app(self, context: Dict[str, Any]) -> bool:
+        """强制停止并经缓存的启动Activity重新启动应用"""
+        adb_device = self._adb()
+        screen_info = context.get('screen_info')
+        package = context.get('app_package') or (screen_info.current_app if screen_info else None)
+        if not adb_device or not package or package in ('Unknown', 'System Home'):
+            return False
+        return adb_device.restart_app(package)
+
+    def dismiss_dialog(self, context: Dict[str, Any]) -> bool:
+        """当前界面签名或UI层级匹配已知弹窗时关闭弹窗"""
+        adb_device = self._adb()
+        if not adb_device:
+            return False
+        screen_info = context.get('screen_info')
+        rule = self.dialogs.get(screen_signature(screen_info)) if screen_info is not None else None
+        if rule is None:
+            rule = self._match_defined_dialog()
+        if rule is None:
+            return False
+
+        logger.info(f"关闭已知弹窗: {rule.name}")
+        if rule.action_type == 'tap_at':
+            adb_device.tap(rule.parameters['x'], rule.parameters['y'], delay=0)
+        else:
+            adb_device.back(delay=0)
+        return True
+
+    def _match_defined_dialog(self) -> Optional[DialogRule]:
+        """获取UI层级，返回第一个界面标识匹配的已定义弹窗"""
+        if not self.defined_dialogs:
+            return None
+        root = self.device.dump_ui_hierarchy()
+        if root is None:
+            return None
+        return next((rule for rule in self.defined_dialogs if screen_matches(root, rule.screen_identifiers)), None)
+
+    def reconnect_transport(self, context: Dict[str, Any]) -> bool:
+        """重建ADB连接"""
+        adb_device = self._adb()
+        if not adb_device:
+            return False
+        return adb_device.reconnect()
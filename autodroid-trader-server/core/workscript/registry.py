@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+按需加载的脚本注册表
+
+注册时只记录工厂（"模块:类名" 字符串或可调用对象），不导入模块；
+第一次使用某个脚本时才导入并缓存工厂，之后每次执行都用工厂创建新实例，
+并发执行的任务不会共享脚本状态。引擎构造因此不再为用不到的脚本付出导入开销。
+"""
+
+import importlib
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Union
+
+logger = logging.getLogger(__name__)
+
+ScriptFactory = Union[str, Callable[[], Any]]
+
+
+def resolve_factory(spec: str) -> Callable[[], Any]:
+    """
+    解析 "模块:属性" 形式的工厂
+
+    Args:
+        spec: 如 "core.enhanced_workscript:EnhancedLoginTestScript"
+
+    Returns:
+        工厂（通常为脚本类）
+
+    Raises:
+        ValueError: 格式错误
+        ImportError: 模块导入失败
+        KeyError: 属性不存在
+    """
+    module_name, _, attr_path = spec.partition(':')
+    if not attr_path:
+        raise ValueError(f"脚本工厂格式应为 模块:属性: {spec}")
+    target: Any = importlib.import_module(module_name)
+    for attr in attr_path.split('.'):
+        target = vars(target)[attr]
+    return target
+
+
+class ScriptRegistry:
+    """线程安全的按需加载脚本注册表"""
+
+    def __init__(self):
+        self._factories: Dict[str, ScriptFactory] = {}
+        self._resolved: Dict[str, Callable[[], Any]] = {}
+        self._lock = threading.Lock()
+        self.load_times_ms: Dict[str, float] = {}
+
+    def register(self, name: str, factory: ScriptFactory):
+        """
+        注册脚本工厂，已解析的同名工厂会被丢弃
+
+        Args:
+            name: 脚本名称
+            factory: "模块:属性" 字符串或无参可调用对象
+        """
+        with self._lock:
+            self._factories[name] = factory
+            self._resolved.pop(name, None)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._factories
+
+    def __len__(self) -> int:
+        return len(self._factories)
+
+    def names(self) -> List[str]:
+        """已注册的脚本名称（不触发加载）"""
+        return list(self._factories)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._resolved
+
+    def factory(self, name: str) -> Callable[[], Any]:
+        """
+        获取脚本工厂，首次使用时导入
+
+        Args:
+            name: 脚本名称
+
+        Returns:
+            脚本工厂
+
+        Raises:
+            KeyError: 脚本未注册
+        """
+        with self._lock:
+            if name in self._resolved:
+                return self._resolved[name]
+
+            factory = self._factories[name]
+            start = time.perf_counter()
+            if isinstance(factory, str):
+                factory = resolve_factory(factory)
+            self._resolved[name] = factory
+            self.load_times_ms[name] = round((time.perf_counter() - start) * 1000, 3)
+            logger.info(f"加载脚本 {name}，耗时 {self.load_times_ms[name]}ms")
+            return factory
+
+    def create(self, name: str) -> Any:
+        """
+        为一次执行创建新的脚本实例
+
+        Args:
+            name: 脚本名称
+
+        Returns:
+            脚本实例
+
+        Raises:
+            KeyError: 脚本未注册
+        """
+        return self.factory(name)()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+流式模型输出 - 增量解析 ACTION/PARAMETERS 并提前下发动作
+
+模型按 OpenAI 兼容接口以 SSE 返回增量文本。ACTION 和 PARAMETERS 字段一旦完整，
+决策就可以返回给执行线程下发动作；之后的 DESCRIPTION 和推理说明继续在后台读取，
+读完后记入追踪。每步从请求到可以执行动作的时间因此不再包含模型尾部说明的生成时间。
+"""
+
+import json
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+import requests
+
+from .tracing import NULL_TRACER, Tracer
+
+_FIELD_PATTERN = re.compile(r'^[ \t]*(ACTION|PARAMETERS|DESCRIPTION)[ \t]*[:：][ \t]*', re.MULTILINE)
+_KEY_VALUE_PATTERN = re.compile(r'(\w+)\s*[=:]\s*("[^"]*"|[^,]+)')
+
+
+def _parse_scalar(value: str) -> Any:
+    value = value.strip().strip('"')
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def _parse_parameters(value: str, complete: bool) -> Optional[Dict[str, Any]]:
+    """
+    解析 PARAMETERS 字段
+
+    JSON 对象在括号配对完成时即可解析，不必等到换行；
+    其他格式（x=500, y=800）需要整行结束。
+
+    Returns:
+        参数字典，尚未完整时返回None
+    """
+    stripped = value.lstrip()
+    if stripped.startswith('{'):
+        depth, in_string, escaped = 0, False, False
+        for index, char in enumerate(stripped):
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == '\\':
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == '{':
+                depth += 1
+            elif char == '}':
+                depth -= 1
+                if depth == 0:
+                    try:
+                        return json.loads(stripped[:index + 1])
+                    except ValueError:
+                        return {'value': stripped[:index + 1]}
+        return {'value': stripped.strip()} if complete and stripped.strip() else None
+
+    line_end = value.find('\n')
+    if line_end < 0 and not complete:
+        return None
+    raw = (value[:line_end] if line_end >= 0 else value).strip()
+    if not raw:
+        return {}
+    pairs = _KEY_VALUE_PATTERN.findall(raw)
+    if pairs:
+        return {key: _parse_scalar(item) for key, item in pairs}
+    return {'value': raw}
+
+
+class ActionStreamParser:
+    """增量解析模型输出中的 ACTION / PARAMETERS / DESCRIPTION 字段"""
+
+    def __init__(self):
+        self.text = ""
+        self.action_type: Optional[str] = None
+        self.parameters: Optional[Dict[str, Any]] = None
+        self.description: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        """ACTION 和 PARAMETERS 是否已完整，可以下发动作"""
+        return self.action_type is not None and self.parameters is not None
+
+    def feed(self, chunk: str) -> bool:
+        """
+        追加增量文本
+
+        Args:
+            chunk: 增量文本
+
+        Returns:
+            是否可以下发动作
+        """
+        self.text += chunk
+        self._parse(final=False)
+        return self.ready
+
+    def finish(self):
+        """流结束，按已有文本确定剩余字段"""
+        self._parse(final=True)
+
+    def _parse(self, final: bool):
+        headers = list(_FIELD_PATTERN.finditer(self.text))
+        for index, match in enumerate(headers):
+            name = match.group(1)
+            end = headers[index + 1].start() if index + 1 < len(headers) else len(self.text)
+            value = self.text[match.end():end]
+            # 后面已经出现下一个字段时，当前字段一定完整
+            complete = final or index + 1 < len(headers)
+
+            if name == 'ACTION' and self.action_type is None:
+                line_end = value.find('\n')
+                if line_end >= 0 or (complete and value.strip()):
+                    self.action_type = (value[:line_end] if line_end >= 0 else value).strip() or None
+            elif name == 'PARAMETERS' and self.parameters is None:
+                self.parameters = _parse_parameters(value, complete)
+            elif name == 'DESCRIPTION' and self.description is None:
+                # 描述只取第一行，行结束即完整，不等待后面的推理说明
+                text = value.lstrip()
+                line_end = text.find('\n')
+                if line_end >= 0 or complete:
+                    self.description = (text[:line_end] if line_end >= 0 else text).strip()
+
+        # ACTION 之后没有 PARAMETERS（如 back、home）：出现 DESCRIPTION 或流结束时视为无参数
+        if self.action_type and self.parameters is None and (
+                final or any(match.group(1) == 'DESCRIPTION' for match in headers)):
+            self.parameters = {}
+
+
+def iter_sse_content(lines: Iterable[str]) -> Iterator[str]:
+    """
+    从 OpenAI 兼容的 SSE 行中提取增量文本
+
+    Args:
+        lines: SSE 文本行
+
+    Yields:
+        choices[0].delta.content
+    """
+    for line in lines:
+        if not line or not line.startswith('data:'):
+            continue
+        data = line[5:].strip()
+        if data == '[DONE]':
+            return
+        chunk = json.loads(data)
+        for choice in chunk.get('choices', []):
+            content = (choice.get('delta') or {}).get('content')
+            if content:
+                yield content
+
+
+def stream_chat_completion(base_url: str, api_key: str, payload: Dict[str, Any],
+                           timeout: float = 60.0,
+                           session: Optional[requests.Session] = None) -> Iterator[str]:
+    """
+    请求流式补全
+
+    Args:
+        base_url: OpenAI 兼容接口地址（如 http://localhost:8000/v1）
+        api_key: API 密钥
+        payload: 请求体，stream 字段会被设置为 True
+        timeout: 连接和读取超时时间（秒）
+        session: 复用连接池的会话（如共享模型客户端的会话）
+
+    Yields:
+        增量文本
+    """
+    response = (session or requests).post(
+        f"{base_url.rstrip('/')}/chat/completions",
+        json={**payload, 'stream': True},
+        headers={'Authorization': f"Bearer {api_key}", 'Accept': 'text/event-stream'},
+        stream=True,
+        timeout=timeout
+    )
+    with response:
+        response.raise_for_status()
+        yield from iter_sse_content(response.iter_lines(decode_unicode=True))
+
+
+class StreamingDecision:
+    """
+    在后台线程消费流式输出
+
+    wait_action() 在 ACTION/PARAMETERS 完整时立即返回，wait_description() 在 DESCRIPTION 行完整时返回；
+    剩余的说明文本继续读取，读完后连同首字延迟、动作延迟写入追踪区间。
+    """
+
+    def __init__(self, chunks: Iterable[str], tracer: Optional[Tracer] = None):
+        """
+        开始消费流式输出
+
+        Args:
+            chunks: 增量文本迭代器
+            tracer: 追踪器
+        """
+        self.parser = ActionStreamParser()
+        self.tracer = tracer or NULL_TRACER
+        self.error: Optional[BaseException] = None
+        self.started_at = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self.action_ready_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+        self._action_ready = threading.Event()
+        self._description_ready = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._consume, args=(chunks,), name='model-stream', daemon=True)
+        self._thread.start()
+
+    def _consume(self, chunks: Iterable[str]):
+        with self.tracer.span("model_stream", "model") as span:
+            try:
+                for chunk in chunks:
+                    if self.first_token_at is None:
+                        self.first_token_at = time.monotonic()
+                    if self.parser.feed(chunk) and not self._action_ready.is_set():
+                        self.action_ready_at = time.monotonic()
+                        self._action_ready.set()
+                    if self.parser.description is not None:
+                        self._description_ready.set()
+                self.parser.finish()
+                if self.parser.ready and self.action_ready_at is None:
+                    self.action_ready_at = time.monotonic()
+            except Exception as e:
+                self.error = e
+            finally:
+                self.finished_at = time.monotonic()
+                if span:
+                    for key, value in self.metrics().items():
+                        span.set_attribute(key, value)
+                    span.set_attribute('output', self.parser.text)
+                self._action_ready.set()
+                self._description_ready.set()
+                self._done.set()
+
+    def wait_action(self, timeout: Optional[float] = None) -> Tuple[str, Dict[str, Any]]:
+        """
+        等待动作字段完整
+
+        Args:
+            timeout: 超时时间（秒）
+
+        Returns:
+            (操作类型, 参数)
+
+        Raises:
+            TimeoutError: 超时
+            ValueError: 输出中没有完整的 ACTION/PARAMETERS
+        """
+        if not self._action_ready.wait(timeout):
+            raise TimeoutError("等待模型输出动作超时")
+        if not self.parser.ready:
+            if self.error:
+                raise self.error
+            raise ValueError(f"模型输出中缺少 ACTION/PARAMETERS: {self.parser.text[:200]}")
+        return self.parser.action_type, self.parser.parameters
+
+    def wait_description(self, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        等待 DESCRIPTION 行完整，流结束仍没有描述时返回 None
+
+        Args:
+            timeout: 超时时间（秒）
+
+        Returns:
+            操作描述
+
+        Raises:
+            TimeoutError: 超时
+        """
+        if not self._description_ready.wait(timeout):
+            raise TimeoutError("等待模型输出操作描述超时")
+        return self.parser.description
+
+    def wait_done(self, timeout: Optional[float] = None) -> bool:
+        """等待流读取结束，返回是否已结束"""
+        return self._done.wait(timeout)
+
+    def metrics(self) -> Dict[str, Optional[float]]:
+        """首字延迟、动作延迟和总耗时（毫秒）"""
+        def since_start(moment: Optional[float]) -> Optional[float]:
+            return round((moment - self.started_at) * 1000, 3) if moment is not None else None
+
+        return {
+            'ttft_ms': since_start(self.first_token_at),
+            'time_to_action_ms': since_start(self.action_ready_at),
+            'total_ms': since_start(self.finished_at)
+        }
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+工作脚本执行追踪 - 记录步骤、ADB命令、等待和模型调用的耗时
+
+导出 Chrome Trace 格式（chrome://tracing 或 Perfetto 可直接打开），
+并提供按名称聚合的延迟统计。
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class Span:
+    """追踪区间"""
+
+    __slots__ = ('name', 'category', 'start_ns', 'end_ns', 'thread_id', 'attributes')
+
+    def __init__(self, name: str, category: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.category = category
+        self.attributes = attributes
+        self.thread_id = threading.get_ident()
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns: Optional[int] = None
+
+    @property
+    def duration_ms(self) -> float:
+        """区间耗时（毫秒），未结束时按当前时间计算"""
+        end_ns = self.end_ns if self.end_ns is not None else time.perf_counter_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value: Any):
+        """设置区间属性"""
+        self.attributes[key] = value
+
+
+class Tracer:
+    """
+    轻量级追踪器
+
+    区间只在内存中追加记录，结束时一次性导出；禁用时 span() 不做任何记录。
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.spans: List[Span] = []
+        self._origin_ns = time.perf_counter_ns()
+        self._open_step: Optional[Span] = None
+
+    @contextmanager
+    def span(self, name: str, category: str = "default", **attributes):
+        """
+        记录一个区间
+
+        Args:
+            name: 区间名称
+            category: 分类，如 step、adb、wait、model
+            **attributes: 附加属性
+        """
+        if not self.enabled:
+            yield None
+            return
+
+        span = Span(name, category, attributes)
+        try:
+            yield span
+        except BaseException as e:
+            span.set_attribute('error', type(e).__name__)
+            raise
+        finally:
+            span.end_ns = time.perf_counter_ns()
+            self.spans.append(span)
+
+    def mark_step(self, name: str, **attributes):
+        """
+        开始一个隐式步骤区间，同时结束上一个
+
+        用于只调用 log_step() 的脚本：每个步骤持续到下一次 log_step() 或 finish_step()。
+        """
+        self.finish_step()
+        if self.enabled:
+            self._open_step = Span(name, "step", attributes)
+
+    def finish_step(self):
+        """结束当前隐式步骤区间"""
+        if self._open_step is not None:
+            self._open_step.end_ns = time.perf_counter_ns()
+            self.spans.append(self._open_step)
+            self._open_step = None
+
+    def summary(self, category: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+        """
+        按区间名称聚合延迟
+
+        Args:
+            category: 只统计指定分类，None 表示全部
+
+        Returns:
+            {名称: {count, total_ms, mean_ms, p50_ms, p95_ms, max_ms}}
+        """
+        durations: Dict[str, List[float]] = {}
+        for span in self.spans:
+            if category is None or span.category == category:
+                durations.setdefault(span.name, []).append(span.duration_ms)
+
+        result = {}
+        for name, values in durations.items():
+            values.sort()
+            count = len(values)
+            result[name] = {
+                'count': count,
+                'total_ms': round(sum(values), 3),
+                'mean_ms': round(sum(values) / count, 3),
+                'p50_ms': round(values[int(0.50 * (count - 1))], 3),
+                'p95_ms': round(values[int(0.95 * (count - 1))], 3),
+                'max_ms': round(values[-1], 3)
+            }
+        return result
+
+    def category_totals(self) -> Dict[str, float]:
+        """
+        按分类汇总自身耗时（毫秒）
+
+        同一线程内嵌套的区间（如步骤内的 adb 命令和等待）只把子区间之外的时间计入父区间的分类，
+        各分类之和不会超过实际耗时。
+        """
+        totals: Dict[str, float] = {}
+        for span, self_ns in self._self_durations():
+            totals[span.category] = totals.get(span.category, 0.0) + self_ns / 1e6
+        return {category: round(total, 3) for category, total in totals.items()}
+
+    def _self_durations(self) -> List[Tuple[Span, int]]:
+        """每个区间扣除直接子区间后的耗时（纳秒）"""
+        by_thread: Dict[int, List[Span]] = {}
+        for span in self.spans:
+            by_thread.setdefault(span.thread_id, []).append(span)
+
+        result = []
+        for spans in by_thread.values():
+            # 开始时间相同时外层区间（结束更晚）在前
+            spans.sort(key=lambda span: (span.start_ns, -span.end_ns))
+            self_ns = [span.end_ns - span.start_ns for span in spans]
+            stack: List[int] = []
+            for i, span in enumerate(spans):
+                while stack and spans[stack[-1]].end_ns <= span.start_ns:
+                    stack.pop()
+                if stack:
+                    parent = stack[-1]
+                    self_ns[parent] -= min(span.end_ns, spans[parent].end_ns) - span.start_ns
+                stack.append(i)
+            result.extend(zip(spans, self_ns))
+        return result
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """转换为 Chrome Trace 事件格式（完整事件 ph=X，时间单位微秒）"""
+        pid = os.getpid()
+        events = []
+        for span in self.spans:
+            events.append({
+                'name': span.name,
+                'cat': span.category,
+                'ph': 'X',
+                'ts': (span.start_ns - self._origin_ns) / 1000,
+                'dur': (span.end_ns - span.start_ns) / 1000,
+                'pid': pid,
+                'tid': span.thread_id,
+                'args': {key: str(value) for key, value in span.attributes.items()}
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export_chrome_trace(self, filepath: str) -> str:
+        """
+        导出 Chrome Trace JSON 文件
+
+        Args:
+            filepath: 输出文件路径
+
+        Returns:
+            文件路径
+        """
+        self.finish_step()
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False)
+        return filepath
+
+
+# 未绑定追踪器时使用的空追踪器
+NULL_TRACER = Tracer(enabled=False)
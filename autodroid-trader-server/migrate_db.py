@@ -14,6 +14,7 @@ from playhouse.migrate import *
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from core.database.models import db, get_db_path
+from core.database.schema import SCHEMA_VERSION, get_schema_version, migrate
 
 def migrate_database():
     """执行数据库迁移"""
@@ -231,6 +232,31 @@ def recreate_deviceapk_table():
     finally:
         conn.close()
 
+def migrate_schema():
+    """按结构版本升级数据库（版本2起包含热点查询的二级索引），服务启动时也会自动执行"""
+    print("升级数据库结构版本...")
+    
+    try:
+        current = get_schema_version(db)
+        print(f"当前版本: {current}，最新版本: {SCHEMA_VERSION}")
+        migrate(db)
+        
+        indexes = db.execute_sql(
+            "SELECT tbl_name, name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL ORDER BY tbl_name, name"
+        ).fetchall()
+        print("当前索引:")
+        for table, name in indexes:
+            print(f"  {table}.{name}")
+        
+        print("数据库结构升级完成！")
+        return True
+        
+    except Exception as e:
+        print(f"结构升级失败: {str(e)}")
+        return False
+    finally:
+        db.close()
+
 if __name__ == "__main__":
     import argparse
     
@@ -238,6 +264,7 @@ if __name__ == "__main__":
     parser.add_argument("--migrate", action="store_true", help="执行基本迁移（添加字段）")
     parser.add_argument("--recreate-device", action="store_true", help="重建Device表以完成主键迁移")
     parser.add_argument("--recreate-deviceapk", action="store_true", help="重建DeviceApk表以完成外键迁移")
+    parser.add_argument("--schema", action="store_true", help="按结构版本升级（创建二级索引等）")
     parser.add_argument("--all", action="store_true", help="执行完整迁移流程")
     
     args = parser.parse_args()
@@ -249,7 +276,11 @@ if __name__ == "__main__":
             if recreate_device_table():
                 print("\nDevice表重建完成，现在重建DeviceApk表...")
                 if recreate_deviceapk_table():
-                    print("\n所有迁移完成！")
+                    print("\nDeviceApk表重建完成，现在升级结构版本...")
+                    if migrate_schema():
+                        print("\n所有迁移完成！")
+                    else:
+                        print("\n结构版本升级失败")
                 else:
                     print("\nDeviceApk表重建失败")
             else:
@@ -262,10 +293,13 @@ if __name__ == "__main__":
         recreate_device_table()
     elif args.recreate_deviceapk:
         recreate_deviceapk_table()
+    elif args.schema:
+        migrate_schema()
     else:
         print("请指定要执行的操作。使用 --help 查看帮助。")
         print("示例：")
         print("  python migrate_db.py --migrate          # 执行基本迁移")
         print("  python migrate_db.py --recreate-device  # 重建Device表")
         print("  python migrate_db.py --recreate-deviceapk  # 重建DeviceApk表")
+        print("  python migrate_db.py --schema           # 升级结构版本（创建索引）")
         print("  python migrate_db.py --all              # 执行完整迁移流程")
\ No newline at end of file
@@ -0,0 +1,116 @@
+"""
+测试数据库连接配置和请求级连接作用域
+"""
+import threading
+
+from peewee import CharField, IntegerField, Model
+
+from core.database.models import (
+    DEFAULT_DATABASE_CONFIG, ConnectionScope, build_pragmas, create_database
+)
+
+
+def make_database(tmp_path, **overrides):
+    config = {**DEFAULT_DATABASE_CONFIG, **overrides}
+    return create_database(str(tmp_path / "test.db"), config)
+
+
+class TestPragmas:
+    """测试连接打开时设置的 PRAGMA"""
+
+    def test_pragmas_from_config(self, tmp_path):
+        database = make_database(tmp_path, cache_size_mb=8, mmap_size_mb=16)
+        database.connect()
+        try:
+            assert database.execute_sql("PRAGMA journal_mode").fetchone()[0] == "wal"
+            assert database.execute_sql("PRAGMA synchronous").fetchone()[0] == 1
+            assert database.execute_sql("PRAGMA cache_size").fetchone()[0] == -8 * 1024
+            assert database.execute_sql("PRAGMA mmap_size").fetchone()[0] == 16 * 1024 * 1024
+            assert database.execute_sql("PRAGMA busy_timeout").fetchone()[0] == 5000
+        finally:
+            database.close()
+
+    def test_build_pragmas(self):
+        pragmas = build_pragmas({**DEFAULT_DATABASE_CONFIG, 'synchronous': 'full', 'mmap_size_mb': 0})
+        assert pragmas['synchronous'] == 'full'
+        assert pragmas['mmap_size'] == 0
+        assert pragmas['cache_size'] == -64 * 1024
+
+
+class TestConcurrentWrites:
+    def test_concurrent_writers_wait_instead_of_failing(self, tmp_path):
+        database = make_database(tmp_path)
+
+        class Heartbeat(Model):
+            serialno = CharField()
+            battery_level = IntegerField()
+
+        Heartbeat.bind(database)
+        with database.connection_context():
+            database.create_tables([Heartbeat])
+        errors = []
+
+        def device(index):
+            try:
+                with database.connection_context():
+                    for level in range(50):
+                        with database.atomic():
+                            Heartbeat.create(serialno=f"device-{index}", battery_level=level)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=device, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        with database.connection_context():
+            assert Heartbeat.select().count() == 400
+
+
+class TestConnectionScope:
+    """测试请求级连接作用域"""
+
+    def test_closes_after_outermost_scope(self, tmp_path):
+        database = make_database(tmp_path)
+        scope = ConnectionScope(database)
+
+        with scope:
+            assert not database.is_closed()
+            with scope:
+                pass
+            assert not database.is_closed()
+        assert database.is_closed()
+
+    def test_interleaved_requests_share_connection(self, tmp_path):
+        """同一线程上交错结束的请求：先进入的请求先结束时不关闭连接"""
+        database = make_database(tmp_path)
+        scope = ConnectionScope(database)
+
+        scope.__enter__()  # 请求 A
+        scope.__enter__()  # 请求 B
+        connection = database.connection()
+        scope.__exit__(None, None, None)  # A 结束
+        assert not database.is_closed()
+        assert database.connection() is connection
+        scope.__exit__(None, None, None)  # B 结束
+        assert database.is_closed()
+
+    def test_connections_are_per_thread(self, tmp_path):
+        database = make_database(tmp_path)
+        scope = ConnectionScope(database)
+        connections = []
+
+        def request():
+            with scope:
+                connections.append(database.connection())
+
+        with scope:
+            thread = threading.Thread(target=request)
+            thread.start()
+            thread.join()
+            assert not database.is_closed()
+            assert connections[0] is not database.connection()
+        assert database.is_closed()
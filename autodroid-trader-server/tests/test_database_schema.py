@@ -0,0 +1,69 @@
+"""
+测试数据库结构版本迁移
+"""
+from core.database.models import DEFAULT_DATABASE_CONFIG, create_database
+from core.database.schema import SCHEMA_VERSION, get_schema_version, migrate
+
+
+def make_database(tmp_path):
+    return create_database(str(tmp_path / "test.db"), DEFAULT_DATABASE_CONFIG)
+
+
+class TestSchemaMigration:
+    """测试启动时的结构迁移"""
+
+    def test_creates_tables_and_records_version(self, tmp_path):
+        database = make_database(tmp_path)
+
+        assert get_schema_version(database) == 0
+        assert migrate(database) == SCHEMA_VERSION
+        assert get_schema_version(database) == SCHEMA_VERSION
+        assert {"device", "tradeplan", "tradescript", "servers"} <= set(database.get_tables())
+
+    def test_migrated_database_is_not_touched_again(self, tmp_path):
+        database = make_database(tmp_path)
+        migrate(database)
+        statements = []
+        database.connection().set_trace_callback(statements.append)
+
+        assert migrate(database) == SCHEMA_VERSION
+        assert statements == ["PRAGMA user_version"]
+
+    def test_upgrades_database_created_before_versioning(self, tmp_path):
+        """版本号出现之前由 create_tables 创建的数据库：已有数据保留，只补记版本"""
+        database = make_database(tmp_path)
+        database.execute_sql(
+            "CREATE TABLE device (serialno VARCHAR(255) NOT NULL PRIMARY KEY, user_id VARCHAR(255), "
+            "battery_level INTEGER, is_online INTEGER NOT NULL)"
+        )
+        database.execute_sql("INSERT INTO device (serialno, is_online) VALUES ('emulator-5554', 1)")
+
+        migrate(database)
+
+        assert get_schema_version(database) == SCHEMA_VERSION
+        assert database.execute_sql("SELECT serialno FROM device").fetchall() == [("emulator-5554",)]
+        assert {"device_user_id", "device_is_online_battery_level"} <= {
+            index.name for index in database.get_indexes("device")
+        }
+
+    def test_version_two_adds_secondary_indexes(self, tmp_path):
+        """结构版本1的数据库升级后，热点查询使用索引"""
+        database = make_database(tmp_path)
+        migrate(database)
+        for name in ("tradeplan_status_created_at", "tradeplan_created_at", "apk_package_name",
+                     "device_is_online_battery_level", "device_user_id"):
+            database.execute_sql(f'DROP INDEX "{name}"')
+        database.pragma("user_version", 1)
+
+        migrate(database)
+
+        indexes = {index.name for index in database.get_indexes("tradeplan")}
+        assert {"tradeplan_status_created_at", "tradeplan_created_at"} <= indexes
+        plan = database.execute_sql(
+            "EXPLAIN QUERY PLAN SELECT id FROM tradeplan WHERE status = ?", ("PENDING",)
+        ).fetchall()
+        assert "tradeplan_status_created_at" in plan[0][-1]
+        assert "apk_package_name" in {index.name for index in database.get_indexes("apk")}
+        assert {"device_user_id", "device_is_online_battery_level"} <= {
+            index.name for index in database.get_indexes("device")
+        }
@@ -0,0 +1,125 @@
+"""
+测试报告和产物异步写入
+"""
+import gzip
+import io
+import json
+import logging
+import os
+import threading
+import time
+
+from PIL import Image
+
+from core.workscript.artifacts import ArtifactSink, get_artifact_sink
+from core.workscript.base import BaseWorkScript
+
+
+class TestArtifactSink:
+    """测试产物写入器"""
+
+    def test_files_written_in_background(self, tmp_path):
+        """文件在后台写入，flush 后可读"""
+        sink = ArtifactSink(str(tmp_path))
+        report = sink.write_text(str(tmp_path / "run" / "report.html"), "<html>报告</html>")
+        trace = sink.write_json(str(tmp_path / "run" / "trace.json"), {"traceEvents": []}, compress=True)
+        sink.flush()
+
+        with open(report, encoding='utf-8') as f:
+            assert f.read() == "<html>报告</html>"
+        assert trace.endswith(".json.gz")
+        with gzip.open(trace, 'rt', encoding='utf-8') as f:
+            assert json.load(f) == {"traceEvents": []}
+        sink.close()
+
+    def test_screenshot_compressed_to_webp(self, tmp_path):
+        """截图压缩为 WebP"""
+        buffer = io.BytesIO()
+        Image.new("RGB", (360, 640), (240, 240, 240)).save(buffer, format="PNG")
+        png_data = buffer.getvalue()
+
+        sink = ArtifactSink(str(tmp_path))
+        path = sink.write_screenshot(str(tmp_path / "step_1.png"), png_data)
+        sink.flush()
+
+        assert path.endswith(".webp")
+        with Image.open(path) as image:
+            assert image.size == (360, 640)
+        assert sink.stats['bytes_out'] < sink.stats['bytes_in']
+        sink.close()
+
+    def test_results_indexed_by_workplan_and_time(self, tmp_path):
+        """结果按工作计划ID和时间查询"""
+        sink = ArtifactSink(str(tmp_path))
+        before = time.time()
+        for i in range(5):
+            sink.record_result('workscript', 'wp_a' if i % 2 == 0 else 'wp_b', {'status': 'success', 'i': i})
+        sink.flush()
+
+        results = sink.query_results(workplan_id='wp_a')
+        assert [r['data']['i'] for r in results] == [4, 2, 0]
+        assert len(sink.query_results(since=before)) == 5
+        assert sink.query_results(until=before) == []
+        sink.close()
+
+    def test_barrier_waits_only_for_earlier_writes(self, tmp_path, monkeypatch):
+        """标记之后其他执行入队的慢写入不影响等待"""
+        sink = ArtifactSink(str(tmp_path))
+        release = threading.Event()
+        write_file = sink._write_file
+
+        def slow_write(job_type, path, *args):
+            if path.endswith("other.txt"):
+                release.wait(5)
+            write_file(job_type, path, *args)
+
+        monkeypatch.setattr(sink, "_write_file", slow_write)
+        mine = sink.write_text(str(tmp_path / "mine.txt"), "本次执行")
+        sink.record_result('workscript', 'wp_mine', {'status': 'success'})
+        done = sink.barrier()
+        sink.write_text(str(tmp_path / "other.txt"), "其他执行")
+
+        assert done.wait(2)
+        assert os.path.exists(mine)
+        assert sink.query_results(workplan_id='wp_mine')[0]['status'] == 'success'
+        assert not os.path.exists(tmp_path / "other.txt")
+        release.set()
+        sink.close()
+
+    def test_log_records_go_through_queue(self, tmp_path):
+        """日志经队列写入文件"""
+        sink = ArtifactSink(str(tmp_path))
+        handler = sink.log_handler("engine.log", console=False)
+        logger = logging.getLogger("test_artifact_sink")
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        try:
+            logger.info("脚本加载成功")
+        finally:
+            logger.removeHandler(handler)
+        sink.close()
+
+        with open(tmp_path / "engine.log", encoding='utf-8') as f:
+            assert "脚本加载成功" in f.read()
+
+
+class ReportScript(BaseWorkScript):
+    """保存报告的测试脚本"""
+
+    def run(self):
+        path = self.save_report('result.json', json.dumps({'ok': True}))
+        return {'status': 'success', 'report_path': path}
+
+
+class TestWorkScriptArtifacts:
+    """测试工作脚本的产物写入"""
+
+    def test_report_written_and_result_indexed(self, tmp_path, monkeypatch):
+        """返回结果时报告已写完，结果已进入索引"""
+        monkeypatch.setenv('AUTODROID_REPORTS_DIR', str(tmp_path))
+        result = ReportScript({'id': 'wp_report', 'data': {}}).execute()
+
+        assert os.path.exists(result['report_path'])
+        indexed = get_artifact_sink(str(tmp_path)).query_results(workplan_id='wp_report')
+        assert indexed[0]['status'] == 'success'
+        assert indexed[0]['data']['script_name'] == 'ReportScript'
@@ -0,0 +1,110 @@
+"""
+测试工作脚本的协作式取消和截止时间
+"""
+import threading
+import time
+
+import pytest
+
+from core.workscript.base import BaseWorkScript
+from core.workscript.cancellation import (
+    CancellationToken,
+    DeadlineExceeded,
+    WorkScriptCancelled,
+)
+
+
+class TestCancellationToken:
+    """测试取消令牌"""
+
+    def test_cancel_is_not_swallowed_by_except_exception(self):
+        """取消异常不能被 except Exception 吞掉"""
+        token = CancellationToken()
+        token.cancel("停止")
+
+        with pytest.raises(WorkScriptCancelled):
+            try:
+                token.check()
+            except Exception:
+                pytest.fail("取消异常被 except Exception 捕获")
+
+    def test_sleep_wakes_up_on_cancel(self):
+        """取消时可中断等待立即返回"""
+        token = CancellationToken()
+        threading.Timer(0.05, token.cancel, args=("用户停止",)).start()
+
+        start = time.monotonic()
+        with pytest.raises(WorkScriptCancelled) as exc_info:
+            token.sleep(5)
+
+        assert time.monotonic() - start < 1
+        assert exc_info.value.reason == "用户停止"
+
+    def test_overall_deadline(self):
+        """整体截止时间"""
+        token = CancellationToken(timeout=0.05)
+
+        with pytest.raises(DeadlineExceeded):
+            token.sleep(5)
+
+    def test_step_deadline_is_scoped(self):
+        """步骤截止时间只约束当前步骤"""
+        token = CancellationToken(timeout=10)
+
+        with pytest.raises(DeadlineExceeded) as exc_info:
+            with token.step("查找元素", timeout=0.05):
+                token.sleep(5)
+
+        assert exc_info.value.step == "查找元素"
+        assert token.remaining() > 5
+
+    def test_timeout_for_clamps_to_remaining(self):
+        """阻塞调用的超时时间被限制在剩余时间内"""
+        token = CancellationToken(timeout=1)
+
+        assert token.timeout_for(30) <= 1
+        assert CancellationToken().timeout_for(30) == 30
+        assert CancellationToken().timeout_for() is None
+
+
+class SlowScript(BaseWorkScript):
+    """执行两个步骤后卡住的测试脚本"""
+
+    def run(self):
+        with self.step("启动应用"):
+            pass
+        with self.step("输入凭据"):
+            pass
+        with self.step("等待登录", timeout=0.05):
+            self.sleep(5)
+        return {'status': 'success'}
+
+
+class TestWorkScriptCancellation:
+    """测试工作脚本的取消结果"""
+
+    def test_step_deadline_reports_partial_result(self, tmp_path, monkeypatch):
+        """步骤超时后返回部分结果"""
+        monkeypatch.setenv('AUTODROID_REPORTS_DIR', str(tmp_path))
+        script = SlowScript({'id': 'wp_cancel', 'data': {}})
+
+        result = script.execute()
+
+        assert result['status'] == 'failed'
+        assert result['cancelled'] is True
+        assert result['cancelled_step'] == '等待登录'
+        assert result['completed_steps'] == ['启动应用', '输入凭据']
+        assert result['execution_time'] < 1
+
+    def test_external_cancel(self, tmp_path, monkeypatch):
+        """外部取消请求"""
+        monkeypatch.setenv('AUTODROID_REPORTS_DIR', str(tmp_path))
+        token = CancellationToken()
+        script = SlowScript({'id': 'wp_cancel', 'data': {}}, cancel_token=token)
+        token.cancel("用户手动停止")
+
+        result = script.execute()
+
+        assert result['cancelled'] is True
+        assert result['message'] == "用户手动停止"
+        assert result['completed_steps'] == []
@@ -0,0 +1,167 @@
+"""
+测试工作脚本检查点和断点恢复
+"""
+import xml.etree.ElementTree as ET
+
+from core.workscript.base import BaseWorkScript
+from core.workscript.checkpoint import Checkpoint, screen_matches
+from core.workscript.engine import WorkScriptEngine
+
+
+class OrderFlowScript(BaseWorkScript):
+    """登录 -> 导航 -> 下单 的测试流程，current_screen 模拟设备当前界面"""
+
+    current_screen = None
+    fail_at = None
+    executed = []
+
+    def _go(self, screen):
+        def action():
+            if self.fail_at == screen:
+                raise RuntimeError(f"{screen} 暂时失败")
+            OrderFlowScript.executed.append(screen)
+            OrderFlowScript.current_screen = screen
+        return action
+
+    def _on(self, screen):
+        return lambda: OrderFlowScript.current_screen == screen
+
+    def run(self):
+        reached = self.run_checkpoints([
+            Checkpoint("login", self._go("home"), self._on("home")),
+            Checkpoint("navigate", self._go("trade"), self._on("trade")),
+            Checkpoint("place_order", self._go("confirm"), self._on("confirm")),
+        ])
+        return {'status': 'success', 'reached': reached}
+
+
+class TestCheckpointResume:
+    """测试检查点恢复"""
+
+    def setup_method(self):
+        OrderFlowScript.current_screen = None
+        OrderFlowScript.fail_at = None
+        OrderFlowScript.executed = []
+
+    def test_retry_resumes_from_nearest_valid_checkpoint(self, tmp_path, monkeypatch):
+        """重试时从最近的有效检查点继续"""
+        monkeypatch.setenv('AUTODROID_REPORTS_DIR', str(tmp_path))
+        workplan = {'id': 'wp_order', 'data': {}}
+
+        OrderFlowScript.fail_at = "confirm"
+        first = OrderFlowScript(workplan).execute()
+        assert first['status'] == 'error'
+
+        OrderFlowScript.fail_at = None
+        OrderFlowScript.executed = []
+        second = OrderFlowScript(workplan).execute()
+
+        assert second['status'] == 'success'
+        assert second['resumed_from'] == 'navigate'
+        assert OrderFlowScript.executed == ["confirm"]
+        assert second['reached'] == ["login", "navigate", "place_order"]
+
+    def test_falls_back_when_screen_changed(self, tmp_path, monkeypatch):
+        """界面已变化时回退到仍然有效的更早检查点"""
+        monkeypatch.setenv('AUTODROID_REPORTS_DIR', str(tmp_path))
+        workplan = {'id': 'wp_order', 'data': {}}
+
+        OrderFlowScript.fail_at = "confirm"
+        OrderFlowScript(workplan).execute()
+
+        # 应用退回了首页
+        OrderFlowScript.current_screen = "home"
+        OrderFlowScript.fail_at = None
+        OrderFlowScript.executed = []
+        result = OrderFlowScript(workplan).execute()
+
+        assert result['resumed_from'] == 'login'
+        assert OrderFlowScript.executed == ["trade", "confirm"]
+
+    def test_progress_cleared_after_success(self, tmp_path, monkeypatch):
+        """流程完成后清除进度，下次从头执行"""
+        monkeypatch.setenv('AUTODROID_REPORTS_DIR', str(tmp_path))
+        workplan = {'id': 'wp_order', 'data': {}}
+
+        OrderFlowScript(workplan).execute()
+        OrderFlowScript.executed = []
+        result = OrderFlowScript(workplan).execute()
+
+        assert result['resumed_from'] is None
+        assert OrderFlowScript.executed == ["home", "trade", "confirm"]
+
+
+class FakeDevice:
+    def __init__(self):
+        self.connected = True
+
+    def is_connected(self):
+        return self.connected
+
+    def disconnect(self):
+        self.connected = False
+
+
+class FlakyScript(BaseWorkScript):
+    """前两次执行失败，记录每次执行使用的设备"""
+
+    devices = []
+
+    def _initialize_device(self):
+        device = FakeDevice()
+        FlakyScript.devices.append(device)
+        return device
+
+    def run(self):
+        if len(FlakyScript.devices) < 3:
+            raise RuntimeError("设备暂时无响应")
+        return {'status': 'success'}
+
+
+class TestEngineRetry:
+    """测试引擎的失败重试"""
+
+    def test_failed_attempts_release_device_before_retry(self, tmp_path, monkeypatch):
+        monkeypatch.setenv('AUTODROID_REPORTS_DIR', str(tmp_path))
+        FlakyScript.devices = []
+        engine = WorkScriptEngine(str(tmp_path), str(tmp_path))
+        engine.loaded_scripts['flaky'] = FlakyScript
+
+        result = engine.execute_script(
+            {'id': 'wp_flaky', 'workscript': 'flaky', 'data': {'max_retries': 2}}, 'emulator-5554'
+        )
+
+        assert result['status'] == 'success'
+        assert result['attempts'] == 3
+        assert [device.connected for device in FlakyScript.devices] == [False, False, True]
+
+
+class TestScreenMatches:
+    """测试界面识别"""
+
+    hierarchy = ET.fromstring(
+        '<hierarchy>'
+        '<node text="欢迎登录" resource-id="com.example.app:id/login_container" class="android.widget.LinearLayout"/>'
+        '<node text="登录" content-desc="login" class="android.widget.Button"/>'
+        '</hierarchy>'
+    )
+
+    def test_any_group_matches(self):
+        """任一标识组匹配即可"""
+        assert screen_matches(self.hierarchy, [
+            {"xpath": {"xpath": "//android.widget.LinearLayout"}},
+            {"resource_id": {"id": "com.example.app:id/login_container"}},
+        ])
+
+    def test_exact_and_partial_text(self):
+        """精确和部分文本匹配"""
+        assert screen_matches(self.hierarchy, [{"text": {"text": "登录", "exact": True}}])
+        assert screen_matches(self.hierarchy, [{"text": {"text": "欢迎", "partial": True}}])
+        assert not screen_matches(self.hierarchy, [{"text": {"text": "欢迎", "exact": True}}])
+
+    def test_group_requires_all_identifiers(self):
+        """同一组内所有标识都要匹配"""
+        assert not screen_matches(self.hierarchy, [{
+            "text": {"text": "登录"},
+            "resource_id": {"id": "com.example.app:id/home_tab"},
+        }])
@@ -0,0 +1,145 @@
+"""
+测试决策缓存
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from core.workscript.decision_cache import DecisionCache, get_decision_cache
+
+
+@dataclass
+class FakeScreen:
+    """与 ScreenInfo 字段一致的屏幕信息"""
+    current_app: str
+    width: int = 1080
+    height: int = 1920
+    text_elements: List[Dict] = field(default_factory=list)
+    ui_elements: List[Dict] = field(default_factory=list)
+
+
+LOGIN_SCREEN = FakeScreen("券商", text_elements=[{"text": "登录"}, {"text": "09:30"}])
+TAP_LOGIN = {"action_type": "tap_at", "parameters": {"x": 500, "y": 800}, "description": "点击登录按钮",
+             "requires_confirmation": False}
+
+
+class TestDecisionCache:
+    """测试决策缓存"""
+
+    def test_hit_requires_confirmed_successes(self):
+        """成功次数达到门槛后才命中"""
+        cache = DecisionCache(min_successes=2)
+        key = cache.make_key("登录", LOGIN_SCREEN, [])
+
+        cache.put(key, TAP_LOGIN)
+        cache.record_outcome(key, True)
+        assert cache.get(key) is None
+
+        cache.put(key, TAP_LOGIN)
+        cache.record_outcome(key, True)
+        assert cache.get(key) == TAP_LOGIN
+        assert cache.stats["hits"] == 1
+        assert cache.stats["gated"] == 1
+
+    def test_failures_lower_confidence(self):
+        """执行失败降低置信度，低于门槛不再命中"""
+        cache = DecisionCache(min_successes=1, min_confidence=0.9)
+        key = cache.make_key("登录", LOGIN_SCREEN, [])
+        cache.put(key, TAP_LOGIN)
+        cache.record_outcome(key, True)
+        cache.record_outcome(key, False)
+
+        assert cache.get(key) is None
+
+    def test_different_decision_resets_statistics(self):
+        """模型给出不同决策时重新计数"""
+        cache = DecisionCache(min_successes=1)
+        key = cache.make_key("登录", LOGIN_SCREEN, [])
+        cache.put(key, TAP_LOGIN)
+        cache.record_outcome(key, True)
+        cache.put(key, {**TAP_LOGIN, "parameters": {"x": 500, "y": 900}})
+
+        assert cache.get(key) is None
+
+    def test_description_does_not_reset_statistics(self):
+        """描述不同（如流式输出尚未生成描述）时保留执行统计"""
+        cache = DecisionCache(min_successes=1)
+        key = cache.make_key("登录", LOGIN_SCREEN, [])
+        cache.put(key, {**TAP_LOGIN, "description": ""})
+        cache.record_outcome(key, True)
+        cache.put(key, TAP_LOGIN)
+
+        assert cache.get(key) == TAP_LOGIN
+
+    def test_key_uses_normalized_screen_and_recent_actions(self):
+        """界面数字变化不影响键，近期操作变化影响键"""
+        cache = DecisionCache(history_k=1)
+        later = FakeScreen("券商", text_elements=[{"text": "登录"}, {"text": "09:31"}])
+        history = [{"action": "tap_at", "description": "打开应用", "success": True}]
+
+        assert cache.make_key("登录", LOGIN_SCREEN, []) == cache.make_key("登录", later, [])
+        assert cache.make_key("登录", LOGIN_SCREEN, []) != cache.make_key("登录", LOGIN_SCREEN, history)
+        assert cache.make_key("登录", LOGIN_SCREEN, history) == cache.make_key(
+            "登录", LOGIN_SCREEN, [{"action": "home"}] + history
+        )
+
+    def test_key_uses_frame_hash(self):
+        """截图不同时即使界面结构相同也不复用决策"""
+        cache = DecisionCache()
+
+        assert cache.make_key("登录", LOGIN_SCREEN, [], 0x1234) == cache.make_key("登录", LOGIN_SCREEN, [], 0x1234)
+        assert cache.make_key("登录", LOGIN_SCREEN, [], 0x1234) != cache.make_key("登录", LOGIN_SCREEN, [], 0x5678)
+
+    def test_screen_without_structure_is_not_cacheable(self):
+        """没有界面结构的屏幕信息无法区分界面，不生成缓存键"""
+        cache = DecisionCache()
+
+        assert cache.make_key("登录", FakeScreen("Unknown"), [], 0x1234) is None
+        assert cache.stats["skipped"] == 1
+
+    def test_lru_and_ttl_eviction(self):
+        """超出容量淘汰最久未使用的条目，过期条目不命中"""
+        cache = DecisionCache(max_entries=2, min_successes=0, min_confidence=0)
+        for key in ("a", "b", "c"):
+            cache.put(key, TAP_LOGIN)
+        assert cache.get("a") is None
+        assert cache.stats["evictions"] == 1
+
+        expiring = DecisionCache(ttl=0.01, min_successes=0, min_confidence=0)
+        expiring.put("a", TAP_LOGIN)
+        time.sleep(0.02)
+        assert expiring.get("a") is None
+        assert expiring.stats["expired"] == 1
+
+    def test_persisted_across_restarts(self, tmp_path):
+        """持久化后重新加载仍然命中"""
+        path = str(tmp_path / "decision_cache.json")
+        cache = DecisionCache(path, min_successes=1)
+        key = cache.make_key("登录", LOGIN_SCREEN, [])
+        cache.put(key, TAP_LOGIN)
+        cache.record_outcome(key, True)
+        cache.save()
+
+        restarted = DecisionCache(path, min_successes=1)
+        assert restarted.get(key) == TAP_LOGIN
+
+    def test_shared_cache_keeps_entries_of_all_devices(self, tmp_path):
+        """同一文件的缓存由各设备共享，并发保存不会互相覆盖，也不残留临时文件"""
+        path = str(tmp_path / "decision_cache.json")
+        caches = [get_decision_cache(path, min_successes=0) for _ in range(4)]
+        assert all(cache is caches[0] for cache in caches)
+
+        def record(device):
+            caches[device].put(f"device-{device}", TAP_LOGIN)
+            caches[device].save()
+
+        threads = [threading.Thread(target=record, args=(device,)) for device in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert DecisionCache(path).stats["size"] == 4
+        assert os.listdir(tmp_path) == ["decision_cache.json"]
@@ -0,0 +1,343 @@
+"""
+测试任务执行器：模拟设备 + 模拟模型驱动完整的AI决策循环
+"""
+import io
+import os
+import threading
+import xml.etree.ElementTree as ET
+
+from PIL import Image
+
+import core.engine
+from core.engine import AgentConfig, AIDecisionEngine, EnhancedWorkScriptEngine, ModelConfig, TaskExecutor
+from core.enhanced_workscript import EnhancedBaseWorkScript, ScreenInfo
+from core.workscript.decision_cache import DecisionCache
+from core.workscript.recovery import Backoff, RecoveryManager, RecoveryPolicy
+
+
+def png(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (90, 160), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class FakeADBDevice:
+    """每次截屏返回下一种颜色的画面"""
+
+    def __init__(self):
+        self.captures = 0
+        self.restarted = []
+
+    def capture_screenshot(self):
+        self.captures += 1
+        return png((self.captures * 40 % 256, 0, 0))
+
+    def restart_app(self, package):
+        self.restarted.append(package)
+        return True
+
+
+class FakeDevice:
+    def __init__(self, screens=None):
+        self.adb_device = FakeADBDevice()
+        self.cancel_token = None
+        self.tracer = None
+        self.disconnected = False
+        self.screens = screens or {}
+        self.screen = None
+
+    def dump_ui_hierarchy(self):
+        return ET.fromstring(self.screens[self.screen]) if self.screen else None
+
+    def is_connected(self):
+        return not self.disconnected
+
+    def disconnect(self):
+        self.disconnected = True
+
+
+class FakeModelClient:
+    """按顺序返回预设的模型输出，并记录收到的请求"""
+
+    def __init__(self, outputs):
+        self.outputs = list(outputs)
+        self.payloads = []
+
+    def complete(self, payload, timeout):
+        self.payloads.append(payload)
+        output = self.outputs.pop(0)
+        if isinstance(output, Exception):
+            raise output
+        return {"choices": [{"message": {"content": output}}]}
+
+
+class TaskScript(EnhancedBaseWorkScript):
+    def run(self, **kwargs):
+        raise AssertionError("启用AI决策时不应直接调用 run")
+
+
+def hierarchy(package, *nodes):
+    """uiautomator dump 格式的UI层级，nodes 为 (resource-id, text)"""
+    children = "".join(
+        f'<node resource-id="{resource_id}" text="{text}" class="android.widget.TextView" package="{package}" '
+        f'content-desc="" bounds="[0,{i * 100}][1080,{i * 100 + 80}]" />'
+        for i, (resource_id, text) in enumerate(nodes)
+    )
+    return (f'<hierarchy rotation="0"><node resource-id="" text="" class="android.widget.FrameLayout" '
+            f'package="{package}" content-desc="" bounds="[0,0][1080,2400]">{children}</node></hierarchy>')
+
+
+SCREENS = {
+    "login": hierarchy("com.tdx.androidCCZQ", ("com.tdx:id/account", "资金账号"), ("com.tdx:id/login", "登录")),
+    "home": hierarchy("com.tdx.androidCCZQ", ("com.tdx:id/position", "持仓"), ("com.tdx:id/quote", "上证 3050.12")),
+}
+
+
+class TickingADBDevice(FakeADBDevice):
+    """每次截屏的像素都不同（时钟、行情刷新），界面结构不变"""
+
+    def capture_screenshot(self):
+        self.captures += 1
+        buffer = io.BytesIO()
+        Image.frombytes("L", (90, 160), os.urandom(90 * 160)).save(buffer, format="PNG")
+        return buffer.getvalue()
+
+
+class LoginScript(TaskScript):
+    """点击后设备切换到主页"""
+
+    def execute_action(self, action):
+        self.device.screen = "home"
+        return super().execute_action(action)
+
+
+def make_executor(outputs, workplan_data=None, **config):
+    executor = TaskExecutor(AgentConfig(enable_ai=True, verbose=False, max_steps=5, **config))
+    executor.ai_engine = AIDecisionEngine(decision_cache=executor.decision_cache)
+    executor.ai_engine.model_client = FakeModelClient(outputs)
+    script = TaskScript({"id": "wp_executor", "data": {"trace": False, **(workplan_data or {})}})
+    script.device = FakeDevice()
+    return executor, script
+
+
+class TestTaskExecutor:
+    """测试任务执行器的AI决策循环"""
+
+    def test_model_decisions_drive_device_until_finish(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("AUTODROID_REPORTS_DIR", str(tmp_path))
+        executor, script = make_executor([
+            'ACTION: tap_at\nPARAMETERS: {"x": 500, "y": 800}\nDESCRIPTION: 点击登录\n',
+            'ACTION: input_text\nPARAMETERS: {"text": "user"}\nDESCRIPTION: 输入用户名\n',
+            'ACTION: finish\nPARAMETERS: {"message": "登录完成"}\n',
+        ])
+
+        result = executor.execute_task("登录券商账户", script)
+
+        assert result.success
+        assert result.message == "登录完成"
+        assert [action["action"] for action in result.actions] == ["tap_at", "input_text", "finish"]
+        assert [entry["action"] for entry in script.action_log] == ["tap_at", "input_text"]
+        assert script.device.adb_device.captures == 3
+        payloads = executor.ai_engine.model_client.payloads
+        assert len(payloads) == 3
+        assert "步骤1: tap_at" in payloads[1]["messages"][0]["content"]
+
+    def test_invalid_model_output_fails_step(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("AUTODROID_REPORTS_DIR", str(tmp_path))
+        executor, script = make_executor(["我不知道该做什么"])
+        executor.error_recovery = RecoveryManager(policies={"execution_error": RecoveryPolicy(max_attempts=0)})
+
+        result = executor.execute_task("登录券商账户", script)
+
+        assert not result.success
+        assert "ACTION/PARAMETERS" in result.error
+
+    def test_recovery_relaunches_target_app(self, tmp_path, monkeypatch):
+        """恢复上下文带有工作计划中的目标应用包名"""
+        monkeypatch.setenv("AUTODROID_REPORTS_DIR", str(tmp_path))
+        executor, script = make_executor(
+            [RuntimeError("应用无响应"), 'ACTION: finish\nPARAMETERS: {"message": "完成"}\n'],
+            workplan_data={"app_package": "com.tdx.androidCCZQ"}
+        )
+        executor.error_recovery = RecoveryManager(policies={
+            "app_not_responding": RecoveryPolicy(("relaunch_app",), Backoff(base=0.001, max_delay=0.01))
+        })
+
+        result = executor.execute_task("查看持仓", script)
+
+        assert result.success
+        assert script.device.adb_device.restarted == ["com.tdx.androidCCZQ"]
+
+    def test_screen_info_read_from_hierarchy(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("AUTODROID_REPORTS_DIR", str(tmp_path))
+        executor, script = make_executor(['ACTION: finish\nPARAMETERS: {"message": "完成"}\n'])
+        script.device = FakeDevice(SCREENS)
+        script.device.screen = "home"
+        executor.execute_task("查看持仓", script)
+
+        screen = script.screen_info
+        assert (screen.current_app, screen.width, screen.height) == ("com.tdx.androidCCZQ", 1080, 2400)
+        assert [element["text"] for element in screen.text_elements] == ["持仓", "上证 3050.12"]
+        assert [element["resource_id"] for element in screen.ui_elements] == ["com.tdx:id/position", "com.tdx:id/quote"]
+        assert "上证 3050.12" in executor.ai_engine.model_client.payloads[0]["messages"][0]["content"]
+
+    def test_decision_cache_hits_on_same_screens_in_next_run(self, tmp_path, monkeypatch):
+        """第二次在相同界面上执行同一任务时，每一步都命中缓存，不再请求模型"""
+        monkeypatch.setenv("AUTODROID_REPORTS_DIR", str(tmp_path))
+        executor, _ = make_executor([
+            'ACTION: tap_at\nPARAMETERS: {"x": 500, "y": 800}\nDESCRIPTION: 点击登录\n',
+            'ACTION: finish\nPARAMETERS: {"message": "登录完成"}\n',
+        ], decision_cache_path=str(tmp_path / "cache.json"), decision_cache_min_successes=1)
+
+        results = []
+        for _ in range(2):
+            script = LoginScript({"id": "wp_executor", "data": {"trace": False}})
+            script.device = FakeDevice(SCREENS)
+            script.device.adb_device = TickingADBDevice()
+            script.device.screen = "login"
+            results.append(executor.execute_task("登录券商账户", script))
+
+        assert [result.success for result in results] == [True, True]
+        assert [action["action"] for action in results[1].actions] == ["tap_at", "finish"]
+        assert len(executor.ai_engine.model_client.payloads) == 2
+        cache_stats = results[1].data["decision_cache"]
+        assert (cache_stats["hits"], cache_stats["skipped"]) == (2, 0)
+
+    def test_unstructured_screens_bypass_decision_cache(self, tmp_path, monkeypatch):
+        """获取不到UI层级时屏幕信息没有界面结构，决策不写入缓存，下次执行仍请求模型"""
+        monkeypatch.setenv("AUTODROID_REPORTS_DIR", str(tmp_path))
+        outputs = ['ACTION: finish\nPARAMETERS: {"message": "完成"}\n'] * 2
+        executor, script = make_executor(
+            outputs, decision_cache_path=str(tmp_path / "cache.json"), decision_cache_min_successes=0
+        )
+
+        executor.execute_task("查看持仓", script)
+        result = executor.execute_task("查看持仓", script)
+
+        assert len(executor.ai_engine.model_client.payloads) == 2
+        assert result.data["decision_cache"]["size"] == 0
+        assert result.data["decision_cache"]["skipped"] == 2
+
+
+class TestEnhancedWorkScriptEngine:
+    """测试引擎按设备调度任务"""
+
+    def test_registered_script_is_new_per_execution(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("AUTODROID_REPORTS_DIR", str(tmp_path))
+        engine = EnhancedWorkScriptEngine(str(tmp_path / "reports"), AgentConfig(verbose=False))
+        scripts = []
+
+        class RecordingScript(TaskScript):
+            def run(self, **kwargs):
+                scripts.append(self)
+                return {"success": True, "message": "完成"}
+
+        engine.script_registry.register("recording", lambda: RecordingScript({"id": "wp_engine"}))
+        engine.execute_intelligent_task("任务一", "recording")
+        engine.execute_intelligent_task("任务二", "recording", device_id="emulator-5556")
+
+        assert len(scripts) == 2 and scripts[0] is not scripts[1]
+
+    def test_reconfigure_keeps_device_serialized(self, tmp_path, monkeypatch):
+        """任务执行期间更新配置，同一设备上的下一个任务仍等待前一个任务结束"""
+        monkeypatch.setenv("AUTODROID_REPORTS_DIR", str(tmp_path))
+        engine = EnhancedWorkScriptEngine(str(tmp_path / "reports"), AgentConfig(verbose=False))
+        started, release, events = threading.Event(), threading.Event(), []
+
+        class BlockingScript(TaskScript):
+            def run(self, task_description, **kwargs):
+                events.append(f"开始 {task_description}")
+                if task_description == "任务一":
+                    started.set()
+                    release.wait(5)
+                events.append(f"结束 {task_description}")
+                return {"success": True, "message": "完成"}
+
+        engine.script_registry.register("blocking", lambda: BlockingScript({"id": "wp_engine"}))
+        first = threading.Thread(target=engine.execute_intelligent_task, args=("任务一", "blocking"))
+        first.start()
+        started.wait(5)
+        engine.set_ai_config(ModelConfig(), AgentConfig(verbose=False))
+        second = threading.Thread(target=engine.execute_intelligent_task, args=("任务二", "blocking"))
+        second.start()
+        second.join(0.2)
+        release.set()
+        first.join()
+        second.join()
+
+        assert events == ["开始 任务一", "结束 任务一", "开始 任务二", "结束 任务二"]
+
+
+TRADE_SCREEN = ScreenInfo(1080, 1920, "com.tdx.androidCCZQ", text_elements=[{"text": "买入"}, {"text": "卖出"}])
+
+
+class TestConfirmation:
+    """测试模型决策的敏感操作标记"""
+
+    def test_shared_client_decision_flags_sensitive_action(self):
+        cache = DecisionCache()
+        engine = AIDecisionEngine(decision_cache=cache)
+        engine.model_client = FakeModelClient([
+            'ACTION: tap_at\nPARAMETERS: {"x": 800, "y": 1700}\nDESCRIPTION: 点击确认买入\n',
+            'ACTION: tap_at\nPARAMETERS: {"x": 200, "y": 1700}\nDESCRIPTION: 打开行情\n',
+        ])
+
+        sensitive = engine.decide_next_action("买入 600000", TRADE_SCREEN, [])
+        benign = engine.decide_next_action("买入 600000", TRADE_SCREEN, [{"action": "tap_at"}])
+
+        assert sensitive.requires_confirmation
+        assert not benign.requires_confirmation
+        assert cache.stats["size"] == 1
+
+    def test_confirmation_can_be_disabled(self):
+        engine = AIDecisionEngine(confirmation_required=False)
+        engine.model_client = FakeModelClient(['ACTION: tap_at\nPARAMETERS: {"x": 1, "y": 2}\nDESCRIPTION: 确认卖出\n'])
+
+        assert not engine.decide_next_action("卖出", TRADE_SCREEN, []).requires_confirmation
+
+    def test_stream_holds_action_until_description_when_confirmation_required(self, monkeypatch):
+        """需要确认时，流式动作等描述解析完才下发，敏感标记在执行前确定"""
+        described = threading.Event()
+
+        def stream(*args, **kwargs):
+            yield 'ACTION: tap_at\nPARAMETERS: {"x": 800, "y": 1700}\n'
+            described.wait(5)
+            yield 'DESCRIPTION: 点击确认卖出\n'
+            yield '这里是较长的推理说明'
+
+        monkeypatch.setattr(core.engine, "stream_chat_completion", stream)
+        cache = DecisionCache()
+        engine = AIDecisionEngine(ModelConfig(stream=True, request_timeout=5), decision_cache=cache)
+
+        result = {}
+        worker = threading.Thread(target=lambda: result.update(action=engine.decide_next_action("卖出 600000", TRADE_SCREEN, [])))
+        worker.start()
+        worker.join(0.2)
+        assert "action" not in result
+
+        described.set()
+        worker.join(5)
+        engine.finish_pending_stream()
+        assert result["action"].requires_confirmation
+        assert result["action"].description == "点击确认卖出"
+        assert cache.stats["size"] == 0
+
+    def test_stream_dispatches_before_description_without_confirmation(self, monkeypatch):
+        """不需要确认时动作先于描述下发，描述在流读完后补全"""
+        described = threading.Event()
+
+        def stream(*args, **kwargs):
+            yield 'ACTION: tap_at\nPARAMETERS: {"x": 800, "y": 1700}\n'
+            described.wait(5)
+            yield 'DESCRIPTION: 点击确认卖出\n'
+
+        monkeypatch.setattr(core.engine, "stream_chat_completion", stream)
+        engine = AIDecisionEngine(ModelConfig(stream=True, request_timeout=5), confirmation_required=False)
+
+        action = engine.decide_next_action("卖出 600000", TRADE_SCREEN, [])
+        assert action.description == ""
+
+        described.set()
+        engine.finish_pending_stream()
+        assert action.description == "点击确认卖出"
+        assert not action.requires_confirmation
@@ -0,0 +1,139 @@
+"""
+测试声明式流程编译和通用流程脚本
+"""
+import xml.etree.ElementTree as ET
+
+from core.workscript.engine import WorkScriptEngine
+from core.workscript.flow import FlowWorkScript, UIIndex, compile_flow
+from workscripts.ui_definitions import UIDefinitionManager
+
+
+LOGIN_FORM = ET.fromstring(
+    '<hierarchy>'
+    '<node text="邮箱地址" resource-id="com.example.app:id/email_input" bounds="[0,0][400,60]"/>'
+    '<node text="密码" resource-id="com.example.app:id/password_input" bounds="[0,100][400,160]"/>'
+    '<node text="登录" resource-id="com.example.app:id/login_btn" bounds="[0,200][200,280]"/>'
+    '</hierarchy>'
+)
+HOME = ET.fromstring('<hierarchy><node text="登录成功，欢迎回来" bounds="[0,0][100,100]"/></hierarchy>')
+
+# 登录表单的输入不单独校验，由登录按钮的 validation_text 作为整个批次的等待条件
+LOGIN_SEQUENCE = [
+    {"element": "email_field", "validation_text": None},
+    {"element": "password_field", "validation_text": None},
+    "login_button",
+]
+
+
+def login_screen(tmp_path):
+    manager = UIDefinitionManager(str(tmp_path / "ui_definitions"))
+    manager.screens["login_screen"] = manager.create_login_screen_example()
+    return manager
+
+
+class RecordingADB:
+    """记录操作的ADB设备"""
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.calls = []
+
+    def tap(self, x, y, delay=1.0):
+        self.calls.append(("tap", x, y, delay))
+        if (x, y) == (100, 240):
+            self.controller.screen = HOME
+
+    def type_text(self, text, delay=1.0):
+        self.calls.append(("text", text, delay))
+
+
+class RecordingDevice:
+    """按当前界面返回UI层级的设备控制器"""
+
+    def __init__(self):
+        self.screen = LOGIN_FORM
+        self.dumps = 0
+        self.adb_device = RecordingADB(self)
+
+    def dump_ui_hierarchy(self):
+        self.dumps += 1
+        return self.screen
+
+
+class TestCompileFlow:
+    """测试流程编译"""
+
+    def test_deterministic_inputs_are_batched(self, tmp_path):
+        """连续输入合并到登录点击所在批次，以 validation_text 为等待条件"""
+        screen = login_screen(tmp_path).get_screen_definition("login_screen")
+        plan = compile_flow(screen, LOGIN_SEQUENCE)
+
+        assert len(plan.batches) == 1
+        assert [action.element for action in plan.batches[0].actions] == [
+            "email_field", "password_field", "login_button"
+        ]
+        assert plan.batches[0].wait_text == "登录成功"
+        assert plan.batches[0].settle == 0.0
+
+    def test_validation_text_ends_batch(self, tmp_path):
+        """默认定义中每个带 validation_text 的操作单独成批"""
+        screen = login_screen(tmp_path).get_screen_definition("login_screen")
+        plan = compile_flow(screen)
+
+        assert [batch.wait_text for batch in plan.batches] == ["邮箱格式正确", "密码已输入", "登录成功"]
+
+    def test_locator_priority(self, tmp_path):
+        """resource-id 优先，坐标最后兜底"""
+        index = UIIndex(LOGIN_FORM)
+        screen = login_screen(tmp_path).get_screen_definition("login_screen")
+        locators = compile_flow(screen).batches[2].actions[0].locators
+
+        assert [locator.kind for locator in locators] == ["resource_id", "text", "coordinates"]
+        assert index.locate(locators) == (100, 240)
+        assert UIIndex(None).locate(locators) == (600, 300)
+        assert UIIndex(None).locate(locators, allow_coordinates=False) is None
+
+
+class TestFlowWorkScript:
+    """测试通用流程脚本"""
+
+    def test_engine_resolves_builtin_flow(self, tmp_path):
+        """flow 是引擎内置的脚本类型"""
+        engine = WorkScriptEngine(str(tmp_path), str(tmp_path / "reports"))
+
+        assert engine.load_script("flow") is FlowWorkScript
+        assert "flow" in engine.list_available_scripts()
+
+    def test_batch_uses_one_dump_and_waits_on_text(self, tmp_path, monkeypatch):
+        """批次只获取一次UI层级，操作之间不等待"""
+        monkeypatch.setenv('AUTODROID_REPORTS_DIR', str(tmp_path))
+        workplan = login_screen(tmp_path).create_flow_workplan(
+            "login_screen", LOGIN_SEQUENCE, poll_interval=0.01
+        )
+        script = FlowWorkScript(workplan)
+        script.device = RecordingDevice()
+
+        result = script.execute()
+
+        assert result['status'] == 'success'
+        assert result['data']['hierarchy_dumps'] == 2
+        assert script.device.adb_device.calls == [
+            ("tap", 200, 30, 0), ("text", "user@example.com", 0),
+            ("tap", 200, 130, 0), ("text", "password123", 0),
+            ("tap", 100, 240, 0),
+        ]
+
+    def test_wait_timeout_fails_step(self, tmp_path, monkeypatch):
+        """等待文本超时则步骤失败"""
+        monkeypatch.setenv('AUTODROID_REPORTS_DIR', str(tmp_path))
+        workplan = login_screen(tmp_path).create_flow_workplan(
+            "login_screen", ["email_field"], wait_timeout=0.05, poll_interval=0.01
+        )
+        script = FlowWorkScript(workplan)
+        script.device = RecordingDevice()
+
+        result = script.execute()
+
+        assert result['status'] == 'error'
+        assert result['error_type'] == 'FlowStepFailed'
+        assert script.completed_steps == []
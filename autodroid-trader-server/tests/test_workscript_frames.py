@@ -0,0 +1,101 @@
+"""
+测试截图环形缓冲区
+"""
+import io
+import os
+import threading
+
+from PIL import Image, ImageDraw
+
+from core.workscript.artifacts import ArtifactSink
+from core.workscript.frames import FrameBuffer, hash_distance, perceptual_hash
+
+
+def make_png(text="登录", noise=0, width=108, height=192):
+    """生成测试截图：登录页深色按钮在上半部分，行情页在下半部分，可叠加轻微噪声"""
+    image = Image.new("RGB", (width, height), (240, 240, 240))
+    draw = ImageDraw.Draw(image)
+    top = 0 if text == "登录" else height // 2
+    for left in range(12, width, 24):
+        draw.rectangle([left, top, left + 11, top + height // 2], fill=(30, 30, 30))
+    if noise:
+        image.putpixel((width - 1, height - 1), (240 - noise, 240, 240))
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class TestPerceptualHash:
+    """测试感知哈希"""
+
+    def test_ignores_small_pixel_noise(self):
+        assert perceptual_hash(make_png()) == perceptual_hash(make_png(noise=3))
+
+    def test_distinguishes_different_screens(self):
+        assert hash_distance(perceptual_hash(make_png("登录")), perceptual_hash(make_png("行情"))) > 8
+
+
+class TestFrameBuffer:
+    """测试截图环形缓冲区"""
+
+    def test_consecutive_identical_frames_deduplicated(self):
+        frames = FrameBuffer(capacity=4)
+        first, is_new = frames.add(make_png())
+        again, is_new_again = frames.add(make_png(noise=3))
+
+        assert is_new and not is_new_again
+        assert again is first
+        assert first.repeats == 2
+        assert len(frames.frames()) == 1
+        assert frames.stats['deduplicated'] == 1
+
+    def test_deduplicated_frame_keeps_newest_capture(self):
+        """感知哈希相同但像素不同时，缓冲区保存最新一次截图"""
+        frames = FrameBuffer()
+        first, _ = frames.add(make_png())
+        first.path = "step1_failed_000001.png"
+        newest = make_png(noise=3)
+        again, is_new = frames.add(newest)
+
+        assert not is_new and again is first
+        assert first.data == newest
+        assert first.path is None
+
+    def test_keeps_last_n_frames(self):
+        frames = FrameBuffer(capacity=2)
+        for text in ["登录", "行情", "登录"]:
+            frames.add(make_png(text))
+
+        assert [frame.seq for frame in frames.frames()] == [2, 3]
+        assert frames.stats['evicted'] == 1
+        assert frames.memory_bytes == sum(len(frame.data) for frame in frames.frames())
+
+    def test_consumers_share_latest_frame(self):
+        """多个使用方读取同一帧，实时预览等待新画面"""
+        frames = FrameBuffer()
+        frame, _ = frames.add(make_png("登录"))
+        assert frames.latest() is frames.latest() is frame
+        assert frames.wait_for_frame(after_seq=frame.seq, timeout=0.01) is None
+
+        received = []
+        viewer = threading.Thread(target=lambda: received.append(frames.wait_for_frame(frame.seq, timeout=5)))
+        viewer.start()
+        frames.add(make_png("行情"))
+        viewer.join()
+        assert received[0].seq == frame.seq + 1
+
+    def test_flush_writes_each_frame_once(self, tmp_path):
+        sink = ArtifactSink(str(tmp_path))
+        frames = FrameBuffer()
+        frames.add(make_png("登录"))
+        frames.add(make_png("行情"))
+        try:
+            paths = frames.flush(sink, str(tmp_path / "screenshots"), prefix="step3_failed")
+            assert frames.flush(sink, str(tmp_path / "screenshots")) == []
+            sink.flush()
+        finally:
+            sink.close()
+
+        assert len(paths) == 2
+        assert all(os.path.exists(path) and "step3_failed" in path for path in paths)
+        assert [frame.path for frame in frames.frames()] == paths
@@ -0,0 +1,74 @@
+"""
+测试对话历史的 token 预算压缩
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from core.workscript.history import ConversationHistory, estimate_tokens
+
+
+@dataclass
+class FakeScreen:
+    """与 ScreenInfo 字段一致的屏幕信息"""
+    current_app: str
+    width: int = 1080
+    height: int = 1920
+    screenshot_path: Optional[str] = None
+    text_elements: List[Dict] = field(default_factory=list)
+    ui_elements: List[Dict] = field(default_factory=list)
+
+
+def add_steps(history, count):
+    for i in range(count):
+        history.add(
+            "tap_at", {"x": 100 + i, "y": 200}, f"点击第{i + 1}个按钮",
+            FakeScreen("券商", screenshot_path=f"screenshot_{i}.png",
+                       text_elements=[{"text": "委托"}, {"text": "持仓"}])
+        )
+        history.record_outcome(i % 5 != 4)
+
+
+class TestConversationHistory:
+    """测试对话历史"""
+
+    def test_estimate_tokens(self):
+        """中文按字计数，其他字符按4个一组"""
+        assert estimate_tokens("委托买入") == 4
+        assert estimate_tokens("tap_at") == 2
+
+    def test_stays_within_budget(self):
+        """历史始终不超过 token 预算，较早的步骤合并为摘要"""
+        history = ConversationHistory(token_budget=300)
+        add_steps(history, 50)
+
+        assert history.token_count() <= 300
+        assert history.summary.startswith(f"步骤1-{history.summarized_steps} 摘要: tap_at×{history.summarized_steps}")
+        assert history.entries[-1].step == 50
+        assert history.compactions >= 1
+
+    def test_old_screenshots_keep_digest_only(self):
+        """只保留最近一步的截图，较早的步骤保留文字摘要"""
+        history = ConversationHistory(token_budget=10000)
+        add_steps(history, 3)
+
+        assert history.recent_screenshots() == ["screenshot_2.png"]
+        assert "券商 [委托 | 持仓]" in history.entries[0].render_compact()
+
+    def test_recent_steps_rendered_in_full(self):
+        """最近的步骤保留完整参数，较早的步骤为单行记录"""
+        history = ConversationHistory(token_budget=10000, keep_full=2)
+        add_steps(history, 4)
+        lines = history.render().splitlines()
+
+        assert lines[0] == "步骤1: tap_at - 点击第1个按钮 (成功) @ 券商 [委托 | 持仓]"
+        assert '"x": 102' in history.render()
+        assert '"x": 100' not in history.render()
+
+    def test_history_stable_between_compactions(self):
+        """两次压缩之间，除最近几步外的历史保持不变"""
+        history = ConversationHistory(token_budget=10000, keep_full=1)
+        add_steps(history, 3)
+        before = history.render().splitlines()[:2]
+        add_steps(history, 1)
+
+        assert history.render().splitlines()[:2] == before
@@ -0,0 +1,169 @@
+"""
+测试共享模型客户端的请求去重、并发限制、背压和超时撤回
+"""
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from core.workscript.model_client import ModelClient, ModelServerBusy
+
+
+class FakeModelServer:
+    """OpenAI 兼容的本地模型服务，记录请求数和最大并发"""
+
+    def __init__(self, delay=0.0, busy_responses=0, retry_after="0.05"):
+        self.delay = delay
+        self.busy_responses = busy_responses
+        self.retry_after = retry_after
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with server.lock:
+                    server.requests += 1
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                    busy = server.busy_responses > 0
+                    server.busy_responses -= busy
+                try:
+                    if busy:
+                        self.send_response(429)
+                        self.send_header('Retry-After', server.retry_after)
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    time.sleep(server.delay)
+                    content = f"ACTION: tap_at\nPARAMETERS: {{\"x\": {body['messages'][0]['content']}}}"
+                    data = json.dumps({"choices": [{"message": {"role": "assistant", "content": content}}]})
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(data.encode())))
+                    self.end_headers()
+                    self.wfile.write(data.encode())
+                finally:
+                    with server.lock:
+                        server.in_flight -= 1
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def payload(content, temperature=0.0):
+    return {"model": "autoglm-phone-9b", "temperature": temperature,
+            "messages": [{"role": "user", "content": str(content)}]}
+
+
+@pytest.fixture
+def make_client():
+    resources = []
+
+    def factory(server_kwargs=None, **client_kwargs):
+        server = FakeModelServer(**(server_kwargs or {}))
+        client = ModelClient(server.base_url, **client_kwargs)
+        resources.append((server, client))
+        return server, client
+
+    yield factory
+    for server, client in resources:
+        client.close()
+        server.close()
+
+
+class TestModelClient:
+    """测试共享模型客户端"""
+
+    def test_identical_deterministic_requests_coalesced(self, make_client):
+        """温度为 0 的相同请求与在途请求合并，只发送一次"""
+        server, client = make_client({'delay': 0.1})
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: client.complete(payload(1), timeout=5), range(8)))
+
+        assert all(result == results[0] for result in results)
+        assert server.requests == 1
+        assert client.stats['coalesced'] == 7
+
+    def test_sampled_requests_not_coalesced(self, make_client):
+        server, client = make_client({'delay': 0.05})
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(lambda _: client.complete(payload(1, temperature=0.7), timeout=5), range(4)))
+
+        assert server.requests == 4
+        assert client.stats['coalesced'] == 0
+
+    def test_concurrent_requests_respect_concurrency(self, make_client):
+        """多设备并发的不同请求各自发送，结果对应各自的请求，在途请求数不超过上限"""
+        server, client = make_client({'delay': 0.05}, max_concurrency=2)
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            results = list(pool.map(lambda i: client.complete(payload(i), timeout=5), range(6)))
+
+        assert [json.loads(r["choices"][0]["message"]["content"].split("PARAMETERS: ")[1])["x"]
+                for r in results] == list(range(6))
+        assert server.requests == 6
+        assert server.max_in_flight <= 2
+
+    def test_retries_after_server_busy(self, make_client):
+        """服务端队列已满时按 Retry-After 暂停后重试"""
+        server, client = make_client({'busy_responses': 2})
+        start = time.monotonic()
+        result = client.complete(payload(3), timeout=5)
+
+        assert result["choices"][0]["message"]["content"].startswith("ACTION: tap_at")
+        assert client.stats['throttled'] == 2
+        assert time.monotonic() - start >= 0.1
+
+    def test_gives_up_when_server_stays_busy(self, make_client):
+        server, client = make_client({'busy_responses': 10}, max_retries=1)
+        with pytest.raises(ModelServerBusy):
+            client.complete(payload(3), timeout=5)
+        assert server.requests == 2
+
+    def test_pending_queue_is_bounded(self, make_client):
+        """在途请求已满时请求在有界队列中等待"""
+        server, client = make_client({'delay': 0.05}, max_concurrency=1, max_pending=2)
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            list(pool.map(lambda i: client.complete(payload(i), timeout=5), range(6)))
+
+        assert client.stats['max_queue_depth'] <= 2
+        assert server.max_in_flight == 1
+
+    def test_async_callers(self, make_client):
+        server, client = make_client()
+
+        async def run():
+            return await asyncio.gather(*(client.acomplete(payload(i)) for i in range(3)))
+
+        assert len(asyncio.run(run())) == 3
+        assert server.requests == 3
+
+    def test_timed_out_request_is_withdrawn(self, make_client):
+        """调用方等待超时后撤回请求：排队中的请求不再发送"""
+        server, client = make_client({'delay': 0.3}, max_concurrency=1)
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            first = pool.submit(client.complete, payload(1), 5)
+            time.sleep(0.05)
+            with pytest.raises(FutureTimeoutError):
+                client.complete(payload(2), timeout=0.05)
+            first.result()
+        time.sleep(0.1)
+
+        assert server.requests == 1
+        assert client.stats['cancelled'] == 1
@@ -0,0 +1,164 @@
+"""
+测试观察流水线
+"""
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import pytest
+
+from core.workscript.cancellation import CancellationToken, WorkScriptCancelled
+from core.workscript.pipeline import ObservationPipeline, observation_signature, screen_signature
+
+
+@dataclass
+class FakeScreen:
+    """与 ScreenInfo 字段一致的屏幕信息"""
+    current_app: str
+    width: int = 1080
+    height: int = 1920
+    text_elements: List[Dict] = field(default_factory=list)
+    ui_elements: List[Dict] = field(default_factory=list)
+    frame_hash: Optional[int] = None
+
+
+def texts(*values):
+    return [{"text": value} for value in values]
+
+
+class ScreenSequence:
+    """按顺序返回屏幕，记录调用线程"""
+
+    def __init__(self, *screens):
+        self.screens = list(screens)
+        self.threads = []
+        self.times = []
+
+    def __call__(self):
+        self.threads.append(threading.current_thread().name)
+        self.times.append(time.monotonic())
+        return self.screens.pop(0) if len(self.screens) > 1 else self.screens[0]
+
+
+class TestScreenSignature:
+    """测试界面签名"""
+
+    def test_digits_are_normalized(self):
+        """价格和时间变化不改变签名"""
+        before = FakeScreen("股票", text_elements=texts("09:30", "最新价 12.34"))
+        after = FakeScreen("股票", text_elements=texts("09:31", "最新价 12.35"))
+
+        assert screen_signature(before) == screen_signature(after)
+
+    def test_structure_change_changes_signature(self):
+        """界面文本变化时签名变化"""
+        login = FakeScreen("股票", text_elements=texts("登录"))
+        home = FakeScreen("股票", text_elements=texts("首页"))
+
+        assert screen_signature(login) != screen_signature(home)
+
+    def test_observation_signature_uses_frame(self):
+        """截屏得到的屏幕信息没有界面结构，按截图哈希区分界面"""
+        login, home = FakeScreen("Unknown", frame_hash=0x0F0F), FakeScreen("Unknown", frame_hash=0xF0F0)
+
+        assert screen_signature(login) == screen_signature(home)
+        assert observation_signature(login) != observation_signature(home)
+
+
+class TestObservationPipeline:
+    """测试观察流水线"""
+
+    def test_stale_observation_discarded(self):
+        """界面变化时丢弃旧观察，稳定后使用最新的预处理结果"""
+        capture = ScreenSequence(
+            FakeScreen("股票", text_elements=texts("加载中")),
+            FakeScreen("股票", text_elements=texts("委托确认")),
+            FakeScreen("股票", text_elements=texts("委托确认")),
+        )
+        prepared = []
+        pipeline = ObservationPipeline(
+            capture,
+            preprocess=lambda screen: prepared.append(screen.text_elements[0]["text"]) or len(prepared),
+            settle_interval=0.01
+        )
+
+        observation = pipeline.next()
+        pipeline.close()
+
+        assert observation.screen.text_elements == texts("委托确认")
+        assert observation.prepared == 2
+        assert prepared == ["加载中", "委托确认"]
+        assert pipeline.stats["discarded"] == 1
+
+    def test_observation_runs_in_background(self):
+        """start() 后观察在后台线程进行，next() 不再同步截屏"""
+        capture = ScreenSequence(FakeScreen("股票"))
+        pipeline = ObservationPipeline(capture, settle_interval=0.01, settle_min_delay=0)
+
+        pipeline.start()
+        pipeline.next()
+        pipeline.close()
+
+        assert capture.threads
+        assert all(name.startswith("observe") for name in capture.threads)
+        assert pipeline.stats == {
+            "observations": 1, "captures": 2, "discarded": 0, "unchanged": 0, "no_change": 0, "unsettled": 0
+        }
+
+    def test_waits_for_screen_to_leave_pre_action_state(self):
+        """动作下发后先等待最短延迟，连续相同但仍是动作前界面的观察不算稳定"""
+        before, after = FakeScreen("Unknown", frame_hash=1), FakeScreen("Unknown", frame_hash=2)
+        capture = ScreenSequence(before, before, before, before, after, after)
+        pipeline = ObservationPipeline(capture, settle_interval=0.01, settle_min_delay=0.05)
+
+        assert pipeline.next().screen is before
+        started = time.monotonic()
+        pipeline.start()
+        observation = pipeline.next()
+        pipeline.close()
+
+        assert observation.screen is after
+        assert capture.times[2] - started >= 0.05
+        assert pipeline.stats["unchanged"] == 1
+        assert pipeline.stats["unsettled"] == 0
+
+    def test_unchanged_screen_returns_before_settle_timeout(self):
+        """动作没有改变界面时，连续几次仍是动作前的界面即返回，不等待到稳定超时"""
+        before = FakeScreen("Unknown", frame_hash=1)
+        capture = ScreenSequence(before)
+        pipeline = ObservationPipeline(capture, settle_interval=0.01, settle_timeout=2.0, settle_min_delay=0)
+
+        pipeline.next()
+        started = time.monotonic()
+        pipeline.start()
+        observation = pipeline.next()
+        pipeline.close()
+
+        assert observation.screen is before
+        assert time.monotonic() - started < 0.5
+        assert pipeline.stats["captures"] == 5
+        assert pipeline.stats["no_change"] == 1
+        assert pipeline.stats["unchanged"] == 1
+        assert pipeline.stats["unsettled"] == 0
+
+    def test_unsettled_screen_uses_latest(self):
+        """超过稳定等待时间后使用最新观察"""
+        capture = ScreenSequence(*[FakeScreen("股票", text_elements=texts(f"第{c}页")) for c in "一二三四五六七八九十"])
+        pipeline = ObservationPipeline(capture, settle_interval=0.01, settle_timeout=0.03)
+
+        observation = pipeline.next()
+        pipeline.close()
+
+        assert pipeline.stats["unsettled"] == 1
+        assert observation.screen.text_elements != texts("第一页")
+
+    def test_cancel_propagates_to_next(self):
+        """观察期间取消，next() 抛出取消异常"""
+        token = CancellationToken()
+        token.cancel("用户手动停止")
+        pipeline = ObservationPipeline(ScreenSequence(FakeScreen("股票")), cancel_token=token)
+
+        with pytest.raises(WorkScriptCancelled):
+            pipeline.next()
+        pipeline.close()
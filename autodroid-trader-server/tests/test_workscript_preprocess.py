@@ -0,0 +1,102 @@
+"""
+测试截图预处理
+"""
+import io
+import random
+
+from PIL import Image, ImageDraw
+
+from core.workscript.preprocess import (
+    PreprocessConfig, ScreenshotPreprocessor, detect_bar_heights, target_size
+)
+
+STATUS_BAR = 63
+NAVIGATION_BAR = 126
+
+
+def make_screen(status_color=(30, 60, 200), content_rows=30):
+    """1080×1920 截图：带图标的状态栏、图片横幅、文字列表、带按钮的导航栏"""
+    image = Image.new("RGB", (1080, 1920), "white")
+    if content_rows:
+        banner = Image.frombytes("RGB", (270, 100), random.Random(content_rows).randbytes(270 * 100 * 3))
+        image.paste(banner.resize((1080, 400), Image.BICUBIC), (0, 1280))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([0, 0, 1079, STATUS_BAR - 1], fill=status_color)
+    draw.rectangle([900, 15, 1050, 45], fill="white")
+    draw.rectangle([0, 1920 - NAVIGATION_BAR, 1079, 1919], fill="black")
+    draw.ellipse([500, 1820, 580, 1890], fill="gray")
+    for row in range(min(content_rows, 20)):
+        draw.rectangle([40, 100 + row * 55, 40 + (row * 37) % 900 + 100, 130 + row * 55], fill=(60, 60, 60))
+    return image
+
+
+def to_png(image):
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class TestBarDetection:
+    """测试状态栏和导航栏检测"""
+
+    def test_detects_status_and_navigation_bars(self):
+        assert detect_bar_heights(make_screen(), PreprocessConfig()) == (STATUS_BAR, NAVIGATION_BAR)
+
+    def test_no_crop_when_bar_matches_content(self):
+        """状态栏与界面同色时无法区分，不裁剪顶部"""
+        top, bottom = detect_bar_heights(make_screen(status_color="white", content_rows=0), PreprocessConfig())
+        assert top == 0
+        assert bottom == NAVIGATION_BAR
+
+
+class TestTargetSize:
+    def test_fits_pixel_budget_and_aligns_to_patch(self):
+        config = PreprocessConfig(max_pixels=600 * 1000, patch_size=28)
+        width, height = target_size(1080, 1731, config)
+        assert width * height <= config.max_pixels
+        assert width % 28 == 0 and height % 28 == 0
+        assert abs(width / height - 1080 / 1731) < 0.05
+
+    def test_never_upscales(self):
+        assert target_size(280, 560, PreprocessConfig()) == (280, 560)
+
+
+class TestScreenshotPreprocessor:
+    """测试截图预处理器"""
+
+    def test_payload_smaller_than_original(self):
+        png = to_png(make_screen())
+        preprocessor = ScreenshotPreprocessor()
+
+        image = preprocessor.process(png)
+
+        assert image.crop == (STATUS_BAR, NAVIGATION_BAR)
+        assert image.mime_type == "image/jpeg"
+        assert image.width * image.height <= PreprocessConfig().max_pixels
+        assert len(image.data) < len(png) / 2
+        assert image.data_url().startswith("data:image/jpeg;base64,")
+        with Image.open(io.BytesIO(image.data)) as decoded:
+            assert decoded.size == (image.width, image.height)
+
+    def test_cached_by_frame_hash(self):
+        png = to_png(make_screen())
+        preprocessor = ScreenshotPreprocessor(cache_size=1)
+
+        first = preprocessor.process(png)
+        assert preprocessor.process(png) is first
+        preprocessor.process(to_png(make_screen(content_rows=5)))
+        assert preprocessor.process(png) is not first
+
+        stats = preprocessor.stats
+        assert stats["frames"] == 4
+        assert stats["cache_hits"] == 1
+        assert 0 < stats["compression_ratio"] < 0.5
+
+    def test_webp_without_crop(self):
+        preprocessor = ScreenshotPreprocessor(PreprocessConfig(format="webp", crop_bars=False))
+        image = preprocessor.process(to_png(make_screen()))
+
+        assert image.crop == (0, 0)
+        assert image.mime_type == "image/webp"
+        with Image.open(io.BytesIO(image.data)) as decoded:
+            assert decoded.format == "WEBP"
@@ -0,0 +1,248 @@
+"""
+测试错误恢复的退避、预算和恢复动作
+"""
+import random
+import subprocess
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+import pytest
+
+from core.workscript.cancellation import CancellationToken, WorkScriptCancelled
+from core.workscript.recovery import (
+    Backoff, RecoveryManager, RecoveryPolicy, classify_error, load_app_dialogs
+)
+from core.workscript.tracing import Tracer
+from workscripts import adb_device
+from workscripts.adb_device import ADBDevice
+
+
+@dataclass
+class FakeScreen:
+    """与 ScreenInfo 字段一致的屏幕信息"""
+    current_app: str
+    width: int = 1080
+    height: int = 1920
+    text_elements: List[Dict] = field(default_factory=list)
+    ui_elements: List[Dict] = field(default_factory=list)
+
+
+class FakeAdbDevice:
+    """记录恢复动作的设备"""
+
+    def __init__(self, reconnect_results=(True,)):
+        self.calls = []
+        self.reconnect_results = list(reconnect_results)
+
+    def restart_app(self, package):
+        self.calls.append(("restart_app", package))
+        return True
+
+    def tap(self, x, y, delay=1.0):
+        self.calls.append(("tap", x, y))
+
+    def back(self, delay=1.0):
+        self.calls.append(("back",))
+
+    def reconnect(self):
+        self.calls.append(("reconnect",))
+        return self.reconnect_results.pop(0)
+
+
+class FakeDevice:
+    def __init__(self, adb_device, ui_xml=None):
+        self.adb_device = adb_device
+        self.ui_xml = ui_xml
+        self.dumps = 0
+
+    def dump_ui_hierarchy(self):
+        self.dumps += 1
+        return ET.fromstring(self.ui_xml) if self.ui_xml else None
+
+
+FAST = Backoff(base=0.001, max_delay=0.01)
+UPDATE_DIALOG = FakeScreen("券商", text_elements=[{"text": "发现新版本"}, {"text": "稍后再说"}])
+
+
+def make_manager(adb_device=None, **policies):
+    return RecoveryManager(
+        device=FakeDevice(adb_device or FakeAdbDevice()),
+        policies=policies,
+        tracer=Tracer(),
+        rng=random.Random(0)
+    )
+
+
+class TestBackoff:
+    """测试指数退避"""
+
+    def test_grows_exponentially_within_jitter(self):
+        backoff = Backoff(base=1.0, factor=2.0, max_delay=5.0, jitter=0.5)
+        rng = random.Random(1)
+        for attempt, upper in enumerate([1.0, 2.0, 4.0, 5.0, 5.0]):
+            delay = backoff.delay(attempt, rng)
+            assert upper * 0.5 <= delay <= upper
+
+
+class TestClassifyError:
+    def test_classifies_messages(self):
+        assert classify_error("步骤执行异常: 元素未找到") == "element_not_found"
+        assert classify_error("adb: device offline") == "network_error"
+        assert classify_error("等待界面超时") == "timeout"
+        assert classify_error("应用无响应") == "app_not_responding"
+        assert classify_error("需要重新登录") == "login_required"
+        assert classify_error("未知错误") == "execution_error"
+        assert classify_error(None) == "execution_error"
+
+    def test_login_words_alone_are_not_login_required(self):
+        """提到登录按钮的元素缺失和超时仍可恢复，只有会话失效才放弃"""
+        assert classify_error("未找到登录按钮") == "element_not_found"
+        assert classify_error("点击登录失败: timeout") == "timeout"
+        assert classify_error("element login_btn not found") == "element_not_found"
+        assert classify_error("登录已过期，请重新登录") == "login_required"
+        assert classify_error("HTTP 401 Unauthorized: session expired") == "login_required"
+
+
+class TestRecoveryManager:
+    """测试错误恢复管理器"""
+
+    def test_relaunches_crashed_app(self):
+        adb = FakeAdbDevice()
+        manager = make_manager(adb, app_not_responding=RecoveryPolicy(('relaunch_app',), FAST))
+
+        assert manager.handle("app_not_responding", {"screen_info": FakeScreen("com.tdx.androidCCZQ")})
+        assert adb.calls == [("restart_app", "com.tdx.androidCCZQ")]
+
+    def test_dismisses_known_dialog_by_signature(self):
+        adb = FakeAdbDevice()
+        manager = make_manager(adb, execution_error=RecoveryPolicy(('dismiss_dialog',), FAST))
+        manager.register_dialog("升级提示", UPDATE_DIALOG, "tap_at", {"x": 300, "y": 1500})
+
+        assert not manager.handle("execution_error", {"screen_info": FakeScreen("券商")})
+        assert manager.handle("execution_error", {"screen_info": UPDATE_DIALOG})
+        assert adb.calls == [("tap", 300, 1500)]
+
+    def test_dismisses_dialog_from_app_definition(self):
+        """应用定义中的弹窗按UI层级识别，不依赖屏幕信息"""
+        adb = FakeAdbDevice()
+        manager = make_manager(adb, execution_error=RecoveryPolicy(('dismiss_dialog',), FAST))
+        manager.load_dialogs(load_app_dialogs("com.example.app"))
+        manager.device.ui_xml = (
+            '<hierarchy><node text="发现新版本 2.0" resource-id="" />'
+            '<node text="以后再说" resource-id="com.example.app:id/btn_later" /></hierarchy>'
+        )
+
+        assert manager.handle("execution_error", {"screen_info": FakeScreen("Unknown")})
+        assert adb.calls == [("tap", 300, 1500)]
+
+        manager.device.ui_xml = '<hierarchy><node text="首页" resource-id="" /></hierarchy>'
+        assert not manager.handle("execution_error", {})
+        assert adb.calls == [("tap", 300, 1500)]
+
+    def test_app_without_definitions_has_no_dialogs(self, tmp_path):
+        assert load_app_dialogs("com.missing.app", str(tmp_path)) == []
+
+    def test_reconnects_transport(self):
+        adb = FakeAdbDevice(reconnect_results=[False, True])
+        manager = make_manager(adb, network_error=RecoveryPolicy(('reconnect_transport',), FAST))
+
+        assert not manager.handle("network_error", {})
+        assert manager.handle("network_error", {})
+        assert manager.stats["network_error"]["attempts"] == 2
+        assert manager.stats["network_error"]["successes"] == 1
+
+    def test_budget_per_error_type(self):
+        """每种错误类型单独计算预算，reset() 后重新计算"""
+        manager = make_manager(
+            timeout=RecoveryPolicy((), FAST, max_attempts=2, wait_is_recovery=True),
+            element_not_found=RecoveryPolicy((), FAST, max_attempts=1, wait_is_recovery=True)
+        )
+
+        assert manager.handle("timeout", {})
+        assert manager.handle("timeout", {})
+        assert not manager.handle("timeout", {})
+        assert manager.handle("element_not_found", {})
+
+        manager.reset()
+        assert manager.handle("timeout", {})
+
+    def test_time_budget_caps_backoff(self):
+        manager = make_manager(timeout=RecoveryPolicy(
+            (), Backoff(base=10.0, jitter=0.0), max_attempts=5, max_seconds=0.05, wait_is_recovery=True
+        ))
+        assert manager.handle("timeout", {})
+        assert not manager.handle("timeout", {})
+        assert manager.stats["timeout"]["seconds"] < 1.0
+
+    def test_login_required_not_recovered(self):
+        assert not make_manager().handle("login_required", {})
+        assert not make_manager().handle("unknown_error", {})
+
+    def test_attempts_recorded_as_spans(self):
+        manager = make_manager(app_not_responding=RecoveryPolicy(('relaunch_app',), FAST))
+        manager.handle("app_not_responding", {"app_package": "com.tdx.androidCCZQ"})
+
+        span = next(span for span in manager.tracer.spans if span.category == "recovery")
+        assert span.name == "recover:app_not_responding"
+        assert span.attributes["actions"] == {"relaunch_app": True}
+        assert span.attributes["recovered"] is True
+        assert span.attributes["delay_ms"] >= 0
+
+
+class FakeAdb:
+    """替换 subprocess.run，记录 adb 命令，hang 中的命令超时"""
+
+    def __init__(self, device_id, hang=()):
+        self.device_id = device_id
+        self.hang = set(hang)
+        self.commands = []
+
+    def __call__(self, command, timeout=None, **kwargs):
+        self.commands.append(command)
+        if command[1] in self.hang:
+            raise subprocess.TimeoutExpired(command, timeout)
+        stdout = f"List of devices attached\n{self.device_id}\tdevice\n" if command[1] == "devices" else ""
+        return subprocess.CompletedProcess(command, 0, stdout=stdout, stderr="")
+
+
+class TestADBReconnect:
+    """测试 ADBDevice.reconnect 的主机级命令"""
+
+    DEVICE = "192.168.1.5:5555"
+
+    def make_device(self, monkeypatch, hang=(), cancel_token=None):
+        fake = FakeAdb(self.DEVICE, hang)
+        monkeypatch.setattr(adb_device.subprocess, "run", fake)
+        device = ADBDevice(self.DEVICE, cancel_token=cancel_token, tracer=Tracer())
+        fake.commands.clear()
+        return device, fake
+
+    def test_network_device_reconnected_and_traced(self, monkeypatch):
+        device, fake = self.make_device(monkeypatch)
+
+        assert device.reconnect()
+        assert fake.commands == [
+            ["adb", "disconnect", self.DEVICE],
+            ["adb", "connect", self.DEVICE],
+            ["adb", "-s", self.DEVICE, "wait-for-device"],
+        ]
+        assert [span.name for span in device.tracer.spans if span.category == "adb"][:2] == [
+            "adb disconnect " + self.DEVICE, "adb connect " + self.DEVICE
+        ]
+
+    def test_connect_timeout_reported_as_failure(self, monkeypatch):
+        device, fake = self.make_device(monkeypatch, hang=("connect",))
+
+        assert not device.reconnect()
+        assert fake.commands[-1] == ["adb", "connect", self.DEVICE]
+
+    def test_cancelled_before_connect(self, monkeypatch):
+        token = CancellationToken()
+        device, fake = self.make_device(monkeypatch, cancel_token=token)
+        token.cancel()
+
+        with pytest.raises(WorkScriptCancelled):
+            device.reconnect()
+        assert fake.commands == []
+
@@ -0,0 +1,81 @@
+"""
+测试按需加载的脚本注册表
+"""
+import sys
+import threading
+
+import pytest
+
+from core.workscript.registry import ScriptRegistry, resolve_factory
+
+SCRIPT_MODULE = '''
+IMPORTS = []
+IMPORTS.append(1)
+
+
+class LazyScript:
+    instances = 0
+
+    def __init__(self):
+        LazyScript.instances += 1
+'''
+
+
+@pytest.fixture
+def script_module(tmp_path, monkeypatch):
+    """临时脚本模块，用于检查导入时机"""
+    (tmp_path / "lazy_registry_script.py").write_text(SCRIPT_MODULE, encoding="utf-8")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield "lazy_registry_script"
+    sys.modules.pop("lazy_registry_script", None)
+
+
+class TestScriptRegistry:
+    """测试按需加载的脚本注册表"""
+
+    def test_register_does_not_import(self, script_module):
+        registry = ScriptRegistry()
+        registry.register("lazy", f"{script_module}:LazyScript")
+
+        assert "lazy" in registry
+        assert registry.names() == ["lazy"]
+        assert script_module not in sys.modules
+        assert not registry.is_loaded("lazy")
+
+    def test_imported_once_and_instance_per_execution(self, script_module):
+        """模块只导入一次，并发执行各自得到新的脚本实例"""
+        registry = ScriptRegistry()
+        registry.register("lazy", f"{script_module}:LazyScript")
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(registry.create("lazy"))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        module = sys.modules[script_module]
+        assert module.IMPORTS == [1]
+        assert module.LazyScript.instances == 4
+        assert len({id(result) for result in results}) == 4
+        assert registry.factory("lazy") is module.LazyScript
+        assert registry.load_times_ms["lazy"] >= 0
+
+    def test_callable_factory_and_reregister(self):
+        registry = ScriptRegistry()
+        registry.register("script", lambda: {"version": 1})
+        assert registry.create("script") == {"version": 1}
+        assert registry.create("script") is not registry.create("script")
+
+        registry.register("script", lambda: {"version": 2})
+        assert not registry.is_loaded("script")
+        assert registry.create("script") == {"version": 2}
+
+    def test_unknown_script(self):
+        with pytest.raises(KeyError):
+            ScriptRegistry().create("missing")
+
+    def test_resolve_factory(self):
+        assert resolve_factory("core.workscript.registry:ScriptRegistry") is ScriptRegistry
+        with pytest.raises(ValueError):
+            resolve_factory("core.workscript.registry")
@@ -0,0 +1,152 @@
+"""
+测试流式模型输出的增量解析和提前下发
+"""
+import json
+import threading
+
+import pytest
+
+from core.workscript.streaming import ActionStreamParser, StreamingDecision, iter_sse_content
+from core.workscript.tracing import Tracer
+
+OUTPUT = (
+    "当前在登录页，需要点击登录按钮。\n"
+    "ACTION: tap_at\n"
+    "PARAMETERS: {\"x\": 500, \"y\": 800}\n"
+    "DESCRIPTION: 点击登录按钮\n"
+    "登录按钮位于屏幕下方中间位置，点击后应进入行情页面。"
+)
+
+
+def feed_chars(parser, text):
+    """逐字符输入，返回可以下发动作时已输入的字符数"""
+    ready_at = None
+    for index, char in enumerate(text):
+        if parser.feed(char) and ready_at is None:
+            ready_at = index + 1
+    parser.finish()
+    return ready_at
+
+
+class TestActionStreamParser:
+    """测试增量解析"""
+
+    def test_ready_when_parameters_complete(self):
+        """JSON 参数括号配对完成即可下发，不等待说明文本"""
+        parser = ActionStreamParser()
+        ready_at = feed_chars(parser, OUTPUT)
+
+        assert ready_at == OUTPUT.index("}") + 1
+        assert parser.action_type == "tap_at"
+        assert parser.parameters == {"x": 500, "y": 800}
+        assert parser.description == "点击登录按钮"
+
+    def test_action_waits_for_line_end(self):
+        """操作类型在行结束前可能不完整"""
+        parser = ActionStreamParser()
+        parser.feed("ACTION: tap")
+        assert parser.action_type is None
+        parser.feed("_at\nPARAMETERS: x=1")
+        assert parser.action_type == "tap_at"
+        assert not parser.ready
+        parser.feed("0, y=20\n")
+        assert parser.parameters == {"x": 10, "y": 20}
+
+    def test_action_without_parameters(self):
+        """无参数操作在出现 DESCRIPTION 时即可下发"""
+        parser = ActionStreamParser()
+        parser.feed("ACTION: back\nDESCRIPTION: 返回")
+        assert parser.ready
+        assert parser.parameters == {}
+
+    def test_braces_inside_strings(self):
+        """字符串中的括号不影响配对"""
+        parser = ActionStreamParser()
+        parser.feed('ACTION: input_text\nPARAMETERS: {"text": "a}b{"')
+        assert not parser.ready
+        parser.feed("}")
+        assert parser.parameters == {"text": "a}b{"}
+
+    def test_missing_fields(self):
+        parser = ActionStreamParser()
+        parser.feed("我不确定该怎么做")
+        parser.finish()
+        assert not parser.ready
+
+
+class TestIterSseContent:
+    """测试 SSE 解析"""
+
+    def test_extracts_delta_content(self):
+        lines = [
+            ": keep-alive",
+            "data: " + json.dumps({"choices": [{"delta": {"role": "assistant"}}]}),
+            "",
+            "data: " + json.dumps({"choices": [{"delta": {"content": "ACTION"}}]}),
+            "data: " + json.dumps({"choices": [{"delta": {"content": ": back"}}]}),
+            "data: [DONE]",
+            "data: " + json.dumps({"choices": [{"delta": {"content": "ignored"}}]}),
+        ]
+        assert list(iter_sse_content(lines)) == ["ACTION", ": back"]
+
+
+class TestStreamingDecision:
+    """测试提前下发"""
+
+    def test_action_returned_before_stream_ends(self):
+        """动作字段完整后立即返回，其余输出继续读入追踪"""
+        release_tail = threading.Event()
+        head, tail = OUTPUT.split("DESCRIPTION")
+
+        def chunks():
+            yield head
+            release_tail.wait(5)
+            yield "DESCRIPTION" + tail
+
+        tracer = Tracer()
+        decision = StreamingDecision(chunks(), tracer=tracer)
+
+        assert decision.wait_action(timeout=5) == ("tap_at", {"x": 500, "y": 800})
+        assert not decision.wait_done(timeout=0.05)
+
+        release_tail.set()
+        assert decision.wait_done(timeout=5)
+        assert decision.parser.description == "点击登录按钮"
+
+        span = tracer.spans[-1]
+        assert span.name == "model_stream"
+        assert span.attributes["output"] == OUTPUT
+        assert span.attributes["time_to_action_ms"] <= span.attributes["total_ms"]
+
+    def test_description_returned_at_line_end(self):
+        """DESCRIPTION 行结束即可取到描述，不等待后面的推理说明"""
+        release_tail = threading.Event()
+        head, tail = OUTPUT.split("登录按钮位于")
+
+        def chunks():
+            yield head
+            release_tail.wait(5)
+            yield "登录按钮位于" + tail
+
+        decision = StreamingDecision(chunks())
+
+        assert decision.wait_description(timeout=5) == "点击登录按钮"
+        assert not decision.wait_done(timeout=0.05)
+
+        release_tail.set()
+        assert decision.wait_done(timeout=5)
+        assert decision.parser.description == "点击登录按钮"
+
+    def test_stream_error_raised(self):
+        def chunks():
+            yield "思考中"
+            raise ConnectionError("连接中断")
+
+        decision = StreamingDecision(chunks())
+        with pytest.raises(ConnectionError):
+            decision.wait_action(timeout=5)
+
+    def test_missing_action_raises(self):
+        decision = StreamingDecision(iter(["无法判断"]))
+        with pytest.raises(ValueError):
+            decision.wait_action(timeout=5)
@@ -0,0 +1,116 @@
+"""
+测试工作脚本执行追踪和 Chrome Trace 导出
+"""
+import json
+import os
+import time
+
+from core.workscript.base import BaseWorkScript
+from core.workscript.tracing import Span, Tracer
+
+
+class TestTracer:
+    """测试追踪器"""
+
+    def test_span_records_duration_and_attributes(self):
+        """区间记录耗时和属性"""
+        tracer = Tracer()
+        with tracer.span("adb shell input", "adb", command="input tap 1 2"):
+            time.sleep(0.01)
+
+        assert len(tracer.spans) == 1
+        span = tracer.spans[0]
+        assert span.category == "adb"
+        assert span.attributes["command"] == "input tap 1 2"
+        assert span.duration_ms >= 10
+
+    def test_disabled_tracer_records_nothing(self):
+        """禁用时不记录"""
+        tracer = Tracer(enabled=False)
+        with tracer.span("sleep", "wait") as span:
+            assert span is None
+        tracer.mark_step("启动应用")
+        tracer.finish_step()
+
+        assert tracer.spans == []
+
+    def test_summary_aggregates_by_name(self):
+        """按名称聚合延迟"""
+        tracer = Tracer()
+        for _ in range(3):
+            with tracer.span("执行步骤", "step"):
+                pass
+        with tracer.span("sleep", "wait"):
+            pass
+
+        summary = tracer.summary("step")
+        assert list(summary) == ["执行步骤"]
+        assert summary["执行步骤"]["count"] == 3
+        assert set(tracer.category_totals()) == {"step", "wait"}
+
+    def test_category_totals_count_nested_time_once(self):
+        """嵌套区间的时间只计入最内层区间的分类"""
+        tracer = Tracer()
+
+        def add(name, category, start_ms, end_ms):
+            span = Span(name, category, {})
+            span.start_ns, span.end_ns = int(start_ms * 1e6), int(end_ms * 1e6)
+            tracer.spans.append(span)
+
+        # 子区间先结束，按结束顺序追加
+        add("adb shell input", "adb", 10, 30)
+        add("sleep", "wait", 40, 90)
+        add("点击登录", "step", 0, 100)
+        add("decide_next_action", "model", 100, 160)
+
+        assert tracer.category_totals() == {"adb": 20.0, "wait": 50.0, "step": 30.0, "model": 60.0}
+
+    def test_chrome_trace_export(self, tmp_path):
+        """导出 Chrome Trace 完整事件"""
+        tracer = Tracer()
+        with tracer.span("decide_next_action", "model"):
+            pass
+
+        path = tracer.export_chrome_trace(str(tmp_path / "trace.json"))
+        with open(path, encoding='utf-8') as f:
+            trace = json.load(f)
+
+        event = trace["traceEvents"][0]
+        assert event["ph"] == "X"
+        assert event["name"] == "decide_next_action"
+        assert event["cat"] == "model"
+        assert event["dur"] >= 0
+
+
+class LoggedStepsScript(BaseWorkScript):
+    """只使用 log_step 的测试脚本"""
+
+    def run(self):
+        self.log_step("启动应用")
+        self.sleep(0.01)
+        self.log_step("输入凭据")
+        return {'status': 'success'}
+
+
+class TestWorkScriptTracing:
+    """测试工作脚本的追踪输出"""
+
+    def test_execute_exports_trace_and_step_latency(self, tmp_path, monkeypatch):
+        """执行结果包含步骤延迟统计并在报告目录生成追踪文件"""
+        monkeypatch.setenv('AUTODROID_REPORTS_DIR', str(tmp_path))
+        result = LoggedStepsScript({'id': 'wp_trace', 'data': {}}).execute()
+
+        assert result['status'] == 'success'
+        assert set(result['step_latency']) == {"启动应用", "输入凭据"}
+        assert result['step_latency']["启动应用"]["total_ms"] >= 10
+        assert 'wait' in result['latency_by_category']
+        assert os.path.dirname(result['trace_file']) == result['report_directory']
+        assert os.path.exists(result['trace_file'])
+
+    def test_trace_can_be_disabled_by_workplan(self, tmp_path, monkeypatch):
+        """工作计划可关闭追踪"""
+        monkeypatch.setenv('AUTODROID_REPORTS_DIR', str(tmp_path))
+        result = LoggedStepsScript({'id': 'wp_trace', 'data': {'trace': False}}).execute()
+
+        assert 'trace_file' not in result
+        assert 'step_latency' not in result
@@ -2,20 +2,29 @@
 
 import subprocess
 import time
+from contextlib import nullcontext
 from typing import Optional, List, Dict, Any
 
 
 class ADBDevice:
     """Android device controller using ADB commands."""
     
-    def __init__(self, device_id: Optional[str] = None):
+    def __init__(self, device_id: Optional[str] = None, cancel_token: Optional[Any] = None,
+                 tracer: Optional[Any] = None):
         """Initialize ADB device connection.
         
         Args:
             device_id: Optional device ID for multi-device setups
+            cancel_token: Optional cancellation token (see core.workscript.cancellation);
+                every command checks it and is bounded by its remaining deadline
+            tracer: Optional tracer (see core.workscript.tracing); commands and
+                sleeps are recorded as spans
         """
         self.device_id = device_id
+        self.cancel_token = cancel_token
+        self.tracer = tracer
         self._connected = False
+        self._launcher_activities: Dict[str, str] = {}
         self._check_adb_available()
         
     def _get_adb_prefix(self) -> List[str]:
@@ -24,6 +33,52 @@ class ADBDevice:
             return ["adb", "-s", self.device_id]
         return ["adb"]
     
+    def _run(self, args: List[str], timeout: Optional[float] = None, host: bool = False,
+             **kwargs) -> subprocess.CompletedProcess:
+        """Run an ADB command for this device, honouring the cancellation token.
+        
+        Args:
+            args: ADB arguments after the device prefix
+            timeout: Optional command timeout in seconds
+            host: Run as a host-level command without the device prefix
+                (e.g. ``adb connect``)
+            **kwargs: Extra arguments passed to subprocess.run
+            
+        Returns:
+            The completed process
+            
+        Raises:
+            WorkScriptCancelled: If the token is cancelled or its deadline passes
+        """
+        if self.cancel_token is not None:
+            timeout = self.cancel_token.timeout_for(timeout)
+        
+        with self._span(" ".join(["adb"] + args[:3]), "adb", command=" ".join(args)) as span:
+            try:
+                prefix = ["adb"] if host else self._get_adb_prefix()
+                result = subprocess.run(prefix + args, timeout=timeout, **kwargs)
+            except subprocess.TimeoutExpired:
+                if self.cancel_token is not None:
+                    self.cancel_token.check()
+                raise
+            if span is not None:
+                span.set_attribute("returncode", result.returncode)
+            return result
+    
+    def _sleep(self, seconds: float) -> None:
+        """Sleep that returns early with an exception when cancelled."""
+        with self._span("sleep", "wait", seconds=seconds):
+            if self.cancel_token is not None:
+                self.cancel_token.sleep(seconds)
+            else:
+                time.sleep(seconds)
+    
+    def _span(self, name: str, category: str, **attributes):
+        """Open a tracing span, or a no-op context when no tracer is attached."""
+        if self.tracer is None:
+            return nullcontext()
+        return self.tracer.span(name, category, **attributes)
+    
     def _check_adb_available(self) -> None:
         """Check if ADB is available and device is connected."""
         try:
@@ -74,11 +129,11 @@ class ADBDevice:
             y: Y coordinate  
             delay: Delay in seconds after tap
         """
-        subprocess.run(
-            self._get_adb_prefix() + ["shell", "input", "tap", str(x), str(y)], 
+        self._run(
+            ["shell", "input", "tap", str(x), str(y)],
             capture_output=True
         )
-        time.sleep(delay)
+        self._sleep(delay)
     
     def swipe(self, start_x: int, start_y: int, end_x: int, end_y: int, 
               duration_ms: Optional[int] = None, delay: float = 1.0) -> None:
@@ -98,14 +153,14 @@ class ADBDevice:
             duration_ms = int(dist_sq / 1000)
             duration_ms = max(500, min(duration_ms, 2000))  # Clamp between 500-2000ms
         
-        subprocess.run(
-            self._get_adb_prefix() + [
+        self._run(
+            [
                 "shell", "input", "swipe",
                 str(start_x), str(start_y), str(end_x), str(end_y), str(duration_ms)
             ],
             capture_output=True
         )
-        time.sleep(delay)
+        self._sleep(delay)
     
     def type_text(self, text: str, delay: float = 1.0) -> None:
         """Type text on the device.
@@ -116,11 +171,11 @@ class ADBDevice:
         """
         # Replace spaces with %s for ADB input
         text = text.replace(' ', '%s')
-        subprocess.run(
-            self._get_adb_prefix() + ["shell", "input", "text", text],
+        self._run(
+            ["shell", "input", "text", text],
             capture_output=True
         )
-        time.sleep(delay)
+        self._sleep(delay)
     
     def press_key(self, keycode: str, delay: float = 1.0) -> None:
         """Press a key on the device.
@@ -129,11 +184,11 @@ class ADBDevice:
             keycode: Android keycode (e.g., '4' for back, 'KEYCODE_HOME' for home)
             delay: Delay in seconds after pressing key
         """
-        subprocess.run(
-            self._get_adb_prefix() + ["shell", "input", "keyevent", keycode],
+        self._run(
+            ["shell", "input", "keyevent", keycode],
             capture_output=True
         )
-        time.sleep(delay)
+        self._sleep(delay)
     
     def back(self, delay: float = 1.0) -> None:
         """Press the back button."""
@@ -149,8 +204,8 @@ class ADBDevice:
         Returns:
             The app name if recognized, otherwise "System Home"
         """
-        result = subprocess.run(
-            self._get_adb_prefix() + ["shell", "dumpsys", "window"],
+        result = self._run(
+            ["shell", "dumpsys", "window"],
             capture_output=True, text=True
         )
         
@@ -174,8 +229,8 @@ class ADBDevice:
         Returns:
             True if app was launched, False otherwise
         """
-        result = subprocess.run(
-            self._get_adb_prefix() + [
+        result = self._run(
+            [
                 "shell", "monkey",
                 "-p", package_name,
                 "-c", "android.intent.category.LAUNCHER",
@@ -184,9 +239,105 @@ class ADBDevice:
             capture_output=True
         )
         
-        time.sleep(delay)
+        self._sleep(delay)
+        return result.returncode == 0
+    
+    def force_stop(self, package_name: str) -> bool:
+        """Force-stop an app.
+        
+        Args:
+            package_name: Android package name
+            
+        Returns:
+            True if the command succeeded
+        """
+        result = self._run(["shell", "am", "force-stop", package_name], capture_output=True)
         return result.returncode == 0
     
+    def resolve_launcher_activity(self, package_name: str) -> Optional[str]:
+        """Resolve the launcher activity of an app, cached per package.
+        
+        Args:
+            package_name: Android package name
+            
+        Returns:
+            Component name such as 'com.example/.MainActivity', or None if unresolved
+        """
+        if package_name in self._launcher_activities:
+            return self._launcher_activities[package_name]
+        
+        result = self._run(
+            [
+                "shell", "cmd", "package", "resolve-activity", "--brief",
+                "-c", "android.intent.category.LAUNCHER", package_name
+            ],
+            capture_output=True, text=True
+        )
+        lines = result.stdout.strip().splitlines() if result.returncode == 0 else []
+        component = lines[-1].strip() if lines and "/" in lines[-1] else None
+        if component:
+            self._launcher_activities[package_name] = component
+        return component
+    
+    def start_activity(self, package_name: str, activity: str, delay: float = 2.0) -> bool:
+        """Start an activity explicitly.
+        
+        Args:
+            package_name: Android package name
+            activity: Activity name, or a full component name containing '/'
+            delay: Delay in seconds after starting
+            
+        Returns:
+            True if the activity was started
+        """
+        component = activity if "/" in activity else f"{package_name}/{activity}"
+        result = self._run(["shell", "am", "start", "-n", component], capture_output=True, text=True)
+        self._sleep(delay)
+        return result.returncode == 0 and "Error" not in (result.stdout or "")
+    
+    def restart_app(self, package_name: str, delay: float = 2.0) -> bool:
+        """Force-stop an app and start it again through its cached launcher activity.
+        
+        Args:
+            package_name: Android package name
+            delay: Delay in seconds after starting
+            
+        Returns:
+            True if the app was restarted
+        """
+        with self._span("restart_app", "adb", package=package_name):
+            self.force_stop(package_name)
+            activity = self.resolve_launcher_activity(package_name)
+            if activity:
+                return self.start_activity(package_name, activity, delay)
+            return self.launch_app(package_name, delay)
+    
+    def reconnect(self, timeout: float = 30.0) -> bool:
+        """Re-establish the ADB transport to this device.
+        
+        Network devices (host:port) are disconnected and connected again;
+        USB devices are asked to reconnect. Then waits until the device is back.
+        
+        Args:
+            timeout: Seconds to wait for the device to come back
+            
+        Returns:
+            True if the device is reachable again
+        """
+        with self._span("reconnect", "adb", device=self.device_id):
+            try:
+                if self.device_id and ":" in self.device_id:
+                    self._run(["disconnect", self.device_id], capture_output=True, timeout=10, host=True)
+                    self._run(["connect", self.device_id], capture_output=True, timeout=10, host=True)
+                else:
+                    self._run(["reconnect"], capture_output=True, timeout=10)
+                result = self._run(["wait-for-device"], capture_output=True, timeout=timeout)
+            except subprocess.TimeoutExpired:
+                self._connected = False
+                return False
+            self._connected = result.returncode == 0
+            return self._connected
+    
     def get_screenshot(self, filename: str = "screenshot.png") -> bool:
         """Take a screenshot of the device.
         
@@ -197,8 +348,8 @@ class ADBDevice:
             True if screenshot was taken successfully
         """
         # Take screenshot on device
-        result = subprocess.run(
-            self._get_adb_prefix() + ["shell", "screencap", "-p", "/sdcard/screenshot.png"],
+        result = self._run(
+            ["shell", "screencap", "-p", "/sdcard/screenshot.png"],
             capture_output=True
         )
         
@@ -206,13 +357,29 @@ class ADBDevice:
             return False
         
         # Pull screenshot to local
-        result = subprocess.run(
-            self._get_adb_prefix() + ["pull", "/sdcard/screenshot.png", filename],
+        result = self._run(
+            ["pull", "/sdcard/screenshot.png", filename],
             capture_output=True
         )
         
         return result.returncode == 0
-    
+
+    def capture_screenshot(self) -> Optional[bytes]:
+        """Capture a PNG screenshot in memory, without a temporary file on the device.
+
+        Returns:
+            PNG bytes, or None if the capture failed
+        """
+        result = self._run(
+            ["exec-out", "screencap", "-p"],
+            capture_output=True
+        )
+
+        if result.returncode != 0 or not result.stdout:
+            return None
+
+        return result.stdout
+
     def is_connected(self) -> bool:
         """Check if device is connected."""
         return self._connected
@@ -221,8 +388,8 @@ class ADBDevice:
         """Check if USB debugging is enabled on the device."""
         try:
             # Check if USB debugging is enabled by checking if we can run adb commands
-            result = subprocess.run(
-                self._get_adb_prefix() + ["shell", "settings", "get", "global", "adb_enabled"],
+            result = self._run(
+                ["shell", "settings", "get", "global", "adb_enabled"],
                 capture_output=True, text=True, timeout=5
             )
             if result.returncode == 0:
@@ -230,8 +397,8 @@ class ADBDevice:
                 return result.stdout.strip() == "1"
             
             # Fallback: try to run a simple command to check if debugging is working
-            result = subprocess.run(
-                self._get_adb_prefix() + ["shell", "echo", "test"],
+            result = self._run(
+                ["shell", "echo", "test"],
                 capture_output=True, text=True, timeout=5
             )
             return result.returncode == 0 and "test" in result.stdout
@@ -242,8 +409,8 @@ class ADBDevice:
         """Check if WiFi debugging is enabled on the device."""
         try:
             # Check if wireless debugging is enabled
-            result = subprocess.run(
-                self._get_adb_prefix() + ["shell", "settings", "get", "global", "adb_wifi_enabled"],
+            result = self._run(
+                ["shell", "settings", "get", "global", "adb_wifi_enabled"],
                 capture_output=True, text=True, timeout=5
             )
             if result.returncode == 0:
@@ -251,8 +418,8 @@ class ADBDevice:
                 return result.stdout.strip() == "1"
             
             # Alternative method: check if adbd is listening on a network port
-            result = subprocess.run(
-                self._get_adb_prefix() + ["shell", "netstat", "-an"],
+            result = self._run(
+                ["shell", "netstat", "-an"],
                 capture_output=True, text=True, timeout=5
             )
             if result.returncode == 0:
@@ -272,8 +439,8 @@ class ADBDevice:
         Returns:
             True if app is installed, False otherwise
         """
-        result = subprocess.run(
-            self._get_adb_prefix() + ["shell", "pm", "path", package_name],
+        result = self._run(
+            ["shell", "pm", "path", package_name],
             capture_output=True, text=True
         )
         
@@ -290,56 +457,56 @@ class ADBDevice:
         info = {}
         
         # Get device model
-        result = subprocess.run(
-            self._get_adb_prefix() + ["shell", "getprop", "ro.product.model"],
+        result = self._run(
+            ["shell", "getprop", "ro.product.model"],
             capture_output=True, text=True
         )
         if result.returncode == 0:
             info["model"] = result.stdout.strip()
         
         # Get manufacturer
-        result = subprocess.run(
-            self._get_adb_prefix() + ["shell", "getprop", "ro.product.manufacturer"],
+        result = self._run(
+            ["shell", "getprop", "ro.product.manufacturer"],
             capture_output=True, text=True
         )
         if result.returncode == 0:
             info["manufacturer"] = result.stdout.strip()
         
         # Get brand
-        result = subprocess.run(
-            self._get_adb_prefix() + ["shell", "getprop", "ro.product.brand"],
+        result = self._run(
+            ["shell", "getprop", "ro.product.brand"],
             capture_output=True, text=True
         )
         if result.returncode == 0:
             info["brand"] = result.stdout.strip()
         
         # Get device
-        result = subprocess.run(
-            self._get_adb_prefix() + ["shell", "getprop", "ro.product.device"],
+        result = self._run(
+            ["shell", "getprop", "ro.product.device"],
             capture_output=True, text=True
         )
         if result.returncode == 0:
             info["device"] = result.stdout.strip()
         
         # Get product
-        result = subprocess.run(
-            self._get_adb_prefix() + ["shell", "getprop", "ro.product.name"],
+        result = self._run(
+            ["shell", "getprop", "ro.product.name"],
             capture_output=True, text=True
         )
         if result.returncode == 0:
             info["product"] = result.stdout.strip()
         
         # Get Android version
-        result = subprocess.run(
-            self._get_adb_prefix() + ["shell", "getprop", "ro.build.version.release"],
+        result = self._run(
+            ["shell", "getprop", "ro.build.version.release"],
             capture_output=True, text=True
         )
         if result.returncode == 0:
             info["android_version"] = result.stdout.strip()
         
         # Get API level
-        result = subprocess.run(
-            self._get_adb_prefix() + ["shell", "getprop", "ro.build.version.sdk"],
+        result = self._run(
+            ["shell", "getprop", "ro.build.version.sdk"],
             capture_output=True, text=True
         )
         if result.returncode == 0:
@@ -349,8 +516,8 @@ class ADBDevice:
                 pass
         
         # Get screen dimensions
-        result = subprocess.run(
-            self._get_adb_prefix() + ["shell", "wm", "size"],
+        result = self._run(
+            ["shell", "wm", "size"],
             capture_output=True, text=True
         )
         if result.returncode == 0:
@@ -365,8 +532,8 @@ class ADBDevice:
                     pass
         
         # Get IP address
-        result = subprocess.run(
-            self._get_adb_prefix() + ["shell", "ip", "addr", "show", "wlan0"],
+        result = self._run(
+            ["shell", "ip", "addr", "show", "wlan0"],
             capture_output=True, text=True
         )
         if result.returncode == 0:
@@ -386,16 +553,16 @@ class ADBDevice:
         info["device_id"] = self.device_id
         
         # Get device name (try Bluetooth name first, then device name)
-        result = subprocess.run(
-            self._get_adb_prefix() + ["shell", "settings", "get", "secure", "bluetooth_name"],
+        result = self._run(
+            ["shell", "settings", "get", "secure", "bluetooth_name"],
             capture_output=True, text=True
         )
         if result.returncode == 0 and result.stdout.strip():
             info["name"] = result.stdout.strip()
         else:
             # Fallback to device name
-            result = subprocess.run(
-                self._get_adb_prefix() + ["shell", "settings", "get", "global", "device_name"],
+            result = self._run(
+                ["shell", "settings", "get", "global", "device_name"],
                 capture_output=True, text=True
             )
             if result.returncode == 0 and result.stdout.strip():
@@ -7,9 +7,11 @@ from adb_device import ADBDevice, quick_connect
 from typing import Optional, Dict, Any
 import time
 import logging
+import re
 import subprocess
 import tempfile
 import os
+import xml.etree.ElementTree as ET
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +33,32 @@ class ADBDeviceController:
         self.serialno = serialno
         self.adb_device = None
         self._is_connected = False
+        self._cancel_token = None
+        self._tracer = None
+    
+    @property
+    def cancel_token(self):
+        """当前绑定的取消令牌（见 core.workscript.cancellation）"""
+        return self._cancel_token
+    
+    @cancel_token.setter
+    def cancel_token(self, token):
+        """绑定取消令牌，同时传递给底层ADB设备"""
+        self._cancel_token = token
+        if self.adb_device:
+            self.adb_device.cancel_token = token
+    
+    @property
+    def tracer(self):
+        """当前绑定的追踪器（见 core.workscript.tracing）"""
+        return self._tracer
+    
+    @tracer.setter
+    def tracer(self, tracer):
+        """绑定追踪器，同时传递给底层ADB设备"""
+        self._tracer = tracer
+        if self.adb_device:
+            self.adb_device.tracer = tracer
         
     def connect(self, app_package: str = None, app_activity: str = None, timeout: int = 30) -> bool:
         """
@@ -47,6 +75,8 @@ class ADBDeviceController:
         try:
             # 初始化ADB设备连接
             self.adb_device = quick_connect(self.serialno)
+            self.adb_device.cancel_token = self._cancel_token
+            self.adb_device.tracer = self._tracer
             self._is_connected = self.adb_device.is_connected()
             
             if self._is_connected:
@@ -61,7 +91,7 @@ class ADBDeviceController:
                         self.adb_device.start_activity(app_package, app_activity)
                     else:
                         self.adb_device.start_app(app_package)
-                    time.sleep(2)  # 等待应用启动
+                    self.adb_device._sleep(2)  # 等待应用启动
                     
                 return True
             else:
@@ -115,7 +145,7 @@ class ADBDeviceController:
                 logger.info(f"设备 {self.serialno} 启动应用: {package_name}")
                 
             if result:
-                time.sleep(2)  # 等待应用启动
+                self.adb_device._sleep(2)  # 等待应用启动
                 return True
             else:
                 logger.error(f"设备 {self.serialno} 启动应用失败")
@@ -125,6 +155,75 @@ class ADBDeviceController:
             logger.error(f"设备 {self.serialno} 启动应用失败：{str(e)}")
             return False
     
+    def dump_ui_hierarchy(self) -> Optional[ET.Element]:
+        """
+        获取当前界面的UI层级结构 - 使用ADB UIAutomator
+        
+        Returns:
+            UI层级XML根节点，获取或解析失败返回None
+        """
+        if not self.is_connected():
+            logger.error(f"设备 {self.serialno} 未连接，无法获取UI层级")
+            return None
+        
+        with self.adb_device._span("dump_ui_hierarchy", "adb"):
+            # 使用uiautomator dump获取UI层次结构（受取消令牌约束）
+            result = self.adb_device._run(
+                ["shell", "uiautomator", "dump", "/sdcard/ui_dump.xml"],
+                capture_output=True, text=True
+            )
+            if result.returncode != 0:
+                return None
+            
+            # 拉取UI dump文件到临时目录
+            temp_file = tempfile.NamedTemporaryFile(mode='w', suffix='.xml', delete=False)
+            temp_file.close()
+            try:
+                self.adb_device._run(
+                    ["pull", "/sdcard/ui_dump.xml", temp_file.name],
+                    capture_output=True
+                )
+                return ET.parse(temp_file.name).getroot()
+            except ET.ParseError as parse_error:
+                logger.warning(f"解析UI dump失败: {parse_error}")
+                return None
+            finally:
+                # 清理临时文件
+                if os.path.exists(temp_file.name):
+                    os.unlink(temp_file.name)
+    
+    @staticmethod
+    def find_in_hierarchy(root: ET.Element, element_id: str) -> Optional[Dict[str, Any]]:
+        """
+        在UI层级中查找指定resource-id的元素
+        
+        Args:
+            root: UI层级XML根节点
+            element_id: 元素ID
+            
+        Returns:
+            元素信息字典，包含bounds坐标信息；未找到返回None
+        """
+        for elem in root.iter():
+            if elem.get("resource-id") != element_id:
+                continue
+            
+            # 解析bounds坐标 [x1,y1][x2,y2]
+            match = re.search(r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]', elem.get("bounds") or "")
+            if match:
+                x1, y1, x2, y2 = map(int, match.groups())
+                return {
+                    "element_id": element_id,
+                    "bounds": elem.get("bounds"),
+                    "center_x": (x1 + x2) // 2,
+                    "center_y": (y1 + y2) // 2,
+                    "x1": x1,
+                    "y1": y1,
+                    "x2": x2,
+                    "y2": y2
+                }
+        return None
+    
     def find_element_by_id(self, element_id: str, timeout: int = 10):
         """
         通过ID查找元素 - 使用ADB UIAutomator，无需Appium
@@ -141,76 +240,24 @@ class ADBDeviceController:
             logger.error(f"设备 {self.serialno} 未连接，无法查找元素")
             return None
             
-        try:
-            import subprocess
-            import json
-            import time
-            
-            start_time = time.time()
-            while time.time() - start_time < timeout:
-                # 使用uiautomator dump获取UI层次结构
-                result = subprocess.run(
-                    self.adb_device._get_adb_prefix() + ["shell", "uiautomator", "dump", "/sdcard/ui_dump.xml"],
-                    capture_output=True, text=True
-                )
-                
-                if result.returncode == 0:
-                    # 拉取UI dump文件到临时目录
-                    temp_file = tempfile.NamedTemporaryFile(mode='w', suffix='.xml', delete=False)
-                    temp_file.close()
-                    subprocess.run(
-                        self.adb_device._get_adb_prefix() + ["pull", "/sdcard/ui_dump.xml", temp_file.name],
-                        capture_output=True
-                    )
+        with self.adb_device._span("find_element_by_id", "wait", element_id=element_id):
+            try:
+                start_time = time.time()
+                while time.time() - start_time < timeout:
+                    root = self.dump_ui_hierarchy()
+                    element = self.find_in_hierarchy(root, element_id) if root is not None else None
+                    if element:
+                        logger.info(f"设备 {self.serialno} 找到元素: {element_id}, 坐标: ({element['center_x']}, {element['center_y']})")
+                        return element
                     
-                    # 解析XML查找元素
-                    import xml.etree.ElementTree as ET
-                    try:
-                        tree = ET.parse(temp_file.name)
-                        root = tree.getroot()
-                        
-                        # 查找包含指定ID的元素
-                        for elem in root.iter():
-                            if elem.get("resource-id") == element_id:
-                                bounds = elem.get("bounds")
-                                if bounds:
-                                    # 解析bounds坐标 [x1,y1][x2,y2]
-                                    import re
-                                    match = re.search(r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]', bounds)
-                                    if match:
-                                        x1, y1, x2, y2 = map(int, match.groups())
-                                        center_x = (x1 + x2) // 2
-                                        center_y = (y1 + y2) // 2
-                                        
-                                        logger.info(f"设备 {self.serialno} 找到元素: {element_id}, 坐标: ({center_x}, {center_y})")
-                                        return {
-                                            "element_id": element_id,
-                                            "bounds": bounds,
-                                            "center_x": center_x,
-                                            "center_y": center_y,
-                                            "x1": x1,
-                                            "y1": y1,
-                                            "x2": x2,
-                                            "y2": y2
-                                        }
-                    except Exception as parse_error:
-                        logger.warning(f"解析UI dump失败: {parse_error}")
-                    finally:
-                        # 清理临时文件
-                        try:
-                            if temp_file and os.path.exists(temp_file.name):
-                                os.unlink(temp_file.name)
-                        except:
-                            pass
+                    self.adb_device._sleep(1)  # 等待1秒后重试，取消时立即退出
                 
-                time.sleep(1)  # 等待1秒后重试
+                logger.error(f"设备 {self.serialno} 在{timeout}秒内未找到元素: {element_id}")
+                return None
             
-            logger.error(f"设备 {self.serialno} 在{timeout}秒内未找到元素: {element_id}")
-            return None
-            
-        except Exception as e:
-            logger.error(f"设备 {self.serialno} 查找元素 {element_id} 失败：{str(e)}")
-            return None
+            except Exception as e:
+                logger.error(f"设备 {self.serialno} 查找元素 {element_id} 失败：{str(e)}")
+                return None
     
     def click(self, element_id: str = None, x: int = None, y: int = None, timeout: int = 10) -> bool:
         """
@@ -274,12 +321,11 @@ class ADBDeviceController:
         try:
             # 先点击元素获取焦点
             if self.click(element_id, timeout=timeout):
-                time.sleep(0.5)  # 等待焦点
+                self.adb_device._sleep(0.5)  # 等待焦点
                 
                 # 使用ADB input text命令输入文本
-                import subprocess
-                result = subprocess.run(
-                    self.adb_device._get_adb_prefix() + ["shell", "input", "text", text],
+                result = self.adb_device._run(
+                    ["shell", "input", "text", text],
                     capture_output=True
                 )
                 
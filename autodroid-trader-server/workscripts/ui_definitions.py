@@ -72,6 +72,103 @@ class ScreenDefinition:
             self.expected_elements = []
 
 
+def screen_definition_to_dict(screen: ScreenDefinition) -> Dict[str, Any]:
+    """Convert a screen definition to a JSON-serializable dict.
+    
+    Args:
+        screen: Screen definition
+        
+    Returns:
+        Screen data with identifier types as strings
+    """
+    screen_data = {
+        "name": screen.name,
+        "app_package": screen.app_package,
+        "elements": {},
+        "screen_identifiers": [],
+        "expected_elements": screen.expected_elements
+    }
+    
+    # Convert elements
+    for elem_name, elem_def in screen.elements.items():
+        elem_data = {
+            "name": elem_def.name,
+            "element_type": elem_def.element_type.value,
+            "identifiers": {},
+            "app_package": elem_def.app_package,
+            "screen": elem_def.screen,
+            "action": elem_def.action,
+            "input_data": elem_def.input_data,
+            "wait_after_action": elem_def.wait_after_action,
+            "fallback_identifiers": elem_def.fallback_identifiers or [],
+            "validation_text": elem_def.validation_text
+        }
+        
+        # Convert identifiers
+        for id_type, id_data in elem_def.identifiers.items():
+            elem_data["identifiers"][id_type.value] = id_data
+        
+        screen_data["elements"][elem_name] = elem_data
+    
+    # Convert screen identifiers
+    for identifier in screen.screen_identifiers:
+        id_data = {}
+        for id_type, id_value in identifier.items():
+            id_data[id_type.value] = id_value
+        screen_data["screen_identifiers"].append(id_data)
+    
+    return screen_data
+
+
+def screen_definition_from_dict(screen_data: Dict[str, Any]) -> ScreenDefinition:
+    """Reconstruct a screen definition from its dict form.
+    
+    Args:
+        screen_data: Screen data as produced by screen_definition_to_dict
+        
+    Returns:
+        Screen definition
+    """
+    # Reconstruct elements
+    elements = {}
+    for elem_name, elem_data in screen_data["elements"].items():
+        identifiers = {}
+        for id_type_str, id_value in elem_data["identifiers"].items():
+            id_type = IdentifierType(id_type_str)
+            identifiers[id_type] = id_value
+        
+        element_def = UIElementDefinition(
+            name=elem_data["name"],
+            element_type=ElementType(elem_data["element_type"]),
+            identifiers=identifiers,
+            app_package=elem_data.get("app_package"),
+            screen=elem_data.get("screen"),
+            action=elem_data.get("action", "tap"),
+            input_data=elem_data.get("input_data"),
+            wait_after_action=elem_data.get("wait_after_action", 1.0),
+            fallback_identifiers=elem_data.get("fallback_identifiers", []),
+            validation_text=elem_data.get("validation_text")
+        )
+        elements[elem_name] = element_def
+    
+    # Reconstruct screen identifiers
+    screen_identifiers = []
+    for identifier_data in screen_data["screen_identifiers"]:
+        identifier = {}
+        for id_type_str, id_value in identifier_data.items():
+            id_type = IdentifierType(id_type_str)
+            identifier[id_type] = id_value
+        screen_identifiers.append(identifier)
+    
+    return ScreenDefinition(
+        name=screen_data["name"],
+        app_package=screen_data["app_package"],
+        elements=elements,
+        screen_identifiers=screen_identifiers,
+        expected_elements=screen_data.get("expected_elements", [])
+    )
+
+
 class UIDefinitionManager:
     """Manager for UI element definitions."""
     
@@ -234,42 +331,7 @@ class UIDefinitionManager:
         
         filepath = os.path.join(self.definitions_dir, filename)
         
-        # Convert to serializable format
-        screen_data = {
-            "name": screen.name,
-            "app_package": screen.app_package,
-            "elements": {},
-            "screen_identifiers": [],
-            "expected_elements": screen.expected_elements
-        }
-        
-        # Convert elements
-        for elem_name, elem_def in screen.elements.items():
-            elem_data = {
-                "name": elem_def.name,
-                "element_type": elem_def.element_type.value,
-                "identifiers": {},
-                "app_package": elem_def.app_package,
-                "screen": elem_def.screen,
-                "action": elem_def.action,
-                "input_data": elem_def.input_data,
-                "wait_after_action": elem_def.wait_after_action,
-                "fallback_identifiers": elem_def.fallback_identifiers or [],
-                "validation_text": elem_def.validation_text
-            }
-            
-            # Convert identifiers
-            for id_type, id_data in elem_def.identifiers.items():
-                elem_data["identifiers"][id_type.value] = id_data
-            
-            screen_data["elements"][elem_name] = elem_data
-        
-        # Convert screen identifiers
-        for identifier in screen.screen_identifiers:
-            id_data = {}
-            for id_type, id_value in identifier.items():
-                id_data[id_type.value] = id_value
-            screen_data["screen_identifiers"].append(id_data)
+        screen_data = screen_definition_to_dict(screen)
         
         with open(filepath, 'w', encoding='utf-8') as f:
             json.dump(screen_data, f, ensure_ascii=False, indent=2)
@@ -290,46 +352,7 @@ class UIDefinitionManager:
         with open(filepath, 'r', encoding='utf-8') as f:
             screen_data = json.load(f)
         
-        # Reconstruct elements
-        elements = {}
-        for elem_name, elem_data in screen_data["elements"].items():
-            identifiers = {}
-            for id_type_str, id_value in elem_data["identifiers"].items():
-                id_type = IdentifierType(id_type_str)
-                identifiers[id_type] = id_value
-            
-            element_def = UIElementDefinition(
-                name=elem_data["name"],
-                element_type=ElementType(elem_data["element_type"]),
-                identifiers=identifiers,
-                app_package=elem_data.get("app_package"),
-                screen=elem_data.get("screen"),
-                action=elem_data.get("action", "tap"),
-                input_data=elem_data.get("input_data"),
-                wait_after_action=elem_data.get("wait_after_action", 1.0),
-                fallback_identifiers=elem_data.get("fallback_identifiers", []),
-                validation_text=elem_data.get("validation_text")
-            )
-            elements[elem_name] = element_def
-        
-        # Reconstruct screen identifiers
-        screen_identifiers = []
-        for identifier_data in screen_data["screen_identifiers"]:
-            identifier = {}
-            for id_type_str, id_value in identifier_data.items():
-                id_type = IdentifierType(id_type_str)
-                identifier[id_type] = id_value
-            screen_identifiers.append(identifier)
-        
-        screen_def = ScreenDefinition(
-            name=screen_data["name"],
-            app_package=screen_data["app_package"],
-            elements=elements,
-            screen_identifiers=screen_identifiers,
-            expected_elements=screen_data.get("expected_elements", [])
-        )
-        
-        return screen_def
+        return screen_definition_from_dict(screen_data)
     
     def load_all_definitions(self):
         """Load all screen definitions from the definitions directory."""
@@ -421,6 +444,39 @@ class UIDefinitionManager:
         
         return workplan
     
+    def create_flow_workplan(self, screen_name: str, sequence: Optional[List[Any]] = None,
+                             **params) -> Dict[str, Any]:
+        """Create a workplan for the generic compiled flow workscript.
+        
+        Unlike create_workplan_from_screen, the result can be executed directly
+        by WorkScriptEngine: the flow compiler prefetches locators, batches
+        deterministic actions and waits on validation_text instead of sleeping.
+        
+        Args:
+            screen_name: Screen name
+            sequence: Element names (or dicts with "element" and overrides such as
+                "input_data"); defaults to the screen's expected elements
+            **params: Extra workplan data, e.g. wait_timeout, max_retries
+            
+        Returns:
+            Workplan data with workscript "flow"
+        """
+        screen_def = self.get_screen_definition(screen_name)
+        if not screen_def:
+            raise ValueError(f"Screen definition not found: {screen_name}")
+        
+        data = {
+            "screen_definition": screen_definition_to_dict(screen_def),
+            "sequence": list(sequence) if sequence is not None else list(screen_def.expected_elements)
+        }
+        data.update(params)
+        
+        return {
+            "id": f"{screen_name}_flow",
+            "workscript": "flow",
+            "data": data
+        }
+    
     def _convert_identifiers_for_workplan(self, identifiers: Dict[IdentifierType, Dict[str, Any]]) -> Dict[str, Any]:
         """Convert identifiers for workplan format."""
         workplan_identifiers = {}